@@ -1,21 +1,73 @@
-from fastapi import FastAPI, Depends, HTTPException, status, Security, Path
-from schemas import RegistrationModel, RegisterUserOut, LoginModel, LoginUserOut, PRResponse, ExerciseCreation, ExerciseCreationResponse, AllExercisesRetrievalResponse, WorkoutRequest, WorkoutResponse, WorkoutExerciseRequest, WorkoutExerciseResponse
-from database import get_db
-from auth import passlib_hash_password, verify_password, create_jwt, decode_jwt, validate_jwt
+from fastapi import FastAPI, Depends, HTTPException, status, Security, Path, Query, Header, Response, WebSocket, WebSocketDisconnect
+from schemas import RegistrationModel, RegisterUserOut, LoginModel, LoginUserOut, PRResponse, ExerciseCreation, ExerciseCreationResponse, AllExercisesRetrievalResponse, ExerciseSearchResponse, CatalogResponse, WorkoutRequest, WorkoutResponse, WorkoutCloneRequest, WorkoutCloneResponse, WorkoutExerciseRequest, WorkoutExerciseResponse, WorkoutExerciseColumns, ExerciseHistoryResponse, LeaderboardMembershipRequest, LeaderboardMembershipResponse, LeaderboardResponse, SlowQueryLogResponse
+from database import get_db, get_read_db, get_write_db, user_session, replica_router, init_engines, warm_up_engines, dispose_engines, AsyncSession as DirectorySession
+from auth import create_jwt, decode_jwt, validate_jwt, require_admin, revoked_users, REVOCATION_REFRESH_SECONDS
+from passwords import password_hasher
+from purge import purge_worker, PURGE_ENABLED, PURGE_DELAY_SECONDS
 from models.user import User
 from models.exercise import Exercise
 from models.workout import Workout
 from models.workout_exercise import WorkoutExercise
+from search import exercise_search_statement, merge_catalog_matches, DEFAULT_SEARCH_LIMIT, MAX_SEARCH_LIMIT
+from cloning import clone_workout
+from history import exercise_history_statement, DEFAULT_HISTORY_POINTS, MAX_HISTORY_POINTS
+from catalog import get_catalog
+import leaderboards
+from leaderboards import leaderboard_cache, DEFAULT_LEADERBOARD_LIMIT, MAX_LEADERBOARD_LIMIT
+from ownership import ownership_cache
+import queries
+from sharding import shard_map
+from live import LiveWorkoutSession, LIVE_FLUSH_SECONDS, WORKOUT_GONE_DETAIL
+from ratelimit import RateLimitMiddleware, rate_limiter
+from compression import CompressionMiddleware
+from slow_queries import SlowQueryMiddleware, slow_query_log, SLOW_QUERY_ENABLED
+from profiler import profiler, collapsed, PROFILE_MAX_SECONDS
+import monitoring
+from monitoring import loop_monitor
+from idempotency import IdempotencyMiddleware, idempotency_store
+from msgpack_codec import MsgPackRoute, packb, unpackb
 from sqlalchemy.ext.asyncio import AsyncSession
-from sqlalchemy import select, or_, and_
+from sqlalchemy import select, update, or_
 from sqlalchemy.exc import IntegrityError, SQLAlchemyError
-from datetime import timedelta
+from datetime import datetime, timedelta, timezone, date
+from typing import Literal
+import asyncio
+import json
+import os
 from fastapi.openapi.utils import get_openapi
-from sqlalchemy.sql import func
+from contextlib import asynccontextmanager
 from starlette.concurrency import run_in_threadpool #for asynchronous handling
 
 
-app = FastAPI()
+@asynccontextmanager
+async def lifespan(app : FastAPI):
+    init_engines()
+    if SLOW_QUERY_ENABLED:
+        slow_query_log.install()
+    await warm_up_engines()
+    if PURGE_ENABLED:
+        purge_worker.start(DirectorySession)
+    if REVOCATION_REFRESH_SECONDS > 0:
+        revoked_users.start(DirectorySession)
+    loop_monitor.start()
+    yield
+    await loop_monitor.stop()
+    await revoked_users.stop()
+    await purge_worker.stop()
+    await dispose_engines()
+    slow_query_log.uninstall()
+    password_hasher.close()
+
+
+app = FastAPI(lifespan = lifespan)
+# every route below negotiates msgpack as well as JSON
+app.router.route_class = MsgPackRoute
+# added last = outermost: rejected requests never reach compression, and replays keep
+# the uncompressed body so each retry negotiates its own encoding
+app.add_middleware(IdempotencyMiddleware, store = idempotency_store, exempt_paths = monitoring.PROBE_PATHS)
+app.add_middleware(CompressionMiddleware, exempt_paths = monitoring.PROBE_PATHS)
+app.add_middleware(RateLimitMiddleware, limiter = rate_limiter, exempt_paths = monitoring.PROBE_PATHS)
+app.add_middleware(SlowQueryMiddleware, log = slow_query_log)
 
 def custom_openapi():
     if app.openapi_schema:
@@ -42,6 +94,19 @@ def custom_openapi():
 
 app.openapi = custom_openapi
 
+@app.get("/metrics", response_class = Response)
+async def metrics():
+    return Response(content = monitoring.prometheus_text(monitoring.snapshot()), media_type = "text/plain; version=0.0.4")
+
+@app.get("/health/ready")
+async def readiness_check(response : Response):
+    # answered from the event loop itself: a blocked loop makes the probe time out instead
+    stats = monitoring.snapshot()
+    failing = monitoring.readiness(stats)
+    if failing:
+        response.status_code = status.HTTP_503_SERVICE_UNAVAILABLE
+    return {"status" : "saturated" if failing else "ready", "failing" : failing, **stats}
+
 @app.get("/")
 async def first_function():
     return {"message" : "Hello!"}
@@ -64,8 +129,7 @@ async def register_user(userdata : RegistrationModel, db : AsyncSession = Depend
                 detail = "A user with this username already exists."
             )
     
-    # hashed_password = passlib_hash_password(userdata.password)
-    hashed_password = await run_in_threadpool(passlib_hash_password, userdata.password)
+    hashed_password = await password_hasher.hash(userdata.password)
 
     new_user = User(email = userdata.email, hashed_password = hashed_password, username = userdata.username)
 
@@ -86,11 +150,24 @@ async def register_user(userdata : RegistrationModel, db : AsyncSession = Depend
             detail="A database error occurred."
         )
 
+    # the directory row exists; give the user's shard its copy, or undo the registration
+    if shard_map.enabled:
+        try:
+            await shard_map.create_stub_user(new_user)
+        except SQLAlchemyError:
+            await db.delete(new_user)
+            await db.commit()
+            raise HTTPException(
+                status_code = status.HTTP_500_INTERNAL_SERVER_ERROR,
+                detail = "A database error occurred."
+            )
+
     return new_user
 
 @app.post("/login", response_model = LoginUserOut)
 async def login_user(user : LoginModel, db : AsyncSession = Depends(get_db)):
-    statement = select(User).where(or_(User.email == user.username_or_email, User.username == user.username_or_email))
+    # deleted accounts are waiting for the purge and can no longer log in
+    statement = select(User).where(or_(User.email == user.username_or_email, User.username == user.username_or_email), User.deleted_at.is_(None))
     existing_user = (await db.scalars(statement)).one_or_none()
 
     if not existing_user:
@@ -102,36 +179,89 @@ async def login_user(user : LoginModel, db : AsyncSession = Depends(get_db)):
     entered_password = user.password
     stored_password = existing_user.hashed_password
 
-    is_valid_password = await run_in_threadpool(verify_password, entered_password, stored_password)
+    is_valid_password, upgraded_password = await password_hasher.verify_and_update(entered_password, stored_password)
     if not is_valid_password:
         raise HTTPException(
             status_code = status.HTTP_400_BAD_REQUEST,
             detail = "Incorrect password for given credentials."
         )
+
+    # read before the upgrade's commit (or rollback) expires them; reloading would need another round trip
+    user_id, username, email = existing_user.id, existing_user.username, existing_user.email
+
+    # the stored hash uses an older scheme or cost; the upgrade is retried on the next login if this fails
+    if upgraded_password is not None:
+        try:
+            existing_user.hashed_password = upgraded_password
+            await db.commit()
+        except SQLAlchemyError:
+            await db.rollback()
     
     active_time = timedelta(minutes = 15)
-    jwt_token = await run_in_threadpool(create_jwt, payload= {"sub" : str(existing_user.id), "username" : existing_user.username}, expires_delta = active_time)
+    jwt_token = await run_in_threadpool(create_jwt, payload= {"sub" : str(user_id), "username" : username}, expires_delta = active_time)
     # jwt_token = create_jwt(
     #     payload = {"sub" : str(existing_user.id), "username" : existing_user.username},
     #     expires_delta = active_time
     # )
 
     return {
-        "id" : existing_user.id,
-        "username" : existing_user.username,
-        "email": existing_user.email,
+        "id" : user_id,
+        "username" : username,
+        "email": email,
         "jwt_token" : jwt_token,
         "message" : "Login Successful."
     }
 
+@app.delete("/me", status_code = status.HTTP_202_ACCEPTED, openapi_extra = {"security" : [{"bearerAuth" : []}]})
+async def delete_account(user : dict = Security(validate_jwt), db : AsyncSession = Depends(get_db)):
+    # only the directory row is touched here; purge.py deletes the data in batches later
+    user_id = int(user["sub"])
+    statement = update(User).where(User.id == user_id, User.deleted_at.is_(None)).values(deleted_at = datetime.now(timezone.utc))
+    try:
+        deleted = (await db.execute(statement)).rowcount
+        if deleted:
+            # off the leaderboards now rather than at the purge
+            await leaderboards.leave(db, user_id)
+        await db.commit()
+    except SQLAlchemyError:
+        await db.rollback()
+        raise HTTPException(
+            status_code = status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail = "A database error occurred."
+        )
+
+    if not deleted:
+        raise HTTPException(
+            status_code = status.HTTP_404_NOT_FOUND,
+            detail = "Account not found or already deleted."
+        )
+
+    # the account's tokens stop working now, not when they expire
+    revoked_users.revoke(user_id)
+    leaderboards.forget_member(user_id)
+    ownership_cache.invalidate(user_id)
+
+    return {
+        "message" : "Account deleted. Its data will be purged.",
+        "purge_after" : int(PURGE_DELAY_SECONDS)
+    }
+
 # CRUD operations for Exercises:-
 # 1. CREATE
 @app.post("/exercises", response_model = ExerciseCreationResponse, openapi_extra={"security": [{"bearerAuth": []}]})
-async def create_exercise(exercise_data : ExerciseCreation, user : dict = Security(validate_jwt), db : AsyncSession = Depends(get_db)):
+async def create_exercise(exercise_data : ExerciseCreation, user : dict = Security(validate_jwt), db : AsyncSession = Depends(get_write_db)):
     user_id = int(user["sub"])
 
-    statement = select(Exercise).where(Exercise.name == exercise_data.name.lower(), Exercise.user_id == user_id)
-    existing_exercise = (await db.scalars(statement)).one_or_none()
+    # link to the global catalog when the name matches one of its entries
+    catalog_entry = (await get_catalog(db)).lookup(exercise_data.name)
+    exercise_name = catalog_entry.name if catalog_entry else exercise_data.name.lower()
+    catalog_id = catalog_entry.catalog_id if catalog_entry else None
+
+    if catalog_id is not None:
+        statement = select(Exercise).where(or_(Exercise.name == exercise_name, Exercise.catalog_id == catalog_id), Exercise.user_id == user_id)
+    else:
+        statement = select(Exercise).where(Exercise.name == exercise_name, Exercise.user_id == user_id)
+    existing_exercise = (await db.scalars(statement)).first()
 
     if existing_exercise:
         raise HTTPException(
@@ -139,7 +269,7 @@ async def create_exercise(exercise_data : ExerciseCreation, user : dict = Securi
             detail = "An exercise with this name already exists. You might want to edit it to make changes."
         )
 
-    new_exercise = Exercise(name = exercise_data.name.lower(), description = exercise_data.description, user_id = user_id)
+    new_exercise = Exercise(name = exercise_name, description = exercise_data.description, user_id = user_id, catalog_id = catalog_id)
 
     try:
         db.add(new_exercise)
@@ -158,24 +288,53 @@ async def create_exercise(exercise_data : ExerciseCreation, user : dict = Securi
             detail="A database error occurred."
         )
 
+    ownership_cache.add_exercise(user_id, new_exercise.exercise_id, new_exercise.catalog_id)
     return new_exercise
 
 # 2. READ all exercises for a user
 @app.get("/exercises", response_model = list[AllExercisesRetrievalResponse], openapi_extra = {"security" : [{"bearerAuth" : []}]})
-async def get_all_exercises_for_user(user : dict = Security(validate_jwt), db : AsyncSession = Depends(get_db)):
+async def get_all_exercises_for_user(user : dict = Security(validate_jwt), db : AsyncSession = Depends(get_read_db)):
     user_id = int(user["sub"])
 
-    statement = select(Exercise).where(Exercise.user_id == user_id)
+    statement = queries.exercises_for_user(user_id)
     all_exercises = (await db.scalars(statement)).all()
 
     return all_exercises
 
+# type-ahead search; registered before /exercises/{exercise_id} so "search" is not parsed as an id
+@app.get("/exercises/search", response_model = list[ExerciseSearchResponse], openapi_extra = {"security" : [{"bearerAuth" : []}]})
+async def search_exercises(q : str = Query(..., min_length = 1, max_length = 100, title = "Name prefix or fragment to search for."), limit : int = Query(DEFAULT_SEARCH_LIMIT, ge = 1, le = MAX_SEARCH_LIMIT), user : dict = Security(validate_jwt), db : AsyncSession = Depends(get_read_db)):
+    user_id = int(user["sub"])
+
+    if not q.strip():
+        return []
+
+    statement = exercise_search_statement(db.bind.dialect.name, user_id, q, limit)
+    user_rows = (await db.execute(statement)).all()
+
+    # catalog prefix matches are answered from the in-memory snapshot, not the database
+    catalog_entries = [] if len(user_rows) >= limit else (await get_catalog(db)).prefix_search(q, limit)
+
+    return merge_catalog_matches(user_rows, catalog_entries, limit)
+
+@app.get("/catalog/exercises", response_model = CatalogResponse, openapi_extra = {"security" : [{"bearerAuth" : []}]})
+async def get_exercise_catalog(response : Response, if_none_match : str | None = Header(None), user : dict = Security(validate_jwt), db : AsyncSession = Depends(get_db)):
+    catalog = await get_catalog(db)
+    etag = f'"{catalog.version}"'
+
+    # compressed responses carry the weak form of the same tag
+    if if_none_match in (etag, f"W/{etag}"):
+        return Response(status_code = status.HTTP_304_NOT_MODIFIED, headers = {"ETag" : etag})
+
+    response.headers["ETag"] = etag
+    return {"version" : catalog.version, "exercises" : sorted(catalog.by_id.values(), key = lambda entry : entry.name)}
+
 #3 READ exercise by exercise_id
 @app.get("/exercises/{exercise_id}", response_model = AllExercisesRetrievalResponse, openapi_extra = {"security" : [{"bearerAuth" : []}]})
-async def get_single_exercise(exercise_id : int = Path(..., title = "ID of exercise to retrieve."), user : dict = Security(validate_jwt), db : AsyncSession = Depends(get_db)):
+async def get_single_exercise(exercise_id : int = Path(..., title = "ID of exercise to retrieve."), user : dict = Security(validate_jwt), db : AsyncSession = Depends(get_read_db)):
     user_id = int(user["sub"])
 
-    by_id_stmt = select(Exercise).where(Exercise.exercise_id == exercise_id)
+    by_id_stmt = queries.exercise_by_id(exercise_id)
     exercise_obj = (await db.scalars(by_id_stmt)).one_or_none()
 
     if not exercise_obj:
@@ -192,11 +351,42 @@ async def get_single_exercise(exercise_id : int = Path(..., title = "ID of exerc
 
     return exercise_obj
 
+# progress chart data; at most `points` sessions however long the history is
+@app.get("/exercises/{exercise_id}/history", response_model = ExerciseHistoryResponse, openapi_extra = {"security" : [{"bearerAuth" : []}]})
+async def get_exercise_history(exercise_id : int = Path(..., title = "ID of exercise to chart."), from_date : date | None = Query(None, alias = "from"), to_date : date | None = Query(None, alias = "to"), points : int = Query(DEFAULT_HISTORY_POINTS, ge = 1, le = MAX_HISTORY_POINTS), user : dict = Security(validate_jwt), db : AsyncSession = Depends(get_read_db)):
+    user_id = int(user["sub"])
+
+    exercise_obj = (await db.scalars(queries.exercise_by_id(exercise_id))).one_or_none()
+
+    if not exercise_obj:
+        raise HTTPException(
+            status_code = status.HTTP_404_NOT_FOUND,
+            detail = "Exercise not found."
+        )
+
+    if exercise_obj.user_id != user_id:
+        raise HTTPException(
+            status_code = status.HTTP_403_FORBIDDEN,
+            detail = "Forbidden: you do not have permission to access this exercise."
+        )
+
+    statement = exercise_history_statement(db.bind.dialect.name, user_id, exercise_id, from_date, to_date, points)
+    rows = (await db.execute(statement)).all()
+    sessions_total = rows[0].sessions_total if rows else 0
+
+    return {
+        "exercise_id" : exercise_id,
+        "name" : exercise_obj.name,
+        "sessions_total" : sessions_total,
+        "downsampled" : sessions_total > len(rows),
+        "points" : rows
+    }
+
 #4 Update exercise
 @app.put("/exercises/{exercise_id}", response_model = AllExercisesRetrievalResponse, openapi_extra = {"security" : [{"bearerAuth" : []}]})
-async def edit_exercise(exercise_details : ExerciseCreation, exercise_id : int = Path(..., title = "ID of the exercise to be edited."), user : dict = Security(validate_jwt), db : AsyncSession = Depends(get_db)):
+async def edit_exercise(exercise_details : ExerciseCreation, exercise_id : int = Path(..., title = "ID of the exercise to be edited."), user : dict = Security(validate_jwt), db : AsyncSession = Depends(get_write_db)):
     user_id = int(user["sub"])
-    by_id_stmt = select(Exercise).where(Exercise.exercise_id == exercise_id)
+    by_id_stmt = queries.exercise_by_id(exercise_id)
     requested_exercise = (await db.scalars(by_id_stmt)).one_or_none()
 
     if not requested_exercise:
@@ -211,7 +401,9 @@ async def edit_exercise(exercise_details : ExerciseCreation, exercise_id : int =
             detail = "Forbidden: you do not have permission to modify this exercise."
         )
     
-    requested_exercise.name = exercise_details.name.lower()
+    catalog_entry = (await get_catalog(db)).lookup(exercise_details.name)
+    requested_exercise.name = catalog_entry.name if catalog_entry else exercise_details.name.lower()
+    requested_exercise.catalog_id = catalog_entry.catalog_id if catalog_entry else None
     requested_exercise.description = exercise_details.description
 
     try:
@@ -231,47 +423,56 @@ async def edit_exercise(exercise_details : ExerciseCreation, exercise_id : int =
             detail = "A database error occurred."
         )
 
+    # a rename may link the exercise to the catalog or unlink it
+    ownership_cache.add_exercise(user_id, exercise_id, requested_exercise.catalog_id)
     return requested_exercise
 
 #5 Delete exercise
 @app.delete("/exercises/{exercise_id}", status_code = status.HTTP_204_NO_CONTENT, openapi_extra = {"security" : [{"bearerAuth" : []}]})
-async def delete_exercise(*, exercise_id : int = Path(..., title = "ID of the exercise to be deleted."), user : dict = Security(validate_jwt), db : AsyncSession = Depends(get_db)):
+async def delete_exercise(*, exercise_id : int = Path(..., title = "ID of the exercise to be deleted."), cascade : bool = Query(False, description = "Also delete every set logged with this exercise."), user : dict = Security(validate_jwt), db : AsyncSession = Depends(get_write_db), directory_db : AsyncSession = Depends(get_db)):
     user_id = int(user["sub"])
-    by_id_stmt = select(Exercise).where(Exercise.exercise_id == exercise_id)
-    exercise_to_be_deleted = (await db.scalars(by_id_stmt)).one_or_none()
+    deleted_at = datetime.now(timezone.utc)
 
-    if not exercise_to_be_deleted:
+    try:
+        deleted_id = (await db.execute(queries.delete_exercise(exercise_id, user_id, cascade, deleted_at))).scalar_one_or_none()
+        if deleted_id is not None and cascade:
+            await db.execute(queries.delete_exercise_sets(exercise_id, deleted_at))
+        await db.commit()
+    except SQLAlchemyError:
+        await db.rollback()
+        raise HTTPException(
+            status_code = status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail = "A database error occurred."
+        )
+
+    if deleted_id is not None:
+        ownership_cache.remove_exercise(user_id, exercise_id)
+        if cascade:
+            await leaderboards.rebuild_member(db, directory_db, user_id)
+        return None
+
+    # nothing deleted: find out why, off the success path
+    exercise_obj = (await db.scalars(queries.exercise_by_id(exercise_id))).one_or_none()
+
+    if not exercise_obj:
         raise HTTPException(
             status_code = status.HTTP_404_NOT_FOUND,
             detail = "Exercise not found."
         )
 
-    if exercise_to_be_deleted.user_id != user_id:
+    if exercise_obj.user_id != user_id:
         raise HTTPException(
             status_code = status.HTTP_403_FORBIDDEN,
             detail = "Forbidden: you do not have permission to delete this exercise."
         )
 
-    try:
-        await db.delete(exercise_to_be_deleted)
-        await db.commit()
-    except IntegrityError:
-        await db.rollback()
-        raise HTTPException(
-            status_code = status.HTTP_400_BAD_REQUEST,
-            detail = "A database integrity error occurred.",
-        )
-    except SQLAlchemyError:
-        await db.rollback()
-        raise HTTPException(
-            status_code = status.HTTP_500_INTERNAL_SERVER_ERROR,
-            detail = "A database error occurred."
-        )
-    
-    return None
+    raise HTTPException(
+        status_code = status.HTTP_409_CONFLICT,
+        detail = "This exercise has logged sets. Delete with ?cascade=true to remove them as well."
+    )
 
 @app.post("/workouts", response_model = WorkoutResponse, openapi_extra = {"security": [{"bearerAuth" : []}]})
-async def create_workout(workout_data : WorkoutRequest, user : dict = Security(validate_jwt), db : AsyncSession = Depends(get_db)):
+async def create_workout(workout_data : WorkoutRequest, user : dict = Security(validate_jwt), db : AsyncSession = Depends(get_write_db)):
     user_id = int(user["sub"])
 
     new_workout = Workout(
@@ -279,6 +480,7 @@ async def create_workout(workout_data : WorkoutRequest, user : dict = Security(v
         description = workout_data.description,
         date = workout_data.date,
         start_time = workout_data.start_time, 
+        is_template = bool(workout_data.is_template),
         user_id = user_id
     )
 
@@ -298,23 +500,23 @@ async def create_workout(workout_data : WorkoutRequest, user : dict = Security(v
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
             detail="A database error occurred."
         )
-    
+
+    ownership_cache.add_workout(user_id, new_workout.workout_id, new_workout.is_template)
     return new_workout
 
 @app.get("/workouts", response_model = list[WorkoutResponse], openapi_extra = {"security" : [{"bearerAuth" : []}]})
-async def get_all_workouts_for_user(user : dict = Security(validate_jwt), db : AsyncSession = Depends(get_db)):
+async def get_all_workouts_for_user(from_date : date | None = Query(None, alias = "from"), to_date : date | None = Query(None, alias = "to"), template : bool = Query(False, description = "List templates instead of logged workouts."), user : dict = Security(validate_jwt), db : AsyncSession = Depends(get_read_db)):
     user_id = int(user["sub"])
 
-    statement = select(Workout).where(Workout.user_id == user_id)
-    all_workouts = (await db.scalars(statement)).all()
+    all_workouts = (await db.scalars(queries.workouts_for_user(user_id, from_date, to_date, template))).all()
 
     return all_workouts
 
 @app.get("/workouts/{workout_id}", response_model = WorkoutResponse, openapi_extra = {"security" : [{"bearerAuth" : []}]})
-async def get_single_workout(workout_id : int = Path(..., title = "ID of workout to retrieve."), user : dict = Security(validate_jwt), db : AsyncSession = Depends(get_db)):
+async def get_single_workout(workout_id : int = Path(..., title = "ID of workout to retrieve."), user : dict = Security(validate_jwt), db : AsyncSession = Depends(get_read_db)):
     user_id = int(user["sub"])
     # First check existence
-    by_id_stmt = select(Workout).where(Workout.workout_id == workout_id)
+    by_id_stmt = queries.workout_by_id(workout_id)
     requested_workout = (await db.scalars(by_id_stmt)).one_or_none()
 
     if not requested_workout:
@@ -332,9 +534,9 @@ async def get_single_workout(workout_id : int = Path(..., title = "ID of workout
     return requested_workout
 
 @app.put("/workouts/{workout_id}", response_model = WorkoutResponse, openapi_extra = {"security" : [{"bearerAuth" : []}]})
-async def edit_workout(workout_details : WorkoutRequest, workout_id : int = Path(..., title = "ID of the exercise to be edited."), user : dict = Security(validate_jwt), db : AsyncSession = Depends(get_db)):
+async def edit_workout(workout_details : WorkoutRequest, workout_id : int = Path(..., title = "ID of the exercise to be edited."), user : dict = Security(validate_jwt), db : AsyncSession = Depends(get_write_db), directory_db : AsyncSession = Depends(get_db)):
     user_id = int(user["sub"])
-    by_id_stmt = select(Workout).where(Workout.workout_id == workout_id)
+    by_id_stmt = queries.workout_by_id(workout_id)
     requested_workout = (await db.scalars(by_id_stmt)).one_or_none()
 
     if not requested_workout:
@@ -349,14 +551,25 @@ async def edit_workout(workout_details : WorkoutRequest, workout_id : int = Path
             detail = "Forbidden: you do not have permission to modify this workout."
         )
 
+    date_changed = requested_workout.date != workout_details.date
+    template_changed = workout_details.is_template is not None and requested_workout.is_template != workout_details.is_template
+
     requested_workout.name = workout_details.name
     requested_workout.description = workout_details.description
     requested_workout.date = workout_details.date
     requested_workout.start_time = workout_details.start_time
+    if workout_details.is_template is not None:
+        requested_workout.is_template = workout_details.is_template
 
     try:
         db.add(requested_workout)
+        if date_changed:
+            # keep the denormalized set dates in step with their workout
+            await db.execute(update(WorkoutExercise).where(WorkoutExercise.workout_id == workout_id).values(date = workout_details.date))
         await db.commit()
+        if date_changed or template_changed:
+            # a best's date, or whether the workout's sets count at all, may have changed
+            await leaderboards.rebuild_member(db, directory_db, user_id)
         await db.refresh(requested_workout)
     except IntegrityError:
         await db.rollback()
@@ -371,34 +584,59 @@ async def edit_workout(workout_details : WorkoutRequest, workout_id : int = Path
             detail = "A database error occurred."
         )
 
+    if template_changed:
+        ownership_cache.add_workout(user_id, workout_id, requested_workout.is_template)
     return requested_workout
 
 @app.delete("/workouts/{workout_id}", status_code = status.HTTP_204_NO_CONTENT, openapi_extra = {"security" : [{"bearerAuth" : []}]})
-async def delete_workout(*, workout_id : int = Path(..., title = "ID of the workout to be deleted."), user : dict = Security(validate_jwt), db : AsyncSession = Depends(get_db)):
+async def delete_workout(*, workout_id : int = Path(..., title = "ID of the workout to be deleted."), user : dict = Security(validate_jwt), db : AsyncSession = Depends(get_write_db), directory_db : AsyncSession = Depends(get_db)):
     user_id = int(user["sub"])
-    by_id_stmt = select(Workout).where(Workout.workout_id == workout_id)
-    workout_to_be_deleted = (await db.scalars(by_id_stmt)).one_or_none()
+    deleted_at = datetime.now(timezone.utc)
+
+    # two statements however many sets the workout has, without loading it or them first
+    try:
+        workout_date = (await db.execute(queries.delete_workout(workout_id, user_id, deleted_at))).scalar_one_or_none()
+        if workout_date is not None:
+            await db.execute(queries.delete_workout_sets(workout_id, workout_date, deleted_at))
+        await db.commit()
+    except SQLAlchemyError:
+        await db.rollback()
+        raise HTTPException(
+            status_code = status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail = "A database error occurred."
+        )
 
-    if not workout_to_be_deleted:
+    if workout_date is not None:
+        ownership_cache.remove_workout(user_id, workout_id)
+        await leaderboards.rebuild_member(db, directory_db, user_id)
+        return None
+
+    workout_obj = (await db.scalars(queries.workout_by_id(workout_id))).one_or_none()
+
+    if not workout_obj:
         raise HTTPException(
             status_code = status.HTTP_404_NOT_FOUND,
             detail = "Workout not found."
         )
 
-    if workout_to_be_deleted.user_id != user_id:
-        raise HTTPException(
-            status_code = status.HTTP_403_FORBIDDEN,
-            detail = "Forbidden: you do not have permission to delete this workout."
-        )
+    raise HTTPException(
+        status_code = status.HTTP_403_FORBIDDEN,
+        detail = "Forbidden: you do not have permission to delete this workout."
+    )
+
+@app.post("/workouts/{workout_id}/clone", response_model = WorkoutCloneResponse, openapi_extra = {"security" : [{"bearerAuth" : []}]})
+async def clone_workout_route(clone : WorkoutCloneRequest, workout_id : int = Path(..., title = "ID of the workout or template to copy."), user : dict = Security(validate_jwt), db : AsyncSession = Depends(get_write_db), directory_db : AsyncSession = Depends(get_db)):
+    user_id = int(user["sub"])
 
+    # copied inside the database; the ownership check is part of the statement
     try:
-        await db.delete(workout_to_be_deleted)
+        cloned = await clone_workout(db, workout_id, user_id, clone.date, clone.start_time, clone.name, clone.is_template, clone.weight_percent)
         await db.commit()
     except IntegrityError:
         await db.rollback()
         raise HTTPException(
             status_code = status.HTTP_400_BAD_REQUEST,
-            detail = "A database integrity error occurred.",
+            detail = "A database integrity error occurred."
         )
     except SQLAlchemyError:
         await db.rollback()
@@ -406,34 +644,82 @@ async def delete_workout(*, workout_id : int = Path(..., title = "ID of the work
             status_code = status.HTTP_500_INTERNAL_SERVER_ERROR,
             detail = "A database error occurred."
         )
-    
-    return status.HTTP_204_NO_CONTENT
 
-#Create Workout Exercise
-@app.post("/workoutexercises", response_model = WorkoutExerciseResponse, openapi_extra = {"security" : [{"bearerAuth" : []}]})
-async def create_workoutexercise(workout_exercise_data : WorkoutExerciseRequest, user : dict = Security(validate_jwt), db : AsyncSession = Depends(get_db)):
-    user_id = int(user["sub"])
-    # Ensure referenced Workout exists first (prioritize missing workout)
-    workout_obj = (await db.scalars(select(Workout).where(Workout.workout_id == workout_exercise_data.workout_id))).one_or_none()
+    if cloned is not None:
+        ownership_cache.add_workout(user_id, cloned["workout_id"], cloned["is_template"])
+        if not clone.is_template and cloned["sets_copied"]:
+            await leaderboards.rebuild_member(db, directory_db, user_id)
+        return cloned
+
+    workout_obj = (await db.scalars(queries.workout_by_id(workout_id))).one_or_none()
+
     if not workout_obj:
-        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Workout not found.")
-    if workout_obj.user_id != user_id:
-        raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="Forbidden: you cannot add sets to this workout.")
+        raise HTTPException(
+            status_code = status.HTTP_404_NOT_FOUND,
+            detail = "Workout not found."
+        )
 
-    # Ensure referenced Exercise exists
-    exercise_obj = (await db.scalars(select(Exercise).where(Exercise.exercise_id == workout_exercise_data.exercise_id))).one_or_none()
-    if not exercise_obj:
-        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Exercise not found.")
-    if exercise_obj.user_id != user_id:
-        raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="Forbidden: you cannot use this exercise.")
+    raise HTTPException(
+        status_code = status.HTTP_403_FORBIDDEN,
+        detail = "Forbidden: you do not have permission to copy this workout."
+    )
 
-    new_workout_exercise = WorkoutExercise(**workout_exercise_data.model_dump())
+#Create Workout Exercise
+@app.post("/workoutexercises", response_model = WorkoutExerciseResponse, openapi_extra = {"security" : [{"bearerAuth" : []}]})
+async def create_workoutexercise(workout_exercise_data : WorkoutExerciseRequest, user : dict = Security(validate_jwt), db : AsyncSession = Depends(get_write_db), directory_db : AsyncSession = Depends(get_db)):
+    user_id = int(user["sub"])
+    workout_id, exercise_id = workout_exercise_data.workout_id, workout_exercise_data.exercise_id
+
+    # ownership comes from the per-user cache; only ids it does not hold are looked up
+    owned = await ownership_cache.load(db, user_id)
+    if owned.owns_workout(workout_id):
+        is_template = owned.is_template(workout_id)
+    else:
+        # Ensure referenced Workout exists first (prioritize missing workout)
+        workout_obj = (await db.scalars(queries.workout_by_id(workout_id))).one_or_none()
+        if not workout_obj:
+            raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Workout not found.")
+        if workout_obj.user_id != user_id:
+            raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="Forbidden: you cannot add sets to this workout.")
+        is_template = workout_obj.is_template
+        owned.add_workout(workout_id, is_template)
+
+    if owned.owns_exercise(exercise_id):
+        catalog_id = owned.catalog_id(exercise_id)
+    else:
+        exercise_obj = (await db.scalars(queries.exercise_by_id(exercise_id))).one_or_none()
+        if not exercise_obj:
+            raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Exercise not found.")
+        if exercise_obj.user_id != user_id:
+            raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="Forbidden: you cannot use this exercise.")
+        catalog_id = exercise_obj.catalog_id
+        owned.add_exercise(exercise_id, catalog_id)
+
+    # one round trip: the INSERT checks the workout is still live and takes the set's date from it
+    insert_set = queries.insert_set(user_id, workout_id, exercise_id, workout_exercise_data.set_number, workout_exercise_data.weight, workout_exercise_data.reps)
 
     try:
-        db.add(new_workout_exercise)
+        try:
+            new_workout_exercise = (await db.scalars(insert_set)).one_or_none()
+        except IntegrityError:
+            await db.rollback()
+            # the key may belong to a deleted set, which gives way; a live one is a real duplicate
+            purged = await db.execute(queries.purge_deleted_set(workout_id, exercise_id, workout_exercise_data.set_number))
+            if not purged.rowcount:
+                raise
+            new_workout_exercise = (await db.scalars(insert_set)).one_or_none()
+        if new_workout_exercise is None:
+            await db.rollback()
+            # the cache vouched for a workout that has since been deleted, possibly by another process
+            ownership_cache.remove_workout(user_id, workout_id)
+            raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Workout not found.")
+        # read from the RETURNING row before the commit expires it
+        created = WorkoutExerciseResponse.model_validate(new_workout_exercise, from_attributes = True)
+        set_date = new_workout_exercise.date
         await db.commit()
-        await db.refresh(new_workout_exercise)
-        return new_workout_exercise
+        if catalog_id is not None and not is_template:
+            await leaderboards.record_sets(directory_db, user_id, [(catalog_id, created.weight, created.reps, set_date)])
+        return created
     except IntegrityError:
         await db.rollback()
         raise HTTPException(
@@ -447,29 +733,99 @@ async def create_workoutexercise(workout_exercise_data : WorkoutExerciseRequest,
             detail = "A database error occurred."
         )
 
+# Live workout session: authenticate and check ownership once, then stream sets over the socket
+@app.websocket("/ws/workouts/{workout_id}")
+async def live_workout(websocket : WebSocket, workout_id : int = Path(..., title = "ID of the workout being logged."), token : str | None = Query(None), db : AsyncSession = Depends(get_db)):
+    # browsers cannot set headers on a websocket, so the JWT may come as ?token=
+    if token is None:
+        scheme, _, credentials = websocket.headers.get("authorization", "").partition(" ")
+        token = credentials if scheme.lower() == "bearer" else None
+    payload = decode_jwt(token) if token else None
+    if not payload or revoked_users.is_revoked(int(payload["sub"])):
+        await websocket.close(code = status.WS_1008_POLICY_VIOLATION, reason = "Unauthorized access")
+        return
+    user_id = int(payload["sub"])
+
+    async with user_session(user_id, db) as session_db:
+        workout = (await session_db.scalars(queries.workout_by_id(workout_id))).one_or_none()
+        if not workout:
+            await websocket.close(code = status.WS_1008_POLICY_VIOLATION, reason = "Workout not found.")
+            return
+        if workout.user_id != user_id:
+            await websocket.close(code = status.WS_1008_POLICY_VIOLATION, reason = "Forbidden: you cannot add sets to this workout.")
+            return
+
+        live = await LiveWorkoutSession.open(session_db, user_id, workout, directory_db = db)
+        await websocket.accept()
+        # clients sending binary frames get msgpack replies
+        binary = False
+        try:
+            while True:
+                try:
+                    frame = await asyncio.wait_for(websocket.receive(), timeout = LIVE_FLUSH_SECONDS)
+                except asyncio.TimeoutError:
+                    replies = await live.flush()
+                else:
+                    if frame["type"] == "websocket.disconnect":
+                        raise WebSocketDisconnect(frame.get("code", 1000))
+                    binary = frame.get("bytes") is not None
+                    try:
+                        message = unpackb(frame["bytes"]) if binary else json.loads(frame["text"])
+                    except ValueError:
+                        message = None
+                    if not isinstance(message, dict):
+                        replies = [{"type" : "error", "detail" : "Expected a JSON object."}]
+                    elif message.get("type") == "flush":
+                        replies = await live.flush()
+                    else:
+                        replies = await live.add_set(message)
+
+                for reply in replies:
+                    if binary:
+                        await websocket.send_bytes(packb(reply))
+                    else:
+                        await websocket.send_json(reply)
+                if any(reply["type"] == "flushed" for reply in replies):
+                    replica_router.pin(user_id)
+                if live.workout_gone:
+                    # deleted by another client while the socket was open; no set can land in it now
+                    await websocket.close(code = status.WS_1008_POLICY_VIOLATION, reason = WORKOUT_GONE_DETAIL)
+                    return
+        except WebSocketDisconnect:
+            pass
+        finally:
+            # whatever is still buffered is written even though nobody is left to ack it
+            if live.buffered:
+                await live.flush()
+                replica_router.pin(user_id)
+
 # get all sets from a workout
-@app.get("/workouts/{workout_id}/sets", response_model = list[WorkoutExerciseResponse], openapi_extra={"security": [{"bearerAuth": []}]})
-async def get_all_sets_from_workout(workout_id: int = Path(..., title="ID of the workout to retrieve sets for."), user: dict = Security(validate_jwt), db: AsyncSession = Depends(get_db)):
+@app.get("/workouts/{workout_id}/sets", response_model = list[WorkoutExerciseResponse] | WorkoutExerciseColumns, openapi_extra={"security": [{"bearerAuth": []}]})
+async def get_all_sets_from_workout(workout_id: int = Path(..., title="ID of the workout to retrieve sets for."), shape : Literal["rows", "columns"] = Query("rows", title = "`columns` returns one array per field instead of one object per set."), user: dict = Security(validate_jwt), db: AsyncSession = Depends(get_read_db)):
     user_id = int(user["sub"])
 
-    workout = (await db.scalars(select(Workout).where(Workout.workout_id == workout_id))).one_or_none()
+    workout = (await db.scalars(queries.workout_by_id(workout_id))).one_or_none()
     if not workout:
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Workout not found.")
     if workout.user_id != user_id:
         raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="Forbidden: you do not have permission to access sets for this workout.")
 
-    sets_stmt = select(WorkoutExercise).where(WorkoutExercise.workout_id == workout_id)
-    sets = (await db.scalars(sets_stmt)).all()
+    sets = (await db.scalars(queries.sets_for_workout(workout_id, workout.date))).all()
 
+    if shape == "columns":
+        return {
+            "workout_id" : workout_id,
+            **{field : [getattr(row, field) for row in sets] for field in ("exercise_id", "set_number", "weight", "reps", "created_at", "updated_at")},
+        }
     return sets
     
     return None
 
 @app.get("/workouts/{workout_id}/sets/{exercise_id}/{set_number}", response_model = WorkoutExerciseResponse, openapi_extra={"security": [{"bearerAuth": []}]})
-async def get_single_set_from_workout(workout_id: int = Path(..., title="Workout ID"), exercise_id: int = Path(..., title="Exercise ID"), set_number: int = Path(..., title="Set number"), user: dict = Security(validate_jwt), db: AsyncSession = Depends(get_db)):
+async def get_single_set_from_workout(workout_id: int = Path(..., title="Workout ID"), exercise_id: int = Path(..., title="Exercise ID"), set_number: int = Path(..., title="Set number"), user: dict = Security(validate_jwt), db: AsyncSession = Depends(get_read_db)):
     user_id = int(user["sub"])
     # find set by composite key
-    stmt = select(WorkoutExercise).where(and_(WorkoutExercise.workout_id == workout_id, WorkoutExercise.exercise_id == exercise_id, WorkoutExercise.set_number == set_number))
+    stmt = queries.set_by_key(workout_id, exercise_id, set_number)
     requested_set = (await db.scalars(stmt)).one_or_none()
     if not requested_set:
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Set not found.")
@@ -481,9 +837,9 @@ async def get_single_set_from_workout(workout_id: int = Path(..., title="Workout
 
 
 @app.put("/workouts/{workout_id}/sets/{exercise_id}/{set_number}", response_model = WorkoutExerciseResponse, openapi_extra={"security": [{"bearerAuth": []}]})
-async def edit_set_from_workout(workout_id: int = Path(..., title="Workout ID"), exercise_id: int = Path(..., title="Exercise ID"), set_number: int = Path(..., title="Set number"), set_details: WorkoutExerciseRequest = None, user: dict = Security(validate_jwt), db: AsyncSession = Depends(get_db)):
+async def edit_set_from_workout(workout_id: int = Path(..., title="Workout ID"), exercise_id: int = Path(..., title="Exercise ID"), set_number: int = Path(..., title="Set number"), set_details: WorkoutExerciseRequest = None, user: dict = Security(validate_jwt), db: AsyncSession = Depends(get_write_db), directory_db: AsyncSession = Depends(get_db)):
     user_id = int(user["sub"])
-    stmt = select(WorkoutExercise).where(and_(WorkoutExercise.workout_id == workout_id, WorkoutExercise.exercise_id == exercise_id, WorkoutExercise.set_number == set_number))
+    stmt = queries.set_by_key(workout_id, exercise_id, set_number)
     requested_set = (await db.scalars(stmt)).one_or_none()
     if not requested_set:
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Set not found.")
@@ -498,6 +854,8 @@ async def edit_set_from_workout(workout_id: int = Path(..., title="Workout ID"),
     try:
         db.add(requested_set)
         await db.commit()
+        # a lower weight can lower the member's best, which an upsert cannot
+        await leaderboards.rebuild_member(db, directory_db, user_id)
         await db.refresh(requested_set)
     except IntegrityError:
         await db.rollback()
@@ -516,50 +874,129 @@ async def edit_set_from_workout(workout_id: int = Path(..., title="Workout ID"),
 
 
 @app.delete("/workouts/{workout_id}/sets/{exercise_id}/{set_number}", status_code=status.HTTP_204_NO_CONTENT, openapi_extra={"security": [{"bearerAuth": []}]})
-async def delete_set_from_workout(workout_id: int = Path(..., title="Workout ID"), exercise_id: int = Path(..., title="Exercise ID"), set_number: int = Path(..., title="Set number"), user: dict = Security(validate_jwt), db: AsyncSession = Depends(get_db)):
+async def delete_set_from_workout(workout_id: int = Path(..., title="Workout ID"), exercise_id: int = Path(..., title="Exercise ID"), set_number: int = Path(..., title="Set number"), user: dict = Security(validate_jwt), db: AsyncSession = Depends(get_write_db), directory_db: AsyncSession = Depends(get_db)):
     user_id = int(user["sub"])
 
-    stmt = select(WorkoutExercise).where(and_(WorkoutExercise.workout_id == workout_id, WorkoutExercise.exercise_id == exercise_id, WorkoutExercise.set_number == set_number))
-    set_to_delete = (await db.scalars(stmt)).one_or_none()
-
-    if not set_to_delete:
-        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Set not found.")
-    if set_to_delete.workout.user_id != user_id:
-        raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="Forbidden: you do not have permission to delete this set.")
-
     try:
-        await db.delete(set_to_delete)
+        deleted = (await db.execute(queries.delete_set(workout_id, exercise_id, set_number, user_id, datetime.now(timezone.utc)))).scalar_one_or_none()
         await db.commit()
-    except IntegrityError:
+    except SQLAlchemyError:
         await db.rollback()
         raise HTTPException(
-            status_code = status.HTTP_400_BAD_REQUEST,
-            detail = "A database integrity error occurred.",
+            status_code = status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail = "A database error occurred."
         )
+
+    if deleted is not None:
+        await leaderboards.rebuild_member(db, directory_db, user_id)
+        return None
+
+    set_obj = (await db.scalars(queries.set_by_key(workout_id, exercise_id, set_number))).one_or_none()
+    if not set_obj:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Set not found.")
+    raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="Forbidden: you do not have permission to delete this set.")
+
+
+@app.get("/prs", response_model = list[PRResponse], openapi_extra={"security": [{"bearerAuth": []}]})
+async def return_prs(from_date : date | None = Query(None, alias = "from"), to_date : date | None = Query(None, alias = "to"), user: dict = Security(validate_jwt), db: AsyncSession = Depends(get_read_db)):
+    user_id = int(user["sub"])
+
+    results = (await db.execute(queries.prs_for_user(user_id, from_date, to_date))).all()
+
+    return [PRResponse.model_validate(row, from_attributes = True) for row in results]
+
+
+
+# Leaderboards:-
+@app.put("/me/leaderboards", response_model = LeaderboardMembershipResponse, openapi_extra = {"security" : [{"bearerAuth" : []}]})
+async def set_leaderboard_membership(membership : LeaderboardMembershipRequest, user : dict = Security(validate_jwt), db : AsyncSession = Depends(get_write_db), directory_db : AsyncSession = Depends(get_db)):
+    user_id = int(user["sub"])
+
+    try:
+        if membership.enabled:
+            await directory_db.execute(update(User).where(User.id == user_id).values(leaderboard_opt_in = True))
+        else:
+            await leaderboards.leave(directory_db, user_id)
+        await directory_db.commit()
     except SQLAlchemyError:
-        await db.rollback()
+        await directory_db.rollback()
         raise HTTPException(
             status_code = status.HTTP_500_INTERNAL_SERVER_ERROR,
             detail = "A database error occurred."
         )
 
-    return None
+    if not membership.enabled:
+        leaderboards.forget_member(user_id)
+        return {"enabled" : False, "boards" : 0}
 
+    # joining ranks the sets already logged
+    boards = await leaderboards.rebuild_member(db, directory_db, user_id)
+    if boards is None:
+        raise HTTPException(
+            status_code = status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail = "A database error occurred."
+        )
+    return {"enabled" : True, "boards" : boards}
 
-@app.get("/prs", response_model = list[PRResponse], openapi_extra={"security": [{"bearerAuth": []}]})
-async def return_prs(user: dict = Security(validate_jwt), db: AsyncSession = Depends(get_db)):
+@app.get("/leaderboards/{exercise}", response_model = LeaderboardResponse, openapi_extra = {"security" : [{"bearerAuth" : []}]})
+async def get_leaderboard(exercise : str = Path(..., title = "Catalog ID or name of the exercise."), around : Literal["me"] | None = Query(None, description = "Center the page on the caller's own rank."), limit : int = Query(DEFAULT_LEADERBOARD_LIMIT, ge = 1, le = MAX_LEADERBOARD_LIMIT), offset : int = Query(0, ge = 0), user : dict = Security(validate_jwt), db : AsyncSession = Depends(get_db)):
     user_id = int(user["sub"])
 
-    statement = (
-        select(Exercise.name, func.max(WorkoutExercise.weight).label("weight"))
-        .join(Exercise)
-        .join(Workout)
-        .where(Workout.user_id == user_id)
-        .group_by(Exercise.exercise_id, Exercise.name)
-    )
+    catalog = await get_catalog(db)
+    catalog_entry = catalog.by_id.get(int(exercise)) if exercise.isdecimal() else catalog.lookup(exercise)
+    if not catalog_entry:
+        raise HTTPException(
+            status_code = status.HTTP_404_NOT_FOUND,
+            detail = "Exercise not found in the catalog."
+        )
 
-    results = (await db.execute(statement)).all()
+    try:
+        board = await leaderboard_cache.board(db, catalog_entry.catalog_id)
+    except SQLAlchemyError:
+        raise HTTPException(
+            status_code = status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail = "A database error occurred."
+        )
 
-    return [PRResponse.model_validate(row, from_attributes = True) for row in results]
+    # ranks and pages come from the cached skip list, O(log n) whatever the board's size
+    rank = board.rank(user_id)
+    start = offset
+    if around == "me" and rank is not None:
+        start = max(0, min(rank - 1 - limit // 2, len(board) - limit))
 
+    return {
+        "catalog_id" : catalog_entry.catalog_id,
+        "name" : catalog_entry.name,
+        "members" : len(board),
+        "rank" : rank,
+        "entries" : [{"rank" : place, **entry._asdict()} for place, entry in board.page(start, limit)],
+    }
+
+# Diagnostics (ADMIN_USER_IDS only):-
+@app.get("/debug/slow-queries", response_model = SlowQueryLogResponse, openapi_extra = {"security" : [{"bearerAuth" : []}]})
+async def get_slow_queries(admin : dict = Security(require_admin)):
+    return {
+        "enabled" : slow_query_log.enabled,
+        "threshold_ms" : slow_query_log.threshold_ms,
+        "explain_rate" : slow_query_log.explain_rate,
+        "queries" : slow_query_log.snapshot(),
+    }
 
+@app.get("/debug/profile", response_class = Response, openapi_extra = {"security" : [{"bearerAuth" : []}]})
+async def profile_worker(seconds : float = Query(10, gt = 0, le = PROFILE_MAX_SECONDS, description = "How long to sample this worker for."), admin : dict = Security(require_admin)):
+    if profiler.running:
+        raise HTTPException(
+            status_code = status.HTTP_409_CONFLICT,
+            detail = "A profile is already running in this worker."
+        )
+
+    profile = await profiler.profile(seconds)
+    return Response(
+        content = collapsed(profile),
+        media_type = "text/plain",
+        headers = {
+            "Content-Disposition" : f'attachment; filename="profile-{os.getpid()}.collapsed"',
+            "X-Profile-Samples" : str(profile.samples),
+            "X-Profile-Overhead" : f"{profile.overhead:.4f}",
+        }
+    )
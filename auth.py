@@ -1,25 +1,18 @@
 from config import JWT_SECRET_KEY
-import bcrypt
+import asyncio
+import logging
+import os
+import time
+from collections import OrderedDict
 
 from datetime import datetime, timedelta, timezone
-from jose import jwt, exceptions
+# jose (which pulls in cryptography) is imported on first use to keep worker startup fast; password hashing lives in passwords.py
 from fastapi import Depends, HTTPException, status
 from fastapi.security import HTTPBearer
 
-#bcrypt password hashing and checking functions
-def passlib_hash_password(password : str) -> str:
-    hashed_password = bcrypt.hashpw(password.encode("utf-8"), bcrypt.gensalt())
-    return hashed_password.decode("utf-8")
-
-
-def verify_password(password : str, hashed_password : str) -> bool:
-    password_bytes = password.encode("utf-8")
-    hashed_password_bytes = hashed_password.encode("utf-8")
-    return bcrypt.checkpw(password_bytes, hashed_password_bytes)
-
-
 #JWT token functions
 def create_jwt(payload : dict, expires_delta : timedelta | None = None) -> str:
+    from jose import jwt
     to_encode = payload.copy()
     if expires_delta:
         expire = datetime.now(timezone.utc) + expires_delta
@@ -29,6 +22,7 @@ def create_jwt(payload : dict, expires_delta : timedelta | None = None) -> str:
     return encoded_jwt
 
 def decode_jwt(token : str) -> dict:
+    from jose import jwt, exceptions
     try:
         payload = jwt.decode(token, JWT_SECRET_KEY, algorithms = ["HS256"])
         return payload
@@ -42,14 +36,130 @@ def decode_jwt(token : str) -> dict:
         print("Error : An unexpected error occured ->", e)
         return None
 
+class TokenSubjectCache:
+    """LRU of already-verified tokens -> `sub`, so per-request middleware avoids re-checking signatures.
+
+    Entries expire with the token's `exp`. Tokens that fail verification are remembered as
+    None for `negative_seconds` so garbage tokens cannot force a decode on every request.
+    """
+
+    def __init__(self, max_size : int = 4096, negative_seconds : float = 60.0):
+        self.max_size = max_size
+        self.negative_seconds = negative_seconds
+        self._entries : OrderedDict[str, tuple[str | None, float]] = OrderedDict()
+
+    def subject(self, token : str) -> str | None:
+        now = time.time()
+        entry = self._entries.get(token)
+        if entry is not None and entry[1] > now:
+            self._entries.move_to_end(token)
+            return entry[0]
+
+        payload = decode_jwt(token)
+        if payload and payload.get("sub") is not None:
+            entry = (str(payload["sub"]), float(payload.get("exp", now + 3600)))
+        else:
+            entry = (None, now + self.negative_seconds)
+        self._entries[token] = entry
+        self._entries.move_to_end(token)
+        if len(self._entries) > self.max_size:
+            self._entries.popitem(last = False)
+        return entry[0]
+
+    def clear(self):
+        self._entries.clear()
+
+
+token_subjects = TokenSubjectCache()
+
+# how often each process reloads the deleted accounts; 0 disables the reload
+REVOCATION_REFRESH_SECONDS = float(os.getenv('REVOCATION_REFRESH_SECONDS', '5'))
+
+logger = logging.getLogger(__name__)
+
+
+class RevokedUsers:
+    """Deleted accounts, whose unexpired tokens must stop working.
+
+    DELETE /me only stamps users.deleted_at, and the purge waits out the token lifetime
+    before removing the row, so the accounts with deleted_at set are exactly the ones
+    whose tokens may still be live. Each process keeps their ids in memory, reloaded
+    every REVOCATION_REFRESH_SECONDS by a task on the event loop, and checks them without
+    a query on every request. The process that served the deletion revokes at once;
+    the others within one refresh.
+    """
+
+    def __init__(self, interval : float = REVOCATION_REFRESH_SECONDS):
+        self.interval = interval
+        self._ids : frozenset[int] = frozenset()
+        # revoked here since the last reload
+        self._local : set[int] = set()
+        self._task = None
+
+    def revoke(self, user_id : int):
+        self._local.add(user_id)
+
+    def is_revoked(self, user_id : int) -> bool:
+        return user_id in self._ids or user_id in self._local
+
+    async def refresh(self, session_factory):
+        from sqlalchemy import select
+        from models.user import User
+        async with session_factory() as db:
+            ids = frozenset((await db.scalars(select(User.id).where(User.deleted_at.is_not(None)))).all())
+        self._ids = ids
+        self._local -= ids
+
+    def start(self, session_factory):
+        if self._task is None:
+            self._task = asyncio.create_task(self._run(session_factory))
+
+    async def stop(self):
+        if self._task is None:
+            return
+        self._task.cancel()
+        try:
+            await self._task
+        except asyncio.CancelledError:
+            pass
+        self._task = None
+
+    async def _run(self, session_factory):
+        from sqlalchemy.exc import SQLAlchemyError
+        while True:
+            try:
+                await self.refresh(session_factory)
+            except (SQLAlchemyError, OSError) as e:
+                # keep the ids from the last reload
+                logger.warning("could not reload deleted accounts: %s", e)
+            await asyncio.sleep(self.interval)
+
+    def clear(self):
+        self._ids = frozenset()
+        self._local.clear()
+
+
+revoked_users = RevokedUsers()
+
 security = HTTPBearer()
 def validate_jwt(credentials = Depends(security)):
     token = credentials.credentials
     payload = decode_jwt(token)
-    if payload:
+    if payload and not revoked_users.is_revoked(int(payload["sub"])):
         return payload
     else:
         raise HTTPException(
             status_code = status.HTTP_401_UNAUTHORIZED,
             detail = "Unauthorized access"
-        )
\ No newline at end of file
+        )
+
+# comma-separated user ids allowed on the /debug endpoints
+ADMIN_USER_IDS = frozenset(int(user_id) for user_id in os.getenv('ADMIN_USER_IDS', '').split(',') if user_id.strip())
+
+def require_admin(payload = Depends(validate_jwt)):
+    if int(payload["sub"]) not in ADMIN_USER_IDS:
+        raise HTTPException(
+            status_code = status.HTTP_403_FORBIDDEN,
+            detail = "Forbidden: admin only."
+        )
+    return payload
@@ -0,0 +1,107 @@
+"""Bandwidth vs CPU for response compression on realistic list payloads.
+
+    python benchmarks/compression_bench.py [--repeat 50]
+
+Payloads are rendered the way the API renders them (response models, then compact JSON),
+for a small, typical and heavy user. For each payload it prints the identity size and, per
+codec/level, the compressed size, ratio and median compression time.
+"""
+import argparse
+import gzip
+import json
+import os
+import random
+import statistics
+import sys
+import time
+from datetime import date, datetime, timedelta, timezone
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from schemas import WorkoutResponse, AllExercisesRetrievalResponse, WorkoutExerciseResponse, WorkoutExerciseColumns  # noqa: E402
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+CODECS = [("gzip", level) for level in (1, 5, 9)] + ([("br", quality) for quality in (1, 4, 6, 11)] if brotli else [])
+EXERCISE_NAMES = ["bench press", "squat", "deadlift", "overhead press", "barbell row", "pull up", "dip", "lunge", "leg press", "bicep curl"]
+
+
+def render(payload) -> bytes:
+    # same settings as starlette's JSONResponse
+    return json.dumps(payload, ensure_ascii = False, allow_nan = False, indent = None, separators = (",", ":")).encode("utf-8")
+
+
+def sets_payload(n_sets : int, rng : random.Random) -> list[dict]:
+    created = datetime(2024, 3, 1, 9, 0, tzinfo = timezone.utc)
+    rows = []
+    for i in range(n_sets):
+        stamp = created + timedelta(seconds = 90 * i + rng.randint(0, 30))
+        rows.append(WorkoutExerciseResponse(workout_id = 812, exercise_id = 40 + i // 5, set_number = i % 5 + 1, weight = rng.randint(40, 160), reps = rng.randint(3, 12), created_at = stamp, updated_at = stamp).model_dump(mode = "json"))
+    return rows
+
+
+def columns_payload(rows : list[dict]) -> dict:
+    fields = ("exercise_id", "set_number", "weight", "reps", "created_at", "updated_at")
+    return WorkoutExerciseColumns(workout_id = rows[0]["workout_id"], **{field : [row[field] for row in rows] for field in fields}).model_dump(mode = "json")
+
+
+def workouts_payload(n_workouts : int, rng : random.Random) -> list[dict]:
+    today = date(2024, 6, 1)
+    rows = []
+    for i in range(n_workouts):
+        day = today - timedelta(days = int(i * 7 / 3))
+        start = datetime(day.year, day.month, day.day, 18, 0, tzinfo = timezone.utc)
+        rows.append(WorkoutResponse(workout_id = 10000 + i, name = f"Session {n_workouts - i}", description = rng.choice(["", "felt strong", "deload week"]), date = day, start_time = start, created_at = start, updated_at = start, user_id = 77).model_dump(mode = "json"))
+    return rows
+
+
+def exercises_payload(rng : random.Random) -> list[dict]:
+    stamp = datetime(2024, 1, 5, 12, 0, tzinfo = timezone.utc)
+    return [AllExercisesRetrievalResponse(exercise_id = 40 + i, name = name, description = "", catalog_id = i + 1, created_at = stamp + timedelta(minutes = rng.randint(0, 600)), updated_at = stamp).model_dump(mode = "json") for i, name in enumerate(EXERCISE_NAMES)]
+
+
+def compress(body : bytes, codec : str, level : int) -> bytes:
+    if codec == "br":
+        return brotli.compress(body, quality = level, mode = brotli.MODE_TEXT)
+    return gzip.compress(body, compresslevel = level, mtime = 0)
+
+
+def measure(body : bytes, codec : str, level : int, repeat : int) -> tuple[int, float]:
+    timings = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        out = compress(body, codec, level)
+        timings.append(time.perf_counter() - started)
+    return len(out), statistics.median(timings)
+
+
+def main(argv = None):
+    parser = argparse.ArgumentParser(description = "Compression benchmark for list payloads.")
+    parser.add_argument("--repeat", type = int, default = 50)
+    args = parser.parse_args(argv)
+    rng = random.Random(7)
+
+    sets_small, sets_large = sets_payload(6, rng), sets_payload(120, rng)
+    payloads = [
+        ("exercises (10)", render(exercises_payload(rng))),
+        ("workouts (20)", render(workouts_payload(20, rng))),
+        ("workouts (600)", render(workouts_payload(600, rng))),
+        ("sets rows (6)", render(sets_small)),
+        ("sets rows (120)", render(sets_large)),
+        ("sets columns (120)", render(columns_payload(sets_large))),
+    ]
+
+    print(f"{'payload':<20}{'identity':>10}  " + "  ".join(f"{codec}-{level:<2}{'':>15}" for codec, level in CODECS))
+    for name, body in payloads:
+        cells = []
+        for codec, level in CODECS:
+            size, seconds = measure(body, codec, level, args.repeat)
+            cells.append(f"{size:>6}B {size / len(body):>4.0%} {seconds * 1e6:>6.0f}us")
+        print(f"{name:<20}{len(body):>9}B  " + "  ".join(cells))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,86 @@
+"""Login throughput and tail latency per password backend and executor size.
+
+    python benchmarks/password_bench.py [--logins 200] [--concurrency 50] [--workers 1 2 4 8]
+
+Each case fires `--logins` verifications at PasswordHasher with at most `--concurrency` in
+flight, the way a login burst arrives, and reports verifications per second with p50/p99
+latency as seen by the awaiting request. "threadpool" is the previous approach
+(starlette's run_in_threadpool on the shared AnyIO pool) for comparison. Backend costs come
+from the same settings the API uses (BCRYPT_ROUNDS, ARGON2_*), so results track production.
+Threads only help up to the number of cores: compare against `nproc`.
+"""
+import argparse
+import asyncio
+import os
+import statistics
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from starlette.concurrency import run_in_threadpool  # noqa: E402
+from passwords import PasswordHasher, BACKENDS  # noqa: E402
+
+
+async def _burst(verify, logins : int, concurrency : int) -> tuple[float, list[float]]:
+    gate = asyncio.Semaphore(concurrency)
+    latencies = []
+
+    async def login():
+        async with gate:
+            started = time.perf_counter()
+            assert await verify()
+            latencies.append(time.perf_counter() - started)
+
+    started = time.perf_counter()
+    await asyncio.gather(*(login() for _ in range(logins)))
+    return time.perf_counter() - started, latencies
+
+
+def _report(label : str, elapsed : float, latencies : list[float]):
+    p99 = statistics.quantiles(latencies, n = 100)[98]
+    print(f"  {label:<16} {len(latencies) / elapsed:8.1f} /s   p50 {statistics.median(latencies) * 1000:7.1f} ms   p99 {p99 * 1000:7.1f} ms")
+
+
+async def bench_backend(name : str, logins : int, concurrency : int, worker_counts : list[int]):
+    try:
+        backend = BACKENDS[name]()
+    except RuntimeError as e:
+        print(f"{name}: skipped ({e})")
+        return
+    # distinct passwords, so the batch deduplication does not flatter the numbers
+    passwords = [f"password-{i}" for i in range(32)]
+    hashes = [backend.hash(password) for password in passwords]
+    print(f"{name}:")
+
+    counter = iter(range(10 ** 9))
+
+    def pair():
+        i = next(counter) % len(passwords)
+        return passwords[i], hashes[i]
+
+    elapsed, latencies = await _burst(lambda: run_in_threadpool(backend.verify, *pair()), logins, concurrency)
+    _report("threadpool", elapsed, latencies)
+
+    for workers in worker_counts:
+        hasher = PasswordHasher(name, workers = workers, backends = {name : backend})
+        elapsed, latencies = await _burst(lambda: hasher.verify(*pair()), logins, concurrency)
+        hasher.close()
+        _report(f"hasher x{workers}", elapsed, latencies)
+
+
+def main(argv = None):
+    parser = argparse.ArgumentParser(description = "Password hashing backend benchmark.")
+    parser.add_argument("--logins", type = int, default = 200)
+    parser.add_argument("--concurrency", type = int, default = 50)
+    parser.add_argument("--workers", type = int, nargs = "+", default = [1, 2, 4, 8])
+    parser.add_argument("--backends", nargs = "+", default = list(BACKENDS))
+    args = parser.parse_args(argv)
+
+    print(f"{args.logins} logins, {args.concurrency} in flight, {os.cpu_count()} CPUs")
+    for name in args.backends:
+        asyncio.run(bench_backend(name, args.logins, args.concurrency, args.workers))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,119 @@
+"""Cold-start cost of an API worker.
+
+    python benchmarks/startup_bench.py [--runs 5] [--top 15] [--uvicorn]
+
+Each run starts a fresh interpreter that imports `app`, runs the lifespan startup and
+serves `GET /` through ASGI, reporting the import time, the time to that first response
+and which of the lazily imported modules got loaded. `python -X importtime` then lists the
+slowest imports by cumulative time. `--uvicorn` also times a real `uvicorn app:app` process
+from spawn to its first HTTP 200.
+
+tests/test_startup.py enforces the budgets below.
+"""
+import argparse
+import json
+import os
+import re
+import socket
+import statistics
+import subprocess
+import sys
+import time
+import urllib.request
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+IMPORT_BUDGET_SECONDS = 2.0
+FIRST_RESPONSE_BUDGET_SECONDS = 2.5
+# must not be imported until a request needs them
+LAZY_MODULES = ("asyncpg", "jose", "cryptography", "bcrypt")
+
+PROBE = """
+import asyncio, json, sys, time
+started = time.perf_counter()
+import app
+imported = time.perf_counter()
+loaded = [m for m in %r if m in sys.modules]
+
+async def first_response():
+    messages = []
+    scope = {"type": "http", "asgi": {"version": "3.0"}, "http_version": "1.1", "method": "GET", "scheme": "http",
+             "path": "/", "raw_path": b"/", "query_string": b"", "root_path": "", "headers": [], "client": ("127.0.0.1", 1), "server": ("127.0.0.1", 80)}
+    async def receive():
+        return {"type": "http.request", "body": b"", "more_body": False}
+    async def send(message):
+        messages.append(message)
+    async with app.app.router.lifespan_context(app.app):
+        await app.app(scope, receive, send)
+        return messages[0]["status"]
+
+status = asyncio.run(first_response())
+print(json.dumps({"import_s": imported - started, "first_response_s": time.perf_counter() - started, "status": status, "loaded": loaded}))
+""" % (LAZY_MODULES,)
+
+
+def run_probe() -> dict:
+    out = subprocess.run([sys.executable, "-c", PROBE], cwd = ROOT, capture_output = True, text = True, check = True)
+    return json.loads(out.stdout.strip().splitlines()[-1])
+
+
+def _importtime(code : str) -> list[tuple[int, int, str]]:
+    out = subprocess.run([sys.executable, "-X", "importtime", "-c", code], cwd = ROOT, capture_output = True, text = True, check = True)
+    rows = []
+    for line in out.stderr.splitlines():
+        match = re.match(r"import time:\s+\d+ \|\s+(\d+) \|( *)(\S+)", line)
+        if match:
+            rows.append((int(match.group(1)), len(match.group(2)), match.group(3)))
+    return rows
+
+
+def slowest_imports(top : int) -> list[tuple[float, str]]:
+    # skip what the bare interpreter imports anyway (site, .pth hooks)
+    baseline = {name for _, _, name in _importtime("pass")}
+    rows = [(micros / 1e6, name) for micros, depth, name in _importtime("import app") if depth <= 3 and name not in baseline]
+    return sorted(rows, reverse = True)[:top]
+
+
+def uvicorn_first_response(timeout : float = 30.0) -> float:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        port = s.getsockname()[1]
+    started = time.perf_counter()
+    server = subprocess.Popen([sys.executable, "-m", "uvicorn", "app:app", "--port", str(port), "--log-level", "warning"], cwd = ROOT)
+    try:
+        while time.perf_counter() - started < timeout:
+            try:
+                with urllib.request.urlopen(f"http://127.0.0.1:{port}/", timeout = 1) as response:
+                    if response.status == 200:
+                        return time.perf_counter() - started
+            except OSError:
+                time.sleep(0.01)
+        raise TimeoutError("uvicorn did not answer in time")
+    finally:
+        server.terminate()
+        server.wait()
+
+
+def main(argv = None):
+    parser = argparse.ArgumentParser(description = "Startup benchmark for the API worker.")
+    parser.add_argument("--runs", type = int, default = 5)
+    parser.add_argument("--top", type = int, default = 15)
+    parser.add_argument("--uvicorn", action = "store_true")
+    args = parser.parse_args(argv)
+
+    probes = [run_probe() for _ in range(args.runs)]
+    import_s = statistics.median(p["import_s"] for p in probes)
+    first_s = statistics.median(p["first_response_s"] for p in probes)
+    print(f"import app:            {import_s * 1000:7.0f} ms (budget {IMPORT_BUDGET_SECONDS * 1000:.0f} ms)")
+    print(f"first response (ASGI): {first_s * 1000:7.0f} ms (budget {FIRST_RESPONSE_BUDGET_SECONDS * 1000:.0f} ms)")
+    print(f"lazy modules loaded by the import: {probes[-1]['loaded'] or 'none'}")
+    if args.uvicorn:
+        print(f"first response (uvicorn, from spawn): {uvicorn_first_response() * 1000:.0f} ms")
+
+    print("\nslowest imports under `import app` (cumulative):")
+    for seconds, module in slowest_imports(args.top):
+        print(f"  {seconds * 1000:7.1f} ms  {module}")
+
+
+if __name__ == "__main__":
+    main()
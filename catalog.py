@@ -0,0 +1,80 @@
+import asyncio
+import hashlib
+from bisect import bisect_left
+from collections import namedtuple
+from types import MappingProxyType
+from sqlalchemy import select
+from models.catalog_exercise import CatalogExercise
+
+CatalogEntry = namedtuple("CatalogEntry", ["catalog_id", "name", "description"])
+
+
+def normalize_name(name : str) -> str:
+    # same normalization the catalog migration uses: lowercase, single spaces
+    return " ".join(name.lower().split())
+
+
+class CatalogSnapshot:
+    """Immutable, process-wide view of the global exercise catalog.
+
+    `version` is a digest of the loaded rows, so clients and caches can tell
+    whether two workers are serving the same catalog.
+    """
+
+    __slots__ = ("version", "by_id", "by_name", "_sorted_names")
+
+    def __init__(self, entries : list[CatalogEntry]):
+        self.by_id = MappingProxyType({entry.catalog_id : entry for entry in entries})
+        self.by_name = MappingProxyType({entry.name : entry for entry in entries})
+        self._sorted_names = tuple(sorted(self.by_name))
+
+        digest = hashlib.sha1()
+        for entry in sorted(entries):
+            digest.update(repr(tuple(entry)).encode("utf-8"))
+        self.version = digest.hexdigest()[:16]
+
+    def __len__(self):
+        return len(self.by_id)
+
+    def lookup(self, name : str) -> CatalogEntry | None:
+        return self.by_name.get(normalize_name(name))
+
+    def prefix_search(self, prefix : str, limit : int) -> list[CatalogEntry]:
+        prefix = normalize_name(prefix)
+        matches = []
+        index = bisect_left(self._sorted_names, prefix)
+        while index < len(self._sorted_names) and len(matches) < limit:
+            name = self._sorted_names[index]
+            if not name.startswith(prefix):
+                break
+            matches.append(self.by_name[name])
+            index += 1
+        return matches
+
+
+_snapshot : CatalogSnapshot | None = None
+_load_lock = asyncio.Lock()
+
+
+async def load_catalog(db) -> CatalogSnapshot:
+    statement = select(CatalogExercise.catalog_id, CatalogExercise.name, CatalogExercise.description)
+    rows = (await db.execute(statement)).all()
+    return CatalogSnapshot([CatalogEntry(*row) for row in rows])
+
+
+async def get_catalog(db) -> CatalogSnapshot:
+    """Return the cached snapshot, loading it with `db` on first use in this process."""
+    global _snapshot
+    if _snapshot is not None:
+        return _snapshot
+
+    async with _load_lock:
+        if _snapshot is None:
+            _snapshot = await load_catalog(db)
+    return _snapshot
+
+
+def reset_catalog():
+    # the catalog is read-only at runtime; this is for tests and for a reload after reseeding
+    global _snapshot
+    _snapshot = None
@@ -0,0 +1,73 @@
+"""Copying a workout and its sets inside the database.
+
+POST /workouts/{id}/clone never loads the source rows into Python. On PostgreSQL it is one
+statement: a data-modifying CTE inserts the new workout with INSERT ... SELECT from the
+source, a second one copies the source's sets under the new workout's id, and the outer
+SELECT returns the new workout with the number of sets copied, so cloning a 40-set routine
+costs one round trip. Other dialects (SQLite in the tests) have no data-modifying CTEs and
+run the two INSERT ... SELECTs as separate statements in the same transaction.
+"""
+from datetime import date, datetime
+from sqlalchemy import select, insert, func, cast, literal, true, Integer, String, Date, DateTime, Boolean
+from models.workout import Workout
+from models.workout_exercise import WorkoutExercise
+
+WORKOUT_COLUMNS = ("name", "description", "date", "start_time", "user_id", "is_template")
+SET_COLUMNS = ("workout_id", "exercise_id", "set_number", "weight", "reps", "user_id", "date")
+
+
+def copy_workout_statement(source_id : int, user_id : int, workout_date : date, start_time : datetime, name : str | None = None, is_template : bool = False):
+    """INSERT ... SELECT of the source workout under a new date; inserts nothing unless the user owns it."""
+    source = (
+        select(
+            func.coalesce(literal(name, String), Workout.name), Workout.description,
+            literal(workout_date, Date), literal(start_time, DateTime(timezone = True)), Workout.user_id, literal(is_template, Boolean),
+        )
+        # the soft-delete filter only rewrites top-level selects
+        .where(Workout.workout_id == source_id, Workout.user_id == user_id, Workout.deleted_at.is_(None))
+    )
+    return insert(Workout.__table__).from_select(WORKOUT_COLUMNS, source).returning(*Workout.__table__.c)
+
+
+def _scaled_weight(weight_percent : float):
+    if weight_percent == 100:
+        return WorkoutExercise.weight
+    return cast(func.round(WorkoutExercise.weight * (weight_percent / 100)), Integer)
+
+
+def copy_sets_statement(source_id : int, new_workout, weight_percent : float = 100):
+    """INSERT ... SELECT of the source's live sets into `new_workout`, a one-row CTE or subquery
+    with the target's workout_id, user_id and date."""
+    source = (
+        select(
+            new_workout.c.workout_id, WorkoutExercise.exercise_id, WorkoutExercise.set_number, _scaled_weight(weight_percent),
+            WorkoutExercise.reps, new_workout.c.user_id, new_workout.c.date,
+        )
+        .select_from(WorkoutExercise)
+        # no row in new_workout (source not found or not owned) means no sets are copied either
+        .join(new_workout, true())
+        .where(WorkoutExercise.workout_id == source_id, WorkoutExercise.deleted_at.is_(None))
+    )
+    return insert(WorkoutExercise.__table__).from_select(SET_COLUMNS, source)
+
+
+def clone_workout_statement(source_id : int, user_id : int, workout_date : date, start_time : datetime, name : str | None = None, is_template : bool = False, weight_percent : float = 100):
+    """The whole clone as one PostgreSQL statement, returning the new workout and `sets_copied`."""
+    new_workout = copy_workout_statement(source_id, user_id, workout_date, start_time, name, is_template).cte("new_workout")
+    copied = copy_sets_statement(source_id, new_workout, weight_percent).returning(WorkoutExercise.__table__.c.set_number).cte("copied_sets")
+    return select(new_workout, select(func.count()).select_from(copied).scalar_subquery().label("sets_copied"))
+
+
+async def clone_workout(db, source_id : int, user_id : int, workout_date : date, start_time : datetime, name : str | None = None, is_template : bool = False, weight_percent : float = 100) -> dict | None:
+    """Clone a workout the user owns; None when there is no such workout (or it is someone else's)."""
+    if db.bind.dialect.name == "postgresql":
+        statement = clone_workout_statement(source_id, user_id, workout_date, start_time, name, is_template, weight_percent)
+        row = (await db.execute(statement)).mappings().one_or_none()
+        return dict(row) if row is not None else None
+
+    new_workout = (await db.execute(copy_workout_statement(source_id, user_id, workout_date, start_time, name, is_template))).mappings().one_or_none()
+    if new_workout is None:
+        return None
+    target = select(literal(new_workout["workout_id"]).label("workout_id"), literal(user_id).label("user_id"), literal(workout_date, Date).label("date")).subquery("new_workout")
+    copied = (await db.execute(copy_sets_statement(source_id, target, weight_percent))).rowcount
+    return {**new_workout, "sets_copied" : copied}
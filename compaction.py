@@ -0,0 +1,75 @@
+"""Physical removal of soft-deleted rows.
+
+Deleting an exercise, workout or set only stamps its `deleted_at` (models/soft_delete.py), so
+the row stays behind as a tombstone that sync and undo can still see. This job removes the
+tombstones older than COMPACTION_RETENTION_DAYS: sets, then workouts, then exercises, at most
+COMPACTION_BATCH_SIZE rows per statement and transaction, each batch found through the
+table's partial `deleted_at` index. Keeping tombstones few is also what keeps the indexes
+shared by live and deleted rows compact.
+
+Run it on a schedule; with DB_SHARD_LINKS set it compacts every shard:
+    python compaction.py [--retention-days 30]
+"""
+import argparse
+import asyncio
+import os
+from datetime import datetime, timedelta, timezone
+from sqlalchemy import select, delete, tuple_
+from models.exercise import Exercise
+from models.workout import Workout
+from models.workout_exercise import WorkoutExercise
+from purge import delete_in_batches
+from sharding import shard_map
+
+COMPACTION_RETENTION_DAYS = float(os.getenv('COMPACTION_RETENTION_DAYS', '30'))
+COMPACTION_BATCH_SIZE = int(os.getenv('COMPACTION_BATCH_SIZE', '5000'))
+COMPACTION_PAUSE_SECONDS = float(os.getenv('COMPACTION_PAUSE_SECONDS', '0.1'))
+
+
+def compaction_statements(cutoff : datetime, batch_size : int = COMPACTION_BATCH_SIZE) -> list:
+    """(table, statement) pairs, children first; each statement removes one batch of tombstones older than `cutoff`."""
+    set_key = (WorkoutExercise.workout_id, WorkoutExercise.exercise_id, WorkoutExercise.set_number)
+    sets = select(*set_key).where(WorkoutExercise.deleted_at < cutoff).limit(batch_size)
+    workouts = select(Workout.workout_id).where(Workout.deleted_at < cutoff).limit(batch_size)
+    exercises = select(Exercise.exercise_id).where(Exercise.deleted_at < cutoff).limit(batch_size)
+    # a deleted workout's or exercise's sets were stamped no later than it was, so they are gone
+    # by the time it is removed and the ON DELETE CASCADE finds nothing left to do
+    return [
+        ("workout_exercises", delete(WorkoutExercise).where(tuple_(*set_key).in_(sets))),
+        ("workouts", delete(Workout).where(Workout.workout_id.in_(workouts))),
+        ("exercises", delete(Exercise).where(Exercise.exercise_id.in_(exercises))),
+    ]
+
+
+async def compact(session_factory, retention_days : float = COMPACTION_RETENTION_DAYS, batch_size : int = COMPACTION_BATCH_SIZE, pause : float = COMPACTION_PAUSE_SECONDS) -> dict:
+    """Remove old tombstones from one database. Returns rows removed per table."""
+    cutoff = datetime.now(timezone.utc) - timedelta(days = retention_days)
+    counts = {}
+    async with session_factory() as db:
+        for table, statement in compaction_statements(cutoff, batch_size):
+            counts[table] = await delete_in_batches(db, statement, batch_size, pause)
+    return counts
+
+
+async def _compact_all(retention_days : float):
+    from database import AsyncSession as DirectorySession, init_engines, dispose_engines
+    init_engines()
+    try:
+        # with shards the directory holds users only
+        factories = shard_map.session_factories if shard_map.enabled else [DirectorySession]
+        for index, factory in enumerate(factories):
+            counts = await compact(factory, retention_days)
+            print(f"database {index}: removed {counts}")
+    finally:
+        await dispose_engines()
+
+
+def main(argv = None):
+    parser = argparse.ArgumentParser(description = "Remove old soft-deleted rows from the FitLog database.")
+    parser.add_argument("--retention-days", type = float, default = COMPACTION_RETENTION_DAYS)
+    args = parser.parse_args(argv)
+    asyncio.run(_compact_all(args.retention_days))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,124 @@
+"""Negotiated brotli/gzip response compression as a pure ASGI middleware.
+
+Only complete (non-streamed) JSON and text bodies of at least COMPRESSION_MIN_SIZE bytes
+are compressed: below roughly one kilobyte a response already fits in a single packet, so
+compressing it costs CPU without saving a round trip. Quality levels favour speed because
+every response is compressed on the fly; see benchmarks/compression_bench.py.
+"""
+import gzip
+import os
+from functools import lru_cache
+from anyio import to_thread
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+COMPRESSION_MIN_SIZE = int(os.getenv('COMPRESSION_MIN_SIZE', '1024'))
+GZIP_LEVEL = int(os.getenv('COMPRESSION_GZIP_LEVEL', '5'))
+BROTLI_QUALITY = int(os.getenv('COMPRESSION_BROTLI_QUALITY', '4'))
+# bodies above this are compressed in a worker thread instead of on the event loop
+THREAD_MIN_SIZE = 256 * 1024
+
+COMPRESSIBLE_TYPES = (b"application/json", b"application/msgpack", b"text/")
+
+
+@lru_cache(maxsize = 256)
+def negotiate(accept_encoding : str) -> str | None:
+    """Pick "br" or "gzip" from an Accept-Encoding value; ties go to brotli."""
+    weights = {}
+    for part in accept_encoding.split(","):
+        name, _, params = part.strip().partition(";")
+        weight = 1.0
+        params = params.strip()
+        if params.startswith("q="):
+            try:
+                weight = float(params[2:])
+            except ValueError:
+                weight = 0.0
+        weights[name.strip().lower()] = weight
+
+    wildcard = weights.get("*", 0.0)
+    best, best_weight = None, 0.0
+    for name in (("br", "gzip") if brotli is not None else ("gzip",)):
+        weight = weights.get(name, wildcard)
+        if weight > best_weight:
+            best, best_weight = name, weight
+    return best
+
+
+def compress(body : bytes, encoding : str, gzip_level : int = GZIP_LEVEL, brotli_quality : int = BROTLI_QUALITY) -> bytes:
+    if encoding == "br":
+        return brotli.compress(body, quality = brotli_quality, mode = brotli.MODE_TEXT)
+    return gzip.compress(body, compresslevel = gzip_level, mtime = 0)
+
+
+class CompressionMiddleware:
+    def __init__(self, app, minimum_size : int = COMPRESSION_MIN_SIZE, exempt_paths : frozenset = frozenset()):
+        self.app = app
+        self.minimum_size = minimum_size
+        # probes answer with a few hundred bytes, which is not worth a compressor
+        self.exempt_paths = exempt_paths
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or scope["path"] in self.exempt_paths:
+            await self.app(scope, receive, send)
+            return
+
+        encoding = None
+        for name, value in scope["headers"]:
+            if name == b"accept-encoding":
+                encoding = negotiate(value.decode("latin-1"))
+                break
+
+        start = None
+        passthrough = False
+
+        async def send_compressed(message):
+            nonlocal start, passthrough
+            if passthrough:
+                await send(message)
+                return
+            if message["type"] == "http.response.start":
+                start = message
+                return
+
+            headers = list(start.get("headers", []))
+            content_type = b""
+            already_encoded = False
+            for name, value in headers:
+                if name == b"content-type":
+                    content_type = value
+                elif name == b"content-encoding":
+                    already_encoded = True
+            compressible = content_type.startswith(COMPRESSIBLE_TYPES) and not already_encoded
+            if compressible:
+                headers.append((b"vary", b"Accept-Encoding"))
+
+            body = message.get("body", b"")
+            # streamed bodies and small or non-text responses go out untouched
+            if encoding is None or not compressible or message.get("more_body", False) or len(body) < self.minimum_size or start["status"] in (204, 304):
+                passthrough = True
+                await send({**start, "headers" : headers})
+                await send(message)
+                return
+
+            if len(body) >= THREAD_MIN_SIZE:
+                body = await to_thread.run_sync(compress, body, encoding)
+            else:
+                body = compress(body, encoding)
+
+            rewritten = []
+            for name, value in headers:
+                if name == b"content-length":
+                    continue
+                if name == b"etag" and not value.startswith(b"W/"):
+                    # the compressed bytes differ from the identity representation
+                    value = b"W/" + value
+                rewritten.append((name, value))
+            rewritten += [(b"content-encoding", encoding.encode()), (b"content-length", str(len(body)).encode())]
+            await send({**start, "headers" : rewritten})
+            await send({"type" : "http.response.body", "body" : body})
+
+        await self.app(scope, receive, send_compressed)
@@ -2,19 +2,24 @@ from dotenv import load_dotenv
 import os
 
 
+# the one place .env is read; modules that need settings import config first
 load_dotenv()
 
-if os.getenv('DB_LINK'):
-    DATABASE_URL = os.getenv('DB_LINK')
-else:
-    raise ValueError("The database url is not set in .env")
+# required settings are checked when first used, so a tool that only needs the
+# database (alembic, partitions.py) does not also need the JWT secret
+_REQUIRED = {
+    "DATABASE_URL" : ("DB_LINK", "The database url is not set in .env"),
+    "TEST_DB_URL" : ("TEST_DB_LINK", "The test database url is not set."),
+    "JWT_SECRET_KEY" : ("JWT_SECRET_KEY", "The secret key is not set in .env"),
+}
 
-if os.getenv('TEST_DB_LINK'):
-    TEST_DB_URL = os.getenv('TEST_DB_LINK')
-else:
-    raise ValueError("The test database url is not set.")
 
-if os.getenv('JWT_SECRET_KEY'):
-    JWT_SECRET_KEY = os.getenv('JWT_SECRET_KEY')
-else:
-    raise ValueError("The secret key is not set in .env")
\ No newline at end of file
+def __getattr__(name):
+    if name not in _REQUIRED:
+        raise AttributeError(f"module 'config' has no attribute {name!r}")
+    env_name, message = _REQUIRED[name]
+    value = os.getenv(env_name)
+    if not value:
+        raise ValueError(message)
+    globals()[name] = value
+    return value
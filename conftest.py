@@ -1,13 +1,28 @@
+import os
 import pytest
 from fastapi.testclient import TestClient
 
+# rate limiting is switched off for the suite; tests/test_rate_limit.py turns it back on
+os.environ.setdefault("RATE_LIMIT_ENABLED", "false")
+# the engines point at a database that does not exist here; tests use SQLite through get_db
+os.environ.setdefault("DB_WARMUP_CONNECTIONS", "0")
+# the account purge polls that same database; tests/test_account_deletion.py runs it directly
+os.environ.setdefault("PURGE_ENABLED", "false")
+# so does the reload of deleted accounts; tests/test_account_deletion.py calls it directly
+os.environ.setdefault("REVOCATION_REFRESH_SECONDS", "0")
+
 from app import app
 from models.base import Base
 from database import get_db
+from catalog import reset_catalog
+from idempotency import idempotency_store
+from leaderboards import leaderboard_cache
+from ownership import ownership_cache
+from auth import revoked_users
 
 # We'll use a synchronous in-memory SQLite engine for tests and provide a small
 # async shim that exposes the AsyncSession-like methods the async endpoints expect.
-from sqlalchemy import create_engine
+from sqlalchemy import create_engine, event
 from sqlalchemy.orm import sessionmaker
 import asyncio
 
@@ -23,6 +38,11 @@ class AsyncSessionShim:
     def __init__(self, sync_session):
         self._session = sync_session
 
+    @property
+    def bind(self):
+        # AsyncSession.bind exposes the engine; endpoints use it to pick dialect-specific SQL
+        return self._session.get_bind()
+
     async def scalars(self, statement):
         # Run the sync SQLAlchemy call directly on the same thread where the
         # TestClient runs the app. Running in-thread avoids cross-thread use of
@@ -69,11 +89,18 @@ class AsyncSessionShim:
     async def delete(self, instance):
         self._session.delete(instance)
 
+    async def connection(self):
+        return self._session.connection()
+
+    async def close(self):
+        self._session.close()
+
     # Provide context manager support if code uses `async with get_db()`
     async def __aenter__(self):
         return self
 
     async def __aexit__(self, exc_type, exc, tb):
+        self._session.close()
         return False
 
 
@@ -88,6 +115,12 @@ ENGINE = create_engine(
 SyncSessionLocal = sessionmaker(bind=ENGINE)
 
 
+# SQLite ignores foreign keys unless asked, and the delete endpoints rely on ON DELETE CASCADE
+@event.listens_for(ENGINE, "connect")
+def _enable_sqlite_foreign_keys(dbapi_connection, connection_record):
+    dbapi_connection.execute("PRAGMA foreign_keys=ON")
+
+
 @pytest.fixture(scope="session", autouse=True)
 def setup_test_db():
     """Create the test schema once per session and tear it down afterwards."""
@@ -97,6 +130,8 @@ def setup_test_db():
     import models.exercise
     import models.workout
     import models.workout_exercise
+    import models.catalog_exercise
+    import models.leaderboard_entry
 
     Base.metadata.create_all(bind=ENGINE)
     yield
@@ -112,6 +147,14 @@ def client():
     # Ensure each test starts with a fresh schema so tests are isolated.
     Base.metadata.drop_all(bind=ENGINE)
     Base.metadata.create_all(bind=ENGINE)
+    # the catalog snapshot is cached per process; drop it along with the schema
+    reset_catalog()
+    # user ids restart with every database, so keys from an earlier test must not replay
+    idempotency_store.client.clear()
+    # cached boards belong to the dropped database as well
+    leaderboard_cache.reset()
+    ownership_cache.clear()
+    revoked_users.clear()
 
     async def override_get_db():
         # create a fresh sync session for each request and yield the async shim
@@ -1,16 +1,261 @@
-# from config import DATABASE_URL
-from dotenv import load_dotenv
+import asyncio
+import logging
 import os
+import time
+from contextlib import asynccontextmanager
+from fastapi import Depends, Security, Request, Response
+from sqlalchemy import text
+from sqlalchemy.exc import SQLAlchemyError
 from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker
+from sqlalchemy.pool import AsyncAdaptedQueuePool
+import config
+from auth import validate_jwt
+from sharding import shard_map, init_shard_engines, dispose_shard_engines, shard_engines
+from queries import warmup_statements
 
-load_dotenv()
-DATABASE_URL = os.getenv('DB_LINK')
-print(DATABASE_URL)
+# optional read replica; GET handlers are routed to it unless the user wrote recently
+REPLICA_DATABASE_URL = os.getenv('DB_REPLICA_LINK')
+REPLICA_PIN_SECONDS = float(os.getenv('DB_REPLICA_PIN_SECONDS', '5'))
+REPLICA_RETRY_SECONDS = float(os.getenv('DB_REPLICA_RETRY_SECONDS', '30'))
+# carries the pin to the client, so the next read is kept off the replica whichever worker serves it
+REPLICA_PIN_COOKIE = "fitlog_read_primary"
+DB_ECHO = os.getenv('DB_ECHO', 'false').lower() in ('1', 'true', 'yes')
+# connections per engine opened and primed at startup; 0 disables the warmup
+DB_WARMUP_CONNECTIONS = int(os.getenv('DB_WARMUP_CONNECTIONS', '5'))
+# per process and per engine; serve.py derives them from DB_CONNECTION_BUDGET for its workers
+DB_POOL_SIZE = int(os.getenv('DB_POOL_SIZE', '5'))
+DB_MAX_OVERFLOW = int(os.getenv('DB_MAX_OVERFLOW', '10'))
 
-engine = create_async_engine(DATABASE_URL, echo = True)
+logger = logging.getLogger(__name__)
+
+# Engines are created by init_engines() from the app lifespan, not at import: creating one
+# loads the asyncpg dialect, which workers do not need until they serve traffic.
+engine = None
+
+AsyncSession = async_sessionmaker() # best practice; bound in init_engines()
+
+replica_engine = None
+
+ReplicaSession = async_sessionmaker()
+
+
+class ReplicaRouter:
+    """Decides per request whether reads may go to the replica.
+
+    A write pins its user to the primary for `pin_seconds` so they read their own
+    writes despite replication lag. A replica error sends all reads to the primary
+    for `retry_seconds` before the replica is tried again.
+
+    The in-process pin only covers the worker that took the write. The same pin also goes
+    to the client as a cookie, "<user_id>:<unix time it lapses>", which any worker honours.
+    Wall-clock time, since the workers may not share a host; a client can only use the
+    cookie to keep its own reads on the primary.
+    """
+
+    SWEEP_THRESHOLD = 10000
+
+    def __init__(self, session_factory, pin_seconds : float, retry_seconds : float):
+        self.session_factory = session_factory
+        self.pin_seconds = pin_seconds
+        self.retry_seconds = retry_seconds
+        self._pinned_until : dict[int, float] = {}
+        self._unhealthy_until = 0.0
+
+    def configure(self, session_factory, pin_seconds : float | None = None, retry_seconds : float | None = None):
+        self.session_factory = session_factory
+        if pin_seconds is not None:
+            self.pin_seconds = pin_seconds
+        if retry_seconds is not None:
+            self.retry_seconds = retry_seconds
+        self._pinned_until.clear()
+        self._unhealthy_until = 0.0
+
+    def pin(self, user_id : int):
+        now = time.monotonic()
+        if len(self._pinned_until) > self.SWEEP_THRESHOLD:
+            self._pinned_until = {uid : until for uid, until in self._pinned_until.items() if until > now}
+        self._pinned_until[user_id] = now + self.pin_seconds
+
+    def is_pinned(self, user_id : int) -> bool:
+        until = self._pinned_until.get(user_id)
+        if until is None:
+            return False
+        if until <= time.monotonic():
+            self._pinned_until.pop(user_id, None)
+            return False
+        return True
+
+    def pin_cookie(self, user_id : int) -> str:
+        return f"{user_id}:{time.time() + self.pin_seconds:.3f}"
+
+    @staticmethod
+    def cookie_pins(value : str | None, user_id : int) -> bool:
+        if not value:
+            return False
+        cookie_user, _, until = value.partition(":")
+        try:
+            return int(cookie_user) == user_id and float(until) > time.time()
+        except ValueError:
+            return False
+
+    def mark_unhealthy(self):
+        self._unhealthy_until = time.monotonic() + self.retry_seconds
+
+    def use_replica(self, user_id : int) -> bool:
+        if self.session_factory is None or self.is_pinned(user_id):
+            return False
+        return time.monotonic() >= self._unhealthy_until
+
+
+replica_router = ReplicaRouter(None, REPLICA_PIN_SECONDS, REPLICA_RETRY_SECONDS)
+
+
+class WaiterCount:
+    """Pool mixin counting the callers inside connect(), for monitoring's readiness check.
+
+    A caller that finds a free connection leaves at once, so the count is made of the callers
+    blocked until one is checked in, plus, for the few milliseconds it takes, any caller opening
+    a new connection. Every checkout of an async pool runs on the event loop's thread.
+    """
+
+    waiting = 0
+
+    def connect(self):
+        self.waiting += 1
+        try:
+            return super().connect()
+        finally:
+            self.waiting -= 1
+
+
+class WaiterCountingPool(WaiterCount, AsyncAdaptedQueuePool):
+    pass
+
+
+def pool_options() -> dict:
+    return {"poolclass" : WaiterCountingPool, "pool_size" : DB_POOL_SIZE, "max_overflow" : DB_MAX_OVERFLOW}
+
+
+def init_engines():
+    global engine, replica_engine
+    if engine is None:
+        engine = create_async_engine(config.DATABASE_URL, echo = DB_ECHO, **pool_options())
+        AsyncSession.configure(bind = engine)
+    if REPLICA_DATABASE_URL and replica_engine is None:
+        replica_engine = create_async_engine(REPLICA_DATABASE_URL, **pool_options())
+        ReplicaSession.configure(bind = replica_engine)
+        replica_router.configure(ReplicaSession)
+    init_shard_engines(**pool_options())
+
+
+async def _warm_connection(target_engine, statements : list) -> int:
+    async with target_engine.connect() as connection:
+        await connection.execute(text("SELECT 1"))
+        # run through a session so the ORM compile path is the one requests use
+        async with AsyncSession(bind = connection) as session:
+            for statement in statements:
+                await session.execute(statement)
+    return len(statements)
+
+
+async def warm_up_engine(target_engine, connections : int = DB_WARMUP_CONNECTIONS) -> int:
+    """Open `connections` pooled connections at once, ping the database on each and prime the
+    hot statements, so they are compiled and prepared before the first request.
+
+    Returns the number of connections warmed; errors are logged and leave the pool lazy.
+    """
+    connections = min(connections, target_engine.pool.size())
+    if connections <= 0:
+        return 0
+    statements = warmup_statements()
+    # holding them concurrently forces distinct connections instead of reusing one
+    results = await asyncio.gather(*(_warm_connection(target_engine, statements) for _ in range(connections)), return_exceptions = True)
+    failures = [result for result in results if isinstance(result, BaseException)]
+    if failures:
+        logger.warning("database warmup failed on %d of %d connections: %s", len(failures), connections, failures[0])
+    return connections - len(failures)
+
+
+async def warm_up_engines(connections : int = DB_WARMUP_CONNECTIONS):
+    for target_engine in [engine, replica_engine, *shard_engines()]:
+        if target_engine is not None:
+            await warm_up_engine(target_engine, connections)
+
+
+async def dispose_engines():
+    global engine, replica_engine
+    for current in (engine, replica_engine):
+        if current is not None:
+            await current.dispose()
+    engine = replica_engine = None
+    await dispose_shard_engines()
 
-AsyncSession = async_sessionmaker(bind = engine) # best practice
 
 async def get_db():
     async with AsyncSession() as db:
         yield db
+
+
+async def _shard_session(user_id : int, directory_db):
+    await shard_map.refresh(directory_db)
+    # release the directory connection; the rest of the request only talks to the shard
+    await directory_db.rollback()
+    return shard_map.session_factory_for(user_id)()
+
+
+@asynccontextmanager
+async def user_session(user_id : int, db):
+    """The session holding a user's data, for work outside the request dependencies (websockets)."""
+    if shard_map.enabled:
+        async with await _shard_session(user_id, db) as shard_db:
+            yield shard_db
+    else:
+        yield db
+
+
+async def get_write_db(response : Response, user : dict = Security(validate_jwt), db = Depends(get_db)):
+    # pin before the handler runs and again once it has finished, so the window starts after the commit
+    user_id = int(user["sub"])
+    replica_router.pin(user_id)
+    if replica_router.session_factory is not None:
+        # headers must be set before the handler returns; the window is short by the handler's run time
+        response.set_cookie(REPLICA_PIN_COOKIE, replica_router.pin_cookie(user_id), max_age = max(1, int(replica_router.pin_seconds)), httponly = True, samesite = "strict")
+    try:
+        if shard_map.enabled:
+            async with await _shard_session(user_id, db) as shard_db:
+                yield shard_db
+        else:
+            yield db
+    finally:
+        replica_router.pin(user_id)
+
+
+async def get_read_db(request : Request, user : dict = Security(validate_jwt), db = Depends(get_db)):
+    user_id = int(user["sub"])
+
+    # shards have no replicas of their own; reads go to the user's shard
+    if shard_map.enabled:
+        async with await _shard_session(user_id, db) as shard_db:
+            yield shard_db
+        return
+
+    if not replica_router.use_replica(user_id) or replica_router.cookie_pins(request.cookies.get(REPLICA_PIN_COOKIE), user_id):
+        yield db
+        return
+
+    replica_db = replica_router.session_factory()
+    try:
+        # check out a replica connection up front so an unreachable replica falls back cleanly
+        await replica_db.connection()
+    except (SQLAlchemyError, OSError):
+        replica_router.mark_unhealthy()
+        await replica_db.close()
+        yield db
+        return
+
+    async with replica_db:
+        try:
+            yield replica_db
+        except (SQLAlchemyError, OSError):
+            replica_router.mark_unhealthy()
+            raise
@@ -0,0 +1,93 @@
+from datetime import date
+from sqlalchemy import select, case, func, cast, Integer, Float, Numeric
+from models.workout_exercise import WorkoutExercise
+from queries import template_ids
+
+DEFAULT_HISTORY_POINTS = 100
+MAX_HISTORY_POINTS = 1000
+
+
+def e1rm_expression(weight, reps):
+    # Epley: weight * (1 + reps / 30), the weight itself for singles
+    return case((reps == 1, cast(weight, Float)), else_ = weight * (1 + cast(reps, Float) / 30))
+
+
+def estimate_1rm(weight : int, reps : int) -> float:
+    """e1rm_expression in Python, rounded like the history points."""
+    return round(float(weight) if reps == 1 else weight * (1 + reps / 30), 1)
+
+
+def _day_number(dialect_name : str, column):
+    # days since an arbitrary epoch; Date - Date is an integer on PostgreSQL but not on SQLite
+    if dialect_name == "postgresql":
+        return column - date(1970, 1, 1)
+    return cast(func.julianday(column), Integer)
+
+
+def exercise_history_statement(dialect_name : str, user_id : int, exercise_id : int, from_date : date | None, to_date : date | None, points : int = DEFAULT_HISTORY_POINTS):
+    """Per-session progress for one exercise, downsampled in SQL to at most `points` rows.
+
+    A session is one workout: its top set (heaviest, then most reps), best estimated 1RM
+    (Epley: weight * (1 + reps / 30), the weight itself for singles) and volume (sum of
+    weight * reps). With more than `points` sessions the date range is cut into `points`
+    equal buckets and each bucket keeps its session with the highest e1RM, so peaks survive
+    and every point is a real session with its real date.
+    """
+    weight, reps = WorkoutExercise.weight, WorkoutExercise.reps
+    e1rm = e1rm_expression(weight, reps)
+
+    filters = [WorkoutExercise.user_id == user_id, WorkoutExercise.exercise_id == exercise_id, WorkoutExercise.workout_id.not_in(template_ids(user_id))]
+    # date bounds let partitioned tables skip months outside the range
+    if from_date:
+        filters.append(WorkoutExercise.date >= from_date)
+    if to_date:
+        filters.append(WorkoutExercise.date <= to_date)
+
+    sets = (
+        select(
+            WorkoutExercise.workout_id, WorkoutExercise.date, weight, reps,
+            func.row_number().over(partition_by = WorkoutExercise.workout_id, order_by = (weight.desc(), reps.desc())).label("set_rank"),
+            e1rm.label("e1rm"),
+            (weight * reps).label("volume"),
+        )
+        .where(*filters)
+        .cte("history_sets")
+    )
+
+    sessions = (
+        select(
+            sets.c.workout_id, sets.c.date,
+            func.max(case((sets.c.set_rank == 1, sets.c.weight))).label("top_weight"),
+            func.max(case((sets.c.set_rank == 1, sets.c.reps))).label("top_reps"),
+            func.max(sets.c.e1rm).label("e1rm"),
+            func.sum(sets.c.volume).label("volume"),
+            func.count().label("sets"),
+        )
+        .group_by(sets.c.workout_id, sets.c.date)
+        .cte("history_sessions")
+    )
+
+    day = _day_number(dialect_name, sessions.c.date)
+    first_day = func.min(day).over()
+    span = func.max(day).over() - first_day + 1
+    total = func.count().over()
+    position = func.row_number().over(order_by = (sessions.c.date, sessions.c.workout_id)) - 1
+    # few enough sessions: one bucket each; otherwise equal-width date buckets
+    bucket = case((total <= points, position), else_ = (day - first_day) * points // span)
+
+    bucketed = select(sessions, total.label("sessions_total"), bucket.label("bucket")).cte("history_buckets")
+
+    picked = select(
+        bucketed,
+        func.row_number().over(partition_by = bucketed.c.bucket, order_by = (bucketed.c.e1rm.desc(), bucketed.c.date.desc())).label("pick"),
+    ).subquery("history_picked")
+
+    return (
+        select(
+            picked.c.date, picked.c.workout_id, picked.c.top_weight, picked.c.top_reps,
+            # PostgreSQL only rounds numerics to a given scale
+            func.round(cast(picked.c.e1rm, Numeric), 1, type_ = Float).label("e1rm"), picked.c.volume, picked.c.sets, picked.c.sessions_total,
+        )
+        .where(picked.c.pick == 1)
+        .order_by(picked.c.date, picked.c.workout_id)
+    )
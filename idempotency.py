@@ -0,0 +1,269 @@
+"""Idempotency-Key support for authenticated POST requests, as a pure ASGI middleware.
+
+A POST that carries `Idempotency-Key` and a valid bearer token is recorded under
+(user, method, path, key). The first request runs normally and its status, headers and body
+are kept for IDEMPOTENCY_TTL_SECONDS; a retry with the same key and the same request gets
+that response back (marked `Idempotent-Replayed: true`) without reaching the endpoint or
+the database. While the first request is still running, a retry gets 409 with Retry-After.
+Reusing a key for a different request (query, content type, Accept or body) gets 422, so a
+retry never gets a body in a format it did not ask for.
+
+Only responses below 500 are kept, so a retry after a server error runs again. Set-Cookie is
+not kept: a replay must not re-send a cookie minted for the first request, such as the
+replica pin with its old timestamp. Requests without a token (/register, /login) are never
+replayed, since a stored login would hand out a JWT, and neither are requests whose account
+was deleted (auth.revoked_users).
+
+Backends:
+    memory   per-process store, LRU-capped at IDEMPOTENCY_MAX_KEYS records and
+             IDEMPOTENCY_MAX_BYTES of stored records (default)
+    redis    shared by every worker, so a retry that lands on another serve.py worker is
+             still recognised. IDEMPOTENCY_REDIS_URL=local:// uses an in-process stand-in.
+             If the shared store errors, the request runs without idempotency.
+"""
+import asyncio
+import hashlib
+import json
+import logging
+import os
+import time
+from collections import OrderedDict
+import msgpack
+from auth import token_subjects, revoked_users
+
+IDEMPOTENCY_ENABLED = os.getenv('IDEMPOTENCY_ENABLED', 'true').lower() not in ('0', 'false', 'no')
+IDEMPOTENCY_BACKEND = os.getenv('IDEMPOTENCY_BACKEND', 'memory')
+IDEMPOTENCY_REDIS_URL = os.getenv('IDEMPOTENCY_REDIS_URL', 'local://')
+IDEMPOTENCY_TTL_SECONDS = int(os.getenv('IDEMPOTENCY_TTL_SECONDS', '86400'))
+IDEMPOTENCY_MAX_KEYS = int(os.getenv('IDEMPOTENCY_MAX_KEYS', '50000'))
+# responses are kept up to IDEMPOTENCY_MAX_BODY each, so the key count alone does not bound memory
+IDEMPOTENCY_MAX_BYTES = int(os.getenv('IDEMPOTENCY_MAX_BYTES', str(64 * 1024 * 1024)))
+# an in-flight marker outlives a request only if its worker died; then the key frees up after this
+IDEMPOTENCY_LOCK_SECONDS = int(os.getenv('IDEMPOTENCY_LOCK_SECONDS', '60'))
+# larger responses are not kept; their retries run again
+IDEMPOTENCY_MAX_BODY = int(os.getenv('IDEMPOTENCY_MAX_BODY', str(64 * 1024)))
+MAX_KEY_LENGTH = 255
+# response headers a replay must not repeat
+UNSTORED_HEADERS = frozenset({b"set-cookie"})
+
+logger = logging.getLogger(__name__)
+
+
+class MemoryKeyValue:
+    """The three Redis calls the store makes, over an LRU of key -> (expires_at, value).
+
+    Bounded by entry count and by the total size of the stored values, whichever is hit first.
+    """
+
+    def __init__(self, max_keys : int = IDEMPOTENCY_MAX_KEYS, max_bytes : int = IDEMPOTENCY_MAX_BYTES):
+        self.max_keys = max_keys
+        self.max_bytes = max_bytes
+        self.size = 0
+        self._entries : OrderedDict[str, tuple[float, bytes]] = OrderedDict()
+
+    async def get(self, key : str) -> bytes | None:
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        if entry[0] <= time.monotonic():
+            await self.delete(key)
+            return None
+        self._entries.move_to_end(key)
+        return entry[1]
+
+    async def set(self, key : str, value : bytes, ex : int, nx : bool = False) -> bool:
+        if nx and await self.get(key) is not None:
+            return False
+        await self.delete(key)
+        self._entries[key] = (time.monotonic() + ex, value)
+        self.size += len(value)
+        # the newest entry stays even when it alone is over max_bytes: it may be an in-flight marker
+        while len(self._entries) > 1 and (len(self._entries) > self.max_keys or self.size > self.max_bytes):
+            _, (_, evicted) = self._entries.popitem(last = False)
+            self.size -= len(evicted)
+        return True
+
+    async def delete(self, key : str):
+        entry = self._entries.pop(key, None)
+        if entry is not None:
+            self.size -= len(entry[1])
+
+    def clear(self):
+        self._entries.clear()
+        self.size = 0
+
+
+class IdempotencyStore:
+    """Records are msgpack arrays: [fingerprint] while in flight, [fingerprint, status, headers, body] once done."""
+
+    def __init__(self, client, prefix : str = "idempotency:", errors : tuple = (OSError, asyncio.TimeoutError)):
+        self.client = client
+        self.prefix = prefix
+        self.errors = errors
+
+    async def begin(self, key : str, fingerprint : bytes) -> tuple[str, list | None]:
+        """("new", None) if the caller should run the request, else ("replay" | "in_flight" | "mismatch", record)."""
+        key = self.prefix + key
+        if await self.client.set(key, msgpack.packb([fingerprint]), ex = IDEMPOTENCY_LOCK_SECONDS, nx = True):
+            return "new", None
+        raw = await self.client.get(key)
+        if raw is None:
+            # expired between the two calls
+            return await self.begin(key[len(self.prefix):], fingerprint)
+        record = msgpack.unpackb(raw)
+        if record[0] != fingerprint:
+            return "mismatch", record
+        if len(record) == 1:
+            return "in_flight", record
+        return "replay", record
+
+    async def complete(self, key : str, fingerprint : bytes, status : int, headers : list, body : bytes):
+        await self.client.set(self.prefix + key, msgpack.packb([fingerprint, status, headers, body]), ex = IDEMPOTENCY_TTL_SECONDS)
+
+    async def abort(self, key : str):
+        await self.client.delete(self.prefix + key)
+
+
+def make_store(backend : str = IDEMPOTENCY_BACKEND, redis_url : str = IDEMPOTENCY_REDIS_URL):
+    if backend == "memory" or (backend == "redis" and redis_url.startswith("local://")):
+        return IdempotencyStore(MemoryKeyValue())
+    if backend != "redis":
+        raise ValueError(f"unknown IDEMPOTENCY_BACKEND {backend!r}")
+    try:
+        import redis.asyncio as redis
+    except ImportError as e:
+        raise RuntimeError("IDEMPOTENCY_BACKEND=redis needs the `redis` package") from e
+    return IdempotencyStore(redis.from_url(redis_url), errors = (redis.RedisError, OSError, asyncio.TimeoutError))
+
+
+def _header(scope, name : bytes) -> bytes | None:
+    for key, value in scope["headers"]:
+        if key == name:
+            return value
+    return None
+
+
+def _subject(scope) -> str | None:
+    authorization = _header(scope, b"authorization")
+    if authorization is None:
+        return None
+    scheme, _, token = authorization.decode("latin-1").partition(" ")
+    if scheme.lower() != "bearer" or not token:
+        return None
+    subject = token_subjects.subject(token)
+    if subject is None or revoked_users.is_revoked(int(subject)):
+        return None
+    return subject
+
+
+def fingerprint(scope, body : bytes) -> bytes:
+    digest = hashlib.blake2b(digest_size = 16)
+    for part in (scope["query_string"], _header(scope, b"content-type") or b"", _header(scope, b"accept") or b"", body):
+        digest.update(len(part).to_bytes(8, "little"))
+        digest.update(part)
+    return digest.digest()
+
+
+async def _send_json(send, status : int, detail : str, extra_headers : list | None = None):
+    body = json.dumps({"detail" : detail}).encode()
+    headers = [(b"content-type", b"application/json"), (b"content-length", str(len(body)).encode())] + (extra_headers or [])
+    await send({"type" : "http.response.start", "status" : status, "headers" : headers})
+    await send({"type" : "http.response.body", "body" : body})
+
+
+class IdempotencyMiddleware:
+    def __init__(self, app, store : IdempotencyStore, enabled : bool = IDEMPOTENCY_ENABLED, exempt_paths : frozenset = frozenset()):
+        self.app = app
+        self.store = store
+        self.enabled = enabled
+        self.exempt_paths = exempt_paths
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or scope["method"] != "POST" or not self.enabled or scope["path"] in self.exempt_paths:
+            await self.app(scope, receive, send)
+            return
+        raw_key = _header(scope, b"idempotency-key")
+        subject = _subject(scope) if raw_key is not None else None
+        if subject is None:
+            await self.app(scope, receive, send)
+            return
+        if not raw_key or len(raw_key) > MAX_KEY_LENGTH:
+            await _send_json(send, 400, f"Idempotency-Key must be 1 to {MAX_KEY_LENGTH} characters.")
+            return
+
+        # the body is part of the fingerprint, so read it up front and hand it on unchanged
+        chunks = []
+        while True:
+            message = await receive()
+            if message["type"] != "http.request":
+                return
+            chunks.append(message.get("body", b""))
+            if not message.get("more_body", False):
+                break
+        body = b"".join(chunks)
+        consumed = False
+
+        async def replay_receive():
+            nonlocal consumed
+            if consumed:
+                return await receive()
+            consumed = True
+            return {"type" : "http.request", "body" : body, "more_body" : False}
+
+        key = f"u:{subject}:POST:{scope['path']}:{raw_key.decode('latin-1')}"
+        request_fingerprint = fingerprint(scope, body)
+        try:
+            outcome, record = await self.store.begin(key, request_fingerprint)
+        except self.store.errors as e:
+            logger.warning("idempotency store unavailable, running the request without it: %s", e)
+            await self.app(scope, replay_receive, send)
+            return
+
+        if outcome == "mismatch":
+            await _send_json(send, 422, "Idempotency-Key was already used for a different request.")
+            return
+        if outcome == "in_flight":
+            await _send_json(send, 409, "A request with this Idempotency-Key is still being processed.", [(b"retry-after", b"1")])
+            return
+        if outcome == "replay":
+            _, status, headers, stored_body = record
+            headers = [(bytes(name), bytes(value)) for name, value in headers] + [(b"idempotent-replayed", b"true")]
+            await send({"type" : "http.response.start", "status" : status, "headers" : headers})
+            await send({"type" : "http.response.body", "body" : stored_body})
+            return
+
+        response = {"status" : None, "headers" : [], "body" : []}
+        size = 0
+
+        async def capture_send(message):
+            nonlocal size
+            if message["type"] == "http.response.start":
+                response["status"] = message["status"]
+                response["headers"] = [[name, value] for name, value in message.get("headers", []) if name.lower() not in UNSTORED_HEADERS]
+            elif message["type"] == "http.response.body" and size <= IDEMPOTENCY_MAX_BODY:
+                chunk = message.get("body", b"")
+                size += len(chunk)
+                response["body"].append(chunk)
+            await send(message)
+
+        try:
+            await self.app(scope, replay_receive, capture_send)
+        except BaseException:
+            await self._finish(key, None)
+            raise
+        if response["status"] is not None and response["status"] < 500 and size <= IDEMPOTENCY_MAX_BODY:
+            await self._finish(key, (request_fingerprint, response["status"], response["headers"], b"".join(response["body"])))
+        else:
+            await self._finish(key, None)
+
+    async def _finish(self, key : str, record : tuple | None):
+        try:
+            if record is None:
+                await self.store.abort(key)
+            else:
+                await self.store.complete(key, *record)
+        except self.store.errors as e:
+            logger.warning("could not record idempotent response: %s", e)
+
+
+idempotency_store = make_store()
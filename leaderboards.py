@@ -0,0 +1,344 @@
+"""Opt-in leaderboards of estimated 1RM per catalog exercise.
+
+Users join with PUT /me/leaderboards. Every catalog exercise is a board, and a member's entry
+on it is their best set (Epley e1RM, as in history.py) among the live, non-template sets of
+their exercises linked to that catalog entry.
+
+leaderboard_entries is the source of truth, kept in the directory database next to users,
+and its rank index (catalog_id, e1rm DESC, achieved_on, user_id) returns a board in rank
+order. It is fed incrementally: logging a set costs one INSERT ... SELECT ... ON CONFLICT DO
+UPDATE, which writes only when the member improved and inserts nothing for users who have
+not joined. Edits and deletes can lower a best, so they rebuild the member's entries from
+their sets instead.
+
+Counting the rows ahead of someone in SQL reads all of them, so ranks come from a cache in
+each process: per board, an indexable skip list in rank index order, in which finding a
+member's rank, moving them and seeking to a position are all O(log n). A board is loaded
+from the rank index on first use, updated in place by this process's own writes and
+reloaded after LEADERBOARD_REFRESH_SECONDS to pick up the other processes' writes. One
+request per board does the reload; the others keep reading the stale board meanwhile, or
+wait for it when there is none yet.
+"""
+import asyncio
+import logging
+import os
+import random
+import time
+from collections import namedtuple
+from datetime import date
+from sqlalchemy import select, insert, delete, update, func, literal, Integer, Float, Date
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.exc import SQLAlchemyError
+from models.user import User
+from models.exercise import Exercise
+from models.leaderboard_entry import LeaderboardEntry
+from models.workout_exercise import WorkoutExercise
+from history import e1rm_expression, estimate_1rm
+from queries import template_ids
+
+LEADERBOARD_REFRESH_SECONDS = float(os.getenv('LEADERBOARD_REFRESH_SECONDS', '30'))
+DEFAULT_LEADERBOARD_LIMIT = 10
+MAX_LEADERBOARD_LIMIT = 100
+# enough levels for 2**32 members at p = 1/2
+SKIP_LIST_MAX_LEVEL = 32
+
+logger = logging.getLogger(__name__)
+
+BoardEntry = namedtuple("BoardEntry", ["user_id", "username", "e1rm", "weight", "reps", "achieved_on"])
+
+ENTRY_COLUMNS = ("catalog_id", "user_id", "username", "e1rm", "weight", "reps", "achieved_on")
+
+
+class _Node:
+    __slots__ = ("key", "next", "width")
+
+    def __init__(self, key, level : int):
+        self.key = key
+        self.next = [None] * level
+        # positions skipped by each forward link; the last node's links reach one past the end
+        self.width = [1] * level
+
+
+class IndexableSkipList:
+    """Sorted, unique keys with O(log n) insert, remove, rank and positional access."""
+
+    def __init__(self, seed : int | None = None):
+        self._head = _Node(None, SKIP_LIST_MAX_LEVEL)
+        self._size = 0
+        self._random = random.Random(seed)
+
+    def __len__(self):
+        return self._size
+
+    def _random_level(self) -> int:
+        level = 1
+        while level < SKIP_LIST_MAX_LEVEL and self._random.random() < 0.5:
+            level += 1
+        return level
+
+    def _predecessors(self, key) -> tuple[list, list]:
+        # the last node before `key` on every level, and its position (head = 0)
+        nodes, positions = [None] * SKIP_LIST_MAX_LEVEL, [0] * SKIP_LIST_MAX_LEVEL
+        node, position = self._head, 0
+        for level in reversed(range(SKIP_LIST_MAX_LEVEL)):
+            while node.next[level] is not None and node.next[level].key < key:
+                position += node.width[level]
+                node = node.next[level]
+            nodes[level], positions[level] = node, position
+        return nodes, positions
+
+    def insert(self, key):
+        nodes, positions = self._predecessors(key)
+        position = positions[0] + 1
+        new = _Node(key, self._random_level())
+        for level, before in enumerate(nodes):
+            if level < len(new.next):
+                new.next[level] = before.next[level]
+                before.next[level] = new
+                new.width[level] = before.width[level] - (position - positions[level]) + 1
+                before.width[level] = position - positions[level]
+            else:
+                before.width[level] += 1
+        self._size += 1
+
+    def remove(self, key):
+        nodes, _ = self._predecessors(key)
+        target = nodes[0].next[0]
+        if target is None or target.key != key:
+            raise KeyError(key)
+        for level, before in enumerate(nodes):
+            if before.next[level] is target:
+                before.width[level] += target.width[level] - 1
+                before.next[level] = target.next[level]
+            else:
+                before.width[level] -= 1
+        self._size -= 1
+
+    def index(self, key) -> int:
+        """0-based position of `key`; KeyError when it is not in the list."""
+        nodes, positions = self._predecessors(key)
+        target = nodes[0].next[0]
+        if target is None or target.key != key:
+            raise KeyError(key)
+        return positions[0]
+
+    def slice(self, start : int, count : int) -> list:
+        """Up to `count` keys from position `start` on: O(log n + count)."""
+        node, position = self._head, 0
+        for level in reversed(range(SKIP_LIST_MAX_LEVEL)):
+            while node.next[level] is not None and position + node.width[level] <= start:
+                position += node.width[level]
+                node = node.next[level]
+        keys = []
+        node = node.next[0]
+        while node is not None and len(keys) < count:
+            keys.append(node.key)
+            node = node.next[0]
+        return keys
+
+
+class Leaderboard:
+    """One board: the skip list of sort keys and each member's entry."""
+
+    def __init__(self, entries = ()):
+        self._ranking = IndexableSkipList()
+        self._entries : dict[int, BoardEntry] = {}
+        self.loaded_at = time.monotonic()
+        for entry in entries:
+            self.upsert(entry)
+
+    @staticmethod
+    def sort_key(entry : BoardEntry) -> tuple:
+        # the rank index's order: best e1RM first, then whoever got there first
+        return (-entry.e1rm, entry.achieved_on, entry.user_id)
+
+    def __len__(self):
+        return len(self._ranking)
+
+    def upsert(self, entry : BoardEntry):
+        self.remove(entry.user_id)
+        self._entries[entry.user_id] = entry
+        self._ranking.insert(self.sort_key(entry))
+
+    def remove(self, user_id : int):
+        old = self._entries.pop(user_id, None)
+        if old is not None:
+            self._ranking.remove(self.sort_key(old))
+
+    def rank(self, user_id : int) -> int | None:
+        """1-based rank, None for users not on the board."""
+        entry = self._entries.get(user_id)
+        if entry is None:
+            return None
+        return self._ranking.index(self.sort_key(entry)) + 1
+
+    def page(self, start : int, count : int) -> list[tuple[int, BoardEntry]]:
+        """(rank, entry) pairs from 0-based position `start`."""
+        keys = self._ranking.slice(start, count)
+        return [(start + offset + 1, self._entries[key[2]]) for offset, key in enumerate(keys)]
+
+
+class LeaderboardCache:
+    """The boards this process has read, reloaded from the database once they are stale."""
+
+    def __init__(self, refresh_seconds : float = LEADERBOARD_REFRESH_SECONDS):
+        self.refresh_seconds = refresh_seconds
+        self._boards : dict[int, Leaderboard] = {}
+        # catalog_id -> set once the load in flight for that board is over
+        self._loading : dict[int, asyncio.Event] = {}
+
+    async def board(self, db, catalog_id : int) -> Leaderboard:
+        board = self._boards.get(catalog_id)
+        if board is not None and time.monotonic() - board.loaded_at <= self.refresh_seconds:
+            return board
+        loading = self._loading.get(catalog_id)
+        if loading is not None:
+            if board is not None:
+                return board
+            await loading.wait()
+            # loaded, or the load failed and this request takes it over
+            return await self.board(db, catalog_id)
+
+        loading = self._loading[catalog_id] = asyncio.Event()
+        try:
+            statement = (
+                select(LeaderboardEntry.user_id, LeaderboardEntry.username, LeaderboardEntry.e1rm, LeaderboardEntry.weight, LeaderboardEntry.reps, LeaderboardEntry.achieved_on)
+                .where(LeaderboardEntry.catalog_id == catalog_id)
+                .order_by(LeaderboardEntry.e1rm.desc(), LeaderboardEntry.achieved_on, LeaderboardEntry.user_id)
+            )
+            rows = (await db.execute(statement)).all()
+            board = self._boards[catalog_id] = Leaderboard(BoardEntry(*row) for row in rows)
+        finally:
+            del self._loading[catalog_id]
+            loading.set()
+        return board
+
+    def apply(self, catalog_id : int, entry : BoardEntry):
+        # boards not loaded yet will read the new entry from the table
+        board = self._boards.get(catalog_id)
+        if board is not None:
+            board.upsert(entry)
+
+    def replace_member(self, user_id : int, entries : dict[int, BoardEntry]):
+        for board in self._boards.values():
+            board.remove(user_id)
+        for catalog_id, entry in entries.items():
+            self.apply(catalog_id, entry)
+
+    def reset(self):
+        self._boards.clear()
+        self._loading.clear()
+
+
+leaderboard_cache = LeaderboardCache()
+
+
+def record_best_statement(dialect_name : str, user_id : int, catalog_id : int, e1rm : float, weight : int, reps : int, achieved_on : date):
+    """Upsert one set as the user's entry if they are a member and it beats their current best."""
+    dialect_insert = postgresql.insert if dialect_name == "postgresql" else sqlite.insert
+    member = select(
+        literal(catalog_id, Integer), User.id, User.username, literal(e1rm, Float), literal(weight, Integer), literal(reps, Integer), literal(achieved_on, Date),
+    ).where(User.id == user_id, User.leaderboard_opt_in, User.deleted_at.is_(None))
+
+    statement = dialect_insert(LeaderboardEntry).from_select(ENTRY_COLUMNS, member)
+    return statement.on_conflict_do_update(
+        index_elements = [LeaderboardEntry.catalog_id, LeaderboardEntry.user_id],
+        set_ = {
+            "e1rm" : statement.excluded.e1rm, "weight" : statement.excluded.weight, "reps" : statement.excluded.reps,
+            "achieved_on" : statement.excluded.achieved_on, "updated_at" : func.now(),
+        },
+        # a tie keeps the earlier date
+        where = LeaderboardEntry.e1rm < statement.excluded.e1rm,
+    ).returning(LeaderboardEntry.catalog_id, LeaderboardEntry.user_id, LeaderboardEntry.username, LeaderboardEntry.e1rm, LeaderboardEntry.weight, LeaderboardEntry.reps, LeaderboardEntry.achieved_on)
+
+
+def member_bests_statement(user_id : int):
+    """A user's best set per catalog exercise: (catalog_id, weight, reps, date)."""
+    e1rm = e1rm_expression(WorkoutExercise.weight, WorkoutExercise.reps)
+    ranked = (
+        select(
+            Exercise.catalog_id, WorkoutExercise.weight, WorkoutExercise.reps, WorkoutExercise.date,
+            func.row_number().over(partition_by = Exercise.catalog_id, order_by = (e1rm.desc(), WorkoutExercise.date)).label("place"),
+        )
+        .join(Exercise, Exercise.exercise_id == WorkoutExercise.exercise_id)
+        # the soft-delete filter only rewrites the outer select
+        .where(
+            WorkoutExercise.user_id == user_id, Exercise.catalog_id.is_not(None),
+            WorkoutExercise.deleted_at.is_(None), Exercise.deleted_at.is_(None),
+            WorkoutExercise.workout_id.not_in(template_ids(user_id)),
+        )
+        .subquery("member_sets")
+    )
+    return select(ranked.c.catalog_id, ranked.c.weight, ranked.c.reps, ranked.c.date).where(ranked.c.place == 1)
+
+
+async def record_sets(directory_db, user_id : int, sets) -> int:
+    """Feed newly logged (catalog_id, weight, reps, date) sets to the user's boards.
+
+    One upsert per board touched, with the batch's best set for it. Returns the number of
+    entries that changed. A failure is logged and swallowed: the sets are saved either way,
+    and the entry catches up on the member's next rebuild.
+    """
+    best = {}
+    for catalog_id, weight, reps, achieved_on in sets:
+        if catalog_id is None:
+            continue
+        e1rm = estimate_1rm(weight, reps)
+        if catalog_id not in best or e1rm > best[catalog_id][0]:
+            best[catalog_id] = (e1rm, weight, reps, achieved_on)
+    if not best:
+        return 0
+
+    dialect_name = directory_db.bind.dialect.name
+    try:
+        changed = []
+        for catalog_id, (e1rm, weight, reps, achieved_on) in best.items():
+            statement = record_best_statement(dialect_name, user_id, catalog_id, e1rm, weight, reps, achieved_on)
+            changed += (await directory_db.execute(statement)).all()
+        await directory_db.commit()
+    except SQLAlchemyError as e:
+        await directory_db.rollback()
+        logger.warning("leaderboard update for user %d failed: %s", user_id, e)
+        return 0
+
+    for catalog_id, *entry in changed:
+        leaderboard_cache.apply(catalog_id, BoardEntry(*entry))
+    return len(changed)
+
+
+async def rebuild_member(data_db, directory_db, user_id : int) -> int | None:
+    """Replace a member's entries with their current bests; None for users who have not joined.
+
+    Failures are logged and swallowed like record_sets'.
+    """
+    try:
+        username = (await directory_db.scalars(
+            select(User.username).where(User.id == user_id, User.leaderboard_opt_in, User.deleted_at.is_(None))
+        )).one_or_none()
+        if username is None:
+            return None
+        rows = (await data_db.execute(member_bests_statement(user_id))).all()
+        entries = {catalog_id : BoardEntry(user_id, username, estimate_1rm(weight, reps), weight, reps, achieved_on) for catalog_id, weight, reps, achieved_on in rows}
+
+        await directory_db.execute(delete(LeaderboardEntry).where(LeaderboardEntry.user_id == user_id))
+        if entries:
+            await directory_db.execute(insert(LeaderboardEntry).values([{"catalog_id" : catalog_id, **entry._asdict()} for catalog_id, entry in entries.items()]))
+        await directory_db.commit()
+    except SQLAlchemyError as e:
+        await directory_db.rollback()
+        logger.warning("leaderboard rebuild for user %d failed: %s", user_id, e)
+        return None
+
+    leaderboard_cache.replace_member(user_id, entries)
+    return len(entries)
+
+
+async def leave(directory_db, user_id : int):
+    """Opt out: clear the flag and take the user off every board. The caller commits."""
+    await directory_db.execute(update(User).where(User.id == user_id).values(leaderboard_opt_in = False))
+    await directory_db.execute(delete(LeaderboardEntry).where(LeaderboardEntry.user_id == user_id))
+
+
+def forget_member(user_id : int):
+    # after leave() or an account deletion has committed
+    leaderboard_cache.replace_member(user_id, {})
@@ -0,0 +1,203 @@
+"""Live workout sessions over a WebSocket.
+
+Protocol (JSON text frames):
+    client -> {"exercise_id": 3, "set_number": 1, "weight": 100, "reps": 5}
+    server -> {"type": "ack", "exercise_id": 3, "set_number": 1, "status": "buffered"}
+    server -> {"type": "flushed", "sets": [[3, 1], ...]}            after each batched commit
+    server -> {"type": "error", "exercise_id": 3, "set_number": 1, "detail": "..."}
+    server -> {"type": "error", "sets": [[3, 1], ...], "detail": "Workout not found."}
+                                                                   then the socket closes
+    client -> {"type": "flush"}                                    optional explicit flush
+
+Authentication and the workout ownership check happen once when the socket opens. The
+user's exercise IDs are cached and read again every OWNERSHIP_TTL_SECONDS, the same window
+logging a set over HTTP has for exercises deleted elsewhere. Sets are written in batches of
+LIVE_BATCH_SIZE, or after LIVE_FLUSH_SECONDS of quiet, and whatever is still buffered is
+written when the client disconnects. Each written batch feeds the leaderboards once.
+
+Batches are written with the INSERT ... SELECT of queries.insert_sets, which reads the
+workout and only inserts while it is live. A workout deleted while the socket is open
+therefore takes no more sets: the batch is reported back unwritten and the socket closes.
+
+A socket can stay open for a whole workout, so the session never leaves a transaction open
+between messages: every read and every flush ends its own, and the pooled connection goes
+back to the pool until the next one.
+"""
+import os
+import time
+from pydantic import ValidationError
+from sqlalchemy import select
+from sqlalchemy.exc import IntegrityError, SQLAlchemyError
+from models.exercise import Exercise
+from schemas import LiveSetMessage
+from queries import insert_sets, purge_deleted_set
+from leaderboards import record_sets
+from ownership import OWNERSHIP_TTL_SECONDS
+
+LIVE_BATCH_SIZE = int(os.getenv('LIVE_BATCH_SIZE', '10'))
+LIVE_FLUSH_SECONDS = float(os.getenv('LIVE_FLUSH_SECONDS', '2'))
+
+DUPLICATE_SET_DETAIL = "An entry with the given workout, exercise, and set number already exists."
+WORKOUT_GONE_DETAIL = "Workout not found."
+
+
+class LiveWorkoutSession:
+    def __init__(self, db, user_id : int, workout, exercise_ids : set[int], batch_size : int = LIVE_BATCH_SIZE, catalog_ids : dict[int, int] | None = None, directory_db = None):
+        self.db = db
+        self.user_id = user_id
+        # copied now: ending the transaction expires the workout, and reloading it would start another
+        self.workout_id = workout.workout_id
+        self.workout_date = workout.date
+        self.exercise_ids = exercise_ids
+        self.exercises_loaded_at = time.monotonic()
+        self.batch_size = batch_size
+        # exercise_id -> catalog_id for the exercises linked to the catalog
+        self.catalog_ids = catalog_ids or {}
+        self.directory_db = directory_db or db
+        self.ranked = not workout.is_template
+        self._buffer : list[dict] = []
+        self._pending : set[tuple[int, int]] = set()
+        # set once a write finds the workout deleted; the socket is closed after the replies
+        self.workout_gone = False
+
+    @staticmethod
+    async def _read_exercises(db, user_id : int) -> tuple[set[int], dict[int, int]]:
+        rows = (await db.execute(select(Exercise.exercise_id, Exercise.catalog_id).where(Exercise.user_id == user_id))).all()
+        exercise_ids = {exercise_id for exercise_id, _ in rows}
+        catalog_ids = {exercise_id : catalog_id for exercise_id, catalog_id in rows if catalog_id is not None}
+        return exercise_ids, catalog_ids
+
+    @classmethod
+    async def open(cls, db, user_id : int, workout, batch_size : int | None = None, directory_db = None):
+        exercise_ids, catalog_ids = await cls._read_exercises(db, user_id)
+        session = cls(db, user_id, workout, exercise_ids, batch_size or LIVE_BATCH_SIZE, catalog_ids, directory_db)
+        # ends the transaction the ownership and workout reads started, releasing the connection
+        await db.rollback()
+        return session
+
+    @property
+    def buffered(self) -> int:
+        return len(self._buffer)
+
+    async def _owns_exercise(self, exercise_id : int) -> bool:
+        if time.monotonic() - self.exercises_loaded_at > OWNERSHIP_TTL_SECONDS:
+            # exercises deleted since the last read, by this client or another, drop out
+            self.exercise_ids, self.catalog_ids = await self._read_exercises(self.db, self.user_id)
+            self.exercises_loaded_at = time.monotonic()
+            await self.db.rollback()
+        if exercise_id in self.exercise_ids:
+            return True
+        # the exercise may have been created after the session started; refresh the cache once
+        row = (await self.db.execute(select(Exercise.user_id, Exercise.catalog_id).where(Exercise.exercise_id == exercise_id))).one_or_none()
+        await self.db.rollback()
+        if row is not None and row.user_id == self.user_id:
+            self.exercise_ids.add(exercise_id)
+            if row.catalog_id is not None:
+                self.catalog_ids[exercise_id] = row.catalog_id
+            return True
+        return False
+
+    async def add_set(self, message : dict) -> list[dict]:
+        """Buffer one incoming set and return the replies for it (plus a flush report when a batch fills)."""
+        try:
+            live_set = LiveSetMessage.model_validate(message)
+        except ValidationError as e:
+            return [{"type" : "error", "exercise_id" : message.get("exercise_id"), "set_number" : message.get("set_number"), "detail" : e.errors(include_url = False, include_context = False)}]
+
+        key = (live_set.exercise_id, live_set.set_number)
+        if not await self._owns_exercise(live_set.exercise_id):
+            return [{"type" : "error", "exercise_id" : key[0], "set_number" : key[1], "detail" : "Forbidden: you cannot use this exercise."}]
+        if key in self._pending:
+            return [{"type" : "error", "exercise_id" : key[0], "set_number" : key[1], "detail" : DUPLICATE_SET_DETAIL}]
+
+        self._pending.add(key)
+        self._buffer.append({
+            **live_set.model_dump(),
+            "workout_id" : self.workout_id,
+            "user_id" : self.user_id,
+            "date" : self.workout_date,
+        })
+        replies = [{"type" : "ack", "exercise_id" : key[0], "set_number" : key[1], "status" : "buffered"}]
+
+        if len(self._buffer) >= self.batch_size:
+            replies += await self.flush()
+        return replies
+
+    async def flush(self) -> list[dict]:
+        """Write buffered sets in one transaction; on a conflict, retry row by row to isolate it."""
+        if not self._buffer:
+            # nothing to write, but never leave a transaction holding the connection
+            await self.db.rollback()
+            return []
+        rows, self._buffer = self._buffer, []
+        self._pending.clear()
+
+        try:
+            written = (await self.db.execute(insert_sets(self.user_id, self.workout_id, rows))).rowcount
+        except SQLAlchemyError:
+            await self.db.rollback()
+        else:
+            if not written:
+                await self.db.rollback()
+                return self._workout_gone(rows)
+            await self.db.commit()
+            await self._record(rows)
+            return [{"type" : "flushed", "sets" : [[row["exercise_id"], row["set_number"]] for row in rows]}]
+
+        saved = []
+        replies = []
+        for index, row in enumerate(rows):
+            try:
+                written = (await self.db.execute(insert_sets(self.user_id, self.workout_id, [row]))).rowcount
+                if not written:
+                    await self.db.rollback()
+                    replies += self._workout_gone(rows[index:])
+                    break
+                await self.db.commit()
+                saved.append([row["exercise_id"], row["set_number"]])
+            except IntegrityError:
+                await self.db.rollback()
+                if await self._replace_deleted_set(row):
+                    saved.append([row["exercise_id"], row["set_number"]])
+                elif self.workout_gone:
+                    replies += self._workout_gone(rows[index:])
+                    break
+                else:
+                    replies.append({"type" : "error", "exercise_id" : row["exercise_id"], "set_number" : row["set_number"], "detail" : DUPLICATE_SET_DETAIL})
+            except SQLAlchemyError:
+                await self.db.rollback()
+                replies.append({"type" : "error", "exercise_id" : row["exercise_id"], "set_number" : row["set_number"], "detail" : "A database error occurred."})
+        if saved:
+            saved_keys = {tuple(key) for key in saved}
+            await self._record([row for row in rows if (row["exercise_id"], row["set_number"]) in saved_keys])
+            replies.insert(0, {"type" : "flushed", "sets" : saved})
+        return replies
+
+    def _workout_gone(self, rows : list[dict]) -> list[dict]:
+        self.workout_gone = True
+        return [{"type" : "error", "sets" : [[row["exercise_id"], row["set_number"]] for row in rows], "detail" : WORKOUT_GONE_DETAIL}]
+
+    async def _record(self, rows : list[dict]):
+        if not self.ranked:
+            return
+        sets = [(self.catalog_ids[row["exercise_id"]], row["weight"], row["reps"], row["date"]) for row in rows if row["exercise_id"] in self.catalog_ids]
+        if sets:
+            await record_sets(self.directory_db, self.user_id, sets)
+
+    async def _replace_deleted_set(self, row : dict) -> bool:
+        """Write `row` over a deleted set holding its key; False when a live set holds it."""
+        try:
+            purged = await self.db.execute(purge_deleted_set(row["workout_id"], row["exercise_id"], row["set_number"]))
+            if not purged.rowcount:
+                await self.db.rollback()
+                return False
+            if not (await self.db.execute(insert_sets(self.user_id, self.workout_id, [row]))).rowcount:
+                # the workout was deleted too; the caller reports it
+                await self.db.rollback()
+                self.workout_gone = True
+                return False
+            await self.db.commit()
+            return True
+        except SQLAlchemyError:
+            await self.db.rollback()
+            return False
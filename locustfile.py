@@ -1,10 +1,17 @@
 from locust import HttpUser, task, between, events, SequentialTaskSet
 from locust.exception import StopUser
 from fastapi import status
+from datetime import date, timedelta
 import random
 import os
 import psycopg2
 from dotenv import load_dotenv
+from seed import SEED_USER_PREFIX, SEED_EXERCISES
+from slo import load_slos, evaluate, format_report
+
+# size of the population loaded with `python seed.py`; persona users log in as one of them
+SEEDED_USERS = int(os.environ.get("SEEDED_USERS", "1000"))
+SEED_PASSWORD = os.environ.get("SEED_PASSWORD", "hello")
 
 class UserFlow(SequentialTaskSet):
     def __init__(self, parent):
@@ -303,7 +310,7 @@ class UserFlow(SequentialTaskSet):
             "description" : ""
         }
 
-        exercise_update = self.client.put(f"/exercises/{self.exercise1_id}", json = new_data, headers = self.auth_headers)
+        exercise_update = self.client.put(f"/exercises/{self.exercise1_id}", json = new_data, headers = self.auth_headers, name = "/exercises/{id}")
         if exercise_update.status_code == status.HTTP_200_OK:
             exercise_update_response = exercise_update.json()
             self.updated_exercise_id = exercise_update_response["exercise_id"]
@@ -324,7 +331,7 @@ class UserFlow(SequentialTaskSet):
         target_id = getattr(self, 'updated_exercise_id', getattr(self, 'exercise1_id', None))
         
         if target_id:
-            self.client.get(f"/exercises/{target_id}", headers = self.auth_headers)
+            self.client.get(f"/exercises/{target_id}", headers = self.auth_headers, name = "/exercises/{id}")
 
     #get first workout
     @task
@@ -332,7 +339,7 @@ class UserFlow(SequentialTaskSet):
         if not hasattr(self, 'workout1_id'):
             return
             
-        self.client.get(f"/workouts/{self.workout1_id}", headers = self.auth_headers)
+        self.client.get(f"/workouts/{self.workout1_id}", headers = self.auth_headers, name = "/workouts/{id}")
 
     #19. Delete the second exercise 
     @task
@@ -340,7 +347,8 @@ class UserFlow(SequentialTaskSet):
         if not hasattr(self, 'exercise2_id'):
             return
             
-        self.client.delete(f"/exercises/{self.exercise2_id}", headers = self.auth_headers)
+        # it has logged sets by now, which are only deleted along with it on request
+        self.client.delete(f"/exercises/{self.exercise2_id}?cascade=true", headers = self.auth_headers, name = "/exercises/{id}")
 
     #20. Get all exercises.
     @task
@@ -349,13 +357,167 @@ class UserFlow(SequentialTaskSet):
         raise StopUser()
 
 
+class SeededUser(HttpUser):
+    """Base persona: logs in as a random seeded user and re-logs in when the token expires."""
+    abstract = True
+
+    wait_time = between(0.5, 3)
+
+    def on_start(self):
+        self.workout_ids = []
+        self.exercise_ids = []
+        self.login()
+
+    def login(self):
+        username = f"{SEED_USER_PREFIX}{random.randrange(SEEDED_USERS)}"
+        response = self.client.post("/login", json = {"username_or_email" : username, "password" : SEED_PASSWORD}, name = "/login")
+        if response.status_code != status.HTTP_200_OK:
+            raise StopUser()
+        self.auth_headers = {"Authorization" : f"Bearer {response.json()['jwt_token']}"}
+
+    def call(self, method, path, name = None, **kwargs):
+        response = self.client.request(method, path, headers = self.auth_headers, name = name or path, **kwargs)
+        if response.status_code == status.HTTP_401_UNAUTHORIZED:
+            self.login()
+            response = self.client.request(method, path, headers = self.auth_headers, name = name or path, **kwargs)
+        return response
+
+    def load_workouts(self, days = 90):
+        since = (date.today() - timedelta(days = days)).isoformat()
+        response = self.call("GET", f"/workouts?from={since}", name = "/workouts")
+        if response.status_code == status.HTTP_200_OK:
+            self.workout_ids = [w["workout_id"] for w in response.json()]
+
+    def load_exercises(self):
+        response = self.call("GET", "/exercises")
+        if response.status_code == status.HTTP_200_OK:
+            self.exercise_ids = [e["exercise_id"] for e in response.json()]
+
+
+class BrowseUser(SeededUser):
+    """Scrolls recent history: listings dominate."""
+    weight = 6
+
+    @task(5)
+    def list_recent_workouts(self):
+        self.load_workouts()
+
+    @task(4)
+    def view_workout_sets(self):
+        if not self.workout_ids:
+            return self.load_workouts()
+        self.call("GET", f"/workouts/{random.choice(self.workout_ids)}/sets", name = "/workouts/{id}/sets")
+
+    @task(2)
+    def view_workout(self):
+        if self.workout_ids:
+            self.call("GET", f"/workouts/{random.choice(self.workout_ids)}", name = "/workouts/{id}")
+
+    @task(2)
+    def list_exercises(self):
+        self.load_exercises()
+
+    @task(2)
+    def search_exercises(self):
+        prefix = random.choice(SEED_EXERCISES)[:random.randint(1, 4)]
+        self.call("GET", f"/exercises/search?q={prefix}", name = "/exercises/search")
+
+
+class LoggerUser(SeededUser):
+    """Logs a live session: one workout, then a stream of sets."""
+    weight = 3
+
+    def on_start(self):
+        super().on_start()
+        self.load_exercises()
+        self.current_workout = None
+        self.set_numbers = {}
+
+    @task(1)
+    def start_workout(self):
+        today = date.today().isoformat()
+        response = self.call("POST", "/workouts", json = {"name" : "Load Session", "description" : "", "date" : today, "start_time" : f"{today}T07:00:00Z"})
+        if response.status_code == status.HTTP_200_OK:
+            self.current_workout = response.json()["workout_id"]
+            self.set_numbers = {}
+
+    @task(6)
+    def log_set(self):
+        if self.current_workout is None or not self.exercise_ids:
+            return self.start_workout()
+        exercise_id = random.choice(self.exercise_ids)
+        set_number = self.set_numbers.get(exercise_id, 0) + 1
+        self.set_numbers[exercise_id] = set_number
+        self.call("POST", "/workoutexercises", json = {
+            "workout_id" : self.current_workout,
+            "exercise_id" : exercise_id,
+            "set_number" : set_number,
+            "weight" : random.randint(50, 200),
+            "reps" : random.randint(3, 12)
+        })
+
+    @task(1)
+    def fix_last_set(self):
+        if self.current_workout is None or not self.set_numbers:
+            return
+        exercise_id, set_number = random.choice(list(self.set_numbers.items()))
+        self.call("PUT", f"/workouts/{self.current_workout}/sets/{exercise_id}/{set_number}", name = "/workouts/{id}/sets/{exercise_id}/{set_number}", json = {
+            "workout_id" : self.current_workout,
+            "exercise_id" : exercise_id,
+            "set_number" : set_number,
+            "weight" : random.randint(50, 200),
+            "reps" : random.randint(3, 12)
+        })
+
+
+class AnalyticsUser(SeededUser):
+    """Opens progress views: aggregates over the whole history."""
+    weight = 1
+
+    @task(3)
+    def all_time_prs(self):
+        self.call("GET", "/prs")
+
+    @task(2)
+    def recent_prs(self):
+        since = (date.today() - timedelta(days = 180)).isoformat()
+        self.call("GET", f"/prs?from={since}", name = "/prs")
+
+    @task(1)
+    def full_history(self):
+        self.call("GET", "/workouts")
+
+
 class AppUser(HttpUser):
+    """Onboarding persona: registers a fresh account and runs the original scripted flow."""
     tasks = [UserFlow]
 
+    weight = 1
+
     wait_time = between(1, 5)
 
 
 load_dotenv()
+@events.quitting.add_listener
+def report_slos(environment, **kwargs):
+    rows = [
+        {
+            "name" : f"{entry.method} {entry.name}",
+            "requests" : entry.num_requests,
+            "failures" : entry.num_failures,
+            "p50" : entry.get_response_time_percentile(0.50),
+            "p95" : entry.get_response_time_percentile(0.95),
+            "p99" : entry.get_response_time_percentile(0.99),
+        }
+        for entry in environment.stats.entries.values()
+    ]
+    report, breaches = evaluate(rows, load_slos())
+
+    print("\n--- SLO report ---")
+    print(format_report(report, breaches))
+    if breaches:
+        environment.process_exit_code = 1
+
 @events.quitting.add_listener
 def on_locust_quit(environment, **kwargs):
     print("\n--- Starting Automatic Test Database Cleanup ---")
@@ -375,16 +537,17 @@ def on_locust_quit(environment, **kwargs):
         connection = psycopg2.connect(clean_db_url)
         cursor = connection.cursor()
 
-        print("Truncating tables")
+        # only accounts registered during the run; the seeded population is kept for the next run
+        print("Deleting users registered by this run")
 
-        cursor.execute("TRUNCATE TABLE users RESTART IDENTITY CASCADE;")
+        cursor.execute("DELETE FROM users WHERE username LIKE 'locustest\\_%';")
 
         connection.commit()
         cursor.close()
         connection.close()
 
-        print("Test database cleared; all the load test data has been removed.")
+        print("Load test accounts removed; seeded users were kept.")
 
     except Exception as e:
         print(f"ERROR during database cleanup: {e}")
-        print("!!! Database may not be clean. Manual check is required. !!!")
\ No newline at end of file
+        print("!!! Database may not be clean. Manual check is required. !!!")
@@ -1,17 +1,16 @@
 from logging.config import fileConfig
 import os
-from dotenv import load_dotenv
+import config as app_config  # noqa: F401  (loads .env; `config` below is Alembic's)
 
-load_dotenv()
-# from ../config import DATABASE_URL
-
-from sqlalchemy import engine_from_config
+from sqlalchemy import engine_from_config, make_url
 from sqlalchemy import pool
 from models.base import Base
 from models.user import User
 from models.exercise import Exercise
 from models.workout import Workout
 from models.workout_exercise import WorkoutExercise
+from models.catalog_exercise import CatalogExercise
+from models.leaderboard_entry import LeaderboardEntry
 from alembic import context
 
 # this is the Alembic Config object, which provides
@@ -28,7 +27,7 @@ def get_db_url():
     if DB_URL is None:
         raise ValueError("Database is not set. Check .env file or command.")
     
-    print(f"Alembic is using this database URL: {DB_URL}")
+    print(f"Alembic is using this database URL: {make_url(DB_URL).render_as_string(hide_password = True)}")
 
     return DB_URL
 
@@ -0,0 +1,37 @@
+"""cascade sets with exercise
+
+Revision ID: 2f9a7c3e5d10
+Revises: 8d2c6f4e1b07
+Create Date: 2026-10-19 16:20:31.507926
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '2f9a7c3e5d10'
+down_revision: Union[str, Sequence[str], None] = '8d2c6f4e1b07'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    # DELETE /exercises/{id}?cascade=true removes the logged sets in the same statement
+    op.drop_constraint('workout_exercises_exercise_id_fkey', 'workout_exercises', type_='foreignkey')
+    op.create_foreign_key('workout_exercises_exercise_id_fkey', 'workout_exercises', 'exercises', ['exercise_id'], ['exercise_id'], ondelete='CASCADE')
+    # the cascade looks sets up by exercise_id alone; an index led by user_id cannot serve it,
+    # while this one still serves the history query (an exercise belongs to one user)
+    op.create_index('ix_workout_exercises_exercise_id_date', 'workout_exercises', ['exercise_id', 'date'], unique=False, if_not_exists=True)
+    op.drop_index('ix_workout_exercises_user_id_exercise_id_date', table_name='workout_exercises', if_exists=True)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.create_index('ix_workout_exercises_user_id_exercise_id_date', 'workout_exercises', ['user_id', 'exercise_id', 'date'], unique=False, if_not_exists=True)
+    op.drop_index('ix_workout_exercises_exercise_id_date', table_name='workout_exercises')
+    op.drop_constraint('workout_exercises_exercise_id_fkey', 'workout_exercises', type_='foreignkey')
+    op.create_foreign_key('workout_exercises_exercise_id_fkey', 'workout_exercises', 'exercises', ['exercise_id'], ['exercise_id'])
@@ -0,0 +1,120 @@
+"""global exercise catalog
+
+Revision ID: 4c66e675f106
+Revises: a15e252825ef
+Create Date: 2026-10-19 10:03:51.402377
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '4c66e675f106'
+down_revision: Union[str, Sequence[str], None] = 'a15e252825ef'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+CATALOG_SEED = [
+    ("bench press", "Barbell press from a flat bench."),
+    ("incline bench press", "Barbell press from an inclined bench."),
+    ("dumbbell press", "Dumbbell press from a flat bench."),
+    ("overhead press", "Standing barbell press overhead."),
+    ("squat", "Barbell back squat."),
+    ("front squat", "Barbell squat with the bar racked in front."),
+    ("deadlift", "Conventional barbell deadlift."),
+    ("romanian deadlift", "Hip hinge with a slight knee bend."),
+    ("barbell row", "Bent-over barbell row."),
+    ("pull up", "Bodyweight pull-up, pronated grip."),
+    ("chin up", "Bodyweight pull-up, supinated grip."),
+    ("lat pulldown", "Cable pulldown to the upper chest."),
+    ("dip", "Bodyweight dip on parallel bars."),
+    ("leg press", "Machine leg press."),
+    ("leg extension", "Machine knee extension."),
+    ("leg curl", "Machine knee flexion."),
+    ("lunge", "Walking or stationary lunge."),
+    ("hip thrust", "Barbell hip thrust from a bench."),
+    ("calf raise", "Standing calf raise."),
+    ("bicep curl", "Dumbbell or barbell curl."),
+    ("tricep extension", "Overhead or cable tricep extension."),
+    ("lateral raise", "Dumbbell lateral raise."),
+    ("face pull", "Cable face pull."),
+    ("clean", "Olympic clean."),
+    ("snatch", "Olympic snatch."),
+    ("clean & jerk", "Olympic clean and jerk."),
+]
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    catalog = op.create_table('catalog_exercises',
+    sa.Column('catalog_id', sa.Integer(), nullable=False),
+    sa.Column('name', sa.String(), nullable=False),
+    sa.Column('description', sa.String(), nullable=True),
+    sa.Column('created_at', sa.DateTime(timezone=True), server_default=sa.text('now()'), nullable=False),
+    sa.Column('updated_at', sa.DateTime(timezone=True), server_default=sa.text('now()'), nullable=False),
+    sa.PrimaryKeyConstraint('catalog_id'),
+    sa.UniqueConstraint('name')
+    )
+    op.bulk_insert(catalog, [{"name": name, "description": description} for name, description in CATALOG_SEED])
+
+    op.add_column('exercises', sa.Column('catalog_id', sa.Integer(), nullable=True))
+    op.create_foreign_key('exercises_catalog_id_fkey', 'exercises', 'catalog_exercises', ['catalog_id'], ['catalog_id'], ondelete='SET NULL')
+
+    # link user rows whose normalized name matches a catalog entry
+    op.execute("""
+        UPDATE exercises e
+        SET catalog_id = c.catalog_id
+        FROM catalog_exercises c
+        WHERE regexp_replace(lower(trim(e.name)), '\\s+', ' ', 'g') = c.name
+    """)
+
+    # dedupe: keep the oldest row per (user, catalog entry) and move the duplicates' sets onto it,
+    # renumbering moved sets after the survivor's highest set number in each workout
+    op.execute("""
+        CREATE TEMP TABLE exercise_merge ON COMMIT DROP AS
+        SELECT exercise_id AS dup_id, keep_id
+        FROM (
+            SELECT exercise_id, min(exercise_id) OVER (PARTITION BY user_id, catalog_id) AS keep_id
+            FROM exercises
+            WHERE catalog_id IS NOT NULL
+        ) ranked
+        WHERE exercise_id <> keep_id
+    """)
+    op.execute("""
+        UPDATE workout_exercises we
+        SET exercise_id = moved.keep_id, set_number = moved.new_set_number
+        FROM (
+            SELECT we2.workout_id, we2.exercise_id, we2.set_number, m.keep_id,
+                   coalesce((
+                       SELECT max(k.set_number) FROM workout_exercises k
+                       WHERE k.workout_id = we2.workout_id AND k.exercise_id = m.keep_id
+                   ), 0) + row_number() OVER (PARTITION BY we2.workout_id, m.keep_id ORDER BY m.dup_id, we2.set_number) AS new_set_number
+            FROM workout_exercises we2
+            JOIN exercise_merge m ON m.dup_id = we2.exercise_id
+        ) moved
+        WHERE we.workout_id = moved.workout_id AND we.exercise_id = moved.exercise_id AND we.set_number = moved.set_number
+    """)
+    op.execute("DELETE FROM exercises WHERE exercise_id IN (SELECT dup_id FROM exercise_merge)")
+
+    # survivors take the canonical catalog name
+    op.execute("""
+        UPDATE exercises e
+        SET name = c.name
+        FROM catalog_exercises c
+        WHERE e.catalog_id = c.catalog_id AND e.name <> c.name
+    """)
+
+    op.create_unique_constraint('exercises_user_id_catalog_id_key', 'exercises', ['user_id', 'catalog_id'])
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    # merged duplicates are not restored
+    op.drop_constraint('exercises_user_id_catalog_id_key', 'exercises', type_='unique')
+    op.drop_constraint('exercises_catalog_id_fkey', 'exercises', type_='foreignkey')
+    op.drop_column('exercises', 'catalog_id')
+    op.drop_table('catalog_exercises')
@@ -0,0 +1,30 @@
+"""workout templates
+
+Revision ID: 5e0d8b7a13f6
+Revises: c81f4a6d2e93
+Create Date: 2026-10-19 19:03:27.551840
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '5e0d8b7a13f6'
+down_revision: Union[str, Sequence[str], None] = 'c81f4a6d2e93'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.add_column('workouts', sa.Column('is_template', sa.Boolean(), server_default=sa.false(), nullable=False))
+    op.create_index('ix_workouts_user_id_template', 'workouts', ['user_id'], unique=False, postgresql_where=sa.text('is_template'))
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index('ix_workouts_user_id_template', table_name='workouts', postgresql_where=sa.text('is_template'))
+    op.drop_column('workouts', 'is_template')
@@ -0,0 +1,31 @@
+"""user shard placement
+
+Revision ID: 635e6ab17ee6
+Revises: e145b12e4623
+Create Date: 2026-10-19 12:41:18.275031
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '635e6ab17ee6'
+down_revision: Union[str, Sequence[str], None] = 'e145b12e4623'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.add_column('users', sa.Column('shard_id', sa.Integer(), nullable=True))
+    # only moved users carry an explicit placement, so the directory refresh reads a small set
+    op.create_index('ix_users_shard_id', 'users', ['shard_id'], unique=False, postgresql_where=sa.text('shard_id IS NOT NULL'))
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index('ix_users_shard_id', table_name='users')
+    op.drop_column('users', 'shard_id')
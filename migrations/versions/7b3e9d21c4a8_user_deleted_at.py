@@ -0,0 +1,31 @@
+"""user deleted_at
+
+Revision ID: 7b3e9d21c4a8
+Revises: 2f9a7c3e5d10
+Create Date: 2026-10-19 17:05:12.318204
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '7b3e9d21c4a8'
+down_revision: Union[str, Sequence[str], None] = '2f9a7c3e5d10'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.add_column('users', sa.Column('deleted_at', sa.DateTime(timezone=True), nullable=True))
+    # the purge worker's queue: only accounts waiting to be purged are indexed
+    op.create_index('ix_users_deleted_at', 'users', ['deleted_at'], unique=False, postgresql_where=sa.text('deleted_at IS NOT NULL'))
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index('ix_users_deleted_at', table_name='users', postgresql_where=sa.text('deleted_at IS NOT NULL'))
+    op.drop_column('users', 'deleted_at')
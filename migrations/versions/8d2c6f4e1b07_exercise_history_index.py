@@ -0,0 +1,31 @@
+"""exercise history index
+
+Revision ID: 8d2c6f4e1b07
+Revises: 635e6ab17ee6
+Create Date: 2026-10-19 15:02:44.118203
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '8d2c6f4e1b07'
+down_revision: Union[str, Sequence[str], None] = '635e6ab17ee6'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    # GET /exercises/{id}/history reads one exercise of one user, optionally bounded by date.
+    # Created on plain and partitioned tables alike: partitions.convert_statements() builds
+    # ix_workout_exercises_exercise_id_date instead, which 2f9a7c3e5d10 later keeps in place of this one
+    op.create_index('ix_workout_exercises_user_id_exercise_id_date', 'workout_exercises', ['user_id', 'exercise_id', 'date'], unique=False, if_not_exists=True)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index('ix_workout_exercises_user_id_exercise_id_date', table_name='workout_exercises')
@@ -0,0 +1,46 @@
+"""leaderboards
+
+Revision ID: 9f4b2c6d8e15
+Revises: 5e0d8b7a13f6
+Create Date: 2026-10-19 20:14:52.318207
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '9f4b2c6d8e15'
+down_revision: Union[str, Sequence[str], None] = '5e0d8b7a13f6'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.add_column('users', sa.Column('leaderboard_opt_in', sa.Boolean(), server_default=sa.false(), nullable=False))
+    op.create_table('leaderboard_entries',
+    sa.Column('catalog_id', sa.Integer(), nullable=False),
+    sa.Column('user_id', sa.Integer(), nullable=False),
+    sa.Column('username', sa.String(), nullable=False),
+    sa.Column('e1rm', sa.Float(), nullable=False),
+    sa.Column('weight', sa.Integer(), nullable=False),
+    sa.Column('reps', sa.Integer(), nullable=False),
+    sa.Column('achieved_on', sa.Date(), nullable=False),
+    sa.Column('updated_at', sa.DateTime(timezone=True), server_default=sa.text('now()'), nullable=False),
+    sa.ForeignKeyConstraint(['catalog_id'], ['catalog_exercises.catalog_id'], ondelete='CASCADE'),
+    sa.ForeignKeyConstraint(['user_id'], ['users.id'], ondelete='CASCADE'),
+    sa.PrimaryKeyConstraint('catalog_id', 'user_id')
+    )
+    op.create_index('ix_leaderboard_entries_rank', 'leaderboard_entries', ['catalog_id', sa.text('e1rm DESC'), 'achieved_on', 'user_id'], unique=False)
+    op.create_index('ix_leaderboard_entries_user_id', 'leaderboard_entries', ['user_id'], unique=False)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index('ix_leaderboard_entries_user_id', table_name='leaderboard_entries')
+    op.drop_index('ix_leaderboard_entries_rank', table_name='leaderboard_entries')
+    op.drop_table('leaderboard_entries')
+    op.drop_column('users', 'leaderboard_opt_in')
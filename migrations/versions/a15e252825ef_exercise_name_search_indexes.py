@@ -0,0 +1,31 @@
+"""exercise name search indexes
+
+Revision ID: a15e252825ef
+Revises: 3cdef19b703a
+Create Date: 2026-10-19 09:12:40.118204
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'a15e252825ef'
+down_revision: Union[str, Sequence[str], None] = '3cdef19b703a'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.execute("CREATE EXTENSION IF NOT EXISTS pg_trgm")
+    op.create_index('ix_exercises_user_id_name_pattern', 'exercises', ['user_id', 'name'], unique=False, postgresql_ops={'name': 'text_pattern_ops'})
+    op.create_index('ix_exercises_name_trgm', 'exercises', ['name'], unique=False, postgresql_using='gin', postgresql_ops={'name': 'gin_trgm_ops'})
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index('ix_exercises_name_trgm', table_name='exercises')
+    op.drop_index('ix_exercises_user_id_name_pattern', table_name='exercises')
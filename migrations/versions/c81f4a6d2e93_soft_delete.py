@@ -0,0 +1,54 @@
+"""soft delete
+
+Revision ID: c81f4a6d2e93
+Revises: 7b3e9d21c4a8
+Create Date: 2026-10-19 18:12:44.902117
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'c81f4a6d2e93'
+down_revision: Union[str, Sequence[str], None] = '7b3e9d21c4a8'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+SOFT_DELETE_TABLES = ('exercises', 'workouts', 'workout_exercises')
+LIVE_ROWS = sa.text('deleted_at IS NULL')
+DELETED_ROWS = sa.text('deleted_at IS NOT NULL')
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    for table in SOFT_DELETE_TABLES:
+        op.add_column(table, sa.Column('deleted_at', sa.DateTime(timezone=True), nullable=True))
+        # compaction.py's queue: only tombstones are indexed
+        op.create_index(f'ix_{table}_deleted_at', table, ['deleted_at'], unique=False, postgresql_where=DELETED_ROWS)
+
+    # names and catalog entries only need to be unique among live exercises
+    op.drop_constraint('exercises_user_id_name_key', 'exercises', type_='unique')
+    op.drop_constraint('exercises_user_id_catalog_id_key', 'exercises', type_='unique')
+    op.create_index('uq_exercises_user_id_name', 'exercises', ['user_id', 'name'], unique=True, postgresql_where=LIVE_ROWS)
+    op.create_index('uq_exercises_user_id_catalog_id', 'exercises', ['user_id', 'catalog_id'], unique=True, postgresql_where=LIVE_ROWS)
+    op.drop_index('ix_exercises_name_trgm', table_name='exercises')
+    op.create_index('ix_exercises_name_trgm', 'exercises', ['name'], unique=False, postgresql_using='gin', postgresql_ops={'name': 'gin_trgm_ops'}, postgresql_where=LIVE_ROWS)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    # tombstones would collide with live rows under the full unique constraints
+    for table in reversed(SOFT_DELETE_TABLES):
+        op.execute(f'DELETE FROM {table} WHERE deleted_at IS NOT NULL')
+    op.drop_index('ix_exercises_name_trgm', table_name='exercises')
+    op.create_index('ix_exercises_name_trgm', 'exercises', ['name'], unique=False, postgresql_using='gin', postgresql_ops={'name': 'gin_trgm_ops'})
+    op.drop_index('uq_exercises_user_id_catalog_id', table_name='exercises')
+    op.drop_index('uq_exercises_user_id_name', table_name='exercises')
+    op.create_unique_constraint('exercises_user_id_catalog_id_key', 'exercises', ['user_id', 'catalog_id'])
+    op.create_unique_constraint('exercises_user_id_name_key', 'exercises', ['user_id', 'name'])
+    for table in reversed(SOFT_DELETE_TABLES):
+        op.drop_index(f'ix_{table}_deleted_at', table_name=table)
+        op.drop_column(table, 'deleted_at')
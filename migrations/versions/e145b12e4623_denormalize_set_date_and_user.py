@@ -0,0 +1,55 @@
+"""denormalize set date and user, optional monthly partitioning
+
+Revision ID: e145b12e4623
+Revises: 4c66e675f106
+Create Date: 2026-10-19 11:20:07.583920
+
+Run with `alembic -x partition=true upgrade head` to also convert workouts and
+workout_exercises into monthly range-partitioned tables (see partitions.py).
+
+"""
+from typing import Sequence, Union
+
+from alembic import op, context
+import sqlalchemy as sa
+
+import partitions
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'e145b12e4623'
+down_revision: Union[str, Sequence[str], None] = '4c66e675f106'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def _partitioning_requested() -> bool:
+    return context.get_x_argument(as_dictionary=True).get("partition", "").lower() in ("1", "true", "yes")
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.add_column('workout_exercises', sa.Column('user_id', sa.Integer(), nullable=True))
+    op.add_column('workout_exercises', sa.Column('date', sa.Date(), nullable=True))
+    op.create_foreign_key('workout_exercises_user_id_fkey', 'workout_exercises', 'users', ['user_id'], ['id'], ondelete='CASCADE')
+    op.execute("""
+        UPDATE workout_exercises we
+        SET user_id = w.user_id, date = w.date
+        FROM workouts w
+        WHERE w.workout_id = we.workout_id
+    """)
+    op.create_index('ix_workout_exercises_user_id_date', 'workout_exercises', ['user_id', 'date'], unique=False)
+    op.create_index('ix_workouts_user_id_date', 'workouts', ['user_id', 'date'], unique=False)
+
+    if _partitioning_requested():
+        partitions.convert(op.get_bind())
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    partitions.revert(op.get_bind())
+    op.drop_index('ix_workouts_user_id_date', table_name='workouts')
+    op.drop_index('ix_workout_exercises_user_id_date', table_name='workout_exercises')
+    op.drop_constraint('workout_exercises_user_id_fkey', 'workout_exercises', type_='foreignkey')
+    op.drop_column('workout_exercises', 'date')
+    op.drop_column('workout_exercises', 'user_id')
@@ -0,0 +1,29 @@
+from models.base import Base
+from datetime import datetime
+from sqlalchemy import String, Integer, DateTime
+from sqlalchemy.sql import func
+from sqlalchemy.orm import Mapped, mapped_column, relationship
+
+class CatalogExercise(Base):
+    __tablename__ = "catalog_exercises"
+
+    catalog_id : Mapped[int] = mapped_column(Integer, primary_key = True)
+
+    name : Mapped[str] = mapped_column(String, unique = True, nullable = False)
+
+    description : Mapped[str] = mapped_column(String, nullable = True)
+
+    created_at : Mapped[datetime] = mapped_column(
+        DateTime(timezone = True),
+        server_default = func.now(),
+        nullable = False
+    )
+
+    updated_at : Mapped[datetime] = mapped_column(
+        DateTime(timezone = True),
+        server_default = func.now(),
+        onupdate = func.now(),
+        nullable = False
+    )
+
+    exercises : Mapped[list["Exercise"]] = relationship(back_populates = "catalog_entry")
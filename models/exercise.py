@@ -1,14 +1,25 @@
 from models.base import Base
+from models.soft_delete import SoftDelete, LIVE_ROWS
 from datetime import datetime
-from sqlalchemy import String, Integer, DateTime, UniqueConstraint, ForeignKey
+from sqlalchemy import String, Integer, DateTime, ForeignKey, Index, text
 from sqlalchemy.sql import func
 from sqlalchemy.orm import Mapped, mapped_column, relationship
 
-class Exercise(Base):
+class Exercise(SoftDelete, Base):
     __tablename__ = "exercises"
 
     __table_args__ = (
-        UniqueConstraint("user_id", "name"),
+        # unique among live rows only, so a deleted exercise's name can be used again
+        Index("uq_exercises_user_id_name", "user_id", "name", unique = True, postgresql_where = text(LIVE_ROWS), sqlite_where = text(LIVE_ROWS)),
+        # at most one personal row per user for each catalog entry
+        Index("uq_exercises_user_id_catalog_id", "user_id", "catalog_id", unique = True, postgresql_where = text(LIVE_ROWS), sqlite_where = text(LIVE_ROWS)),
+        # names are lowercased on write, so a pattern-ops btree serves case-insensitive prefix lookups;
+        # it covers deleted rows too because it is also the index behind the users foreign key
+        Index("ix_exercises_user_id_name_pattern", "user_id", "name", postgresql_ops = {"name" : "text_pattern_ops"}),
+        # trigram index for similarity ranking (pg_trgm); other dialects get a plain index on name
+        Index("ix_exercises_name_trgm", "name", postgresql_using = "gin", postgresql_ops = {"name" : "gin_trgm_ops"}, postgresql_where = text(LIVE_ROWS)),
+        # compaction.py's queue
+        Index("ix_exercises_deleted_at", "deleted_at", postgresql_where = text("deleted_at IS NOT NULL"), sqlite_where = text("deleted_at IS NOT NULL")),
     )
 
     exercise_id : Mapped[int] = mapped_column(Integer, primary_key = True)
@@ -33,5 +44,8 @@ class Exercise(Base):
     user_id : Mapped[int] = mapped_column(ForeignKey("users.id", ondelete = "CASCADE"), nullable = False)
     user  : Mapped["User"] = relationship(back_populates = "exercises")
 
-    workout_exercises : Mapped[list["WorkoutExercise"]] = relationship(back_populates = "exercise")
+    workout_exercises : Mapped[list["WorkoutExercise"]] = relationship(back_populates = "exercise", cascade = "all,delete-orphan", passive_deletes = True)
+
+    catalog_id : Mapped[int] = mapped_column(ForeignKey("catalog_exercises.catalog_id", ondelete = "SET NULL"), nullable = True)
+    catalog_entry : Mapped["CatalogExercise"] = relationship(back_populates = "exercises")
      
\ No newline at end of file
@@ -0,0 +1,39 @@
+from models.base import Base
+from datetime import datetime, date
+from sqlalchemy import String, Integer, Float, Date, DateTime, ForeignKey, Index, text
+from sqlalchemy.sql import func
+from sqlalchemy.orm import Mapped, mapped_column
+
+class LeaderboardEntry(Base):
+    """A member's best estimated 1RM on one catalog exercise (see leaderboards.py)."""
+    __tablename__ = "leaderboard_entries"
+
+    __table_args__ = (
+        # the rank index: a board in rank order. e1rm is the only descending key, which a
+        # backward scan of an all-ascending index could not give
+        Index("ix_leaderboard_entries_rank", "catalog_id", text("e1rm DESC"), "achieved_on", "user_id"),
+        # behind the users foreign key and a member's rebuilds
+        Index("ix_leaderboard_entries_user_id", "user_id"),
+    )
+
+    catalog_id : Mapped[int] = mapped_column(ForeignKey("catalog_exercises.catalog_id", ondelete = "CASCADE"), primary_key = True)
+
+    user_id : Mapped[int] = mapped_column(ForeignKey("users.id", ondelete = "CASCADE"), primary_key = True)
+
+    # copied from users so a page of the board needs no join
+    username : Mapped[str] = mapped_column(String, nullable = False)
+
+    e1rm : Mapped[float] = mapped_column(Float, nullable = False)
+
+    weight : Mapped[int] = mapped_column(Integer, nullable = False)
+
+    reps : Mapped[int] = mapped_column(Integer, nullable = False)
+
+    achieved_on : Mapped[date] = mapped_column(Date, nullable = False)
+
+    updated_at : Mapped[datetime] = mapped_column(
+        DateTime(timezone = True),
+        server_default = func.now(),
+        onupdate = func.now(),
+        nullable = False
+    )
@@ -0,0 +1,34 @@
+from datetime import datetime
+from sqlalchemy import DateTime, event
+from sqlalchemy.orm import Mapped, mapped_column, Session, with_loader_criteria
+from sqlalchemy.sql.lambdas import StatementLambdaElement
+
+# partial-index predicate for indexes that only live rows need
+LIVE_ROWS = "deleted_at IS NULL"
+
+
+class SoftDelete:
+    """Rows are deleted by stamping `deleted_at`; compaction.py removes them for good later.
+
+    Every ORM select, including relationship loads, sees live rows only. Pass
+    `execution_options(include_deleted = True)` to see the deleted ones as well.
+    """
+
+    deleted_at : Mapped[datetime] = mapped_column(DateTime(timezone = True), nullable = True)
+
+
+@event.listens_for(Session, "do_orm_execute")
+def _exclude_deleted_rows(orm_execute_state):
+    # column loads refresh an instance already in hand, e.g. right after it was deleted
+    if not orm_execute_state.is_select or orm_execute_state.is_column_load:
+        return
+    if orm_execute_state.execution_options.get("include_deleted", False):
+        return
+    statement = orm_execute_state.statement
+    if isinstance(statement, StatementLambdaElement):
+        # options() on a lambda statement would apply to its cached first version, bound values
+        # included; add them to the statement resolved with this call's values instead
+        statement = statement._resolved
+    orm_execute_state.statement = statement.options(
+        with_loader_criteria(SoftDelete, lambda cls: cls.deleted_at.is_(None), include_aliases = True)
+    )
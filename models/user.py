@@ -1,6 +1,6 @@
 from .base import Base
 from datetime import datetime
-from sqlalchemy import String, Integer, DateTime, Text
+from sqlalchemy import String, Integer, Boolean, DateTime, Text, Index, text, false
 from sqlalchemy.sql import func 
 from sqlalchemy.orm import Mapped, mapped_column, relationship
 from typing import List
@@ -8,6 +8,11 @@ from typing import List
 class User(Base):
     __tablename__ = "users"
 
+    __table_args__ = (
+        Index("ix_users_shard_id", "shard_id", postgresql_where = text("shard_id IS NOT NULL")),
+        Index("ix_users_deleted_at", "deleted_at", postgresql_where = text("deleted_at IS NOT NULL")),
+    )
+
     id : Mapped[int] = mapped_column(Integer, primary_key = True)
 
     username : Mapped[str] = mapped_column(String, unique = True, index = True)
@@ -29,6 +34,15 @@ class User(Base):
 
     email : Mapped[str] = mapped_column(String, unique = True)
 
-    exercises : Mapped[list["Exercise"]] = relationship(back_populates = "user", cascade="all,delete-orphan")
+    # explicit shard placement in the directory; NULL means the default user_id % shard_count
+    shard_id : Mapped[int] = mapped_column(Integer, nullable = True)
+
+    # set by DELETE /me; the account can no longer log in and purge.py removes its data
+    deleted_at : Mapped[datetime] = mapped_column(DateTime(timezone = True), nullable = True)
+
+    # joined the leaderboards (PUT /me/leaderboards); only members' sets are ranked
+    leaderboard_opt_in : Mapped[bool] = mapped_column(Boolean, nullable = False, server_default = false(), default = False)
+
+    exercises : Mapped[list["Exercise"]] = relationship(back_populates = "user", cascade = "all,delete-orphan", passive_deletes = True)
 
-    workouts : Mapped[list["Workout"]] = relationship(back_populates = "user", cascade = "all,delete-orphan")
\ No newline at end of file
+    workouts : Mapped[list["Workout"]] = relationship(back_populates = "user", cascade = "all,delete-orphan", passive_deletes = True)
\ No newline at end of file
@@ -1,12 +1,22 @@
 from models.base import Base
+from models.soft_delete import SoftDelete
 from sqlalchemy.orm import Mapped, mapped_column, relationship
-from sqlalchemy import String, Integer, DateTime, ForeignKey, Date 
+from sqlalchemy import String, Integer, Boolean, DateTime, ForeignKey, Date, Index, text, false
 from datetime import datetime,date
 from sqlalchemy.sql import func
 
-class Workout(Base):
+class Workout(SoftDelete, Base):
     __tablename__ = "workouts"
 
+    __table_args__ = (
+        # not partial: it is also the index behind the users foreign key, whose lookups ignore partial indexes
+        Index("ix_workouts_user_id_date", "user_id", "date"),
+        # a user's few templates, which PRs and history leave out
+        Index("ix_workouts_user_id_template", "user_id", postgresql_where = text("is_template"), sqlite_where = text("is_template")),
+        # compaction.py's queue
+        Index("ix_workouts_deleted_at", "deleted_at", postgresql_where = text("deleted_at IS NOT NULL"), sqlite_where = text("deleted_at IS NOT NULL")),
+    )
+
     workout_id : Mapped[int] = mapped_column(Integer, primary_key = True)
 
     name : Mapped[str] = mapped_column(String, nullable = False)
@@ -17,6 +27,9 @@ class Workout(Base):
 
     start_time : Mapped[datetime] = mapped_column(DateTime(timezone = True), nullable = False)
 
+    # a routine to clone from (POST /workouts/{id}/clone) rather than a logged session
+    is_template : Mapped[bool] = mapped_column(Boolean, nullable = False, server_default = false(), default = False)
+
     created_at : Mapped[datetime] = mapped_column(
         DateTime(timezone = True),
         server_default = func.now(),
@@ -34,4 +47,5 @@ class Workout(Base):
 
     user : Mapped["User"] = relationship(back_populates = "workouts")
 
-    workout_exercises : Mapped[list["WorkoutExercise"]] = relationship(back_populates = "workout")
\ No newline at end of file
+    # sets go with their workout via ON DELETE CASCADE; passive_deletes keeps the ORM from loading them first
+    workout_exercises : Mapped[list["WorkoutExercise"]] = relationship(back_populates = "workout", cascade = "all,delete-orphan", passive_deletes = True)
\ No newline at end of file
@@ -1,14 +1,22 @@
 from models.base import Base
+from models.soft_delete import SoftDelete
 from sqlalchemy.sql import func
-from sqlalchemy import Integer, DateTime, String, PrimaryKeyConstraint, ForeignKey
+from sqlalchemy import Integer, DateTime, String, PrimaryKeyConstraint, ForeignKey, Date, Index, text
 from sqlalchemy.orm import Mapped, mapped_column, relationship
-from datetime import datetime
+from datetime import datetime, date
 
-class WorkoutExercise(Base):
+class WorkoutExercise(SoftDelete, Base):
     __tablename__ = "workout_exercises"
 
     __table_args__ = (
         PrimaryKeyConstraint("workout_id", "exercise_id", "set_number"),
+        # not partial: it is also the index behind the users foreign key, whose lookups ignore partial indexes
+        Index("ix_workout_exercises_user_id_date", "user_id", "date"),
+        # one exercise's history without reading the user's other sets; also serves the
+        # exercise_id foreign key's ON DELETE CASCADE (exercise ids belong to a single user)
+        Index("ix_workout_exercises_exercise_id_date", "exercise_id", "date"),
+        # compaction.py's queue
+        Index("ix_workout_exercises_deleted_at", "deleted_at", postgresql_where = text("deleted_at IS NOT NULL"), sqlite_where = text("deleted_at IS NOT NULL")),
     )
 
     # session_id : Mapped[int] = mapped_column(Integer)
@@ -34,7 +42,12 @@ class WorkoutExercise(Base):
 
     workout_id : Mapped[int] = mapped_column(ForeignKey("workouts.workout_id", ondelete = "CASCADE"), nullable = False)
 
-    exercise_id : Mapped[int] = mapped_column(ForeignKey("exercises.exercise_id"), nullable = False)
+    exercise_id : Mapped[int] = mapped_column(ForeignKey("exercises.exercise_id", ondelete = "CASCADE"), nullable = False)
+
+    # denormalized from the parent workout so sets can be partitioned and pruned by date
+    user_id : Mapped[int] = mapped_column(ForeignKey("users.id", ondelete = "CASCADE"), nullable = True)
+
+    date : Mapped[date] = mapped_column(Date, nullable = True)
 
     workout : Mapped["Workout"] = relationship(back_populates = "workout_exercises")
 
@@ -0,0 +1,162 @@
+"""Saturation signals for a worker: event loop lag, thread pools and database pools.
+
+The lifespan starts a task that sleeps MONITOR_INTERVAL_SECONDS and records how late it
+woke up. A blocked or overloaded event loop shows up as lag before it shows up as latency.
+The other readings are taken when asked for:
+    - AnyIO's default thread limiter, which run_in_threadpool and sync endpoints share:
+      busy threads, its size and the tasks waiting for a thread
+    - the password hashing pool (passwords.py): jobs running and jobs queued
+    - every engine's connection pool: size, capacity (size plus max overflow), connections
+      checked out, overflow in use and requests waiting for a connection
+
+GET /metrics returns them in the Prometheus text format. GET /health/ready answers 503
+once the average lag over the last MONITOR_WINDOW samples, a thread pool's queue or a
+pool's waiters go over their READY_* limit, so a load balancer stops sending traffic to a
+saturated worker until it has caught up. A pool that is fully checked out with nobody
+waiting is a worker busy at peak, not a saturated one, and stays ready. Both are unauthenticated,
+like any health check, and PROBE_PATHS are left out of rate limiting, idempotency and
+compression, so probes from one load balancer address are never throttled.
+
+Only public counters are read: AnyIO's limiter statistics, the hasher's own job counts, the
+pools' size(), checkedout() and overflow(), and the waiters database.WaiterCount counts in
+the pools' connect().
+"""
+import asyncio
+import os
+from collections import deque
+import anyio.to_thread
+import database
+from passwords import password_hasher
+from sharding import shard_engines
+
+MONITOR_INTERVAL_SECONDS = float(os.getenv('MONITOR_INTERVAL_SECONDS', '0.5'))
+# samples averaged for readiness: a single GC pause does not take a worker out
+MONITOR_WINDOW = 10
+READY_MAX_LOOP_LAG_MS = float(os.getenv('READY_MAX_LOOP_LAG_MS', '200'))
+READY_MAX_THREADPOOL_QUEUE = int(os.getenv('READY_MAX_THREADPOOL_QUEUE', '50'))
+READY_MAX_DB_WAITERS = int(os.getenv('READY_MAX_DB_WAITERS', '10'))
+PROBE_PATHS = frozenset({"/metrics", "/health/ready"})
+
+
+class LoopLagMonitor:
+    """Measures how late a periodic sleep on the event loop wakes up."""
+
+    def __init__(self, interval : float = MONITOR_INTERVAL_SECONDS, window : int = MONITOR_WINDOW):
+        self.interval = interval
+        self.samples : deque[float] = deque(maxlen = window)
+        self._task = None
+
+    @property
+    def lag(self) -> float:
+        return self.samples[-1] if self.samples else 0.0
+
+    @property
+    def average_lag(self) -> float:
+        return sum(self.samples) / len(self.samples) if self.samples else 0.0
+
+    @property
+    def max_lag(self) -> float:
+        return max(self.samples, default = 0.0)
+
+    def start(self):
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task is None:
+            return
+        self._task.cancel()
+        try:
+            await self._task
+        except asyncio.CancelledError:
+            pass
+        self._task = None
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            due = loop.time() + self.interval
+            await asyncio.sleep(self.interval)
+            self.samples.append(max(0.0, loop.time() - due))
+
+
+loop_monitor = LoopLagMonitor()
+
+
+def threadpool_stats() -> dict:
+    # the limiter belongs to the running event loop, so call this from a coroutine
+    statistics = anyio.to_thread.current_default_thread_limiter().statistics()
+    return {"busy" : statistics.borrowed_tokens, "size" : int(statistics.total_tokens), "queue" : statistics.tasks_waiting}
+
+
+def pool_stats() -> dict:
+    """Per engine: {"size", "capacity", "checked_out", "overflow", "waiters"}."""
+    engines = {"primary" : database.engine, "replica" : database.replica_engine}
+    engines.update({f"shard_{i}" : shard_engine for i, shard_engine in enumerate(shard_engines())})
+    stats = {}
+    for name, engine in engines.items():
+        if engine is None or not hasattr(engine.pool, "checkedout"):
+            continue
+        pool = engine.pool
+        # every engine is built with database.pool_options(), so its overflow limit is known here
+        capacity = pool.size() + database.DB_MAX_OVERFLOW
+        stats[name] = {
+            "size" : pool.size(), "capacity" : capacity, "checked_out" : pool.checkedout(), "overflow" : max(0, pool.overflow()),
+            # pools built without database.pool_options() do not count their waiters
+            "waiters" : getattr(pool, "waiting", 0),
+        }
+    return stats
+
+
+def snapshot() -> dict:
+    return {
+        "loop_lag" : {"last" : loop_monitor.lag, "average" : loop_monitor.average_lag, "max" : loop_monitor.max_lag},
+        "threadpool" : threadpool_stats(),
+        "password_hash" : password_hasher.stats(),
+        "db_pools" : pool_stats(),
+    }
+
+
+def readiness(stats : dict) -> list[str]:
+    """The limits a snapshot breaks; empty when the worker can take more traffic."""
+    failing = []
+    if stats["loop_lag"]["average"] * 1000 > READY_MAX_LOOP_LAG_MS:
+        failing.append("event_loop_lag")
+    if stats["threadpool"]["queue"] > READY_MAX_THREADPOOL_QUEUE:
+        failing.append("threadpool_queue")
+    if stats["password_hash"]["queue"] > READY_MAX_THREADPOOL_QUEUE:
+        failing.append("password_hash_queue")
+    failing += [f"db_pool_waiters:{name}" for name, pool in stats["db_pools"].items() if pool["waiters"] > READY_MAX_DB_WAITERS]
+    return failing
+
+
+def _metric(lines : list, name : str, help_text : str, samples : list[tuple[str, float]]):
+    lines.append(f"# HELP fitlog_{name} {help_text}")
+    lines.append(f"# TYPE fitlog_{name} gauge")
+    lines += [f"fitlog_{name}{labels} {value}" for labels, value in samples]
+
+
+def prometheus_text(stats : dict) -> str:
+    lines = []
+    lag = stats["loop_lag"]
+    _metric(lines, "event_loop_lag_seconds", "How late the monitor's last sleep woke up.", [("", lag["last"])])
+    _metric(lines, "event_loop_lag_max_seconds", f"Largest lag over the last {MONITOR_WINDOW} samples.", [("", lag["max"])])
+    threadpool = stats["threadpool"]
+    _metric(lines, "threadpool_threads_busy", "AnyIO worker threads running a task.", [("", threadpool["busy"])])
+    _metric(lines, "threadpool_threads_max", "AnyIO default thread limiter size.", [("", threadpool["size"])])
+    _metric(lines, "threadpool_queue_depth", "Tasks waiting for an AnyIO worker thread.", [("", threadpool["queue"])])
+    password_hash = stats["password_hash"]
+    _metric(lines, "password_hash_busy", "Password hashing jobs running.", [("", password_hash["busy"])])
+    _metric(lines, "password_hash_queue_depth", "Hashing jobs waiting for a thread.", [("", password_hash["queue"])])
+    pools = stats["db_pools"]
+    for key, name, help_text in (
+        ("size", "db_pool_size", "Connections the pool keeps."),
+        ("capacity", "db_pool_capacity", "Connections the pool may open, overflow included."),
+        ("checked_out", "db_pool_checked_out", "Connections in use."),
+        ("overflow", "db_pool_overflow", "Connections open beyond the pool size."),
+        ("waiters", "db_pool_waiters", "Requests waiting for a connection."),
+    ):
+        _metric(lines, name, help_text, [(f'{{engine="{engine}"}}', pool[key]) for engine, pool in pools.items()])
+    ready = not readiness(stats)
+    _metric(lines, "ready", "1 while /health/ready answers 200.", [("", int(ready))])
+    return "\n".join(lines) + "\n"
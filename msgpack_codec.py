@@ -0,0 +1,139 @@
+"""MessagePack content negotiation.
+
+Requests with `Content-Type: application/msgpack` are decoded and validated against the
+same schemas as JSON bodies. Responses are packed when the client sends
+`Accept: application/msgpack`: the JSON rendering is parsed back through the route's
+response model, so datetimes travel as the msgpack timestamp extension type (-1) rather
+than ISO strings. Dates stay ISO strings. Error bodies are packed as they are.
+
+Every route gets this behaviour by being created through MsgPackRoute
+(`app.router.route_class`).
+"""
+import json
+from datetime import date, datetime, timezone
+from functools import lru_cache
+import msgpack
+from fastapi import HTTPException, Request, Response
+from fastapi.routing import APIRoute
+from pydantic import TypeAdapter
+from starlette.exceptions import HTTPException as StarletteHTTPException
+from fastapi.exceptions import RequestValidationError
+
+MSGPACK_MEDIA_TYPES = ("application/msgpack", "application/x-msgpack", "application/vnd.msgpack")
+MSGPACK_MEDIA_TYPE = MSGPACK_MEDIA_TYPES[0]
+
+
+def _default(value):
+    if isinstance(value, datetime):
+        # naive values come from databases without time zone support and are stored as UTC
+        return msgpack.Timestamp.from_datetime(value if value.tzinfo else value.replace(tzinfo = timezone.utc))
+    if isinstance(value, date):
+        return value.isoformat()
+    raise TypeError(f"cannot serialize {type(value).__name__} to msgpack")
+
+
+def packb(value) -> bytes:
+    return msgpack.packb(value, default = _default, datetime = True)
+
+
+def unpackb(data : bytes):
+    # timestamp=3 turns the timestamp extension into aware datetimes
+    return msgpack.unpackb(data, timestamp = 3)
+
+
+@lru_cache(maxsize = 256)
+def wants_msgpack(accept : str) -> bool:
+    """True when the Accept header ranks msgpack at least as high as JSON."""
+    msgpack_weight = json_weight = 0.0
+    for part in accept.split(","):
+        media_type, _, params = part.strip().partition(";")
+        media_type = media_type.strip().lower()
+        weight = 1.0
+        params = params.strip()
+        if params.startswith("q="):
+            try:
+                weight = float(params[2:])
+            except ValueError:
+                weight = 0.0
+        if media_type in MSGPACK_MEDIA_TYPES:
+            msgpack_weight = max(msgpack_weight, weight)
+        elif media_type in ("application/json", "application/*", "*/*"):
+            json_weight = max(json_weight, weight)
+    return msgpack_weight > 0 and msgpack_weight >= json_weight
+
+
+def is_msgpack(content_type : str | None) -> bool:
+    return content_type is not None and content_type.split(";")[0].strip().lower() in MSGPACK_MEDIA_TYPES
+
+
+class MsgPackRoute(APIRoute):
+    _response_adapter = None
+
+    def response_adapter(self):
+        # built on first use so routes nobody asks msgpack from cost nothing at startup
+        if self._response_adapter is None and self.response_model is not None:
+            self._response_adapter = TypeAdapter(self.response_model)
+        return self._response_adapter
+
+    def get_route_handler(self):
+        handle_json = super().get_route_handler()
+
+        async def handler(request : Request) -> Response:
+            packed = wants_msgpack(request.headers.get("accept", ""))
+            try:
+                if is_msgpack(request.headers.get("content-type")):
+                    request = await _as_json_request(request)
+                response = await handle_json(request)
+            except (StarletteHTTPException, RequestValidationError) as exc:
+                if not packed:
+                    raise
+                response = await _handle_exception(request, exc)
+
+            if packed:
+                return self._pack(response)
+            return response
+
+        return handler
+
+    def _pack(self, response : Response) -> Response:
+        if not response.body or not response.headers.get("content-type", "").startswith("application/json"):
+            return response
+
+        content = json.loads(response.body)
+        adapter = self.response_adapter()
+        if adapter is not None and 200 <= response.status_code < 300:
+            content = adapter.dump_python(adapter.validate_python(content))
+
+        packed = Response(content = packb(content), status_code = response.status_code, media_type = MSGPACK_MEDIA_TYPE, background = response.background)
+        for name, value in response.raw_headers:
+            if name in (b"content-length", b"content-type"):
+                continue
+            if name == b"etag" and not value.startswith(b"W/"):
+                value = b"W/" + value
+            packed.raw_headers.append((name, value))
+        packed.raw_headers.append((b"vary", b"Accept"))
+        return packed
+
+
+async def _as_json_request(request : Request) -> Request:
+    body = await request.body()
+    try:
+        decoded = unpackb(body) if body else None
+    except (ValueError, msgpack.UnpackException) as e:
+        raise HTTPException(status_code = 400, detail = "There was an error parsing the body") from e
+
+    # hand FastAPI an equivalent JSON request whose parsed body is already cached
+    scope = dict(request.scope)
+    scope["headers"] = [(name, value) for name, value in request.scope["headers"] if name != b"content-type"] + [(b"content-type", b"application/json")]
+    json_request = Request(scope, request.receive)
+    json_request._body = body
+    json_request._json = decoded
+    return json_request
+
+
+async def _handle_exception(request : Request, exc : Exception) -> Response:
+    handlers = request.app.exception_handlers
+    for cls in type(exc).__mro__:
+        if cls in handlers:
+            return await handlers[cls](request, exc)
+    raise exc
@@ -0,0 +1,188 @@
+"""Per-user cache of which exercises and workouts a user owns.
+
+Logging a set used to start with two SELECTs, one for the workout and one for the
+exercise, only to check that both belong to the caller. Rows never change owner, so each
+process keeps, per user:
+    - every live exercise id with its catalog_id (for the leaderboards)
+    - the OWNERSHIP_RECENT_WORKOUTS newest workout ids with their template flag, which
+      are the ones sets get logged into
+
+They are stored as sorted array('i') columns, searched with bisect: about 8 bytes per
+exercise and 5 per workout, instead of a Python int object and a set or dict slot for each.
+A user is loaded with two indexed queries on first use and again OWNERSHIP_TTL_SECONDS
+later. At most OWNERSHIP_CACHE_USERS users are kept, least recently used first out.
+
+The create, edit and delete endpoints update the cache of the process that served them;
+an update that races a load keeps that load's snapshot out of the cache. Other processes
+see those changes only when their copy expires, so a set can still be logged against an
+exercise deleted elsewhere for up to OWNERSHIP_TTL_SECONDS. Workouts are safe from this:
+the set's INSERT only selects from the caller's live workout. Ids that are not in the cache
+(older workouts, someone else's rows) fall back to the database, which also decides
+between 404 and 403.
+"""
+import os
+import time
+from array import array
+from bisect import bisect_left
+from collections import OrderedDict
+from queries import owned_exercises, recent_workouts
+
+OWNERSHIP_TTL_SECONDS = float(os.getenv('OWNERSHIP_TTL_SECONDS', '60'))
+OWNERSHIP_CACHE_USERS = int(os.getenv('OWNERSHIP_CACHE_USERS', '100000'))
+OWNERSHIP_RECENT_WORKOUTS = 32
+# catalog_ids are positive; 0 stands for an exercise outside the catalog
+NO_CATALOG = 0
+
+
+class UserOwnership:
+    __slots__ = ("exercise_ids", "catalog_ids", "workout_ids", "template_flags", "loaded_at")
+
+    def __init__(self, exercises : list[tuple[int, int | None]], workouts : list[tuple[int, bool]]):
+        exercises, workouts = sorted(exercises), sorted(workouts)[-OWNERSHIP_RECENT_WORKOUTS:]
+        self.exercise_ids = array("i", [exercise_id for exercise_id, _ in exercises])
+        self.catalog_ids = array("i", [catalog_id or NO_CATALOG for _, catalog_id in exercises])
+        self.workout_ids = array("i", [workout_id for workout_id, _ in workouts])
+        self.template_flags = array("b", [is_template for _, is_template in workouts])
+        self.loaded_at = time.monotonic()
+
+    @staticmethod
+    def _find(ids : array, key : int) -> int | None:
+        index = bisect_left(ids, key)
+        return index if index < len(ids) and ids[index] == key else None
+
+    def owns_exercise(self, exercise_id : int) -> bool:
+        return self._find(self.exercise_ids, exercise_id) is not None
+
+    def catalog_id(self, exercise_id : int) -> int | None:
+        index = self._find(self.exercise_ids, exercise_id)
+        if index is None or self.catalog_ids[index] == NO_CATALOG:
+            return None
+        return self.catalog_ids[index]
+
+    def owns_workout(self, workout_id : int) -> bool:
+        return self._find(self.workout_ids, workout_id) is not None
+
+    def is_template(self, workout_id : int) -> bool:
+        index = self._find(self.workout_ids, workout_id)
+        return index is not None and bool(self.template_flags[index])
+
+    def add_exercise(self, exercise_id : int, catalog_id : int | None):
+        self.remove_exercise(exercise_id)
+        index = bisect_left(self.exercise_ids, exercise_id)
+        self.exercise_ids.insert(index, exercise_id)
+        self.catalog_ids.insert(index, catalog_id or NO_CATALOG)
+
+    def remove_exercise(self, exercise_id : int):
+        index = self._find(self.exercise_ids, exercise_id)
+        if index is not None:
+            del self.exercise_ids[index]
+            del self.catalog_ids[index]
+
+    def add_workout(self, workout_id : int, is_template : bool):
+        self.remove_workout(workout_id)
+        index = bisect_left(self.workout_ids, workout_id)
+        self.workout_ids.insert(index, workout_id)
+        self.template_flags.insert(index, is_template)
+        if len(self.workout_ids) > OWNERSHIP_RECENT_WORKOUTS:
+            # ids grow with time: the smallest is the oldest
+            del self.workout_ids[0]
+            del self.template_flags[0]
+
+    def remove_workout(self, workout_id : int):
+        index = self._find(self.workout_ids, workout_id)
+        if index is not None:
+            del self.workout_ids[index]
+            del self.template_flags[index]
+
+
+class OwnershipCache:
+    def __init__(self, ttl : float = OWNERSHIP_TTL_SECONDS, max_users : int = OWNERSHIP_CACHE_USERS):
+        self.ttl = ttl
+        self.max_users = max_users
+        self._users : OrderedDict[int, UserOwnership] = OrderedDict()
+        # users with a load in flight: the number of loads and a version every update bumps
+        self._loading : dict[int, list[int]] = {}
+
+    def __len__(self):
+        return len(self._users)
+
+    def get(self, user_id : int) -> UserOwnership | None:
+        """The user's cached entry if it is fresh; never queries."""
+        entry = self._users.get(user_id)
+        if entry is None:
+            return None
+        if time.monotonic() - entry.loaded_at > self.ttl:
+            del self._users[user_id]
+            return None
+        self._users.move_to_end(user_id)
+        return entry
+
+    async def load(self, db, user_id : int) -> UserOwnership:
+        """The user's entry, read from `db` when it is missing or expired.
+
+        An update that lands while the queries are awaited may not be in their snapshot; the
+        entry then serves this call only and is not cached.
+        """
+        entry = self.get(user_id)
+        if entry is not None:
+            return entry
+        loading = self._loading.setdefault(user_id, [0, 0])
+        loading[0] += 1
+        version = loading[1]
+        try:
+            exercises = (await db.execute(owned_exercises(user_id))).all()
+            workouts = (await db.execute(recent_workouts(user_id, OWNERSHIP_RECENT_WORKOUTS))).all()
+        finally:
+            loading[0] -= 1
+            if not loading[0]:
+                del self._loading[user_id]
+        entry = UserOwnership([tuple(row) for row in exercises], [tuple(row) for row in workouts])
+        if loading[1] != version:
+            return entry
+        self._users[user_id] = entry
+        if len(self._users) > self.max_users:
+            self._users.popitem(last = False)
+        return entry
+
+    # the endpoints' updates; users that are not cached are left to load fresh
+
+    def _changed(self, user_id : int):
+        loading = self._loading.get(user_id)
+        if loading is not None:
+            loading[1] += 1
+
+    def add_exercise(self, user_id : int, exercise_id : int, catalog_id : int | None):
+        self._changed(user_id)
+        entry = self._users.get(user_id)
+        if entry is not None:
+            entry.add_exercise(exercise_id, catalog_id)
+
+    def remove_exercise(self, user_id : int, exercise_id : int):
+        self._changed(user_id)
+        entry = self._users.get(user_id)
+        if entry is not None:
+            entry.remove_exercise(exercise_id)
+
+    def add_workout(self, user_id : int, workout_id : int, is_template : bool):
+        self._changed(user_id)
+        entry = self._users.get(user_id)
+        if entry is not None:
+            entry.add_workout(workout_id, is_template)
+
+    def remove_workout(self, user_id : int, workout_id : int):
+        self._changed(user_id)
+        entry = self._users.get(user_id)
+        if entry is not None:
+            entry.remove_workout(workout_id)
+
+    def invalidate(self, user_id : int):
+        self._changed(user_id)
+        self._users.pop(user_id, None)
+
+    def clear(self):
+        for loading in self._loading.values():
+            loading[1] += 1
+        self._users.clear()
+
+
+ownership_cache = OwnershipCache()
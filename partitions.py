@@ -0,0 +1,276 @@
+"""Monthly range partitioning of `workouts` and `workout_exercises` (PostgreSQL only).
+
+Partitioning is opt-in. Either run the migrations with `alembic -x partition=true upgrade head`,
+or convert an already-migrated database with `python partitions.py convert`.
+
+Maintenance:
+    python partitions.py ensure --months-ahead 3     # pre-create upcoming monthly partitions
+    python partitions.py detach --before 2024-01     # detach (not drop) partitions older than a month
+    python partitions.py list
+
+Converting needs PostgreSQL 15 or later. Editing a workout's date can move it to another
+partition, and before 15 such an UPDATE ran as a DELETE plus an INSERT that fired the sets'
+ON DELETE CASCADE instead of their ON UPDATE CASCADE, deleting every set of the workout.
+
+Run `ensure` on a schedule so months are created before any row lands in them; rows for a month
+without its own partition go to the default partition, and that month then has to be split by hand.
+"""
+import argparse
+from datetime import date
+from sqlalchemy import text, create_engine
+from sqlalchemy.engine import make_url
+
+PARTITIONED_TABLES = ("workouts", "workout_exercises")
+# server_version_num of PostgreSQL 15, the first to cascade cross-partition UPDATEs as updates
+MIN_SERVER_VERSION = 150000
+
+# indexes on columns that later migrations add, as (table, column, DDL); convert() also runs
+# from the migration that predates them
+LATER_INDEXES = [
+    ("workouts", "deleted_at", "CREATE INDEX ix_workouts_deleted_at ON workouts (deleted_at) WHERE deleted_at IS NOT NULL"),
+    ("workout_exercises", "deleted_at", "CREATE INDEX ix_workout_exercises_deleted_at ON workout_exercises (deleted_at) WHERE deleted_at IS NOT NULL"),
+    ("workouts", "is_template", "CREATE INDEX ix_workouts_user_id_template ON workouts (user_id) WHERE is_template"),
+]
+
+
+def month_start(value : date) -> date:
+    return value.replace(day = 1)
+
+
+def add_months(value : date, months : int) -> date:
+    index = value.year * 12 + (value.month - 1) + months
+    return date(index // 12, index % 12 + 1, 1)
+
+
+def month_range(first : date, last : date) -> list[date]:
+    months = []
+    current = month_start(first)
+    while current <= month_start(last):
+        months.append(current)
+        current = add_months(current, 1)
+    return months
+
+
+def partition_name(table : str, month : date) -> str:
+    return f"{table}_p{month.year:04d}_{month.month:02d}"
+
+
+def parse_month(value : str) -> date:
+    year, month = value.split("-")[:2]
+    return date(int(year), int(month), 1)
+
+
+def create_partition_sql(table : str, month : date) -> str:
+    return (
+        f"CREATE TABLE IF NOT EXISTS {partition_name(table, month)} PARTITION OF {table} "
+        f"FOR VALUES FROM ('{month.isoformat()}') TO ('{add_months(month, 1).isoformat()}')"
+    )
+
+
+def create_default_partition_sql(table : str) -> str:
+    # catches dates outside the pre-created months so inserts never fail
+    return f"CREATE TABLE IF NOT EXISTS {table}_pdefault PARTITION OF {table} DEFAULT"
+
+
+def detach_partition_sql(table : str, month : date) -> str:
+    return f"ALTER TABLE {table} DETACH PARTITION {partition_name(table, month)}"
+
+
+def convert_statements(months : list[date]) -> list[str]:
+    """DDL that rebuilds both tables as partitioned tables, copying existing rows.
+
+    Partitioned primary keys must contain the partition key, so `workouts` is keyed on
+    (workout_id, date) and sets reference it through (workout_id, date) with ON UPDATE
+    CASCADE, which moves a workout's sets when its date is edited.
+    """
+    statements = [
+        "ALTER SEQUENCE workouts_workout_id_seq OWNED BY NONE",
+        "CREATE TABLE workouts_partitioned (LIKE workouts INCLUDING DEFAULTS INCLUDING CONSTRAINTS) PARTITION BY RANGE (date)",
+        "ALTER TABLE workouts_partitioned ADD CONSTRAINT workouts_partitioned_pkey PRIMARY KEY (workout_id, date)",
+        "CREATE TABLE workout_exercises_partitioned (LIKE workout_exercises INCLUDING DEFAULTS INCLUDING CONSTRAINTS) PARTITION BY RANGE (date)",
+        "ALTER TABLE workout_exercises_partitioned ALTER COLUMN date SET NOT NULL, ALTER COLUMN user_id SET NOT NULL",
+        "ALTER TABLE workout_exercises_partitioned ADD CONSTRAINT workout_exercises_partitioned_pkey PRIMARY KEY (workout_id, exercise_id, set_number, date)",
+    ]
+
+    for table in ("workouts_partitioned", "workout_exercises_partitioned"):
+        statements += [create_partition_sql(table, month) for month in months]
+        statements.append(create_default_partition_sql(table))
+
+    statements += [
+        "INSERT INTO workouts_partitioned SELECT * FROM workouts",
+        "INSERT INTO workout_exercises_partitioned SELECT * FROM workout_exercises",
+        "DROP TABLE workout_exercises",
+        "DROP TABLE workouts",
+        "ALTER TABLE workouts_partitioned RENAME TO workouts",
+        "ALTER TABLE workout_exercises_partitioned RENAME TO workout_exercises",
+        "ALTER TABLE workouts RENAME CONSTRAINT workouts_partitioned_pkey TO workouts_pkey",
+        "ALTER TABLE workout_exercises RENAME CONSTRAINT workout_exercises_partitioned_pkey TO workout_exercises_pkey",
+        "ALTER SEQUENCE workouts_workout_id_seq OWNED BY workouts.workout_id",
+        "ALTER TABLE workouts ADD CONSTRAINT workouts_user_id_fkey FOREIGN KEY (user_id) REFERENCES users (id) ON DELETE CASCADE",
+        "ALTER TABLE workout_exercises ADD CONSTRAINT workout_exercises_workout_id_fkey FOREIGN KEY (workout_id, date) REFERENCES workouts (workout_id, date) ON DELETE CASCADE ON UPDATE CASCADE",
+        "ALTER TABLE workout_exercises ADD CONSTRAINT workout_exercises_exercise_id_fkey FOREIGN KEY (exercise_id) REFERENCES exercises (exercise_id) ON DELETE CASCADE",
+        "ALTER TABLE workout_exercises ADD CONSTRAINT workout_exercises_user_id_fkey FOREIGN KEY (user_id) REFERENCES users (id) ON DELETE CASCADE",
+        "CREATE INDEX ix_workouts_user_id_date ON workouts (user_id, date)",
+        "CREATE INDEX ix_workout_exercises_user_id_date ON workout_exercises (user_id, date)",
+        "CREATE INDEX ix_workout_exercises_exercise_id_date ON workout_exercises (exercise_id, date)",
+    ]
+
+    # partition names were derived from the temporary parent names
+    for table in PARTITIONED_TABLES:
+        for month in months:
+            statements.append(f"ALTER TABLE {partition_name(table + '_partitioned', month)} RENAME TO {partition_name(table, month)}")
+        statements.append(f"ALTER TABLE {table}_partitioned_pdefault RENAME TO {table}_pdefault")
+
+    return statements
+
+
+def revert_statements() -> list[str]:
+    """DDL that turns the partitioned tables back into the plain layout of the base migrations."""
+    return [
+        "ALTER SEQUENCE workouts_workout_id_seq OWNED BY NONE",
+        "CREATE TABLE workouts_plain (LIKE workouts INCLUDING DEFAULTS INCLUDING CONSTRAINTS)",
+        "CREATE TABLE workout_exercises_plain (LIKE workout_exercises INCLUDING DEFAULTS INCLUDING CONSTRAINTS)",
+        "INSERT INTO workouts_plain SELECT * FROM workouts",
+        "INSERT INTO workout_exercises_plain SELECT * FROM workout_exercises",
+        "DROP TABLE workout_exercises",
+        "DROP TABLE workouts",
+        "ALTER TABLE workouts_plain RENAME TO workouts",
+        "ALTER TABLE workout_exercises_plain RENAME TO workout_exercises",
+        "ALTER TABLE workout_exercises ALTER COLUMN date DROP NOT NULL, ALTER COLUMN user_id DROP NOT NULL",
+        "ALTER TABLE workouts ADD CONSTRAINT workouts_pkey PRIMARY KEY (workout_id)",
+        "ALTER TABLE workout_exercises ADD CONSTRAINT workout_exercises_pkey PRIMARY KEY (workout_id, exercise_id, set_number)",
+        "ALTER SEQUENCE workouts_workout_id_seq OWNED BY workouts.workout_id",
+        "ALTER TABLE workouts ADD CONSTRAINT workouts_user_id_fkey FOREIGN KEY (user_id) REFERENCES users (id) ON DELETE CASCADE",
+        "ALTER TABLE workout_exercises ADD CONSTRAINT workout_exercises_workout_id_fkey FOREIGN KEY (workout_id) REFERENCES workouts (workout_id) ON DELETE CASCADE",
+        "ALTER TABLE workout_exercises ADD CONSTRAINT workout_exercises_exercise_id_fkey FOREIGN KEY (exercise_id) REFERENCES exercises (exercise_id) ON DELETE CASCADE",
+        "ALTER TABLE workout_exercises ADD CONSTRAINT workout_exercises_user_id_fkey FOREIGN KEY (user_id) REFERENCES users (id) ON DELETE CASCADE",
+        "CREATE INDEX ix_workouts_user_id_date ON workouts (user_id, date)",
+        "CREATE INDEX ix_workout_exercises_user_id_date ON workout_exercises (user_id, date)",
+        "CREATE INDEX ix_workout_exercises_exercise_id_date ON workout_exercises (exercise_id, date)",
+    ]
+
+
+def is_partitioned(connection, table : str) -> bool:
+    statement = text("SELECT EXISTS (SELECT 1 FROM pg_partitioned_table pt JOIN pg_class c ON c.oid = pt.partrelid WHERE c.relname = :table)")
+    return bool(connection.execute(statement, {"table" : table}).scalar())
+
+
+def existing_months(connection) -> list[date]:
+    first, last = connection.execute(text("SELECT min(date), max(date) FROM workouts")).one()
+    if first is None:
+        return []
+    return month_range(first, last)
+
+
+def has_column(connection, table : str, column : str) -> bool:
+    statement = text("SELECT EXISTS (SELECT 1 FROM information_schema.columns WHERE table_name = :table AND column_name = :column)")
+    return connection.execute(statement, {"table" : table, "column" : column}).scalar()
+
+
+def _later_indexes(connection) -> list[str]:
+    return [statement for table, column, statement in LATER_INDEXES if has_column(connection, table, column)]
+
+
+def server_version(connection) -> int:
+    return int(connection.execute(text("SHOW server_version_num")).scalar())
+
+
+def convert(connection, months_ahead : int = 3):
+    if is_partitioned(connection, "workouts"):
+        return
+    if server_version(connection) < MIN_SERVER_VERSION:
+        raise RuntimeError("Partitioning needs PostgreSQL 15 or later: older servers delete a workout's sets when its date moves it to another partition.")
+    today = date.today()
+    months = sorted(set(existing_months(connection)) | set(month_range(today, add_months(today, months_ahead))))
+    for statement in convert_statements(months) + _later_indexes(connection):
+        connection.execute(text(statement))
+
+
+def revert(connection):
+    if not is_partitioned(connection, "workouts"):
+        return
+    for statement in revert_statements() + _later_indexes(connection):
+        connection.execute(text(statement))
+
+
+def ensure_future_partitions(connection, months_ahead : int, today : date | None = None) -> list[str]:
+    today = today or date.today()
+    created = []
+    for month in month_range(today, add_months(today, months_ahead)):
+        for table in PARTITIONED_TABLES:
+            connection.execute(text(create_partition_sql(table, month)))
+            created.append(partition_name(table, month))
+    return created
+
+
+def list_partitions(connection, table : str) -> list[str]:
+    statement = text(
+        "SELECT c.relname FROM pg_inherits i JOIN pg_class c ON c.oid = i.inhrelid "
+        "JOIN pg_class p ON p.oid = i.inhparent WHERE p.relname = :table ORDER BY c.relname"
+    )
+    return list(connection.execute(statement, {"table" : table}).scalars())
+
+
+def detach_before(connection, before : date) -> list[str]:
+    """Detach monthly partitions that end on or before `before`.
+
+    Sets are detached before workouts so no attached set still references a detached
+    workout. Detached tables keep their data and can be archived or dropped later.
+    """
+    detached = []
+    for table in ("workout_exercises", "workouts"):
+        prefix = f"{table}_p"
+        for name in list_partitions(connection, table):
+            suffix = name[len(prefix):]
+            if not name.startswith(prefix) or suffix == "default":
+                continue
+            month = parse_month(suffix.replace("_", "-"))
+            if add_months(month, 1) <= month_start(before):
+                connection.execute(text(detach_partition_sql(table, month)))
+                detached.append(name)
+    return detached
+
+
+def _sync_engine():
+    from config import DATABASE_URL
+    url = make_url(DATABASE_URL).set(drivername = "postgresql+psycopg2")
+    return create_engine(url)
+
+
+def main(argv = None):
+    parser = argparse.ArgumentParser(description = "Maintain monthly partitions of workouts and workout_exercises.")
+    subcommands = parser.add_subparsers(dest = "command", required = True)
+    ensure_cmd = subcommands.add_parser("ensure", help = "pre-create partitions for the coming months")
+    ensure_cmd.add_argument("--months-ahead", type = int, default = 3)
+    detach_cmd = subcommands.add_parser("detach", help = "detach partitions older than a month (YYYY-MM)")
+    detach_cmd.add_argument("--before", type = parse_month, required = True)
+    convert_cmd = subcommands.add_parser("convert", help = "convert plain tables to partitioned tables")
+    convert_cmd.add_argument("--months-ahead", type = int, default = 3)
+    subcommands.add_parser("list", help = "list partitions")
+    args = parser.parse_args(argv)
+
+    engine = _sync_engine()
+    with engine.begin() as connection:
+        if args.command == "convert":
+            try:
+                convert(connection, args.months_ahead)
+            except RuntimeError as error:
+                raise SystemExit(str(error))
+            print("Tables are partitioned.")
+            return
+        if not is_partitioned(connection, "workouts"):
+            raise SystemExit("workouts is not partitioned; run `python partitions.py convert` first.")
+        if args.command == "ensure":
+            for name in ensure_future_partitions(connection, args.months_ahead):
+                print(f"ensured {name}")
+        elif args.command == "detach":
+            for name in detach_before(connection, args.before):
+                print(f"detached {name}")
+        else:
+            for table in PARTITIONED_TABLES:
+                for name in list_partitions(connection, table):
+                    print(name)
+
+
+if __name__ == "__main__":
+    main()
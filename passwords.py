@@ -0,0 +1,193 @@
+"""Async password hashing with pluggable algorithms.
+
+    hashed = await password_hasher.hash(password)
+    valid, upgraded = await password_hasher.verify_and_update(password, hashed)
+
+`PASSWORD_SCHEME` picks the algorithm for new hashes: `bcrypt` (default) or `argon2id`
+(needs the `argon2-cffi` package). Stored hashes of any known scheme still verify, and
+`verify_and_update` returns a replacement hash when a correct password was checked against
+a hash from another scheme or with outdated cost settings, so a scheme or cost change
+rolls out as users log in.
+
+Hashing runs on the hasher's own thread pool (PASSWORD_HASH_WORKERS threads), not on the
+shared AnyIO pool the sync endpoints and file responses use: a burst of logins then queues
+behind itself only. bcrypt and argon2 release the GIL, so the threads run in parallel.
+Verifications that arrive in the same event loop iteration are handed to the pool as one job
+per thread, each login resuming as soon as its own check finishes; identical (password, hash)
+pairs in a batch (client retries) are checked once.
+"""
+import asyncio
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+PASSWORD_SCHEME = os.getenv('PASSWORD_SCHEME', 'bcrypt')
+PASSWORD_HASH_WORKERS = int(os.getenv('PASSWORD_HASH_WORKERS', str(min(4, os.cpu_count() or 1))))
+BCRYPT_ROUNDS = int(os.getenv('BCRYPT_ROUNDS', '12'))
+# argon2-cffi's defaults (RFC 9106 low-memory profile)
+ARGON2_TIME_COST = int(os.getenv('ARGON2_TIME_COST', '3'))
+ARGON2_MEMORY_KIB = int(os.getenv('ARGON2_MEMORY_KIB', '65536'))
+ARGON2_PARALLELISM = int(os.getenv('ARGON2_PARALLELISM', '4'))
+
+
+class BcryptBackend:
+    name = "bcrypt"
+    prefixes = ("$2b$", "$2a$", "$2y$")
+
+    def __init__(self, rounds : int = BCRYPT_ROUNDS):
+        self.rounds = rounds
+
+    def hash(self, password : str) -> str:
+        import bcrypt
+        return bcrypt.hashpw(password.encode("utf-8"), bcrypt.gensalt(self.rounds)).decode("utf-8")
+
+    def verify(self, password : str, hashed : str) -> bool:
+        import bcrypt
+        return bcrypt.checkpw(password.encode("utf-8"), hashed.encode("utf-8"))
+
+    def needs_update(self, hashed : str) -> bool:
+        # "$2b$12$..." carries its cost factor
+        return int(hashed[4:6]) != self.rounds
+
+
+class Argon2Backend:
+    name = "argon2id"
+    prefixes = ("$argon2id$",)
+
+    def __init__(self, time_cost : int = ARGON2_TIME_COST, memory_kib : int = ARGON2_MEMORY_KIB, parallelism : int = ARGON2_PARALLELISM):
+        try:
+            from argon2 import PasswordHasher as Argon2Hasher
+        except ImportError as e:
+            raise RuntimeError("PASSWORD_SCHEME=argon2id needs the `argon2-cffi` package") from e
+        self._hasher = Argon2Hasher(time_cost = time_cost, memory_cost = memory_kib, parallelism = parallelism)
+
+    def hash(self, password : str) -> str:
+        return self._hasher.hash(password)
+
+    def verify(self, password : str, hashed : str) -> bool:
+        from argon2.exceptions import VerificationError, InvalidHashError
+        try:
+            return self._hasher.verify(hashed, password)
+        except (VerificationError, InvalidHashError):
+            return False
+
+    def needs_update(self, hashed : str) -> bool:
+        return self._hasher.check_needs_rehash(hashed)
+
+
+BACKENDS = {"bcrypt" : BcryptBackend, "argon2id" : Argon2Backend}
+
+
+class PasswordHasher:
+    def __init__(self, scheme : str = PASSWORD_SCHEME, workers : int = PASSWORD_HASH_WORKERS, backends : dict | None = None):
+        if scheme not in BACKENDS and not (backends and scheme in backends):
+            raise ValueError(f"unknown PASSWORD_SCHEME {scheme!r}")
+        self.scheme = scheme
+        self.workers = workers
+        # backends are built on first use: argon2-cffi is optional and bcrypt slows down worker startup
+        self._backends = dict(backends or {})
+        self._executor = None
+        self._pending : list[tuple[str, str, asyncio.Future]] = []
+        # jobs handed to the pool and not started yet, and jobs running; counted here rather
+        # than read from ThreadPoolExecutor's private queue
+        self._queued = 0
+        self._busy = 0
+        self._counts_lock = threading.Lock()
+
+    def backend(self, name : str | None = None):
+        name = name or self.scheme
+        if name not in self._backends:
+            self._backends[name] = BACKENDS[name]()
+        return self._backends[name]
+
+    def identify(self, hashed : str):
+        for name, backend_class in BACKENDS.items():
+            if hashed.startswith(backend_class.prefixes):
+                return self.backend(name)
+        return None
+
+    @property
+    def executor(self) -> ThreadPoolExecutor:
+        # created lazily so serve.py's master forks workers before any thread exists
+        if self._executor is None:
+            self._executor = ThreadPoolExecutor(max_workers = self.workers, thread_name_prefix = "password-hash")
+        return self._executor
+
+    def stats(self) -> dict:
+        """Jobs running on the hashing threads and jobs queued behind them."""
+        with self._counts_lock:
+            return {"busy" : self._busy, "size" : self.workers, "queue" : self._queued}
+
+    def _submit(self, function, *args):
+        with self._counts_lock:
+            self._queued += 1
+        return self.executor.submit(self._run_job, function, args)
+
+    def _run_job(self, function, args):
+        with self._counts_lock:
+            self._queued -= 1
+            self._busy += 1
+        try:
+            return function(*args)
+        finally:
+            with self._counts_lock:
+                self._busy -= 1
+
+    async def hash(self, password : str) -> str:
+        return await asyncio.wrap_future(self._submit(self.backend().hash, password))
+
+    async def verify(self, password : str, hashed : str) -> bool:
+        future = asyncio.get_running_loop().create_future()
+        if not self._pending:
+            asyncio.get_running_loop().call_soon(self._dispatch)
+        self._pending.append((password, hashed, future))
+        return await future
+
+    async def verify_and_update(self, password : str, hashed : str) -> tuple[bool, str | None]:
+        """(valid, new hash or None); a new hash is only returned for a correct password."""
+        if not await self.verify(password, hashed):
+            return False, None
+        backend = self.identify(hashed)
+        if backend.name == self.scheme and not backend.needs_update(hashed):
+            return True, None
+        return True, await self.hash(password)
+
+    def _dispatch(self):
+        pending, self._pending = self._pending, []
+        loop = asyncio.get_running_loop()
+        by_pair : dict[tuple[str, str], list[asyncio.Future]] = {}
+        for password, hashed, future in pending:
+            by_pair.setdefault((password, hashed), []).append(future)
+        pairs = list(by_pair.items())
+        # one job per thread instead of one per login, so a burst costs a few executor submissions
+        chunks = min(self.workers, len(pairs))
+        for i in range(chunks):
+            self._submit(self._verify_batch, loop, pairs[i::chunks])
+
+    def _verify_batch(self, loop : asyncio.AbstractEventLoop, pairs : list):
+        for (password, hashed), futures in pairs:
+            backend = self.identify(hashed)
+            try:
+                result = backend is not None and backend.verify(password, hashed)
+            except Exception as e:
+                result = e
+            # each login resumes as soon as its own check is done, not when the whole batch is
+            loop.call_soon_threadsafe(self._resolve, futures, result)
+
+    @staticmethod
+    def _resolve(futures : list[asyncio.Future], result):
+        for future in futures:
+            if future.done():
+                continue
+            if isinstance(result, Exception):
+                future.set_exception(result)
+            else:
+                future.set_result(result)
+
+    def close(self):
+        if self._executor is not None:
+            self._executor.shutdown(wait = True)
+            self._executor = None
+
+
+password_hasher = PasswordHasher()
@@ -0,0 +1,99 @@
+"""Sampling CPU profiler for a running worker.
+
+GET /debug/profile?seconds=N (admins only) samples the stack of every thread in the process
+for N seconds: the event loop thread, with whatever coroutine is running on it, the anyio
+threadpool and the password hashing threads. The answer is the collapsed-stack format that
+flamegraph.pl, speedscope and inferno read, one line per distinct stack:
+
+    MainThread;run (uvicorn/server.py:65);...;prs_for_user (queries.py:53) 12
+
+A sampler thread wakes every PROFILE_INTERVAL_MS and reads sys._current_frames(). The
+process is not instrumented in any other way, so there is no cost outside a profile. While
+one runs, the sampler backs off whenever a sample took more than PROFILE_MAX_OVERHEAD of
+the interval, so it holds the GIL for at most that share of the time, however many threads
+there are. Only one profile runs per process at a time, and only the worker that served
+the request is profiled.
+"""
+import asyncio
+import os
+import sys
+import threading
+import time
+from collections import Counter, namedtuple
+
+PROFILE_INTERVAL_MS = float(os.getenv('PROFILE_INTERVAL_MS', '10'))
+PROFILE_MAX_SECONDS = float(os.getenv('PROFILE_MAX_SECONDS', '60'))
+# share of the GIL the sampler may hold
+PROFILE_MAX_OVERHEAD = 0.05
+# deeper stacks keep their innermost frames
+MAX_STACK_DEPTH = 256
+
+Profile = namedtuple("Profile", ["stacks", "samples", "seconds", "overhead"])
+
+
+def _frame_label(frame) -> str:
+    code = frame.f_code
+    path = code.co_filename
+    # the last two path parts, enough to tell uvicorn/server.py from app.py
+    short = "/".join(path.replace("\\", "/").split("/")[-2:])
+    # ';' separates frames; spaces are fine, the count is whatever follows the last one
+    return f"{code.co_name} ({short}:{code.co_firstlineno})".replace(";", ":")
+
+
+def collapse_stack(thread_name : str, frame) -> str:
+    """'thread;outermost;...;innermost' for one thread's current frame."""
+    frames = []
+    while frame is not None and len(frames) < MAX_STACK_DEPTH:
+        frames.append(_frame_label(frame))
+        frame = frame.f_back
+    frames.append(thread_name.replace(";", ":"))
+    return ";".join(reversed(frames))
+
+
+def collapsed(profile : Profile) -> str:
+    return "".join(f"{stack} {count}\n" for stack, count in sorted(profile.stacks.items()))
+
+
+class SamplingProfiler:
+    def __init__(self, interval_ms : float = PROFILE_INTERVAL_MS, max_overhead : float = PROFILE_MAX_OVERHEAD):
+        self.interval = interval_ms / 1000
+        self.max_overhead = max_overhead
+        self.running = False
+
+    def _sample(self, stop : threading.Event, stacks : Counter, totals : list):
+        own = threading.get_ident()
+        interval = self.interval
+        while not stop.wait(interval):
+            started = time.perf_counter()
+            names = {thread.ident : thread.name for thread in threading.enumerate()}
+            for ident, frame in sys._current_frames().items():
+                if ident != own:
+                    stacks[collapse_stack(names.get(ident, f"thread-{ident}"), frame)] += 1
+            cost = time.perf_counter() - started
+            totals[0] += 1
+            totals[1] += cost
+            # stay under max_overhead even when there are many threads to walk
+            interval = max(self.interval, cost / self.max_overhead)
+
+    async def profile(self, seconds : float) -> Profile:
+        """Sample every thread for `seconds` while the event loop keeps serving requests."""
+        if self.running:
+            raise RuntimeError("a profile is already running")
+        self.running = True
+        stop = threading.Event()
+        stacks, totals = Counter(), [0, 0.0]
+        sampler = threading.Thread(target = self._sample, args = (stop, stacks, totals), name = "profiler", daemon = True)
+        started = time.perf_counter()
+        try:
+            sampler.start()
+            await asyncio.sleep(seconds)
+        finally:
+            stop.set()
+            # the sampler wakes on stop at once, so this is not a blocking wait
+            sampler.join()
+            self.running = False
+        elapsed = time.perf_counter() - started
+        return Profile(stacks, totals[0], elapsed, totals[1] / elapsed if elapsed else 0.0)
+
+
+profiler = SamplingProfiler()
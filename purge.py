@@ -0,0 +1,172 @@
+"""Background purge of deleted accounts.
+
+`DELETE /me` only stamps `users.deleted_at`, which blocks login at once. The data goes later:
+the worker deletes the account's sets, then its workouts, then its exercises, at most
+PURGE_BATCH_SIZE rows per statement and transaction with PURGE_PAUSE_SECONDS between batches,
+and finally the user row itself. Deleting a user with millions of sets in one statement would
+hold its locks and write its WAL in one go; small transactions keep locks short, let replicas
+keep up and give autovacuum something to follow.
+
+Purging starts PURGE_DELAY_SECONDS after the deletion (default: the 15 minute token lifetime),
+once tokens issued before it have expired and nothing writes behind the worker any more.
+
+Every API process runs the worker unless PURGE_ENABLED=false; on PostgreSQL an advisory lock
+per account keeps two processes off the same one. It also runs on its own:
+    python purge.py            # poll every PURGE_INTERVAL_SECONDS
+    python purge.py --once     # purge what is due, then exit
+"""
+import argparse
+import asyncio
+import logging
+import os
+from datetime import datetime, timedelta, timezone
+from sqlalchemy import select, delete, func, tuple_
+from sqlalchemy.exc import SQLAlchemyError
+from models.user import User
+from models.exercise import Exercise
+from models.workout import Workout
+from models.workout_exercise import WorkoutExercise
+from sharding import shard_map
+
+PURGE_ENABLED = os.getenv('PURGE_ENABLED', 'true').lower() in ('1', 'true', 'yes')
+PURGE_BATCH_SIZE = int(os.getenv('PURGE_BATCH_SIZE', '5000'))
+PURGE_PAUSE_SECONDS = float(os.getenv('PURGE_PAUSE_SECONDS', '0.1'))
+PURGE_INTERVAL_SECONDS = float(os.getenv('PURGE_INTERVAL_SECONDS', '60'))
+PURGE_DELAY_SECONDS = float(os.getenv('PURGE_DELAY_SECONDS', '900'))
+# accounts taken per poll, so one run cannot keep the worker busy indefinitely
+PURGE_USERS_PER_RUN = 10
+# first key of the pg_try_advisory_xact_lock(int, int) pair; the second is the user id
+PURGE_LOCK_KEY = 4301
+
+logger = logging.getLogger(__name__)
+
+
+def purge_statements(user_id : int, batch_size : int = PURGE_BATCH_SIZE) -> list:
+    """(table, statement) pairs in foreign key order; each statement deletes one batch of the user's rows."""
+    set_key = (WorkoutExercise.workout_id, WorkoutExercise.exercise_id, WorkoutExercise.set_number)
+    sets = select(*set_key).where(WorkoutExercise.user_id == user_id).limit(batch_size)
+    workouts = select(Workout.workout_id).where(Workout.user_id == user_id).limit(batch_size)
+    exercises = select(Exercise.exercise_id).where(Exercise.user_id == user_id).limit(batch_size)
+    return [
+        ("workout_exercises", delete(WorkoutExercise).where(tuple_(*set_key).in_(sets))),
+        # sets without a user_id (logged before it was denormalized) cascade with their workout
+        ("workouts", delete(Workout).where(Workout.workout_id.in_(workouts))),
+        ("exercises", delete(Exercise).where(Exercise.exercise_id.in_(exercises))),
+    ]
+
+
+async def delete_in_batches(db, statement, batch_size : int, pause : float) -> int:
+    """Run a statement deleting at most `batch_size` rows, one transaction each, until it deletes fewer."""
+    total = 0
+    while True:
+        deleted = (await db.execute(statement.execution_options(synchronize_session = False))).rowcount
+        await db.commit()
+        total += deleted
+        if deleted < batch_size:
+            return total
+        await asyncio.sleep(pause)
+
+
+async def purge_user(directory_factory, data_factory, user_id : int, batch_size : int = PURGE_BATCH_SIZE, pause : float = PURGE_PAUSE_SECONDS) -> dict:
+    """Delete a deleted account's rows batch by batch, then the account. Returns rows deleted per table."""
+    counts = {}
+    async with data_factory() as db:
+        for table, statement in purge_statements(user_id, batch_size):
+            counts[table] = await delete_in_batches(db, statement, batch_size, pause)
+        if data_factory is not directory_factory:
+            # the shard's stub row
+            await db.execute(delete(User).where(User.id == user_id))
+            await db.commit()
+
+    async with directory_factory() as directory_db:
+        await directory_db.execute(delete(User).where(User.id == user_id, User.deleted_at.is_not(None)))
+        await directory_db.commit()
+    return counts
+
+
+async def _try_lock(db, user_id : int) -> bool:
+    # held until db's transaction ends; other processes skip the account meanwhile
+    if db.bind.dialect.name != "postgresql":
+        return True
+    return (await db.execute(select(func.pg_try_advisory_xact_lock(PURGE_LOCK_KEY, user_id)))).scalar()
+
+
+async def purge_pending(directory_factory, delay : float = PURGE_DELAY_SECONDS, batch_size : int = PURGE_BATCH_SIZE, pause : float = PURGE_PAUSE_SECONDS) -> list[int]:
+    """Purge accounts deleted more than `delay` seconds ago. Returns the purged user ids."""
+    cutoff = datetime.now(timezone.utc) - timedelta(seconds = delay)
+    async with directory_factory() as directory_db:
+        statement = select(User.id).where(User.deleted_at <= cutoff).order_by(User.deleted_at).limit(PURGE_USERS_PER_RUN)
+        user_ids = (await directory_db.scalars(statement)).all()
+        if user_ids and shard_map.enabled:
+            await shard_map.refresh(directory_db)
+
+    purged = []
+    for user_id in user_ids:
+        async with directory_factory() as lock_db:
+            if not await _try_lock(lock_db, user_id):
+                continue
+            data_factory = shard_map.session_factory_for(user_id) if shard_map.enabled else directory_factory
+            counts = await purge_user(directory_factory, data_factory, user_id, batch_size, pause)
+            logger.info("purged user %d: %s", user_id, counts)
+            purged.append(user_id)
+    return purged
+
+
+class PurgeWorker:
+    """Runs purge_pending every `interval` seconds as a task on the event loop."""
+
+    def __init__(self, interval : float = PURGE_INTERVAL_SECONDS):
+        self.interval = interval
+        self._task = None
+
+    def start(self, directory_factory):
+        if self._task is None:
+            self._task = asyncio.create_task(self._run(directory_factory))
+
+    async def stop(self):
+        if self._task is None:
+            return
+        self._task.cancel()
+        try:
+            await self._task
+        except asyncio.CancelledError:
+            pass
+        self._task = None
+
+    async def _run(self, directory_factory):
+        while True:
+            try:
+                await purge_pending(directory_factory)
+            except (SQLAlchemyError, OSError) as e:
+                # batches already committed stay deleted; the account is picked up again on the next run
+                logger.warning("account purge failed: %s", e)
+            await asyncio.sleep(self.interval)
+
+
+purge_worker = PurgeWorker()
+
+
+async def _purge(once : bool):
+    from database import AsyncSession as DirectorySession, init_engines, dispose_engines
+    init_engines()
+    try:
+        while True:
+            purged = await purge_pending(DirectorySession)
+            print(f"purged {len(purged)} account(s): {purged}")
+            if once:
+                return
+            await asyncio.sleep(PURGE_INTERVAL_SECONDS)
+    finally:
+        await dispose_engines()
+
+
+def main(argv = None):
+    parser = argparse.ArgumentParser(description = "Purge the data of deleted FitLog accounts.")
+    parser.add_argument("--once", action = "store_true", help = "purge the accounts that are due, then exit")
+    args = parser.parse_args(argv)
+    logging.basicConfig(level = logging.INFO)
+    asyncio.run(_purge(args.once))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,170 @@
+"""Hot statements shared by the endpoints.
+
+They are built with `lambda_stmt`, so SQLAlchemy caches both the statement construction and
+its compiled SQL under the lambda's code location; arguments become bound parameters. The
+lifespan warmup (database.warm_up_engines) executes every variant in `warmup_statements()`
+once per pooled connection, so neither compilation nor asyncpg's per-connection statement
+preparation happens on a user's first request after a deploy.
+"""
+from datetime import date, datetime
+from itertools import product
+from sqlalchemy import select, insert, update, delete, exists, lambda_stmt, func, literal, union_all, Integer
+from models.exercise import Exercise
+from models.workout import Workout
+from models.workout_exercise import WorkoutExercise
+
+
+def exercise_by_id(exercise_id : int):
+    return lambda_stmt(lambda: select(Exercise).where(Exercise.exercise_id == exercise_id))
+
+
+def exercises_for_user(user_id : int):
+    return lambda_stmt(lambda: select(Exercise).where(Exercise.user_id == user_id))
+
+
+def workout_by_id(workout_id : int):
+    return lambda_stmt(lambda: select(Workout).where(Workout.workout_id == workout_id))
+
+
+def insert_sets(user_id : int, workout_id : int, sets : list[dict]):
+    # INSERT ... SELECT from the caller's live workout: each set's date comes from that row, and
+    # a workout that is deleted or someone else's inserts nothing, so the caller can tell
+    live = (Workout.workout_id == workout_id, Workout.user_id == user_id, Workout.deleted_at.is_(None))
+    # one SELECT per set rather than a CTE: SQLite puts a CTE before the INSERT, and its
+    # driver then reports no rowcount
+    rows = [
+        select(
+            Workout.workout_id, literal(row["exercise_id"], Integer), Workout.user_id, literal(row["set_number"], Integer),
+            literal(row["weight"], Integer), literal(row["reps"], Integer), Workout.date,
+        ).where(*live)
+        for row in sets
+    ]
+    return insert(WorkoutExercise).from_select(
+        ["workout_id", "exercise_id", "user_id", "set_number", "weight", "reps", "date"],
+        rows[0] if len(rows) == 1 else union_all(*rows),
+    )
+
+
+def insert_set(user_id : int, workout_id : int, exercise_id : int, set_number : int, weight : int, reps : int):
+    # no row back means the workout is gone; the caller answers 404
+    row = {"exercise_id" : exercise_id, "set_number" : set_number, "weight" : weight, "reps" : reps}
+    return insert_sets(user_id, workout_id, [row]).returning(WorkoutExercise)
+
+
+def owned_exercises(user_id : int):
+    return lambda_stmt(lambda: select(Exercise.exercise_id, Exercise.catalog_id).where(Exercise.user_id == user_id))
+
+
+def recent_workouts(user_id : int, limit : int):
+    return lambda_stmt(lambda: select(Workout.workout_id, Workout.is_template).where(Workout.user_id == user_id).order_by(Workout.workout_id.desc()).limit(limit))
+
+
+def workouts_for_user(user_id : int, from_date : date | None = None, to_date : date | None = None, templates : bool = False):
+    statement = lambda_stmt(lambda: select(Workout).where(Workout.user_id == user_id, Workout.is_template == templates))
+    # date bounds let partitioned tables skip months outside the range
+    if from_date:
+        statement += lambda s: s.where(Workout.date >= from_date)
+    if to_date:
+        statement += lambda s: s.where(Workout.date <= to_date)
+    return statement
+
+
+def sets_for_workout(workout_id : int, workout_date : date):
+    # the date predicate pins the lookup to the workout's partition
+    return lambda_stmt(lambda: select(WorkoutExercise).where(WorkoutExercise.workout_id == workout_id, WorkoutExercise.date == workout_date))
+
+
+def set_by_key(workout_id : int, exercise_id : int, set_number : int):
+    return lambda_stmt(lambda: select(WorkoutExercise).where(WorkoutExercise.workout_id == workout_id, WorkoutExercise.exercise_id == exercise_id, WorkoutExercise.set_number == set_number))
+
+
+def template_ids(user_id : int):
+    # planned weights, not lifted ones: PRs and history leave template sets out
+    return select(Workout.workout_id).where(Workout.user_id == user_id, Workout.is_template)
+
+
+def prs_for_user(user_id : int, from_date : date | None = None, to_date : date | None = None):
+    # sets carry user_id and date, so the workouts join is not needed and date bounds prune partitions
+    statement = lambda_stmt(lambda: (
+        select(Exercise.name, func.max(WorkoutExercise.weight).label("weight"))
+        .select_from(WorkoutExercise)
+        .join(Exercise)
+        .where(WorkoutExercise.user_id == user_id, WorkoutExercise.workout_id.not_in(template_ids(user_id)))
+        .group_by(Exercise.exercise_id, Exercise.name)
+    ))
+    if from_date:
+        statement += lambda s: s.where(WorkoutExercise.date >= from_date)
+    if to_date:
+        statement += lambda s: s.where(WorkoutExercise.date <= to_date)
+    return statement
+
+
+def delete_workout(workout_id : int, user_id : int, deleted_at : datetime):
+    # the ownership check is part of the statement; RETURNING gives the date that locates its sets
+    return lambda_stmt(lambda: (
+        update(Workout)
+        .where(Workout.workout_id == workout_id, Workout.user_id == user_id, Workout.deleted_at.is_(None))
+        .values(deleted_at = deleted_at)
+        .returning(Workout.date)
+        .execution_options(synchronize_session = False)
+    ))
+
+
+def delete_workout_sets(workout_id : int, workout_date : date, deleted_at : datetime):
+    # stamped with the workout's own deleted_at, so they can be told apart from sets deleted earlier
+    return lambda_stmt(lambda: (
+        update(WorkoutExercise)
+        .where(WorkoutExercise.workout_id == workout_id, WorkoutExercise.date == workout_date, WorkoutExercise.deleted_at.is_(None))
+        .values(deleted_at = deleted_at)
+        .execution_options(synchronize_session = False)
+    ))
+
+
+def delete_exercise(exercise_id : int, user_id : int, cascade : bool, deleted_at : datetime):
+    statement = lambda_stmt(lambda: (
+        update(Exercise)
+        .where(Exercise.exercise_id == exercise_id, Exercise.user_id == user_id, Exercise.deleted_at.is_(None))
+        .values(deleted_at = deleted_at)
+        .returning(Exercise.exercise_id)
+        .execution_options(synchronize_session = False)
+    ))
+    # without cascade an exercise with history is kept; the caller reports the conflict
+    if not cascade:
+        statement += lambda s: s.where(~exists().where(WorkoutExercise.exercise_id == exercise_id, WorkoutExercise.deleted_at.is_(None)))
+    return statement
+
+
+def delete_exercise_sets(exercise_id : int, deleted_at : datetime):
+    return lambda_stmt(lambda: (
+        update(WorkoutExercise)
+        .where(WorkoutExercise.exercise_id == exercise_id, WorkoutExercise.deleted_at.is_(None))
+        .values(deleted_at = deleted_at)
+        .execution_options(synchronize_session = False)
+    ))
+
+
+def delete_set(workout_id : int, exercise_id : int, set_number : int, user_id : int, deleted_at : datetime):
+    return lambda_stmt(lambda: (
+        update(WorkoutExercise)
+        .where(WorkoutExercise.workout_id == workout_id, WorkoutExercise.exercise_id == exercise_id, WorkoutExercise.set_number == set_number, WorkoutExercise.user_id == user_id, WorkoutExercise.deleted_at.is_(None))
+        .values(deleted_at = deleted_at)
+        .returning(WorkoutExercise.set_number)
+        .execution_options(synchronize_session = False)
+    ))
+
+
+def purge_deleted_set(workout_id : int, exercise_id : int, set_number : int):
+    # a deleted set still holds its primary key; logging the same set again removes the tombstone first
+    return lambda_stmt(lambda: (
+        delete(WorkoutExercise)
+        .where(WorkoutExercise.workout_id == workout_id, WorkoutExercise.exercise_id == exercise_id, WorkoutExercise.set_number == set_number, WorkoutExercise.deleted_at.is_not(None))
+        .execution_options(synchronize_session = False)
+    ))
+
+
+def warmup_statements() -> list:
+    """Every cached variant of the statements above, with sentinel ids that match no rows."""
+    statements = [exercise_by_id(0), exercises_for_user(0), workout_by_id(0), sets_for_workout(0, date.min), set_by_key(0, 0, 0), owned_exercises(0), recent_workouts(0, 1)]
+    for from_date, to_date in product((None, date.min), (None, date.max)):
+        statements += [workouts_for_user(0, from_date, to_date), prs_for_user(0, from_date, to_date)]
+    return statements
@@ -0,0 +1,269 @@
+"""Token-bucket rate limiting as a pure ASGI middleware.
+
+Buckets are keyed by the JWT `sub` when the request carries a valid token, otherwise by
+client IP; rules with scope "ip" (login, register) always key by IP. Every limited response
+carries RateLimit-Limit / RateLimit-Remaining / RateLimit-Reset / RateLimit-Policy headers,
+and rejected requests get 429 with Retry-After.
+
+Backends:
+    memory   per-process buckets (default; each worker enforces its own share)
+    redis    buckets shared by every worker, updated atomically by a Lua script.
+             RATE_LIMIT_REDIS_URL=local:// uses an in-process stand-in for development
+             and tests. If the shared store errors, the request is checked against the
+             in-process buckets instead of failing.
+"""
+import asyncio
+import json
+import math
+import os
+import time
+from collections import OrderedDict
+from starlette.routing import compile_path
+from auth import token_subjects
+
+RATE_LIMIT_ENABLED = os.getenv('RATE_LIMIT_ENABLED', 'true').lower() not in ('0', 'false', 'no')
+RATE_LIMIT_BACKEND = os.getenv('RATE_LIMIT_BACKEND', 'memory')
+RATE_LIMIT_REDIS_URL = os.getenv('RATE_LIMIT_REDIS_URL', 'local://')
+# only honour X-Forwarded-For behind a proxy that sets it
+RATE_LIMIT_TRUST_FORWARDED = os.getenv('RATE_LIMIT_TRUST_FORWARDED', 'false').lower() in ('1', 'true', 'yes')
+
+PERIODS = {"second" : 1, "minute" : 60, "hour" : 3600}
+
+
+class RateLimitRule:
+    __slots__ = ("name", "rate", "burst", "scope", "window", "policy")
+
+    def __init__(self, name : str, limit : str, burst : int | None = None, scope : str = "user"):
+        # limit is "<count>/<period>", e.g. "5/minute"; burst defaults to count
+        count, period = limit.split("/")
+        self.name = name
+        self.window = PERIODS[period]
+        self.rate = int(count) / self.window
+        self.burst = burst or int(count)
+        self.scope = scope
+        self.policy = f"{self.burst};w={self.window}"
+
+
+DEFAULT_RULES = {
+    ("POST", "/login") : RateLimitRule("login", "5/minute", burst = 10, scope = "ip"),
+    ("POST", "/register") : RateLimitRule("register", "5/hour", scope = "ip"),
+    ("POST", "/workoutexercises") : RateLimitRule("sets", "2/second", burst = 30),
+    ("PUT", "/workouts/{workout_id}/sets/{exercise_id}/{set_number}") : RateLimitRule("sets", "2/second", burst = 30),
+}
+DEFAULT_RULE = RateLimitRule("default", "20/second", burst = 100)
+
+
+class MemoryBucketStore:
+    """Per-process buckets: key -> [tokens, updated_at, full_at], least recently used first.
+
+    full_at is when the bucket will have refilled under its own rule; past it, the bucket
+    says nothing a fresh one would not. At max_keys, refilled buckets are dropped from the
+    least recently used end, then the least recently used one. Clients that keep sending
+    stay at the other end, so a flood of new keys cannot reset their limits.
+    """
+
+    def __init__(self, max_keys : int = 100000):
+        self.max_keys = max_keys
+        self._buckets : OrderedDict[str, list[float]] = OrderedDict()
+
+    def take(self, key : str, rate : float, burst : int, cost : float = 1.0) -> tuple[bool, float]:
+        """Returns (allowed, tokens left)."""
+        now = time.monotonic()
+        bucket = self._buckets.get(key)
+        if bucket is None:
+            if len(self._buckets) >= self.max_keys:
+                self._evict(now)
+            bucket = self._buckets[key] = [float(burst), now, now]
+        else:
+            bucket[0] = min(burst, bucket[0] + (now - bucket[1]) * rate)
+            bucket[1] = now
+            self._buckets.move_to_end(key)
+
+        allowed = bucket[0] >= cost
+        if allowed:
+            bucket[0] -= cost
+        bucket[2] = now + (burst - bucket[0]) / rate
+        return allowed, bucket[0]
+
+    def _evict(self, now : float):
+        while self._buckets:
+            _, bucket = next(iter(self._buckets.items()))
+            if bucket[2] > now:
+                break
+            self._buckets.popitem(last = False)
+        if len(self._buckets) >= self.max_keys:
+            self._buckets.popitem(last = False)
+
+    def __len__(self):
+        return len(self._buckets)
+
+    def clear(self):
+        self._buckets.clear()
+
+
+# KEYS[1] = bucket key; ARGV = rate, burst, cost. Uses the Redis clock so workers agree on time.
+TOKEN_BUCKET_LUA = """
+local rate = tonumber(ARGV[1])
+local burst = tonumber(ARGV[2])
+local cost = tonumber(ARGV[3])
+local t = redis.call('TIME')
+local now = tonumber(t[1]) + tonumber(t[2]) / 1000000
+local bucket = redis.call('HMGET', KEYS[1], 'tokens', 'ts')
+local tokens = tonumber(bucket[1]) or burst
+local ts = tonumber(bucket[2]) or now
+tokens = math.min(burst, tokens + math.max(0, now - ts) * rate)
+local allowed = 0
+if tokens >= cost then
+    tokens = tokens - cost
+    allowed = 1
+end
+redis.call('HSET', KEYS[1], 'tokens', tostring(tokens), 'ts', tostring(now))
+redis.call('EXPIRE', KEYS[1], math.ceil(burst / rate) + 1)
+return {allowed, tostring(tokens)}
+"""
+
+
+class LocalRedisStandIn:
+    """In-process stand-in for the one Redis call the shared store makes.
+
+    It runs the Python equivalent of TOKEN_BUCKET_LUA, so the shared code path can be
+    exercised without a Redis server.
+    """
+
+    def __init__(self):
+        self._store = MemoryBucketStore()
+
+    async def eval(self, script : str, numkeys : int, key : str, rate, burst, cost):
+        if script != TOKEN_BUCKET_LUA:
+            raise NotImplementedError("the stand-in only understands the token bucket script")
+        allowed, tokens = self._store.take(key, float(rate), int(burst), float(cost))
+        return [int(allowed), str(tokens)]
+
+
+class SharedBucketStore:
+    def __init__(self, client, prefix : str = "ratelimit:", errors : tuple = (OSError, asyncio.TimeoutError)):
+        self.client = client
+        self.prefix = prefix
+        self.errors = errors
+
+    async def take(self, key : str, rate : float, burst : int, cost : float = 1.0) -> tuple[bool, float]:
+        allowed, tokens = await self.client.eval(TOKEN_BUCKET_LUA, 1, self.prefix + key, rate, burst, cost)
+        return bool(int(allowed)), float(tokens)
+
+
+def make_store(backend : str = RATE_LIMIT_BACKEND, redis_url : str = RATE_LIMIT_REDIS_URL):
+    if backend == "memory":
+        return MemoryBucketStore()
+    if backend != "redis":
+        raise ValueError(f"unknown RATE_LIMIT_BACKEND {backend!r}")
+    if redis_url.startswith("local://"):
+        return SharedBucketStore(LocalRedisStandIn())
+    try:
+        import redis.asyncio as redis
+    except ImportError as e:
+        raise RuntimeError("RATE_LIMIT_BACKEND=redis needs the `redis` package") from e
+    return SharedBucketStore(redis.from_url(redis_url), errors = (redis.RedisError, OSError, asyncio.TimeoutError))
+
+
+class RateLimiter:
+    def __init__(self, rules : dict, default_rule : RateLimitRule | None, store, enabled : bool = True):
+        self.enabled = enabled
+        self.store = store
+        self.fallback_store = store if isinstance(store, MemoryBucketStore) else MemoryBucketStore()
+        self.default_rule = default_rule
+        self.configure_rules(rules)
+
+    def configure_rules(self, rules : dict):
+        # static paths resolve with one dict lookup; templated paths fall back to regexes
+        self._exact = {}
+        self._templated = []
+        for (method, path), rule in rules.items():
+            if "{" in path:
+                self._templated.append((method, compile_path(path)[0], rule))
+            else:
+                self._exact[(method, path)] = rule
+
+    def rule_for(self, method : str, path : str) -> RateLimitRule | None:
+        rule = self._exact.get((method, path))
+        if rule is not None:
+            return rule
+        for rule_method, pattern, rule in self._templated:
+            if rule_method == method and pattern.match(path):
+                return rule
+        return self.default_rule
+
+    async def take(self, key : str, rule : RateLimitRule) -> tuple[bool, float]:
+        result = self.store.take(key, rule.rate, rule.burst)
+        if not asyncio.iscoroutine(result):
+            return result
+        try:
+            return await result
+        except self.store.errors:
+            # the shared store is unavailable; keep limiting per process rather than not at all
+            return self.fallback_store.take(key, rule.rate, rule.burst)
+
+
+def _identity(scope, rule : RateLimitRule) -> str:
+    if rule.scope == "user":
+        for name, value in scope["headers"]:
+            if name == b"authorization":
+                scheme, _, token = value.decode("latin-1").partition(" ")
+                if scheme.lower() == "bearer" and token:
+                    subject = token_subjects.subject(token)
+                    if subject is not None:
+                        return "u:" + subject
+                break
+
+    if RATE_LIMIT_TRUST_FORWARDED:
+        for name, value in scope["headers"]:
+            if name == b"x-forwarded-for":
+                return "ip:" + value.decode("latin-1").split(",")[0].strip()
+    client = scope.get("client")
+    return "ip:" + (client[0] if client else "unknown")
+
+
+class RateLimitMiddleware:
+    def __init__(self, app, limiter : RateLimiter, exempt_paths : frozenset = frozenset()):
+        self.app = app
+        self.limiter = limiter
+        # health checks and scrapes, which share a load balancer's address and must never get 429
+        self.exempt_paths = exempt_paths
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or not self.limiter.enabled or scope["path"] in self.exempt_paths:
+            await self.app(scope, receive, send)
+            return
+
+        rule = self.limiter.rule_for(scope["method"], scope["path"])
+        if rule is None:
+            await self.app(scope, receive, send)
+            return
+
+        allowed, tokens = await self.limiter.take(rule.name + ":" + _identity(scope, rule), rule)
+        headers = [
+            (b"ratelimit-limit", str(rule.burst).encode()),
+            (b"ratelimit-remaining", str(int(tokens)).encode()),
+            (b"ratelimit-reset", str(math.ceil((rule.burst - tokens) / rule.rate)).encode()),
+            (b"ratelimit-policy", rule.policy.encode()),
+        ]
+
+        if not allowed:
+            body = json.dumps({"detail" : "Too many requests."}).encode()
+            headers += [
+                (b"retry-after", str(math.ceil((1 - tokens) / rule.rate)).encode()),
+                (b"content-type", b"application/json"),
+                (b"content-length", str(len(body)).encode()),
+            ]
+            await send({"type" : "http.response.start", "status" : 429, "headers" : headers})
+            await send({"type" : "http.response.body", "body" : body})
+            return
+
+        async def send_with_headers(message):
+            if message["type"] == "http.response.start":
+                message["headers"] = list(message.get("headers", [])) + headers
+            await send(message)
+
+        await self.app(scope, receive, send_with_headers)
+
+
+rate_limiter = RateLimiter(DEFAULT_RULES, DEFAULT_RULE, make_store(), enabled = RATE_LIMIT_ENABLED)
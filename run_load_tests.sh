@@ -1,19 +1,35 @@
 source ./.env
 
 export DB_LINK=$TEST_DB_LINK
+# every locust user comes from one IP, so the per-IP login limit would throttle the run
+export RATE_LIMIT_ENABLED=${RATE_LIMIT_ENABLED:-false}
 
-echo "Starting FastAPI server with Database url set to test_db"
-uvicorn app:app --host 0.0.0.0 --port 8000 &
+# optional: seed a population first, e.g. SEED_USERS=100000 ./run_load_tests.sh
+if [ -n "$SEED_USERS" ]; then
+    echo "Seeding $SEED_USERS users into the test database"
+    python seed.py --users "$SEED_USERS" || exit 1
+    export SEEDED_USERS=$SEED_USERS
+fi
+
+echo "Starting FastAPI server (${SERVE_WORKERS:-1} workers) with Database url set to test_db"
+SERVE_WORKERS=${SERVE_WORKERS:-1} python serve.py --host 0.0.0.0 --port 8000 &
 
 UVICORN_PID=$!
 
 sleep 5
 
-#start locust
+#start locust; LOCUST_HEADLESS=1 runs without the web UI and fails the script on SLO breaches
 echo "Starting locust tests"
-locust -f locustfile.py
+if [ -n "$LOCUST_HEADLESS" ]; then
+    locust -f locustfile.py --headless --host http://localhost:8000 -u "${LOCUST_USERS:-200}" -r "${LOCUST_SPAWN_RATE:-20}" -t "${LOCUST_RUN_TIME:-5m}" ${LOCUST_CSV:+--csv "$LOCUST_CSV"}
+else
+    locust -f locustfile.py
+fi
+LOCUST_EXIT=$?
 
 echo "Load test finished. Shutting down FastAPI server (PID: $UVICORN_PID)..."
 kill $UVICORN_PID
+wait $UVICORN_PID
 
 echo "Test run complete."
+exit $LOCUST_EXIT
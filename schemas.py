@@ -1,6 +1,6 @@
-from pydantic import BaseModel, EmailStr, ConfigDict
+from pydantic import BaseModel, EmailStr, ConfigDict, Field
 from datetime import datetime, date
-from typing import Optional
+from typing import Optional, Literal
 
 class RegistrationModel(BaseModel):
     username : str
@@ -34,6 +34,7 @@ class ExerciseCreationResponse(BaseModel):
     name : str
     description : str
     user_id : int
+    catalog_id : Optional[int] = None
     created_at : datetime
     updated_at : datetime
     model_config = ConfigDict(from_attributes = True)
@@ -42,15 +43,36 @@ class AllExercisesRetrievalResponse(BaseModel):
     exercise_id : int
     name : str
     description : str
+    catalog_id : Optional[int] = None
     created_at : datetime
     updated_at : datetime
     model_config = ConfigDict(from_attributes = True)
 
+class ExerciseSearchResponse(BaseModel):
+    exercise_id : Optional[int] = None
+    catalog_id : Optional[int] = None
+    name : str
+    description : Optional[str] = None
+    score : float
+    source : Literal["user", "catalog"]
+    model_config = ConfigDict(from_attributes = True)
+
+class CatalogExerciseResponse(BaseModel):
+    catalog_id : int
+    name : str
+    description : Optional[str] = None
+    model_config = ConfigDict(from_attributes = True)
+
+class CatalogResponse(BaseModel):
+    version : str
+    exercises : list[CatalogExerciseResponse]
+
 class WorkoutRequest(BaseModel):
     name : str
     description : Optional[str] = None
     date : date #YYYY-MM-DD
     start_time : datetime #YYYY-MM-DD HH:MI:SS
+    is_template : Optional[bool] = None # left as it is on edits when omitted
     model_config = ConfigDict(from_attributes = True)
 
 class WorkoutResponse(BaseModel):
@@ -62,8 +84,19 @@ class WorkoutResponse(BaseModel):
     created_at : datetime
     updated_at : datetime
     user_id : int
+    is_template : bool = False
     model_config = ConfigDict(from_attributes = True)
 
+class WorkoutCloneRequest(BaseModel):
+    date : date
+    start_time : datetime
+    name : Optional[str] = None # defaults to the source workout's name
+    is_template : bool = False
+    weight_percent : float = Field(100, gt = 0, le = 1000) # 105 adds 5% to every set, rounded to whole units
+
+class WorkoutCloneResponse(WorkoutResponse):
+    sets_copied : int
+
 class WorkoutExerciseRequest(BaseModel):
     workout_id : int
     exercise_id : int
@@ -71,6 +104,12 @@ class WorkoutExerciseRequest(BaseModel):
     weight : int
     reps : int 
 
+class LiveSetMessage(BaseModel):
+    exercise_id : int
+    set_number : int
+    weight : int
+    reps : int
+
 class WorkoutExerciseResponse(BaseModel):
     workout_id : int
     exercise_id : int
@@ -80,7 +119,75 @@ class WorkoutExerciseResponse(BaseModel):
     created_at : datetime
     updated_at : datetime
 
+class WorkoutExerciseColumns(BaseModel):
+    # columnar shape of a workout's sets: one array per field, index i is the i-th set
+    workout_id : int
+    exercise_id : list[int]
+    set_number : list[int]
+    weight : list[int]
+    reps : list[int]
+    created_at : list[datetime]
+    updated_at : list[datetime]
+
 class PRResponse(BaseModel):
     name : str
     weight : float
-    
\ No newline at end of file
+    
+class ExerciseHistoryPoint(BaseModel):
+    # one session: its top set, best estimated 1RM (Epley) and total volume
+    date : date
+    workout_id : int
+    top_weight : int
+    top_reps : int
+    e1rm : float
+    volume : int
+    sets : int
+
+    model_config = ConfigDict(from_attributes = True)
+
+class ExerciseHistoryResponse(BaseModel):
+    exercise_id : int
+    name : str
+    sessions_total : int
+    downsampled : bool
+    points : list[ExerciseHistoryPoint]
+
+class LeaderboardMembershipRequest(BaseModel):
+    enabled : bool
+
+class LeaderboardMembershipResponse(BaseModel):
+    enabled : bool
+    # boards the user is ranked on
+    boards : int
+
+class LeaderboardEntryResponse(BaseModel):
+    rank : int
+    user_id : int
+    username : str
+    e1rm : float
+    weight : int
+    reps : int
+    achieved_on : date
+
+class LeaderboardResponse(BaseModel):
+    catalog_id : int
+    name : str
+    members : int
+    # the caller's rank, None unless they are on this board
+    rank : Optional[int] = None
+    entries : list[LeaderboardEntryResponse]
+
+class SlowQueryEntry(BaseModel):
+    at : datetime
+    duration_ms : float
+    # "METHOD /route/{template}", None outside a request
+    route : Optional[str] = None
+    statement : str
+    parameters : str
+    plan : Optional[str] = None
+
+class SlowQueryLogResponse(BaseModel):
+    enabled : bool
+    threshold_ms : float
+    explain_rate : float
+    queries : list[SlowQueryEntry]
@@ -0,0 +1,62 @@
+from sqlalchemy import select, or_, case, func, literal
+from models.exercise import Exercise
+from catalog import normalize_name
+
+DEFAULT_SEARCH_LIMIT = 10
+MAX_SEARCH_LIMIT = 50
+
+
+def escape_like(term : str) -> str:
+    return term.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+
+
+def normalize_query(q : str) -> str:
+    # exercise names are stored lowercased, so searches are normalized the same way
+    return normalize_name(q)
+
+
+def exercise_search_statement(dialect_name : str, user_id : int, q : str, limit : int = DEFAULT_SEARCH_LIMIT):
+    """Build the type-ahead query for a user's exercises.
+
+    Prefix matches always rank first. On PostgreSQL the remaining candidates come
+    from the pg_trgm `%` operator and are ranked by `similarity()`; other dialects
+    (SQLite in tests) fall back to a substring match ranked by name length.
+    """
+    term = normalize_query(q)
+    is_prefix = Exercise.name.like(escape_like(term) + "%", escape = "\\")
+    prefix_rank = case((is_prefix, 0), else_ = 1)
+
+    if dialect_name == "postgresql":
+        score = func.similarity(Exercise.name, term)
+        matches = or_(is_prefix, Exercise.name.op("%")(term))
+        ordering = (prefix_rank, score.desc(), Exercise.name)
+    else:
+        score = literal(1.0) / (func.length(Exercise.name) + 1)
+        matches = or_(is_prefix, func.instr(Exercise.name, term) > 0)
+        ordering = (prefix_rank, func.length(Exercise.name), Exercise.name)
+
+    return (
+        select(Exercise.exercise_id, Exercise.catalog_id, Exercise.name, Exercise.description, score.label("score"))
+        .where(Exercise.user_id == user_id, matches)
+        .order_by(*ordering)
+        .limit(limit)
+    )
+
+
+def merge_catalog_matches(user_rows, catalog_entries, limit : int) -> list[dict]:
+    """Append catalog prefix matches after the user's own rows, skipping entries the user already has."""
+    results = [
+        {"exercise_id" : row.exercise_id, "catalog_id" : row.catalog_id, "name" : row.name, "description" : row.description, "score" : row.score, "source" : "user"}
+        for row in user_rows
+    ]
+    owned_ids = {row.catalog_id for row in user_rows if row.catalog_id is not None}
+    owned_names = {row.name for row in user_rows}
+
+    for entry in catalog_entries:
+        if len(results) >= limit:
+            break
+        if entry.catalog_id in owned_ids or entry.name in owned_names:
+            continue
+        results.append({"exercise_id" : None, "catalog_id" : entry.catalog_id, "name" : entry.name, "description" : entry.description, "score" : 1.0, "source" : "catalog"})
+
+    return results
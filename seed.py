@@ -0,0 +1,122 @@
+"""Bulk-load a realistic user population for load testing.
+
+History sizes follow a power law: most users have a handful of workouts and a few have
+years of them, which is what stresses listings and /prs in production.
+
+    python seed.py --users 100000 --alpha 1.2 --max-workouts 1500
+
+Seeded users are named `seeduser_<n>` and share one password (`--password`, default
+"hello"); locustfile.py logs in as them. Run against the test database (TEST_DB_LINK).
+"""
+import argparse
+import os
+import random
+import time
+from datetime import date, datetime, timedelta, timezone
+from dotenv import load_dotenv
+
+SEED_USER_PREFIX = "seeduser_"
+SEED_EXERCISES = ["bench press", "squat", "deadlift", "overhead press", "barbell row", "pull up", "dip", "lunge", "leg press", "bicep curl"]
+
+
+def history_sizes(n_users : int, alpha : float, max_workouts : int, rng : random.Random) -> list[int]:
+    """Workouts per user drawn from a Pareto distribution with minimum 1, capped at `max_workouts`."""
+    return [min(max_workouts, int(rng.paretovariate(alpha))) for _ in range(n_users)]
+
+
+def workout_rows(user_id : int, n_workouts : int, today : date, rng : random.Random) -> list[tuple]:
+    # roughly three sessions a week going back from today
+    rows = []
+    for i in range(n_workouts):
+        day = today - timedelta(days = int(i * 7 / 3) + rng.randint(0, 1))
+        start = datetime(day.year, day.month, day.day, rng.randint(6, 20), 0, tzinfo = timezone.utc)
+        rows.append((f"Session {n_workouts - i}", "", day, start, user_id))
+    return rows
+
+
+def set_rows(workout_id : int, workout_date : date, user_id : int, exercise_ids : list[int], rng : random.Random) -> list[tuple]:
+    rows = []
+    for exercise_id in rng.sample(exercise_ids, k = min(3, len(exercise_ids))):
+        base = rng.randint(40, 160)
+        for set_number in range(1, 4):
+            rows.append((workout_id, exercise_id, set_number, base + rng.randint(-5, 10), rng.randint(3, 12), user_id, workout_date))
+    return rows
+
+
+def seed(connection, n_users : int, alpha : float, max_workouts : int, password : str, batch_size : int, rng_seed : int):
+    import bcrypt
+    from psycopg2.extras import execute_values
+
+    rng = random.Random(rng_seed)
+    # one hash for everyone: hashing 100k passwords would dominate the run
+    hashed_password = bcrypt.hashpw(password.encode("utf-8"), bcrypt.gensalt()).decode("utf-8")
+    sizes = history_sizes(n_users, alpha, max_workouts, rng)
+    today = date.today()
+    cursor = connection.cursor()
+
+    cursor.execute("SELECT coalesce(max(CAST(substring(username FROM %s) AS INTEGER)), -1) FROM users WHERE username LIKE %s", (f"{SEED_USER_PREFIX}(\\d+)$", f"{SEED_USER_PREFIX}%"))
+    offset = cursor.fetchone()[0] + 1
+
+    started = time.perf_counter()
+    totals = {"users" : 0, "workouts" : 0, "sets" : 0}
+    for batch_start in range(0, n_users, batch_size):
+        batch = range(batch_start, min(batch_start + batch_size, n_users))
+        users = [(f"{SEED_USER_PREFIX}{offset + i}", f"{SEED_USER_PREFIX}{offset + i}@load.test", hashed_password) for i in batch]
+        user_ids = [row[0] for row in execute_values(cursor, "INSERT INTO users (username, email, hashed_password) VALUES %s RETURNING id", users, fetch = True)]
+
+        exercises = [(name, "", user_id) for user_id in user_ids for name in SEED_EXERCISES]
+        exercise_rows = execute_values(cursor, "INSERT INTO exercises (name, description, user_id) VALUES %s RETURNING exercise_id, user_id", exercises, fetch = True)
+        exercises_by_user = {}
+        for exercise_id, user_id in exercise_rows:
+            exercises_by_user.setdefault(user_id, []).append(exercise_id)
+
+        workouts = []
+        for user_id, i in zip(user_ids, batch):
+            workouts += workout_rows(user_id, sizes[i], today, rng)
+        workout_ids = execute_values(cursor, "INSERT INTO workouts (name, description, date, start_time, user_id) VALUES %s RETURNING workout_id, date, user_id", workouts, fetch = True, page_size = 1000)
+
+        sets = []
+        for workout_id, workout_date, user_id in workout_ids:
+            sets += set_rows(workout_id, workout_date, user_id, exercises_by_user[user_id], rng)
+        execute_values(cursor, "INSERT INTO workout_exercises (workout_id, exercise_id, set_number, weight, reps, user_id, date) VALUES %s", sets, page_size = 5000)
+
+        connection.commit()
+        totals["users"] += len(user_ids)
+        totals["workouts"] += len(workout_ids)
+        totals["sets"] += len(sets)
+        print(f"seeded {totals['users']}/{n_users} users, {totals['workouts']} workouts, {totals['sets']} sets ({time.perf_counter() - started:.1f}s)")
+
+    # link the seeded exercises to the global catalog like the API would
+    cursor.execute("UPDATE exercises e SET catalog_id = c.catalog_id FROM catalog_exercises c WHERE e.name = c.name AND e.catalog_id IS NULL")
+    connection.commit()
+    cursor.execute("ANALYZE users, exercises, workouts, workout_exercises")
+    connection.commit()
+    return totals
+
+
+def main(argv = None):
+    parser = argparse.ArgumentParser(description = "Seed a load-test population.")
+    parser.add_argument("--users", type = int, default = 1000)
+    parser.add_argument("--alpha", type = float, default = 1.2, help = "Pareto shape; smaller means heavier tail")
+    parser.add_argument("--max-workouts", type = int, default = 1500)
+    parser.add_argument("--password", default = "hello")
+    parser.add_argument("--batch-size", type = int, default = 500)
+    parser.add_argument("--seed", type = int, default = 7)
+    args = parser.parse_args(argv)
+
+    import psycopg2
+    load_dotenv()
+    db_url = os.environ.get("TEST_DB_LINK") or os.environ.get("DB_LINK")
+    if not db_url:
+        raise SystemExit("Set TEST_DB_LINK (or DB_LINK) to the database to seed.")
+
+    connection = psycopg2.connect(db_url.replace("+asyncpg", ""))
+    try:
+        totals = seed(connection, args.users, args.alpha, args.max_workouts, args.password, args.batch_size, args.seed)
+    finally:
+        connection.close()
+    print(f"done: {totals}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,220 @@
+"""Production launcher: a preloaded app forked into N uvicorn workers on one listening socket.
+
+    python serve.py [--host 0.0.0.0] [--port 8000] [--workers N] [--connection-budget 80]
+
+The master imports the app (and everything it imports) once, binds the socket, then forks
+the workers, so they start without re-importing and share the master's pages until they
+write to them. Each worker runs uvicorn with uvloop and httptools and creates its own
+engines in the app lifespan, after the fork; no connection is ever shared between processes.
+
+DB_CONNECTION_BUDGET is the number of connections the whole deployment may hold on each
+database server (primary, replica, every shard). It is split evenly across the workers, so
+adding workers never pushes Postgres past max_connections; leave headroom for migrations,
+psql and replication.
+
+SIGTERM or SIGINT drains: every worker stops accepting, finishes in-flight requests (up to
+SERVE_GRACEFUL_SECONDS; live sessions are closed with 1012 after flushing their buffered sets),
+runs the lifespan shutdown that disposes the engines, and exits. A worker that dies otherwise
+is replaced. One that dies within MIN_WORKER_UPTIME_SECONDS of starting is replaced after a
+backoff that doubles with each fast failure of its slot (1 s, 2 s, 4 s, ... up to
+RESPAWN_BACKOFF_MAX_SECONDS); after SERVE_MAX_FAST_FAILURES in a row, typically a bad
+environment or a database that is down at startup, the master stops the other workers and
+exits with status 1 instead of forking in a loop.
+
+Environment: SERVE_HOST, SERVE_PORT, SERVE_WORKERS (default: usable CPUs),
+DB_CONNECTION_BUDGET (default 80), SERVE_GRACEFUL_SECONDS (default 30),
+SERVE_MAX_FAST_FAILURES (default 5).
+"""
+import argparse
+import gc
+import logging
+import os
+import signal
+import sys
+import time
+import uvicorn
+
+SERVE_HOST = os.getenv('SERVE_HOST', '0.0.0.0')
+SERVE_PORT = int(os.getenv('SERVE_PORT', '8000'))
+SERVE_WORKERS = os.getenv('SERVE_WORKERS')
+# Postgres ships with max_connections = 100; keep 20 for everything that is not the API
+DB_CONNECTION_BUDGET = int(os.getenv('DB_CONNECTION_BUDGET', '80'))
+SERVE_GRACEFUL_SECONDS = float(os.getenv('SERVE_GRACEFUL_SECONDS', '30'))
+SERVE_MAX_FAST_FAILURES = int(os.getenv('SERVE_MAX_FAST_FAILURES', '5'))
+# a worker that exits sooner than this after its fork counts as failing to start
+MIN_WORKER_UPTIME_SECONDS = 10
+RESPAWN_BACKOFF_SECONDS = 1
+RESPAWN_BACKOFF_MAX_SECONDS = 30
+
+logger = logging.getLogger("serve")
+
+
+def default_workers() -> int:
+    # the CPUs this process may run on, which is what a container's cpuset limits
+    if hasattr(os, "sched_getaffinity"):
+        return len(os.sched_getaffinity(0))
+    return os.cpu_count() or 1
+
+
+def pool_sizing(budget : int, workers : int) -> tuple[int, int]:
+    """(pool_size, max_overflow) per worker so that all workers together stay within `budget`.
+
+    A quarter of each worker's share is overflow, which is closed again when returned, so an
+    idle deployment holds fewer connections than its ceiling.
+    """
+    per_worker = budget // workers
+    if per_worker < 1:
+        raise ValueError(f"a connection budget of {budget} cannot give each of {workers} workers a connection")
+    max_overflow = per_worker // 4
+    return per_worker - max_overflow, max_overflow
+
+
+HANDLED_SIGNALS = (signal.SIGTERM, signal.SIGINT)
+
+
+def _run_worker(config : uvicorn.Config, sock) -> int:
+    server = uvicorn.Server(config)
+    # until uvicorn installs its own handlers (and after it restores these and re-raises what it
+    # caught), a stop request only marks the server as exiting
+    for sig in HANDLED_SIGNALS:
+        signal.signal(sig, lambda signum, frame: setattr(server, "should_exit", True))
+    signal.pthread_sigmask(signal.SIG_UNBLOCK, HANDLED_SIGNALS)
+    if server.should_exit:
+        return 0
+    try:
+        server.run(sockets = [sock])
+    except Exception:
+        logger.exception("worker %d crashed", os.getpid())
+        return 1
+    return 0
+
+
+class Master:
+    def __init__(self, config : uvicorn.Config, workers : int, graceful_seconds : float, max_fast_failures : int = SERVE_MAX_FAST_FAILURES,
+                 backoff : float = RESPAWN_BACKOFF_SECONDS, min_uptime : float = MIN_WORKER_UPTIME_SECONDS):
+        self.config = config
+        self.workers = workers
+        self.graceful_seconds = graceful_seconds
+        self.max_fast_failures = max_fast_failures
+        self.backoff = backoff
+        self.min_uptime = min_uptime
+        # pid -> slot; each slot keeps its own start time, failure streak and pending respawn
+        self.children : dict[int, int] = {}
+        self.started_at : dict[int, float] = {}
+        self.fast_failures : dict[int, int] = {}
+        self.respawn_at : dict[int, float] = {}
+        self.stopping = False
+        self.failed = False
+
+    def spawn(self, sock, slot : int):
+        # a signal arriving mid-fork must not run the master's handler in the child
+        signal.pthread_sigmask(signal.SIG_BLOCK, HANDLED_SIGNALS)
+        pid = os.fork()
+        if pid == 0:
+            # out of the terminal's process group: Ctrl+C reaches only the master, which sends one SIGTERM,
+            # instead of a SIGINT racing the SIGTERM (uvicorn skips the drain on a second signal)
+            os.setpgid(0, 0)
+            os._exit(_run_worker(self.config, sock))
+        self.children[pid] = slot
+        self.started_at[slot] = time.monotonic()
+        signal.pthread_sigmask(signal.SIG_UNBLOCK, HANDLED_SIGNALS)
+
+    def respawn_delay(self, slot : int, now : float) -> float | None:
+        """Seconds to wait before replacing the worker that just left `slot`; None to give up."""
+        if now - self.started_at[slot] >= self.min_uptime:
+            self.fast_failures[slot] = 0
+            return 0.0
+        failures = self.fast_failures[slot] = self.fast_failures.get(slot, 0) + 1
+        if failures >= self.max_fast_failures:
+            return None
+        return min(RESPAWN_BACKOFF_MAX_SECONDS, self.backoff * 2 ** (failures - 1))
+
+    def stop(self, signum, frame):
+        if not self.stopping:
+            logger.info("received %s, draining %d workers", signal.Signals(signum).name, len(self.children))
+        self.drain()
+
+    def drain(self):
+        self.stopping = True
+        for pid in self.children:
+            try:
+                os.kill(pid, signal.SIGTERM)
+            except ProcessLookupError:
+                pass
+
+    def run(self, sock) -> int:
+        for sig in HANDLED_SIGNALS:
+            signal.signal(sig, self.stop)
+        for slot in range(self.workers):
+            self.spawn(sock, slot)
+
+        deadline = None
+        while self.children or (self.respawn_at and not self.stopping):
+            if self.stopping and deadline is None:
+                deadline = time.monotonic() + self.graceful_seconds + 5
+                self.respawn_at.clear()
+                # the workers hold their own copies; new connections now queue only until they close theirs
+                sock.close()
+            for slot, due in list(self.respawn_at.items()):
+                if time.monotonic() >= due:
+                    del self.respawn_at[slot]
+                    self.spawn(sock, slot)
+            try:
+                pid, status = os.waitpid(-1, os.WNOHANG)
+            except ChildProcessError:
+                pid = 0
+            if pid == 0:
+                if deadline is not None and time.monotonic() > deadline:
+                    for child in self.children:
+                        os.kill(child, signal.SIGKILL)
+                    deadline = float("inf")
+                time.sleep(0.1)
+                continue
+            slot = self.children.pop(pid)
+            if self.stopping:
+                continue
+            exit_code = os.waitstatus_to_exitcode(status)
+            delay = self.respawn_delay(slot, time.monotonic())
+            if delay is None:
+                logger.error("worker %d exited with status %d, %d fast failures in a row: stopping", pid, exit_code, self.max_fast_failures)
+                self.failed = True
+                self.drain()
+                continue
+            logger.warning("worker %d exited with status %d, starting a replacement in %.0f s", pid, exit_code, delay)
+            self.respawn_at[slot] = time.monotonic() + delay
+        return 1 if self.failed else 0
+
+
+def main(argv = None):
+    parser = argparse.ArgumentParser(description = "Run the API with preloaded, forked uvicorn workers.")
+    parser.add_argument("--host", default = SERVE_HOST)
+    parser.add_argument("--port", type = int, default = SERVE_PORT)
+    parser.add_argument("--workers", type = int, default = int(SERVE_WORKERS) if SERVE_WORKERS else default_workers())
+    parser.add_argument("--connection-budget", type = int, default = DB_CONNECTION_BUDGET)
+    parser.add_argument("--graceful-seconds", type = float, default = SERVE_GRACEFUL_SECONDS)
+    args = parser.parse_args(argv)
+
+    try:
+        pool_size, max_overflow = pool_sizing(args.connection_budget, args.workers)
+    except ValueError as exc:
+        raise SystemExit(str(exc))
+
+    # preload: import the app and build its middleware stack before forking
+    import database
+    from app import app
+    database.DB_POOL_SIZE, database.DB_MAX_OVERFLOW = pool_size, max_overflow
+
+    config = uvicorn.Config(app, host = args.host, port = args.port, loop = "uvloop", http = "httptools",
+                            timeout_graceful_shutdown = args.graceful_seconds, log_level = "info")
+    config.load()
+    logging.basicConfig(level = logging.INFO, format = "%(levelname)s:     %(message)s")
+    sock = config.bind_socket()
+    logger.info("starting %d workers, %d+%d database connections each (budget %d)", args.workers, pool_size, max_overflow, args.connection_budget)
+
+    # keep the preloaded objects out of the collector so the workers' GC does not touch (and copy) their pages
+    gc.freeze()
+    return Master(config, args.workers, args.graceful_seconds).run(sock)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
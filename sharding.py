@@ -0,0 +1,215 @@
+"""User-sharded database routing.
+
+Every exercise, workout and set belongs to exactly one user, so a user's rows live together
+on one shard. The primary database (DB_LINK) is the global directory: it holds the full
+`users` table used by registration and login. Each shard holds a stub `users` row for its
+own users (for foreign keys) plus their data.
+
+Placement is `user_id % shard_count` unless the directory records an explicit `shard_id`,
+which is what a move writes. Explicit placements are cached per process and refreshed every
+DB_SHARD_REFRESH_SECONDS.
+
+Tooling:
+    python sharding.py interleave-sequences   # make exercise/workout ids unique across shards
+    python sharding.py move --user-id 42 --to 1
+"""
+import argparse
+import asyncio
+import os
+import time
+from sqlalchemy import select, insert, delete, update, text
+from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker
+from models.user import User
+from models.exercise import Exercise
+from models.workout import Workout
+from models.workout_exercise import WorkoutExercise
+import config  # noqa: F401  (loads .env)
+
+SHARD_DATABASE_URLS = [url.strip() for url in os.getenv('DB_SHARD_LINKS', '').split(',') if url.strip()]
+SHARD_REFRESH_SECONDS = float(os.getenv('DB_SHARD_REFRESH_SECONDS', '30'))
+
+# tables with per-shard id sequences, in the order rows must be copied
+SHARDED_SEQUENCES = (("exercises", "exercise_id"), ("workouts", "workout_id"))
+
+
+class ShardMap:
+    def __init__(self, session_factories : list, refresh_seconds : float = SHARD_REFRESH_SECONDS):
+        self.session_factories = list(session_factories)
+        self.refresh_seconds = refresh_seconds
+        self._placements : dict[int, int] = {}
+        self._refreshed_at = float("-inf")
+
+    @property
+    def enabled(self) -> bool:
+        return len(self.session_factories) > 0
+
+    def configure(self, session_factories : list, refresh_seconds : float | None = None):
+        self.session_factories = list(session_factories)
+        if refresh_seconds is not None:
+            self.refresh_seconds = refresh_seconds
+        self._placements.clear()
+        self._refreshed_at = float("-inf")
+
+    def default_shard(self, user_id : int) -> int:
+        return user_id % len(self.session_factories)
+
+    def shard_for(self, user_id : int) -> int:
+        return self._placements.get(user_id, self.default_shard(user_id))
+
+    def session_factory_for(self, user_id : int):
+        return self.session_factories[self.shard_for(user_id)]
+
+    def set_placement(self, user_id : int, shard_id : int):
+        if shard_id == self.default_shard(user_id):
+            self._placements.pop(user_id, None)
+        else:
+            self._placements[user_id] = shard_id
+
+    async def refresh(self, directory_db, force : bool = False):
+        """Reload explicit placements (moved users) from the directory when the cache is stale."""
+        now = time.monotonic()
+        if not force and now - self._refreshed_at < self.refresh_seconds:
+            return
+        self._refreshed_at = now
+        rows = (await directory_db.execute(select(User.id, User.shard_id).where(User.shard_id.is_not(None)))).all()
+        self._placements = {user_id : shard_id for user_id, shard_id in rows if shard_id != self.default_shard(user_id)}
+
+    async def create_stub_user(self, user : User):
+        # shards keep a password-less copy of the user row so their foreign keys hold
+        async with self.session_factory_for(user.id)() as shard_db:
+            await shard_db.execute(insert(User).values(id = user.id, username = user.username, email = user.email, hashed_password = ""))
+            await shard_db.commit()
+
+
+shard_map = ShardMap([])
+
+_shard_engines = []
+
+
+def init_shard_engines(**engine_options):
+    # called from database.init_engines(); a no-op unless DB_SHARD_LINKS is set or engines exist
+    if _shard_engines or not SHARD_DATABASE_URLS:
+        return
+    _shard_engines.extend(create_async_engine(url, **engine_options) for url in SHARD_DATABASE_URLS)
+    shard_map.configure([async_sessionmaker(bind = shard_engine) for shard_engine in _shard_engines])
+
+
+def shard_engines() -> list:
+    return list(_shard_engines)
+
+
+async def dispose_shard_engines():
+    for shard_engine in _shard_engines:
+        await shard_engine.dispose()
+    _shard_engines.clear()
+
+
+def interleave_sequences_sql(shard_index : int, shard_count : int, floor : int) -> list[str]:
+    """Sequence settings that give shard k the ids k+1, k+1+N, k+1+2N, ... above `floor`.
+
+    With disjoint id sets a user's rows can be copied to another shard unchanged.
+    """
+    start = floor - floor % shard_count + shard_count + shard_index + 1
+    return [
+        f"ALTER SEQUENCE {table}_{column}_seq INCREMENT BY {shard_count} RESTART WITH {start}"
+        for table, column in SHARDED_SEQUENCES
+    ]
+
+
+async def _rows(db, statement) -> list[dict]:
+    return [dict(row) for row in (await db.execute(statement)).mappings().all()]
+
+
+async def move_user(directory_factory, source_factory, target_factory, user_id : int, target_shard : int) -> dict:
+    """Copy a user's rows to the target shard, flip the directory entry, then delete the source rows.
+
+    Writes that land on the source between the copy and the point where every worker has
+    refreshed its placements would be lost, so move users while they are idle.
+    """
+    async with source_factory() as source_db:
+        users = await _rows(source_db, select(User.__table__).where(User.id == user_id))
+        if not users:
+            raise ValueError(f"user {user_id} has no rows on the source shard")
+        exercises = await _rows(source_db, select(Exercise.__table__).where(Exercise.user_id == user_id))
+        workouts = await _rows(source_db, select(Workout.__table__).where(Workout.user_id == user_id))
+        workout_ids = [row["workout_id"] for row in workouts]
+        sets = await _rows(source_db, select(WorkoutExercise.__table__).where(WorkoutExercise.workout_id.in_(workout_ids))) if workout_ids else []
+
+    async with target_factory() as target_db:
+        clashes = []
+        # deleted rows still hold their ids
+        if exercises:
+            clashes += (await target_db.execute(select(Exercise.exercise_id).where(Exercise.exercise_id.in_([row["exercise_id"] for row in exercises])).execution_options(include_deleted = True))).scalars().all()
+        if workout_ids:
+            clashes += (await target_db.execute(select(Workout.workout_id).where(Workout.workout_id.in_(workout_ids)).execution_options(include_deleted = True))).scalars().all()
+        if clashes:
+            raise ValueError(f"ids already used on the target shard: {sorted(clashes)[:10]}; run interleave-sequences first")
+
+        for table, rows in ((User.__table__, users), (Exercise.__table__, exercises), (Workout.__table__, workouts), (WorkoutExercise.__table__, sets)):
+            if rows:
+                await target_db.execute(insert(table).values(rows))
+        await target_db.commit()
+
+    async with directory_factory() as directory_db:
+        await directory_db.execute(update(User).where(User.id == user_id).values(shard_id = target_shard))
+        await directory_db.commit()
+
+    async with source_factory() as source_db:
+        if workout_ids:
+            await source_db.execute(delete(WorkoutExercise).where(WorkoutExercise.workout_id.in_(workout_ids)))
+        await source_db.execute(delete(Workout).where(Workout.user_id == user_id))
+        await source_db.execute(delete(Exercise).where(Exercise.user_id == user_id))
+        await source_db.execute(delete(User).where(User.id == user_id))
+        await source_db.commit()
+
+    return {"exercises" : len(exercises), "workouts" : len(workouts), "sets" : len(sets)}
+
+
+async def _interleave_all():
+    for index, factory in enumerate(shard_map.session_factories):
+        async with factory() as shard_db:
+            floors = [
+                (await shard_db.execute(text(f"SELECT coalesce(max({column}), 0) FROM {table}"))).scalar()
+                for table, column in SHARDED_SEQUENCES
+            ]
+            for statement in interleave_sequences_sql(index, len(shard_map.session_factories), max(floors)):
+                await shard_db.execute(text(statement))
+            await shard_db.commit()
+            print(f"shard {index}: sequences interleaved above {max(floors)}")
+
+
+async def _move(user_id : int, target_shard : int):
+    from database import AsyncSession as DirectorySession, init_engines
+    init_engines()
+    async with DirectorySession() as directory_db:
+        await shard_map.refresh(directory_db, force = True)
+    source_shard = shard_map.shard_for(user_id)
+    if source_shard == target_shard:
+        print(f"user {user_id} is already on shard {target_shard}")
+        return
+    counts = await move_user(DirectorySession, shard_map.session_factories[source_shard], shard_map.session_factories[target_shard], user_id, target_shard)
+    print(f"moved user {user_id} from shard {source_shard} to {target_shard}: {counts}")
+
+
+def main(argv = None):
+    parser = argparse.ArgumentParser(description = "Shard maintenance for the FitLog API.")
+    subcommands = parser.add_subparsers(dest = "command", required = True)
+    subcommands.add_parser("interleave-sequences", help = "give each shard a disjoint id sequence")
+    move_cmd = subcommands.add_parser("move", help = "move one user's data to another shard")
+    move_cmd.add_argument("--user-id", type = int, required = True)
+    move_cmd.add_argument("--to", type = int, required = True, dest = "target")
+    args = parser.parse_args(argv)
+
+    init_shard_engines()
+    if not shard_map.enabled:
+        raise SystemExit("DB_SHARD_LINKS is not set.")
+    if args.command == "interleave-sequences":
+        asyncio.run(_interleave_all())
+    else:
+        if not 0 <= args.target < len(shard_map.session_factories):
+            raise SystemExit(f"--to must be between 0 and {len(shard_map.session_factories) - 1}")
+        asyncio.run(_move(args.user_id, args.target))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,66 @@
+"""Latency SLOs for the load tests.
+
+Thresholds are milliseconds per request name as reported by locust ("GET /workouts").
+Override them with a JSON file passed through the SLO_FILE environment variable, in the
+same shape as DEFAULT_SLOS.
+"""
+import json
+import os
+
+PERCENTILES = ("p50", "p95", "p99")
+
+DEFAULT_SLO = {"p50" : 100, "p95" : 300, "p99" : 800, "max_failure_ratio" : 0.01}
+
+DEFAULT_SLOS = {
+    "POST /login" : {"p50" : 400, "p95" : 1000, "p99" : 2000, "max_failure_ratio" : 0.01},
+    "POST /register" : {"p50" : 400, "p95" : 1000, "p99" : 2000, "max_failure_ratio" : 0.01},
+    "GET /workouts" : {"p50" : 50, "p95" : 150, "p99" : 400, "max_failure_ratio" : 0.01},
+    "GET /workouts/{id}/sets" : {"p50" : 50, "p95" : 150, "p99" : 400, "max_failure_ratio" : 0.01},
+    "GET /prs" : {"p50" : 80, "p95" : 250, "p99" : 600, "max_failure_ratio" : 0.01},
+    "POST /workoutexercises" : {"p50" : 50, "p95" : 150, "p99" : 400, "max_failure_ratio" : 0.01},
+}
+
+
+def load_slos(path : str | None = None) -> dict:
+    path = path or os.environ.get("SLO_FILE")
+    if not path:
+        return dict(DEFAULT_SLOS)
+    with open(path) as f:
+        return json.load(f)
+
+
+def evaluate(rows : list[dict], slos : dict, default : dict = DEFAULT_SLO) -> tuple[list[dict], list[str]]:
+    """Compare per-endpoint stats against thresholds.
+
+    Each row holds `name`, `requests`, `failures` and `p50`/`p95`/`p99` in ms.
+    Returns the rows annotated with their thresholds, and a list of breach messages.
+    """
+    report = []
+    breaches = []
+    for row in sorted(rows, key = lambda r : r["name"]):
+        if not row["requests"]:
+            continue
+        slo = {**default, **slos.get(row["name"], {})}
+        failure_ratio = row["failures"] / row["requests"]
+        report.append({**row, "slo" : slo, "failure_ratio" : failure_ratio})
+
+        for percentile in PERCENTILES:
+            if row[percentile] > slo[percentile]:
+                breaches.append(f"{row['name']}: {percentile} {row[percentile]:.0f} ms > {slo[percentile]} ms")
+        if failure_ratio > slo["max_failure_ratio"]:
+            breaches.append(f"{row['name']}: failure ratio {failure_ratio:.2%} > {slo['max_failure_ratio']:.2%}")
+
+    return report, breaches
+
+
+def format_report(report : list[dict], breaches : list[str]) -> str:
+    lines = [f"{'endpoint':<32}{'reqs':>8}{'fail%':>8}{'p50':>8}{'p95':>8}{'p99':>8}   slo p50/p95/p99"]
+    for row in report:
+        slo = row["slo"]
+        lines.append(
+            f"{row['name']:<32}{row['requests']:>8}{row['failure_ratio']:>8.2%}"
+            f"{row['p50']:>8.0f}{row['p95']:>8.0f}{row['p99']:>8.0f}   {slo['p50']}/{slo['p95']}/{slo['p99']}"
+        )
+    lines.append("SLO breaches:" if breaches else "All SLOs met.")
+    lines += [f"  - {breach}" for breach in breaches]
+    return "\n".join(lines)
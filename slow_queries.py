@@ -0,0 +1,172 @@
+"""Slow-query log with sampled query plans.
+
+With SLOW_QUERY_ENABLED=true, hooks on the engines' cursor events time every statement.
+Statements slower than SLOW_QUERY_THRESHOLD_MS are logged with their parameters and the
+route that ran them, and kept in a ring buffer of the last SLOW_QUERY_BUFFER_SIZE,
+which GET /debug/slow-queries returns to admins.
+
+A fraction SLOW_QUERY_EXPLAIN_RATE of the slow SELECTs also gets its plan captured on the
+same connection and inside the same transaction: EXPLAIN (ANALYZE, BUFFERS) on PostgreSQL,
+EXPLAIN QUERY PLAN on SQLite. ANALYZE runs the query a second time, which is why plans are
+sampled (default 0: never) and why only plain SELECTs are explained. A write, or a WITH
+that may hide one, would be applied twice.
+
+When disabled no event listener is registered at all, and the middleware that tags
+statements with their route is a single attribute check per request.
+"""
+import logging
+import os
+import random
+import time
+from collections import deque
+from contextvars import ContextVar
+from datetime import datetime, timezone
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+SLOW_QUERY_ENABLED = os.getenv('SLOW_QUERY_ENABLED', 'false').lower() in ('1', 'true', 'yes')
+SLOW_QUERY_THRESHOLD_MS = float(os.getenv('SLOW_QUERY_THRESHOLD_MS', '200'))
+SLOW_QUERY_EXPLAIN_RATE = float(os.getenv('SLOW_QUERY_EXPLAIN_RATE', '0'))
+SLOW_QUERY_BUFFER_SIZE = int(os.getenv('SLOW_QUERY_BUFFER_SIZE', '100'))
+# longest parameter repr kept per statement
+MAX_PARAMETERS_LENGTH = 500
+
+EXPLAIN_PREFIXES = {
+    "postgresql" : "EXPLAIN (ANALYZE, BUFFERS) ",
+    "sqlite" : "EXPLAIN QUERY PLAN ",
+}
+# bind names whose values never reach the log
+REDACTED_PARAMETERS = ("password", "token")
+
+logger = logging.getLogger(__name__)
+
+_request_scope : ContextVar[dict | None] = ContextVar("slow_query_scope", default = None)
+
+
+def current_route() -> str | None:
+    """'METHOD /route/{template}' of the request running the current statement, if any."""
+    scope = _request_scope.get()
+    if scope is None:
+        return None
+    route = scope.get("route")
+    path = route.path if route is not None else scope["path"]
+    return f"{scope.get('method', 'WS')} {path}"
+
+
+def _parameters(context, parameters) -> str:
+    # compiled statements have named binds, so secrets can be masked by name
+    compiled = getattr(context, "compiled_parameters", None)
+    if compiled:
+        values = [
+            {name : "***" if any(word in name for word in REDACTED_PARAMETERS) else value for name, value in row.items()}
+            for row in compiled
+        ]
+        text = repr(values[0] if len(values) == 1 else values)
+    else:
+        text = repr(parameters)
+    return text if len(text) <= MAX_PARAMETERS_LENGTH else text[:MAX_PARAMETERS_LENGTH] + "..."
+
+
+class SlowQueryLog:
+    def __init__(self, threshold_ms : float = SLOW_QUERY_THRESHOLD_MS, explain_rate : float = SLOW_QUERY_EXPLAIN_RATE, size : int = SLOW_QUERY_BUFFER_SIZE):
+        self.threshold_ms = threshold_ms
+        self.explain_rate = explain_rate
+        self.entries : deque[dict] = deque(maxlen = size)
+        self.enabled = False
+        self._random = random.Random()
+
+    def install(self, target = Engine):
+        """Start timing statements on `target`: every engine by default, or one sync engine."""
+        if not event.contains(target, "before_cursor_execute", self._before):
+            event.listen(target, "before_cursor_execute", self._before)
+            event.listen(target, "after_cursor_execute", self._after)
+            event.listen(target, "handle_error", self._failed)
+        self.enabled = True
+
+    def uninstall(self, target = Engine):
+        if event.contains(target, "before_cursor_execute", self._before):
+            event.remove(target, "before_cursor_execute", self._before)
+            event.remove(target, "after_cursor_execute", self._after)
+            event.remove(target, "handle_error", self._failed)
+        self.enabled = False
+
+    def clear(self):
+        self.entries.clear()
+
+    def _before(self, conn, cursor, statement, parameters, context, executemany):
+        # cursor executes on a connection do not nest, so one start time is enough
+        conn.info["slow_query_start"] = time.perf_counter()
+
+    def _failed(self, exception_context):
+        # a statement that raised never reaches _after; its start must not time the next one
+        if exception_context.connection is not None:
+            exception_context.connection.info.pop("slow_query_start", None)
+
+    def _after(self, conn, cursor, statement, parameters, context, executemany):
+        started = conn.info.pop("slow_query_start", None)
+        if started is None:
+            return
+        elapsed_ms = (time.perf_counter() - started) * 1000
+        if elapsed_ms < self.threshold_ms:
+            return
+
+        entry = {
+            "at" : datetime.now(timezone.utc),
+            "duration_ms" : round(elapsed_ms, 1),
+            "route" : current_route(),
+            "statement" : statement,
+            "parameters" : _parameters(context, parameters),
+            "plan" : None,
+        }
+        if self.explain_rate and not executemany and statement.lstrip()[:6].upper() == "SELECT" and self._random.random() < self.explain_rate:
+            entry["plan"] = self._explain(conn, statement, parameters)
+        self.entries.append(entry)
+        logger.warning("slow query (%.1f ms) on %s: %s %s", elapsed_ms, entry["route"] or "-", statement, entry["parameters"])
+
+    def _explain(self, conn, statement : str, parameters) -> str | None:
+        prefix = EXPLAIN_PREFIXES.get(conn.dialect.name)
+        if prefix is None:
+            return None
+        # a DBAPI cursor of its own: fires no events and leaves the statement's cursor alone
+        cursor = conn.connection.cursor()
+        savepoint = conn.dialect.name == "postgresql"
+        try:
+            if savepoint:
+                # a failed EXPLAIN must not abort the request's transaction
+                cursor.execute("SAVEPOINT slow_query_explain")
+            cursor.execute(prefix + statement, parameters)
+            plan = "\n".join(str(row[-1]) for row in cursor.fetchall())
+            if savepoint:
+                cursor.execute("RELEASE SAVEPOINT slow_query_explain")
+            return plan
+        except Exception as e:
+            if savepoint:
+                cursor.execute("ROLLBACK TO SAVEPOINT slow_query_explain")
+            return f"EXPLAIN failed: {e}"
+        finally:
+            cursor.close()
+
+    def snapshot(self) -> list[dict]:
+        """Newest first."""
+        return list(reversed(self.entries))
+
+
+slow_query_log = SlowQueryLog()
+
+
+class SlowQueryMiddleware:
+    """Tags the request's statements with its route while the slow-query log is on."""
+
+    def __init__(self, app, log : SlowQueryLog):
+        self.app = app
+        self.log = log
+
+    async def __call__(self, scope, receive, send):
+        if not self.log.enabled or scope["type"] not in ("http", "websocket"):
+            await self.app(scope, receive, send)
+            return
+        token = _request_scope.set(scope)
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            _request_scope.reset(token)
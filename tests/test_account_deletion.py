@@ -0,0 +1,105 @@
+import asyncio
+
+from fastapi import status
+from sqlalchemy import event, func, select
+
+from conftest import ENGINE, SyncSessionLocal, AsyncSessionShim
+from models.exercise import Exercise
+from models.user import User
+from models.workout import Workout
+from models.workout_exercise import WorkoutExercise
+from auth import revoked_users
+from purge import purge_pending
+
+
+def _get_auth_headers(client, username: str, password: str, email: str):
+    register_payload = {"username": username, "password": password, "email": email}
+    reg = client.post("/register", json=register_payload)
+    assert reg.status_code == status.HTTP_200_OK
+
+    login_payload = {"username_or_email": username, "password": password}
+    login_resp = client.post("/login", json=login_payload)
+    assert login_resp.status_code == status.HTTP_200_OK
+    token = login_resp.json().get("jwt_token")
+    assert token
+    return {"Authorization": f"Bearer {token}"}
+
+
+def _log_data(client, headers, n_sets: int):
+    exercise_id = client.post("/exercises", json={"name": "Squat", "description": ""}, headers=headers).json()["exercise_id"]
+    client.post("/exercises", json={"name": "Bench", "description": ""}, headers=headers)
+    for day in ("2024-03-01", "2024-03-03"):
+        workout = {"name": "Legs", "description": "", "date": day, "start_time": f"{day}T09:00:00"}
+        workout_id = client.post("/workouts", json=workout, headers=headers).json()["workout_id"]
+        for set_number in range(1, n_sets + 1):
+            payload = {"workout_id": workout_id, "exercise_id": exercise_id, "set_number": set_number, "weight": 100, "reps": 5}
+            assert client.post("/workoutexercises", json=payload, headers=headers).status_code == status.HTTP_200_OK
+
+
+def _count(model, user_id: int) -> int:
+    with SyncSessionLocal() as db:
+        column = model.id if model is User else model.user_id
+        return db.scalar(select(func.count()).select_from(model).where(column == user_id))
+
+
+def _purge(**kwargs) -> list[int]:
+    return asyncio.run(purge_pending(lambda: AsyncSessionShim(SyncSessionLocal()), **kwargs))
+
+
+def test_deleted_account_cannot_log_in(client):
+    headers = _get_auth_headers(client, "deluser1", "pw", "deluser1@example.com")
+    _log_data(client, headers, 2)
+
+    deleted = client.delete("/me", headers=headers)
+    assert deleted.status_code == status.HTTP_202_ACCEPTED
+    assert client.post("/login", json={"username_or_email": "deluser1", "password": "pw"}).status_code == status.HTTP_400_BAD_REQUEST
+    # the account's token stopped working with the deletion
+    assert client.delete("/me", headers=headers).status_code == status.HTTP_401_UNAUTHORIZED
+    # nothing is purged inside the request
+    assert _count(WorkoutExercise, 1) == 4
+
+
+def test_deleted_account_token_is_rejected_on_every_worker(client):
+    headers = _get_auth_headers(client, "deluser4", "pw", "deluser4@example.com")
+    workout = {"name": "Legs", "description": "", "date": "2024-03-01", "start_time": "2024-03-01T09:00:00"}
+    assert client.post("/workouts", json=workout, headers=headers).status_code == status.HTTP_200_OK
+    assert client.delete("/me", headers=headers).status_code == status.HTTP_202_ACCEPTED
+
+    # nothing can be read or written behind the purge with the old token
+    assert client.get("/workouts", headers=headers).status_code == status.HTTP_401_UNAUTHORIZED
+    assert client.post("/workouts", json=workout, headers=headers).status_code == status.HTTP_401_UNAUTHORIZED
+    assert _count(Workout, 1) == 1
+
+    # a process that did not serve the deletion learns of it on its next reload
+    revoked_users.clear()
+    asyncio.run(revoked_users.refresh(lambda: AsyncSessionShim(SyncSessionLocal())))
+    assert client.get("/workouts", headers=headers).status_code == status.HTTP_401_UNAUTHORIZED
+
+
+def test_purge_waits_for_the_delay_then_deletes_in_batches(client):
+    leaving = _get_auth_headers(client, "deluser2", "pw", "deluser2@example.com")
+    staying = _get_auth_headers(client, "deluser3", "pw", "deluser3@example.com")
+    _log_data(client, leaving, 5)
+    _log_data(client, staying, 2)
+    assert client.delete("/me", headers=leaving).status_code == status.HTTP_202_ACCEPTED
+
+    # tokens issued before the deletion are still valid for a while, so nothing is due yet
+    assert _purge() == []
+    assert _count(WorkoutExercise, 1) == 10
+
+    statements = []
+    record = lambda conn, cursor, statement, params, context, executemany: statements.append(statement)
+    event.listen(ENGINE, "before_cursor_execute", record)
+    try:
+        assert _purge(delay=0, batch_size=4, pause=0) == [1]
+    finally:
+        event.remove(ENGINE, "before_cursor_execute", record)
+
+    set_deletes = [s for s in statements if s.startswith("DELETE FROM workout_exercises")]
+    assert len(set_deletes) == 3  # 4 + 4 + 2 sets
+    for model in (WorkoutExercise, Workout, Exercise, User):
+        assert _count(model, 1) == 0
+    assert _count(WorkoutExercise, 2) == 4 and _count(Workout, 2) == 2 and _count(Exercise, 2) == 2
+
+    # the username is free again once the account is gone
+    _get_auth_headers(client, "deluser2", "pw", "deluser2@example.com")
@@ -0,0 +1,81 @@
+from fastapi import status
+from sqlalchemy import event, func, select
+
+from conftest import ENGINE, SyncSessionLocal
+from models.workout_exercise import WorkoutExercise
+
+
+def _get_auth_headers(client, username: str, password: str, email: str):
+    register_payload = {"username": username, "password": password, "email": email}
+    reg = client.post("/register", json=register_payload)
+    assert reg.status_code == status.HTTP_200_OK
+
+    login_payload = {"username_or_email": username, "password": password}
+    login_resp = client.post("/login", json=login_payload)
+    assert login_resp.status_code == status.HTTP_200_OK
+    token = login_resp.json().get("jwt_token")
+    assert token
+    return {"Authorization": f"Bearer {token}"}
+
+
+def _setup(client, headers, n_sets: int):
+    exercise_id = client.post("/exercises", json={"name": "Squat", "description": ""}, headers=headers).json()["exercise_id"]
+    workout = {"name": "Legs", "description": "", "date": "2024-03-01", "start_time": "2024-03-01T09:00:00"}
+    workout_id = client.post("/workouts", json=workout, headers=headers).json()["workout_id"]
+    for set_number in range(1, n_sets + 1):
+        payload = {"workout_id": workout_id, "exercise_id": exercise_id, "set_number": set_number, "weight": 100, "reps": 5}
+        assert client.post("/workoutexercises", json=payload, headers=headers).status_code == status.HTTP_200_OK
+    return exercise_id, workout_id
+
+
+def _set_count() -> int:
+    with SyncSessionLocal() as db:
+        return db.scalar(select(func.count()).select_from(WorkoutExercise))
+
+
+def test_deleting_a_workout_does_not_load_it_or_its_sets(client):
+    headers = _get_auth_headers(client, "casuser1", "pw", "casuser1@example.com")
+    _, workout_id = _setup(client, headers, 25)
+    assert _set_count() == 25
+
+    statements = []
+    record = lambda conn, cursor, statement, params, context, executemany: statements.append(statement)
+    event.listen(ENGINE, "before_cursor_execute", record)
+    try:
+        assert client.delete(f"/workouts/{workout_id}", headers=headers).status_code == status.HTTP_204_NO_CONTENT
+    finally:
+        event.remove(ENGINE, "before_cursor_execute", record)
+
+    # no SELECT of the workout or its sets: the workout's UPDATE ... RETURNING, then one for its sets,
+    # then only the leaderboard membership check
+    assert [s.split()[0] for s in statements[:2]] == ["UPDATE", "UPDATE"]
+    assert [s.split()[0] for s in statements[2:]] == ["SELECT"] and "FROM users" in statements[2]
+    assert "RETURNING" in statements[0]
+    assert _set_count() == 0
+    assert client.delete(f"/workouts/{workout_id}", headers=headers).status_code == status.HTTP_404_NOT_FOUND
+
+
+def test_exercise_with_history_needs_cascade(client):
+    headers = _get_auth_headers(client, "casuser2", "pw", "casuser2@example.com")
+    exercise_id, workout_id = _setup(client, headers, 3)
+
+    conflict = client.delete(f"/exercises/{exercise_id}", headers=headers)
+    assert conflict.status_code == status.HTTP_409_CONFLICT
+    assert client.get(f"/exercises/{exercise_id}", headers=headers).status_code == status.HTTP_200_OK
+    assert _set_count() == 3
+
+    assert client.delete(f"/exercises/{exercise_id}", params={"cascade": "true"}, headers=headers).status_code == status.HTTP_204_NO_CONTENT
+    assert client.get(f"/exercises/{exercise_id}", headers=headers).status_code == status.HTTP_404_NOT_FOUND
+    assert _set_count() == 0
+    # the workout itself stays
+    assert client.get(f"/workouts/{workout_id}", headers=headers).status_code == status.HTTP_200_OK
+
+
+def test_deletes_check_ownership_inside_the_statement(client):
+    owner = _get_auth_headers(client, "casuser3", "pw", "casuser3@example.com")
+    other = _get_auth_headers(client, "casuser4", "pw", "casuser4@example.com")
+    exercise_id, workout_id = _setup(client, owner, 2)
+
+    assert client.delete(f"/workouts/{workout_id}", headers=other).status_code == status.HTTP_403_FORBIDDEN
+    assert client.delete(f"/exercises/{exercise_id}", params={"cascade": "true"}, headers=other).status_code == status.HTTP_403_FORBIDDEN
+    assert _set_count() == 2
@@ -0,0 +1,99 @@
+from fastapi import status
+import pytest
+from sqlalchemy.orm import Session
+
+from catalog import CatalogSnapshot, CatalogEntry, reset_catalog
+from conftest import ENGINE
+from models.catalog_exercise import CatalogExercise
+
+
+def _get_auth_headers(client, username: str, password: str, email: str):
+    register_payload = {"username": username, "password": password, "email": email}
+    reg = client.post("/register", json=register_payload)
+    assert reg.status_code == status.HTTP_200_OK
+
+    login_payload = {"username_or_email": username, "password": password}
+    login_resp = client.post("/login", json=login_payload)
+    assert login_resp.status_code == status.HTTP_200_OK
+    token = login_resp.json().get("jwt_token")
+    assert token
+    return {"Authorization": f"Bearer {token}"}
+
+
+@pytest.fixture
+def seeded_catalog(client):
+    """Seed a small global catalog after the per-test schema reset."""
+    with Session(ENGINE) as session:
+        session.add_all([
+            CatalogExercise(name="bench press", description="Flat barbell press."),
+            CatalogExercise(name="barbell row", description="Bent-over row."),
+            CatalogExercise(name="bicep curl", description="Curl."),
+            CatalogExercise(name="squat", description="Back squat."),
+        ])
+        session.commit()
+    reset_catalog()
+    return client
+
+
+def test_create_exercise_links_catalog(seeded_catalog):
+    client = seeded_catalog
+    headers = _get_auth_headers(client, "catuser1", "pw", "catuser1@example.com")
+
+    resp = client.post("/exercises", json={"name": "Bench   Press", "description": ""}, headers=headers)
+    assert resp.status_code == status.HTTP_200_OK
+    data = resp.json()
+    assert data["name"] == "bench press"
+    assert data["catalog_id"] is not None
+
+    # a second personal copy of the same catalog entry is rejected
+    dup = client.post("/exercises", json={"name": "bench press", "description": ""}, headers=headers)
+    assert dup.status_code == status.HTTP_400_BAD_REQUEST
+
+    # names outside the catalog keep working as before
+    custom = client.post("/exercises", json={"name": "Zercher Carry", "description": ""}, headers=headers)
+    assert custom.status_code == status.HTTP_200_OK
+    assert custom.json()["catalog_id"] is None
+
+
+def test_search_includes_catalog_entries(seeded_catalog):
+    client = seeded_catalog
+    headers = _get_auth_headers(client, "catuser2", "pw", "catuser2@example.com")
+    client.post("/exercises", json={"name": "Bench Press", "description": "mine"}, headers=headers)
+
+    resp = client.get("/exercises/search", params={"q": "b"}, headers=headers)
+    assert resp.status_code == status.HTTP_200_OK
+    results = resp.json()
+
+    assert results[0]["source"] == "user" and results[0]["name"] == "bench press"
+    catalog_names = [r["name"] for r in results if r["source"] == "catalog"]
+    # the user's own copy is not repeated from the catalog
+    assert catalog_names == ["barbell row", "bicep curl"]
+    assert all(r["exercise_id"] is None for r in results if r["source"] == "catalog")
+
+
+def test_catalog_endpoint_etag(seeded_catalog):
+    client = seeded_catalog
+    headers = _get_auth_headers(client, "catuser3", "pw", "catuser3@example.com")
+
+    resp = client.get("/catalog/exercises", headers=headers)
+    assert resp.status_code == status.HTTP_200_OK
+    body = resp.json()
+    assert len(body["exercises"]) == 4
+    assert resp.headers["ETag"] == f'"{body["version"]}"'
+
+    cached = client.get("/catalog/exercises", headers={**headers, "If-None-Match": resp.headers["ETag"]})
+    assert cached.status_code == status.HTTP_304_NOT_MODIFIED
+
+
+def test_snapshot_is_immutable_and_versioned():
+    entries = [CatalogEntry(1, "squat", None), CatalogEntry(2, "split squat", None), CatalogEntry(3, "deadlift", None)]
+    snapshot = CatalogSnapshot(entries)
+
+    assert [e.name for e in snapshot.prefix_search("SQ", 10)] == ["squat"]
+    assert snapshot.lookup("  Split  Squat ").catalog_id == 2
+    with pytest.raises(TypeError):
+        snapshot.by_name["bench press"] = CatalogEntry(4, "bench press", None)
+
+    # same rows give the same version regardless of load order
+    assert CatalogSnapshot(list(reversed(entries))).version == snapshot.version
+    assert CatalogSnapshot(entries[:2]).version != snapshot.version
@@ -0,0 +1,86 @@
+import gzip
+
+from fastapi import status
+
+from compression import negotiate, compress
+
+
+def _get_auth_headers(client, username: str, password: str, email: str):
+    register_payload = {"username": username, "password": password, "email": email}
+    reg = client.post("/register", json=register_payload)
+    assert reg.status_code == status.HTTP_200_OK
+
+    login_payload = {"username_or_email": username, "password": password}
+    login_resp = client.post("/login", json=login_payload)
+    assert login_resp.status_code == status.HTTP_200_OK
+    token = login_resp.json().get("jwt_token")
+    assert token
+    return {"Authorization": f"Bearer {token}"}
+
+
+def _workout_with_sets(client, headers, n_sets: int):
+    exercise_id = client.post("/exercises", json={"name": "Squat", "description": ""}, headers=headers).json()["exercise_id"]
+    workout_id = client.post("/workouts", json={"name": "Legs", "description": "", "date": "2024-03-01", "start_time": "2024-03-01T09:00:00"}, headers=headers).json()["workout_id"]
+    for set_number in range(1, n_sets + 1):
+        client.post("/workoutexercises", json={"workout_id": workout_id, "exercise_id": exercise_id, "set_number": set_number, "weight": 100 + set_number, "reps": 5}, headers=headers)
+    return workout_id, exercise_id
+
+
+def test_negotiate_prefers_brotli_and_honours_q_values():
+    assert negotiate("gzip, deflate, br") == "br"
+    assert negotiate("gzip;q=1.0, br;q=0.5") == "gzip"
+    assert negotiate("br;q=0, gzip;q=0") is None
+    assert negotiate("*") == "br"
+    assert negotiate("identity") is None
+
+
+def test_large_listing_is_compressed(client):
+    headers = _get_auth_headers(client, "zipuser1", "pw", "zipuser1@example.com")
+    workout_id, _ = _workout_with_sets(client, headers, 20)
+
+    resp = client.get(f"/workouts/{workout_id}/sets", headers={**headers, "Accept-Encoding": "gzip"})
+    assert resp.status_code == status.HTTP_200_OK
+    assert resp.headers["Content-Encoding"] == "gzip"
+    assert resp.headers["Vary"] == "Accept-Encoding"
+    assert len(resp.json()) == 20
+    # Content-Length describes the compressed bytes on the wire
+    assert int(resp.headers["Content-Length"]) < len(resp.content)
+
+    br = client.get(f"/workouts/{workout_id}/sets", headers={**headers, "Accept-Encoding": "br"})
+    assert br.headers["Content-Encoding"] == "br"
+    assert br.json() == resp.json()
+
+
+def test_small_or_unaccepted_responses_are_not_compressed(client):
+    headers = _get_auth_headers(client, "zipuser2", "pw", "zipuser2@example.com")
+    workout_id, _ = _workout_with_sets(client, headers, 20)
+
+    small = client.get("/exercises", headers={**headers, "Accept-Encoding": "gzip"})
+    assert "Content-Encoding" not in small.headers
+    assert small.headers["Vary"] == "Accept-Encoding"
+
+    identity = client.get(f"/workouts/{workout_id}/sets", headers={**headers, "Accept-Encoding": "identity"})
+    assert "Content-Encoding" not in identity.headers
+    assert len(identity.json()) == 20
+
+
+def test_sets_columnar_shape(client):
+    headers = _get_auth_headers(client, "zipuser3", "pw", "zipuser3@example.com")
+    workout_id, exercise_id = _workout_with_sets(client, headers, 3)
+
+    rows = client.get(f"/workouts/{workout_id}/sets", headers=headers).json()
+    columns = client.get(f"/workouts/{workout_id}/sets", params={"shape": "columns"}, headers=headers).json()
+
+    assert columns["workout_id"] == workout_id
+    assert columns["exercise_id"] == [exercise_id] * 3
+    assert columns["set_number"] == [r["set_number"] for r in rows]
+    assert columns["weight"] == [101, 102, 103]
+    assert columns["created_at"] == [r["created_at"] for r in rows]
+
+    bad = client.get(f"/workouts/{workout_id}/sets", params={"shape": "csv"}, headers=headers)
+    assert bad.status_code == status.HTTP_422_UNPROCESSABLE_ENTITY
+
+
+def test_gzip_body_round_trips():
+    body = b'{"a":1}' * 400
+    assert gzip.decompress(compress(body, "gzip")) == body
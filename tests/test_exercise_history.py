@@ -0,0 +1,78 @@
+from datetime import date, timedelta
+
+from fastapi import status
+
+
+def _get_auth_headers(client, username: str, password: str, email: str):
+    register_payload = {"username": username, "password": password, "email": email}
+    reg = client.post("/register", json=register_payload)
+    assert reg.status_code == status.HTTP_200_OK
+
+    login_payload = {"username_or_email": username, "password": password}
+    login_resp = client.post("/login", json=login_payload)
+    assert login_resp.status_code == status.HTTP_200_OK
+    token = login_resp.json().get("jwt_token")
+    assert token
+    return {"Authorization": f"Bearer {token}"}
+
+
+def _log_session(client, headers, exercise_id: int, day: date, sets: list[tuple[int, int]]) -> int:
+    workout = {"name": "Session", "description": "", "date": day.isoformat(), "start_time": f"{day.isoformat()}T09:00:00"}
+    workout_id = client.post("/workouts", json=workout, headers=headers).json()["workout_id"]
+    for set_number, (weight, reps) in enumerate(sets, start=1):
+        payload = {"workout_id": workout_id, "exercise_id": exercise_id, "set_number": set_number, "weight": weight, "reps": reps}
+        assert client.post("/workoutexercises", json=payload, headers=headers).status_code == status.HTTP_200_OK
+    return workout_id
+
+
+def test_history_reports_top_set_e1rm_and_volume_per_session(client):
+    headers = _get_auth_headers(client, "histuser1", "pw", "histuser1@example.com")
+    squat = client.post("/exercises", json={"name": "Squat", "description": ""}, headers=headers).json()["exercise_id"]
+    bench = client.post("/exercises", json={"name": "Bench", "description": ""}, headers=headers).json()["exercise_id"]
+
+    first = _log_session(client, headers, squat, date(2024, 1, 1), [(100, 5), (110, 3), (110, 2)])
+    _log_session(client, headers, squat, date(2024, 1, 4), [(140, 1)])
+    _log_session(client, headers, bench, date(2024, 1, 4), [(80, 8)])
+
+    history = client.get(f"/exercises/{squat}/history", headers=headers)
+    assert history.status_code == status.HTTP_200_OK
+    body = history.json()
+    assert body["name"] == "squat"
+    assert body["sessions_total"] == 2 and body["downsampled"] is False
+    assert body["points"][0] == {"date": "2024-01-01", "workout_id": first, "top_weight": 110, "top_reps": 3, "e1rm": 121.0, "volume": 1050, "sets": 3}
+    # a single is its own 1RM
+    assert body["points"][1]["e1rm"] == 140.0
+
+    ranged = client.get(f"/exercises/{squat}/history", params={"from": "2024-01-02"}, headers=headers).json()
+    assert [p["date"] for p in ranged["points"]] == ["2024-01-04"]
+
+
+def test_history_is_downsampled_to_at_most_n_points_keeping_peaks(client):
+    headers = _get_auth_headers(client, "histuser2", "pw", "histuser2@example.com")
+    squat = client.post("/exercises", json={"name": "Squat", "description": ""}, headers=headers).json()["exercise_id"]
+
+    start = date(2024, 1, 1)
+    for i in range(12):
+        weight = 200 if i == 7 else 100 + i
+        _log_session(client, headers, squat, start + timedelta(days=3 * i), [(weight, 1)])
+
+    body = client.get(f"/exercises/{squat}/history", params={"points": 4}, headers=headers).json()
+    assert body["sessions_total"] == 12 and body["downsampled"] is True
+    assert len(body["points"]) <= 4
+    assert 200 in [p["top_weight"] for p in body["points"]]
+    dates = [p["date"] for p in body["points"]]
+    assert dates == sorted(dates)
+
+    # asking for more points than there are sessions returns every session
+    assert len(client.get(f"/exercises/{squat}/history", params={"points": 50}, headers=headers).json()["points"]) == 12
+
+
+def test_history_checks_ownership(client):
+    owner = _get_auth_headers(client, "histuser3", "pw", "histuser3@example.com")
+    other = _get_auth_headers(client, "histuser4", "pw", "histuser4@example.com")
+    squat = client.post("/exercises", json={"name": "Squat", "description": ""}, headers=owner).json()["exercise_id"]
+
+    assert client.get(f"/exercises/{squat}/history", headers=other).status_code == status.HTTP_403_FORBIDDEN
+    assert client.get("/exercises/999/history", headers=owner).status_code == status.HTTP_404_NOT_FOUND
+    empty = client.get(f"/exercises/{squat}/history", headers=owner).json()
+    assert empty["points"] == [] and empty["sessions_total"] == 0
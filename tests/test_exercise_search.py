@@ -0,0 +1,71 @@
+from fastapi import status
+import pytest
+from sqlalchemy.dialects import postgresql
+
+from search import exercise_search_statement, escape_like
+
+
+def _get_auth_headers(client, username: str, password: str, email: str):
+    register_payload = {"username": username, "password": password, "email": email}
+    reg = client.post("/register", json=register_payload)
+    assert reg.status_code == status.HTTP_200_OK
+
+    login_payload = {"username_or_email": username, "password": password}
+    login_resp = client.post("/login", json=login_payload)
+    assert login_resp.status_code == status.HTTP_200_OK
+    token = login_resp.json().get("jwt_token")
+    assert token
+    return {"Authorization": f"Bearer {token}"}
+
+
+def test_search_prefix_ranks_first(client):
+    headers = _get_auth_headers(client, "searchuser1", "pw", "searchuser1@example.com")
+    for name in ["Bench Press", "Incline Bench Press", "Benchmark Row", "Squat"]:
+        resp = client.post("/exercises", json={"name": name, "description": ""}, headers=headers)
+        assert resp.status_code == status.HTTP_200_OK
+
+    resp = client.get("/exercises/search", params={"q": "BENCH"}, headers=headers)
+    assert resp.status_code == status.HTTP_200_OK
+    names = [r["name"] for r in resp.json()]
+
+    # prefix matches come before the substring match, shortest first
+    assert names == ["bench press", "benchmark row", "incline bench press"]
+
+
+def test_search_limit_and_ownership(client):
+    headers_a = _get_auth_headers(client, "searchuserA", "pw", "searchA@example.com")
+    headers_b = _get_auth_headers(client, "searchuserB", "pw", "searchB@example.com")
+    for i in range(5):
+        client.post("/exercises", json={"name": f"curl {i}", "description": ""}, headers=headers_a)
+
+    resp = client.get("/exercises/search", params={"q": "curl", "limit": 3}, headers=headers_a)
+    assert resp.status_code == status.HTTP_200_OK
+    assert len(resp.json()) == 3
+
+    # user B does not see user A's exercises
+    resp_b = client.get("/exercises/search", params={"q": "curl"}, headers=headers_b)
+    assert resp_b.status_code == status.HTTP_200_OK
+    assert resp_b.json() == []
+
+
+def test_search_escapes_like_wildcards(client):
+    headers = _get_auth_headers(client, "searchuser2", "pw", "searchuser2@example.com")
+    client.post("/exercises", json={"name": "Row", "description": ""}, headers=headers)
+
+    resp = client.get("/exercises/search", params={"q": "%"}, headers=headers)
+    assert resp.status_code == status.HTTP_200_OK
+    assert resp.json() == []
+    assert escape_like("50%_a\\b") == "50\\%\\_a\\\\b"
+
+
+def test_search_requires_query(client):
+    headers = _get_auth_headers(client, "searchuser3", "pw", "searchuser3@example.com")
+    resp = client.get("/exercises/search", headers=headers)
+    assert resp.status_code == status.HTTP_422_UNPROCESSABLE_ENTITY
+
+
+def test_postgres_statement_uses_trigram_similarity():
+    stmt = exercise_search_statement("postgresql", 1, "Bench", 5)
+    sql = str(stmt.compile(dialect=postgresql.dialect()))
+    assert "similarity(exercises.name" in sql
+    assert "exercises.name %% " in sql or "exercises.name % " in sql
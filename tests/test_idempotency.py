@@ -0,0 +1,153 @@
+import asyncio
+
+from fastapi import status
+
+import idempotency
+from auth import revoked_users
+from idempotency import IdempotencyMiddleware, IdempotencyStore, MemoryKeyValue
+
+
+def _get_auth_headers(client, username: str, password: str, email: str):
+    register_payload = {"username": username, "password": password, "email": email}
+    reg = client.post("/register", json=register_payload)
+    assert reg.status_code == status.HTTP_200_OK
+
+    login_payload = {"username_or_email": username, "password": password}
+    login_resp = client.post("/login", json=login_payload)
+    assert login_resp.status_code == status.HTTP_200_OK
+    token = login_resp.json().get("jwt_token")
+    assert token
+    return {"Authorization": f"Bearer {token}"}
+
+
+WORKOUT = {"name": "Legs", "description": "", "date": "2024-03-01", "start_time": "2024-03-01T09:00:00"}
+
+
+def test_retried_post_replays_without_a_second_write(client):
+    headers = _get_auth_headers(client, "idemuser1", "pw", "idemuser1@example.com")
+
+    first = client.post("/workouts", json=WORKOUT, headers={**headers, "Idempotency-Key": "k1"})
+    retry = client.post("/workouts", json=WORKOUT, headers={**headers, "Idempotency-Key": "k1"})
+    assert first.status_code == retry.status_code == status.HTTP_200_OK
+    assert retry.json() == first.json()
+    assert retry.headers["Idempotent-Replayed"] == "true"
+    assert "Idempotent-Replayed" not in first.headers
+
+    # a new key is a new request; no key keeps the old behaviour
+    client.post("/workouts", json=WORKOUT, headers={**headers, "Idempotency-Key": "k2"})
+    client.post("/workouts", json=WORKOUT, headers=headers)
+    assert len(client.get("/workouts", headers=headers).json()) == 3
+
+
+def test_replayed_conflict_and_key_reuse(client):
+    headers = _get_auth_headers(client, "idemuser2", "pw", "idemuser2@example.com")
+    exercise_id = client.post("/exercises", json={"name": "Squat", "description": ""}, headers=headers).json()["exercise_id"]
+    workout_id = client.post("/workouts", json=WORKOUT, headers=headers).json()["workout_id"]
+    payload = {"workout_id": workout_id, "exercise_id": exercise_id, "set_number": 1, "weight": 100, "reps": 5}
+
+    assert client.post("/workoutexercises", json=payload, headers={**headers, "Idempotency-Key": "set-1"}).status_code == status.HTTP_200_OK
+    # the retry gets the original success, not a 409 for the row it created
+    retry = client.post("/workoutexercises", json=payload, headers={**headers, "Idempotency-Key": "set-1"})
+    assert retry.status_code == status.HTTP_200_OK
+    assert retry.headers["Idempotent-Replayed"] == "true"
+
+    reused = client.post("/workoutexercises", json={**payload, "set_number": 2}, headers={**headers, "Idempotency-Key": "set-1"})
+    assert reused.status_code == status.HTTP_422_UNPROCESSABLE_ENTITY
+    assert client.post("/workouts", json=WORKOUT, headers={**headers, "Idempotency-Key": "x" * 256}).status_code == status.HTTP_400_BAD_REQUEST
+
+
+def test_keys_are_scoped_per_user_and_unauthenticated_posts_pass_through(client):
+    alice = _get_auth_headers(client, "idemuser3", "pw", "idemuser3@example.com")
+    bob = _get_auth_headers(client, "idemuser4", "pw", "idemuser4@example.com")
+
+    mine = client.post("/workouts", json=WORKOUT, headers={**alice, "Idempotency-Key": "same"})
+    theirs = client.post("/workouts", json=WORKOUT, headers={**bob, "Idempotency-Key": "same"})
+    assert "Idempotent-Replayed" not in theirs.headers
+    assert theirs.json()["workout_id"] != mine.json()["workout_id"]
+
+    login = {"username_or_email": "idemuser3", "password": "pw"}
+    assert "Idempotent-Replayed" not in client.post("/login", json=login, headers={"Idempotency-Key": "l"}).headers
+    assert "Idempotent-Replayed" not in client.post("/login", json=login, headers={"Idempotency-Key": "l"}).headers
+
+
+
+def test_retries_must_ask_for_the_same_format_and_deleted_accounts_get_no_replay(client):
+    headers = _get_auth_headers(client, "idemuser5", "pw", "idemuser5@example.com")
+    first = client.post("/workouts", json=WORKOUT, headers={**headers, "Idempotency-Key": "fmt"})
+    assert first.status_code == status.HTTP_200_OK
+
+    # the stored body is JSON; a retry asking for msgpack is a different request
+    packed = client.post("/workouts", json=WORKOUT, headers={**headers, "Idempotency-Key": "fmt", "Accept": "application/msgpack"})
+    assert packed.status_code == status.HTTP_422_UNPROCESSABLE_ENTITY
+
+    revoked_users.revoke(first.json()["user_id"])
+    retry = client.post("/workouts", json=WORKOUT, headers={**headers, "Idempotency-Key": "fmt"})
+    assert retry.status_code == status.HTTP_401_UNAUTHORIZED
+    assert "Idempotent-Replayed" not in retry.headers
+
+
+def test_replays_do_not_repeat_set_cookie(monkeypatch):
+    monkeypatch.setattr(idempotency, "_subject", lambda scope: "1")
+
+    async def endpoint(scope, receive, send):
+        await receive()
+        await send({"type": "http.response.start", "status": 200, "headers": [(b"content-type", b"text/plain"), (b"set-cookie", b"pin=1")]})
+        await send({"type": "http.response.body", "body": b"ok"})
+
+    middleware = IdempotencyMiddleware(endpoint, IdempotencyStore(MemoryKeyValue()))
+    scope = {"type": "http", "method": "POST", "path": "/things", "query_string": b"", "headers": [(b"authorization", b"Bearer t"), (b"idempotency-key", b"c")]}
+
+    async def call():
+        sent = []
+
+        async def receive():
+            return {"type": "http.request", "body": b"", "more_body": False}
+
+        async def send(message):
+            sent.append(message)
+
+        await middleware(scope, receive, send)
+        return dict(sent[0]["headers"]), sent[1]["body"]
+
+    original = asyncio.run(call())
+    replay = asyncio.run(call())
+    assert original[0][b"set-cookie"] == b"pin=1" and original[1] == b"ok"
+    assert b"set-cookie" not in replay[0] and replay[0][b"idempotent-replayed"] == b"true" and replay[1] == b"ok"
+
+
+def test_store_in_flight_and_eviction():
+    async def scenario():
+        store = IdempotencyStore(MemoryKeyValue(max_keys=2))
+        assert (await store.begin("a", b"fp"))[0] == "new"
+        assert (await store.begin("a", b"fp"))[0] == "in_flight"
+        await store.complete("a", b"fp", 201, [[b"content-type", b"application/json"]], b"{}")
+        outcome, record = await store.begin("a", b"fp")
+        assert outcome == "replay" and record[1:] == [201, [[b"content-type", b"application/json"]], b"{}"]
+
+        # a failed request frees its key for the retry
+        await store.begin("b", b"fp")
+        await store.abort("b")
+        assert (await store.begin("b", b"fp"))[0] == "new"
+
+        # least recently used keys go first once the store is full
+        await store.begin("c", b"fp")
+        assert (await store.begin("a", b"fp"))[0] == "new"
+
+    asyncio.run(scenario())
+
+
+def test_memory_store_is_bounded_by_bytes():
+    async def scenario():
+        kv = MemoryKeyValue(max_keys=100, max_bytes=1000)
+        for i in range(10):
+            await kv.set(f"k{i}", bytes(300), ex=60)
+            assert kv.size <= 1000
+        # only the three newest records fit
+        assert [await kv.get(f"k{i}") is not None for i in range(10)] == [False] * 7 + [True] * 3
+
+        # replacing and deleting keep the running total exact
+        await kv.set("k9", bytes(10), ex=60)
+        await kv.delete("k8")
+        assert kv.size == 310
+
+    asyncio.run(scenario())
@@ -0,0 +1,166 @@
+import asyncio
+import random
+
+from fastapi import status
+import pytest
+from sqlalchemy.orm import Session
+
+from catalog import reset_catalog
+from conftest import ENGINE
+from leaderboards import IndexableSkipList, LeaderboardCache
+from models.catalog_exercise import CatalogExercise
+
+
+def _get_auth_headers(client, username: str, password: str, email: str):
+    register_payload = {"username": username, "password": password, "email": email}
+    reg = client.post("/register", json=register_payload)
+    assert reg.status_code == status.HTTP_200_OK
+
+    login_payload = {"username_or_email": username, "password": password}
+    login_resp = client.post("/login", json=login_payload)
+    assert login_resp.status_code == status.HTTP_200_OK
+    token = login_resp.json().get("jwt_token")
+    assert token
+    return {"Authorization": f"Bearer {token}"}
+
+
+@pytest.fixture
+def seeded_catalog(client):
+    with Session(ENGINE) as session:
+        session.add_all([CatalogExercise(name="bench press", description="Flat barbell press.")])
+        session.commit()
+    reset_catalog()
+    return client
+
+
+def _lifter(client, username: str, join: bool = True):
+    headers = _get_auth_headers(client, username, "pw", f"{username}@example.com")
+    exercise_id = client.post("/exercises", json={"name": "Bench Press", "description": ""}, headers=headers).json()["exercise_id"]
+    workout = {"name": "Push", "description": "", "date": "2024-05-01", "start_time": "2024-05-01T09:00:00"}
+    workout_id = client.post("/workouts", json=workout, headers=headers).json()["workout_id"]
+    if join:
+        assert client.put("/me/leaderboards", json={"enabled": True}, headers=headers).json() == {"enabled": True, "boards": 0}
+    return headers, exercise_id, workout_id
+
+
+def _log(client, headers, workout_id: int, exercise_id: int, set_number: int, weight: int, reps: int):
+    payload = {"workout_id": workout_id, "exercise_id": exercise_id, "set_number": set_number, "weight": weight, "reps": reps}
+    assert client.post("/workoutexercises", json=payload, headers=headers).status_code == status.HTTP_200_OK
+
+
+def test_skip_list_ranks_and_slices_like_a_sorted_list():
+    rng = random.Random(7)
+    skip_list, reference = IndexableSkipList(seed=1), []
+    for _ in range(2000):
+        key = rng.randrange(500)
+        if key in reference:
+            skip_list.remove(key)
+            reference.remove(key)
+        else:
+            skip_list.insert(key)
+            reference.append(key)
+            reference.sort()
+    assert len(skip_list) == len(reference)
+    assert all(skip_list.index(key) == position for position, key in enumerate(reference))
+    for start in (0, 1, len(reference) // 2, len(reference) - 3, len(reference)):
+        assert skip_list.slice(start, 5) == reference[start:start + 5]
+    with pytest.raises(KeyError):
+        skip_list.index(-1)
+
+
+def test_sets_feed_the_board_of_members_only(seeded_catalog):
+    client = seeded_catalog
+    alice, alice_bench, alice_workout = _lifter(client, "lbuser1")
+    bob, bob_bench, bob_workout = _lifter(client, "lbuser2")
+    carol, carol_bench, carol_workout = _lifter(client, "lbuser3", join=False)
+
+    _log(client, alice, alice_workout, alice_bench, 1, 100, 5)
+    _log(client, bob, bob_workout, bob_bench, 1, 120, 1)
+    _log(client, carol, carol_workout, carol_bench, 1, 200, 1)
+
+    board = client.get("/leaderboards/bench press", headers=alice).json()
+    assert board["members"] == 2 and board["rank"] == 2
+    assert [(e["rank"], e["username"], e["e1rm"]) for e in board["entries"]] == [(1, "lbuser2", 120.0), (2, "lbuser1", 116.7)]
+
+    # a better set moves the member up; a worse one changes nothing
+    _log(client, alice, alice_workout, alice_bench, 2, 125, 1)
+    _log(client, alice, alice_workout, alice_bench, 3, 60, 10)
+    board = client.get(f"/leaderboards/{board['catalog_id']}", headers=bob).json()
+    assert board["rank"] == 2 and board["entries"][0]["username"] == "lbuser1" and board["entries"][0]["e1rm"] == 125.0
+
+    # joining late ranks the sets already logged
+    assert client.put("/me/leaderboards", json={"enabled": True}, headers=carol).json() == {"enabled": True, "boards": 1}
+    assert client.get("/leaderboards/bench press", headers=carol).json()["rank"] == 1
+
+    # deleting the best set falls back to the next best; leaving takes the user off
+    assert client.delete(f"/workouts/{alice_workout}/sets/{alice_bench}/2", headers=alice).status_code == status.HTTP_204_NO_CONTENT
+    entries = client.get("/leaderboards/bench press", headers=alice).json()["entries"]
+    assert [(e["username"], e["e1rm"]) for e in entries] == [("lbuser3", 200.0), ("lbuser2", 120.0), ("lbuser1", 116.7)]
+    assert client.put("/me/leaderboards", json={"enabled": False}, headers=carol).json() == {"enabled": False, "boards": 0}
+    board = client.get("/leaderboards/bench press", headers=carol).json()
+    assert board["members"] == 2 and board["rank"] is None
+
+
+def test_around_me_centers_the_page_on_the_caller(seeded_catalog):
+    client = seeded_catalog
+    lifters = []
+    for i in range(7):
+        headers, bench, workout_id = _lifter(client, f"lbaround{i}")
+        _log(client, headers, workout_id, bench, 1, 100 + 10 * i, 1)
+        lifters.append(headers)
+
+    # lbaround2 lifted 120, fifth of seven
+    page = client.get("/leaderboards/bench press", params={"around": "me", "limit": 3}, headers=lifters[2]).json()
+    assert page["rank"] == 5
+    assert [e["rank"] for e in page["entries"]] == [4, 5, 6]
+    # the window stays inside the board at its ends
+    bottom = client.get("/leaderboards/bench press", params={"around": "me", "limit": 3}, headers=lifters[0]).json()
+    assert [e["rank"] for e in bottom["entries"]] == [5, 6, 7]
+    assert [e["rank"] for e in client.get("/leaderboards/bench press", params={"offset": 5}, headers=lifters[0]).json()["entries"]] == [6, 7]
+
+    assert client.get("/leaderboards/deadlift", headers=lifters[0]).status_code == status.HTTP_404_NOT_FOUND
+    # a digit str.isdigit() accepts but int() does not is just an unknown name
+    assert client.get("/leaderboards/²", headers=lifters[0]).status_code == status.HTTP_404_NOT_FOUND
+
+
+def test_template_sets_are_not_ranked(seeded_catalog):
+    client = seeded_catalog
+    headers, bench, _ = _lifter(client, "lbtemplate")
+    template = {"name": "Plan", "description": "", "date": "2024-05-02", "start_time": "2024-05-02T09:00:00", "is_template": True}
+    template_id = client.post("/workouts", json=template, headers=headers).json()["workout_id"]
+    _log(client, headers, template_id, bench, 1, 300, 1)
+
+    assert client.get("/leaderboards/bench press", headers=headers).json()["members"] == 0
+
+
+class _SlowBoardSession:
+    """Answers the board query with no rows, after yielding to the other requests."""
+
+    def __init__(self):
+        self.queries = 0
+
+    async def execute(self, statement):
+        self.queries += 1
+        await asyncio.sleep(0.01)
+
+        class _Rows:
+            def all(self):
+                return []
+
+        return _Rows()
+
+
+def test_concurrent_requests_share_one_board_reload():
+    async def scenario():
+        cache, db = LeaderboardCache(refresh_seconds=30), _SlowBoardSession()
+        first = await asyncio.gather(*(cache.board(db, 1) for _ in range(20)))
+        assert db.queries == 1 and all(board is first[0] for board in first)
+
+        # once stale, one request reloads while the others are served the stale board
+        first[0].loaded_at -= 60
+        boards = await asyncio.gather(*(cache.board(db, 1) for _ in range(20)))
+        assert db.queries == 2
+        assert sum(board is first[0] for board in boards) == 19
+        assert await cache.board(db, 1) is not first[0]
+
+    asyncio.run(scenario())
@@ -0,0 +1,184 @@
+from fastapi import status
+import pytest
+from sqlalchemy import create_engine, select
+from sqlalchemy.orm import sessionmaker
+from starlette.websockets import WebSocketDisconnect
+
+import live
+from app import app
+from conftest import AsyncSessionShim, SyncSessionLocal
+from database import get_db
+from models.base import Base
+from models.workout_exercise import WorkoutExercise
+
+
+def _get_auth_headers(client, username: str, password: str, email: str):
+    register_payload = {"username": username, "password": password, "email": email}
+    reg = client.post("/register", json=register_payload)
+    assert reg.status_code == status.HTTP_200_OK
+
+    login_payload = {"username_or_email": username, "password": password}
+    login_resp = client.post("/login", json=login_payload)
+    assert login_resp.status_code == status.HTTP_200_OK
+    token = login_resp.json().get("jwt_token")
+    assert token
+    return {"Authorization": f"Bearer {token}"}
+
+
+def _setup_workout(client, username: str):
+    headers = _get_auth_headers(client, username, "pw", f"{username}@example.com")
+    token = headers["Authorization"].split(" ", 1)[1]
+    exercise_id = client.post("/exercises", json={"name": "Squat", "description": ""}, headers=headers).json()["exercise_id"]
+    workout = client.post("/workouts", json={"name": "Legs", "description": "", "date": "2024-03-01", "start_time": "2024-03-01T09:00:00"}, headers=headers).json()
+    return headers, token, workout["workout_id"], exercise_id
+
+
+def test_live_session_acks_and_flushes_in_batches(client, monkeypatch):
+    monkeypatch.setattr(live, "LIVE_BATCH_SIZE", 2)
+    headers, token, workout_id, exercise_id = _setup_workout(client, "liveuser1")
+
+    with client.websocket_connect(f"/ws/workouts/{workout_id}?token={token}") as ws:
+        ws.send_json({"exercise_id": exercise_id, "set_number": 1, "weight": 100, "reps": 5})
+        assert ws.receive_json() == {"type": "ack", "exercise_id": exercise_id, "set_number": 1, "status": "buffered"}
+
+        # the second set fills the batch and both are written together
+        ws.send_json({"exercise_id": exercise_id, "set_number": 2, "weight": 105, "reps": 5})
+        assert ws.receive_json()["type"] == "ack"
+        assert ws.receive_json() == {"type": "flushed", "sets": [[exercise_id, 1], [exercise_id, 2]]}
+
+        ws.send_json({"exercise_id": exercise_id, "set_number": 3, "weight": 110, "reps": 3})
+        assert ws.receive_json()["type"] == "ack"
+        ws.send_json({"type": "flush"})
+        assert ws.receive_json() == {"type": "flushed", "sets": [[exercise_id, 3]]}
+
+    sets = client.get(f"/workouts/{workout_id}/sets", headers=headers).json()
+    assert sorted((s["set_number"], s["weight"]) for s in sets) == [(1, 100), (2, 105), (3, 110)]
+
+
+def test_buffered_sets_are_written_on_disconnect(client):
+    headers, token, workout_id, exercise_id = _setup_workout(client, "liveuser2")
+
+    with client.websocket_connect(f"/ws/workouts/{workout_id}", headers=headers) as ws:
+        for set_number in (1, 2):
+            ws.send_json({"exercise_id": exercise_id, "set_number": set_number, "weight": 60, "reps": 10})
+            assert ws.receive_json()["status"] == "buffered"
+
+    sets = client.get(f"/workouts/{workout_id}/sets", headers=headers).json()
+    assert sorted(s["set_number"] for s in sets) == [1, 2]
+
+    # the denormalized columns are filled like the HTTP endpoint does
+    prs = client.get("/prs", params={"from": "2024-03-01", "to": "2024-03-01"}, headers=headers).json()
+    assert prs == [{"name": "squat", "weight": 60}]
+
+
+def test_live_session_rejects_bad_sets(client):
+    headers, token, workout_id, exercise_id = _setup_workout(client, "liveuser3")
+    other_headers, _, _, other_exercise_id = _setup_workout(client, "liveuser4")
+    client.post("/workoutexercises", json={"workout_id": workout_id, "exercise_id": exercise_id, "set_number": 1, "weight": 50, "reps": 5}, headers=headers)
+
+    with client.websocket_connect(f"/ws/workouts/{workout_id}?token={token}") as ws:
+        ws.send_json({"exercise_id": other_exercise_id, "set_number": 1, "weight": 50, "reps": 5})
+        assert ws.receive_json()["detail"] == "Forbidden: you cannot use this exercise."
+
+        ws.send_json({"exercise_id": exercise_id, "set_number": 2})
+        assert ws.receive_json()["type"] == "error"
+
+        ws.send_text("not json")
+        assert ws.receive_json() == {"type": "error", "detail": "Expected a JSON object."}
+
+        # set 1 already exists; set 2 in the same batch is still saved
+        ws.send_json({"exercise_id": exercise_id, "set_number": 1, "weight": 50, "reps": 5})
+        ws.receive_json()
+        ws.send_json({"exercise_id": exercise_id, "set_number": 2, "weight": 55, "reps": 5})
+        ws.receive_json()
+        ws.send_json({"type": "flush"})
+        assert ws.receive_json() == {"type": "flushed", "sets": [[exercise_id, 2]]}
+        assert ws.receive_json() == {"type": "error", "exercise_id": exercise_id, "set_number": 1, "detail": live.DUPLICATE_SET_DETAIL}
+
+
+
+def test_workout_deleted_while_open_takes_no_sets(client):
+    headers, token, workout_id, exercise_id = _setup_workout(client, "liveuser7")
+
+    with client.websocket_connect(f"/ws/workouts/{workout_id}?token={token}") as ws:
+        ws.send_json({"exercise_id": exercise_id, "set_number": 1, "weight": 80, "reps": 5})
+        assert ws.receive_json()["status"] == "buffered"
+
+        # another client deletes the workout mid-session
+        assert client.delete(f"/workouts/{workout_id}", headers=headers).status_code == status.HTTP_204_NO_CONTENT
+
+        ws.send_json({"type": "flush"})
+        assert ws.receive_json() == {"type": "error", "sets": [[exercise_id, 1]], "detail": live.WORKOUT_GONE_DETAIL}
+        with pytest.raises(WebSocketDisconnect) as exc:
+            ws.receive_json()
+        assert exc.value.code == status.WS_1008_POLICY_VIOLATION
+
+    with SyncSessionLocal() as db:
+        assert db.scalars(select(WorkoutExercise).execution_options(include_deleted = True)).all() == []
+    assert client.get("/prs", headers=headers).json() == []
+
+
+def test_live_session_rereads_exercises_after_the_ttl(client, monkeypatch):
+    monkeypatch.setattr(live, "OWNERSHIP_TTL_SECONDS", 0)
+    headers, token, workout_id, exercise_id = _setup_workout(client, "liveuser8")
+    other = client.post("/exercises", json={"name": "Lunge", "description": ""}, headers=headers).json()["exercise_id"]
+
+    with client.websocket_connect(f"/ws/workouts/{workout_id}?token={token}") as ws:
+        assert client.delete(f"/exercises/{other}", params={"cascade": "true"}, headers=headers).status_code == status.HTTP_204_NO_CONTENT
+        ws.send_json({"exercise_id": other, "set_number": 1, "weight": 40, "reps": 8})
+        assert ws.receive_json()["detail"] == "Forbidden: you cannot use this exercise."
+        ws.send_json({"exercise_id": exercise_id, "set_number": 1, "weight": 40, "reps": 8})
+        assert ws.receive_json()["status"] == "buffered"
+
+
+def test_live_session_requires_token_and_ownership(client):
+    _, _, workout_id, _ = _setup_workout(client, "liveuser5")
+    _, other_token, _, _ = _setup_workout(client, "liveuser6")
+
+    with pytest.raises(WebSocketDisconnect) as exc:
+        with client.websocket_connect(f"/ws/workouts/{workout_id}"):
+            pass
+    assert exc.value.code == status.WS_1008_POLICY_VIOLATION
+
+    with pytest.raises(WebSocketDisconnect) as exc:
+        with client.websocket_connect(f"/ws/workouts/{workout_id}?token={other_token}"):
+            pass
+    assert exc.value.code == status.WS_1008_POLICY_VIOLATION
+
+
+def test_open_socket_does_not_hold_a_pooled_connection(client, tmp_path):
+    # a file database gets a real QueuePool, where a connection left in a transaction stays checked out
+    pooled = create_engine(f"sqlite:///{tmp_path / 'live.db'}", connect_args={"check_same_thread": False})
+    Base.metadata.create_all(bind=pooled)
+    PooledSession = sessionmaker(bind=pooled)
+
+    async def pooled_get_db():
+        sync_sess = PooledSession()
+        try:
+            yield AsyncSessionShim(sync_sess)
+        finally:
+            sync_sess.close()
+
+    previous = app.dependency_overrides[get_db]
+    app.dependency_overrides[get_db] = pooled_get_db
+    try:
+        headers, token, workout_id, exercise_id = _setup_workout(client, "liveuser5")
+        with client.websocket_connect(f"/ws/workouts/{workout_id}?token={token}") as ws:
+            ws.send_json({"exercise_id": exercise_id, "set_number": 1, "weight": 100, "reps": 5})
+            assert ws.receive_json()["status"] == "buffered"
+            assert pooled.pool.checkedout() == 0
+
+            # an exercise outside the session's cache is looked up, then the connection is let go
+            ws.send_json({"exercise_id": exercise_id + 100, "set_number": 1, "weight": 100, "reps": 5})
+            assert ws.receive_json()["type"] == "error"
+            assert pooled.pool.checkedout() == 0
+
+            ws.send_json({"type": "flush"})
+            assert ws.receive_json()["type"] == "flushed"
+            ws.send_json({"type": "flush"})
+            ws.send_json({"exercise_id": exercise_id, "set_number": 2, "weight": 100, "reps": 5})
+            assert ws.receive_json()["status"] == "buffered"
+            assert pooled.pool.checkedout() == 0
+    finally:
+        app.dependency_overrides[get_db] = previous
+        pooled.dispose()
@@ -0,0 +1,48 @@
+import random
+from datetime import date
+
+import pytest
+
+from seed import history_sizes, workout_rows, set_rows
+from slo import evaluate, DEFAULT_SLO
+
+
+def test_history_sizes_are_heavy_tailed():
+    rng = random.Random(1)
+    sizes = history_sizes(20000, alpha=1.2, max_workouts=1500, rng=rng)
+    assert min(sizes) >= 1 and max(sizes) <= 1500
+    sizes.sort()
+    # most users are light, a few are very heavy
+    assert sizes[len(sizes) // 2] <= 3
+    assert sizes[-len(sizes) // 100] >= 40
+
+
+def test_seed_rows_are_consistent():
+    rng = random.Random(2)
+    workouts = workout_rows(user_id=5, n_workouts=10, today=date(2026, 1, 31), rng=rng)
+    assert len(workouts) == 10
+    assert all(w[4] == 5 and w[2] <= date(2026, 1, 31) for w in workouts)
+
+    sets = set_rows(workout_id=9, workout_date=date(2026, 1, 2), user_id=5, exercise_ids=[1, 2, 3, 4], rng=rng)
+    assert len(sets) == 9
+    # set rows carry the denormalized user and date
+    assert {(s[0], s[5], s[6]) for s in sets} == {(9, 5, date(2026, 1, 2))}
+    assert len({(s[1], s[2]) for s in sets}) == 9
+
+
+def test_slo_evaluation_flags_regressions():
+    rows = [
+        {"name": "GET /workouts", "requests": 1000, "failures": 0, "p50": 20, "p95": 90, "p99": 500},
+        {"name": "GET /prs", "requests": 200, "failures": 10, "p50": 30, "p95": 100, "p99": 200},
+        {"name": "GET /unused", "requests": 0, "failures": 0, "p50": 0, "p95": 0, "p99": 0},
+    ]
+    slos = {"GET /workouts": {"p99": 400}}
+    report, breaches = evaluate(rows, slos)
+
+    assert [r["name"] for r in report] == ["GET /prs", "GET /workouts"]
+    assert breaches == [
+        "GET /prs: failure ratio 5.00% > 1.00%",
+        "GET /workouts: p99 500 ms > 400 ms",
+    ]
+    # unspecified thresholds fall back to the defaults
+    assert report[1]["slo"]["p95"] == DEFAULT_SLO["p95"]
@@ -0,0 +1,123 @@
+import asyncio
+import threading
+import time
+from collections import deque
+
+from fastapi import status
+from sqlalchemy import create_engine
+from sqlalchemy.pool import QueuePool
+
+import database
+import monitoring
+from database import WaiterCount
+from monitoring import LoopLagMonitor, loop_monitor, readiness
+from passwords import PasswordHasher, password_hasher
+from ratelimit import rate_limiter, RateLimitRule, MemoryBucketStore
+
+
+def test_lag_monitor_sees_a_blocked_loop():
+    async def scenario():
+        monitor = LoopLagMonitor(interval=0.01)
+        monitor.start()
+        await asyncio.sleep(0.05)
+        time.sleep(0.2)
+        await asyncio.sleep(0.05)
+        await monitor.stop()
+        return monitor
+
+    monitor = asyncio.run(scenario())
+    assert monitor.max_lag >= 0.15
+    assert monitor.average_lag < monitor.max_lag
+
+
+def test_ready_worker_reports_its_gauges(client):
+    ready = client.get("/health/ready")
+    assert ready.status_code == status.HTTP_200_OK
+    body = ready.json()
+    assert body["status"] == "ready" and body["failing"] == []
+    assert body["threadpool"]["size"] > 0 and "queue" in body["threadpool"]
+    assert body["password_hash"] == {"busy": 0, "size": password_hasher.workers, "queue": 0}
+
+    metrics = client.get("/metrics")
+    assert metrics.status_code == status.HTTP_200_OK
+    assert metrics.headers["content-type"].startswith("text/plain")
+    lines = metrics.text.splitlines()
+    assert "# TYPE fitlog_event_loop_lag_seconds gauge" in lines
+    assert "fitlog_password_hash_queue_depth 0" in lines
+    assert "fitlog_ready 1" in lines
+
+
+def test_lagging_loop_fails_readiness(client, monkeypatch):
+    monkeypatch.setattr(loop_monitor, "samples", deque([0.5, 0.5]))
+
+    ready = client.get("/health/ready")
+    assert ready.status_code == status.HTTP_503_SERVICE_UNAVAILABLE
+    assert ready.json()["failing"] == ["event_loop_lag"]
+    assert "fitlog_ready 0" in client.get("/metrics").text.splitlines()
+
+
+def test_probes_are_never_rate_limited(client, monkeypatch):
+    monkeypatch.setattr(rate_limiter, "enabled", True)
+    monkeypatch.setattr(rate_limiter, "store", MemoryBucketStore())
+    monkeypatch.setattr(rate_limiter, "default_rule", RateLimitRule("default", "1/minute"))
+
+    # a load balancer probing from one address
+    for _ in range(5):
+        assert client.get("/health/ready").status_code == status.HTTP_200_OK
+        assert client.get("/metrics").status_code == status.HTTP_200_OK
+    assert client.get("/").status_code == status.HTTP_200_OK
+    assert client.get("/").status_code == status.HTTP_429_TOO_MANY_REQUESTS
+
+
+def test_hasher_counts_running_and_queued_jobs():
+    hasher = PasswordHasher("bcrypt", workers=1)
+    release = threading.Event()
+    started = threading.Event()
+
+    def blocking():
+        started.set()
+        release.wait(5)
+
+    try:
+        jobs = [hasher._submit(blocking) for _ in range(3)]
+        assert started.wait(5)
+        assert hasher.stats() == {"busy": 1, "size": 1, "queue": 2}
+        release.set()
+        for job in jobs:
+            job.result(5)
+        assert hasher.stats() == {"busy": 0, "size": 1, "queue": 0}
+    finally:
+        release.set()
+        hasher.close()
+
+
+def test_pool_waiters_take_a_worker_out_and_back(monkeypatch, tmp_path):
+    class CountingQueuePool(WaiterCount, QueuePool):
+        pass
+
+    engine = create_engine(f"sqlite:///{tmp_path / 'pool.db'}", poolclass=CountingQueuePool, pool_size=1, max_overflow=0, pool_timeout=5)
+    monkeypatch.setattr(database, "engine", engine)
+    monkeypatch.setattr(database, "replica_engine", None)
+    monkeypatch.setattr(monitoring, "READY_MAX_DB_WAITERS", 0)
+    idle = {"loop_lag": {"average": 0.0}, "threadpool": {"queue": 0}, "password_hash": {"queue": 0}}
+
+    def failing():
+        return readiness({**idle, "db_pools": monitoring.pool_stats()})
+
+    try:
+        held = engine.connect()
+        # the whole pool in use but nobody waiting: busy, still ready
+        assert engine.pool.checkedout() == 1 and failing() == []
+
+        waiter = threading.Thread(target=lambda: engine.connect().close())
+        waiter.start()
+        deadline = time.monotonic() + 5
+        while engine.pool.waiting == 0 and time.monotonic() < deadline:
+            time.sleep(0.01)
+        assert failing() == ["db_pool_waiters:primary"]
+
+        held.close()
+        waiter.join(5)
+        assert engine.pool.waiting == 0 and failing() == []
+    finally:
+        engine.dispose()
@@ -0,0 +1,100 @@
+from datetime import datetime, timedelta, timezone
+
+from fastapi import status
+import msgpack
+
+from msgpack_codec import wants_msgpack, packb, unpackb, _default
+
+MSGPACK = "application/msgpack"
+
+
+def _get_auth_headers(client, username: str, password: str, email: str):
+    register_payload = {"username": username, "password": password, "email": email}
+    reg = client.post("/register", json=register_payload)
+    assert reg.status_code == status.HTTP_200_OK
+
+    login_payload = {"username_or_email": username, "password": password}
+    login_resp = client.post("/login", json=login_payload)
+    assert login_resp.status_code == status.HTTP_200_OK
+    token = login_resp.json().get("jwt_token")
+    assert token
+    return {"Authorization": f"Bearer {token}"}
+
+
+def _post_msgpack(client, url: str, payload: dict, headers: dict):
+    return client.post(url, content=packb(payload), headers={**headers, "Content-Type": MSGPACK, "Accept": MSGPACK})
+
+
+def test_msgpack_request_and_response_bodies(client):
+    headers = _get_auth_headers(client, "mpuser1", "pw", "mpuser1@example.com")
+
+    created = _post_msgpack(client, "/exercises", {"name": "Squat", "description": "legs"}, headers)
+    assert created.status_code == status.HTTP_200_OK
+    assert created.headers["Content-Type"] == MSGPACK
+    exercise = unpackb(created.content)
+    assert exercise["name"] == "squat"
+    # datetimes use the timestamp extension type, not strings
+    assert isinstance(exercise["created_at"], datetime)
+
+    workout = unpackb(_post_msgpack(client, "/workouts", {"name": "Legs", "description": "", "date": "2024-03-01", "start_time": "2024-03-01T09:00:00"}, headers).content)
+    assert workout["date"] == "2024-03-01"
+    assert isinstance(workout["start_time"], datetime)
+
+    listing = client.get(f"/workouts/{workout['workout_id']}/sets", params={"shape": "columns"}, headers={**headers, "Accept": MSGPACK})
+    assert unpackb(listing.content)["set_number"] == []
+    # JSON stays the default
+    assert client.get("/exercises", headers=headers).headers["Content-Type"] == "application/json"
+
+
+def test_msgpack_is_smaller_than_json(client):
+    headers = _get_auth_headers(client, "mpuser2", "pw", "mpuser2@example.com")
+    for name in ("Squat", "Bench", "Row", "Dip"):
+        client.post("/exercises", json={"name": name, "description": ""}, headers=headers)
+
+    as_json = client.get("/exercises", headers=headers)
+    as_msgpack = client.get("/exercises", headers={**headers, "Accept": MSGPACK})
+    assert len(as_msgpack.content) < len(as_json.content)
+    assert [e["name"] for e in unpackb(as_msgpack.content)] == [e["name"] for e in as_json.json()]
+
+
+def test_msgpack_errors(client):
+    headers = _get_auth_headers(client, "mpuser3", "pw", "mpuser3@example.com")
+
+    missing = _post_msgpack(client, "/exercises", {"description": "no name"}, headers)
+    assert missing.status_code == status.HTTP_422_UNPROCESSABLE_ENTITY
+    assert unpackb(missing.content)["detail"][0]["loc"] == ["body", "name"]
+
+    not_found = client.get("/workouts/999", headers={**headers, "Accept": MSGPACK})
+    assert not_found.status_code == status.HTTP_404_NOT_FOUND
+    assert unpackb(not_found.content) == {"detail": "Workout not found."}
+
+    garbage = client.post("/exercises", content=b"\xc1", headers={**headers, "Content-Type": MSGPACK})
+    assert garbage.status_code == status.HTTP_400_BAD_REQUEST
+
+
+def test_live_session_accepts_msgpack_frames(client):
+    headers = _get_auth_headers(client, "mpuser4", "pw", "mpuser4@example.com")
+    exercise_id = client.post("/exercises", json={"name": "Squat", "description": ""}, headers=headers).json()["exercise_id"]
+    workout_id = client.post("/workouts", json={"name": "Legs", "description": "", "date": "2024-03-01", "start_time": "2024-03-01T09:00:00"}, headers=headers).json()["workout_id"]
+
+    with client.websocket_connect(f"/ws/workouts/{workout_id}", headers=headers) as ws:
+        ws.send_bytes(packb({"exercise_id": exercise_id, "set_number": 1, "weight": 80, "reps": 8}))
+        assert unpackb(ws.receive_bytes())["status"] == "buffered"
+        ws.send_bytes(packb({"type": "flush"}))
+        assert unpackb(ws.receive_bytes()) == {"type": "flushed", "sets": [[exercise_id, 1]]}
+
+
+def test_accept_negotiation():
+    assert wants_msgpack("application/msgpack")
+    assert wants_msgpack("application/x-msgpack, application/json;q=0.5")
+    assert not wants_msgpack("application/json, application/msgpack;q=0.5")
+    assert not wants_msgpack("*/*")
+    assert isinstance(msgpack.unpackb(packb({"t": datetime(2024, 1, 1)}), timestamp=3)["t"], datetime)
+
+
+def test_datetimes_keep_their_instant():
+    # an aware value keeps its offset; a naive one is read as UTC
+    aware = datetime(2024, 1, 1, 9, 30, tzinfo=timezone(timedelta(hours=2)))
+    assert unpackb(packb({"t": aware}))["t"] == aware
+    assert _default(aware).to_datetime() == aware
+    assert unpackb(packb({"t": datetime(2024, 1, 1, 9, 30)}))["t"] == datetime(2024, 1, 1, 9, 30, tzinfo=timezone.utc)
@@ -0,0 +1,170 @@
+import asyncio
+from datetime import date, datetime, timezone
+
+from fastapi import status
+from sqlalchemy import event, select, update
+
+from conftest import ENGINE, SyncSessionLocal
+from models.workout import Workout
+from models.workout_exercise import WorkoutExercise
+from ownership import OWNERSHIP_RECENT_WORKOUTS, OwnershipCache, UserOwnership, ownership_cache
+
+
+def _get_auth_headers(client, username: str, password: str, email: str):
+    register_payload = {"username": username, "password": password, "email": email}
+    reg = client.post("/register", json=register_payload)
+    assert reg.status_code == status.HTTP_200_OK
+
+    login_payload = {"username_or_email": username, "password": password}
+    login_resp = client.post("/login", json=login_payload)
+    assert login_resp.status_code == status.HTTP_200_OK
+    token = login_resp.json().get("jwt_token")
+    assert token
+    return {"Authorization": f"Bearer {token}"}
+
+
+def _setup(client, headers):
+    exercise_id = client.post("/exercises", json={"name": "Row", "description": ""}, headers=headers).json()["exercise_id"]
+    workout = {"name": "Pull", "description": "", "date": "2024-06-01", "start_time": "2024-06-01T09:00:00"}
+    workout_id = client.post("/workouts", json=workout, headers=headers).json()["workout_id"]
+    return exercise_id, workout_id
+
+
+def _set(workout_id: int, exercise_id: int, set_number: int):
+    return {"workout_id": workout_id, "exercise_id": exercise_id, "set_number": set_number, "weight": 60, "reps": 8}
+
+
+def test_logging_a_set_skips_the_ownership_selects_once_cached(client):
+    headers = _get_auth_headers(client, "ownuser1", "pw", "ownuser1@example.com")
+    exercise_id, workout_id = _setup(client, headers)
+    first = client.post("/workoutexercises", json=_set(workout_id, exercise_id, 1), headers=headers)
+    assert first.status_code == status.HTTP_200_OK
+
+    statements = []
+    record = lambda conn, cursor, statement, params, context, executemany: statements.append(statement)
+    event.listen(ENGINE, "before_cursor_execute", record)
+    try:
+        second = client.post("/workoutexercises", json=_set(workout_id, exercise_id, 2), headers=headers)
+    finally:
+        event.remove(ENGINE, "before_cursor_execute", record)
+
+    assert second.status_code == status.HTTP_200_OK
+    # one INSERT ... SELECT ... RETURNING: no workout or exercise lookup first, no refresh after
+    assert len(statements) == 1
+    assert "INSERT INTO workout_exercises" in statements[0] and "FROM workouts" in statements[0] and "RETURNING" in statements[0]
+    # the date comes from the workout inside the INSERT
+    with SyncSessionLocal() as db:
+        assert set(db.scalars(select(WorkoutExercise.date))) == {date(2024, 6, 1)}
+
+
+def test_cache_keeps_ownership_checks_and_follows_deletes(client):
+    alice = _get_auth_headers(client, "ownuser2", "pw", "ownuser2@example.com")
+    bob = _get_auth_headers(client, "ownuser3", "pw", "ownuser3@example.com")
+    exercise_id, workout_id = _setup(client, alice)
+    bob_exercise, bob_workout = _setup(client, bob)
+    assert client.post("/workoutexercises", json=_set(workout_id, exercise_id, 1), headers=alice).status_code == status.HTTP_200_OK
+
+    # alice is cached now; ids outside her cache still get the database's answer
+    assert client.post("/workoutexercises", json=_set(bob_workout, exercise_id, 1), headers=alice).status_code == status.HTTP_403_FORBIDDEN
+    assert client.post("/workoutexercises", json=_set(workout_id, bob_exercise, 2), headers=alice).status_code == status.HTTP_403_FORBIDDEN
+    assert client.post("/workoutexercises", json=_set(999999, exercise_id, 2), headers=alice).status_code == status.HTTP_404_NOT_FOUND
+
+    # a new exercise is usable at once, a deleted one no longer is
+    other = client.post("/exercises", json={"name": "Curl", "description": ""}, headers=alice).json()["exercise_id"]
+    assert client.post("/workoutexercises", json=_set(workout_id, other, 3), headers=alice).status_code == status.HTTP_200_OK
+    assert client.delete(f"/exercises/{other}", params={"cascade": "true"}, headers=alice).status_code == status.HTTP_204_NO_CONTENT
+    assert client.post("/workoutexercises", json=_set(workout_id, other, 4), headers=alice).status_code == status.HTTP_404_NOT_FOUND
+
+    assert client.delete(f"/workouts/{workout_id}", headers=alice).status_code == status.HTTP_204_NO_CONTENT
+    assert client.post("/workoutexercises", json=_set(workout_id, exercise_id, 5), headers=alice).status_code == status.HTTP_404_NOT_FOUND
+    assert len(ownership_cache) == 1
+
+
+def test_cached_workout_deleted_elsewhere_takes_no_sets(client):
+    headers = _get_auth_headers(client, "ownuser4", "pw", "ownuser4@example.com")
+    exercise_id, workout_id = _setup(client, headers)
+    assert client.post("/workoutexercises", json=_set(workout_id, exercise_id, 1), headers=headers).status_code == status.HTTP_200_OK
+    assert ownership_cache.get(1).owns_workout(workout_id)
+
+    # another process deletes the workout; this one's cache still vouches for it
+    with SyncSessionLocal() as db:
+        db.execute(update(Workout).where(Workout.workout_id == workout_id).values(deleted_at = datetime.now(timezone.utc)))
+        db.commit()
+
+    response = client.post("/workoutexercises", json=_set(workout_id, exercise_id, 2), headers=headers)
+    assert response.status_code == status.HTTP_404_NOT_FOUND
+    assert not ownership_cache.get(1).owns_workout(workout_id)
+    with SyncSessionLocal() as db:
+        assert db.scalars(select(WorkoutExercise.set_number).execution_options(include_deleted = True)).all() == [1]
+
+
+def test_user_ownership_arrays_stay_sorted_and_bounded():
+    owned = UserOwnership([(9, None), (3, 4)], [(5, False), (2, True)])
+    assert list(owned.exercise_ids) == [3, 9] and owned.catalog_id(3) == 4 and owned.catalog_id(9) is None
+    assert owned.is_template(2) and not owned.is_template(5) and not owned.owns_workout(7)
+
+    owned.add_exercise(9, 12)
+    owned.remove_exercise(3)
+    assert list(owned.exercise_ids) == [9] and owned.catalog_id(9) == 12
+
+    for workout_id in range(100, 100 + OWNERSHIP_RECENT_WORKOUTS):
+        owned.add_workout(workout_id, False)
+    # the oldest ids make room for the newest
+    assert len(owned.workout_ids) == OWNERSHIP_RECENT_WORKOUTS and not owned.owns_workout(5)
+    assert list(owned.workout_ids) == sorted(owned.workout_ids)
+
+
+class _EmptyResult:
+    def all(self):
+        return []
+
+
+class _CountingSession:
+    def __init__(self):
+        self.queries = 0
+
+    async def execute(self, statement):
+        self.queries += 1
+        return _EmptyResult()
+
+
+def test_cache_evicts_least_recently_used_and_expired_users():
+    cache, db = OwnershipCache(ttl=60, max_users=2), _CountingSession()
+    asyncio.run(cache.load(db, 1))
+    asyncio.run(cache.load(db, 2))
+    assert cache.get(1) is not None
+    asyncio.run(cache.load(db, 3))
+    # two queries per load; 2 was the least recently used and went out
+    assert db.queries == 6 and cache.get(2) is None and cache.get(1) is not None
+
+    cache.get(1).loaded_at -= 61
+    assert cache.get(1) is None and len(cache) == 1
+
+
+class _BlockingSession(_CountingSession):
+    def __init__(self):
+        super().__init__()
+        self.release = asyncio.Event()
+
+    async def execute(self, statement):
+        await self.release.wait()
+        return await super().execute(statement)
+
+
+def test_update_during_a_load_keeps_its_snapshot_out_of_the_cache():
+    async def scenario():
+        cache, db = OwnershipCache(), _BlockingSession()
+        load = asyncio.create_task(cache.load(db, 1))
+        await asyncio.sleep(0)
+        # the endpoint that created this workout runs while the queries are in flight
+        cache.add_workout(1, 42, False)
+        db.release.set()
+        entry = await load
+        assert not entry.owns_workout(42)
+        assert cache.get(1) is None and cache._loading == {}
+
+        # a load with nothing racing it is cached
+        await cache.load(db, 1)
+        assert cache.get(1) is not None
+
+    asyncio.run(scenario())
@@ -0,0 +1,103 @@
+from datetime import date
+
+from fastapi import status
+import pytest
+
+from partitions import add_months, month_range, partition_name, create_partition_sql, convert_statements, parse_month, convert
+
+
+def _get_auth_headers(client, username: str, password: str, email: str):
+    register_payload = {"username": username, "password": password, "email": email}
+    reg = client.post("/register", json=register_payload)
+    assert reg.status_code == status.HTTP_200_OK
+
+    login_payload = {"username_or_email": username, "password": password}
+    login_resp = client.post("/login", json=login_payload)
+    assert login_resp.status_code == status.HTTP_200_OK
+    token = login_resp.json().get("jwt_token")
+    assert token
+    return {"Authorization": f"Bearer {token}"}
+
+
+def test_month_helpers():
+    assert add_months(date(2025, 11, 15), 2) == date(2026, 1, 1)
+    assert add_months(date(2025, 1, 1), -1) == date(2024, 12, 1)
+    assert month_range(date(2025, 11, 20), date(2026, 1, 3)) == [date(2025, 11, 1), date(2025, 12, 1), date(2026, 1, 1)]
+    assert parse_month("2024-03") == date(2024, 3, 1)
+    assert partition_name("workouts", date(2025, 3, 1)) == "workouts_p2025_03"
+
+
+def test_partition_ddl():
+    sql = create_partition_sql("workout_exercises", date(2025, 12, 1))
+    assert sql == (
+        "CREATE TABLE IF NOT EXISTS workout_exercises_p2025_12 PARTITION OF workout_exercises "
+        "FOR VALUES FROM ('2025-12-01') TO ('2026-01-01')"
+    )
+
+    statements = convert_statements([date(2025, 10, 1)])
+    # partitioned keys must contain the partition column
+    assert any("PRIMARY KEY (workout_id, date)" in s for s in statements)
+    assert any("FOREIGN KEY (workout_id, date) REFERENCES workouts (workout_id, date)" in s for s in statements)
+    assert statements[-1] == "ALTER TABLE workout_exercises_partitioned_pdefault RENAME TO workout_exercises_pdefault"
+
+
+
+class _Result:
+    def __init__(self, value):
+        self.value = value
+
+    def scalar(self):
+        return self.value
+
+
+class _OldServer:
+    def __init__(self):
+        self.statements = []
+
+    def execute(self, statement, params = None):
+        self.statements.append(str(statement))
+        if "server_version_num" in str(statement):
+            return _Result("140011")
+        return _Result(False)
+
+
+def test_convert_refuses_servers_that_delete_moved_sets():
+    connection = _OldServer()
+    with pytest.raises(RuntimeError, match = "PostgreSQL 15"):
+        convert(connection)
+    # checked before any DDL runs
+    assert not any(s.startswith(("CREATE", "ALTER", "INSERT", "DROP")) for s in connection.statements)
+
+
+def test_sets_follow_workout_date(client):
+    headers = _get_auth_headers(client, "partuser1", "pw", "partuser1@example.com")
+    ex_id = client.post("/exercises", json={"name": "Press", "description": ""}, headers=headers).json()["exercise_id"]
+    w = client.post("/workouts", json={"name": "W", "description": "", "date": "2025-10-01", "start_time": "2025-10-01T08:00:00"}, headers=headers)
+    w_id = w.json()["workout_id"]
+    s = client.post("/workoutexercises", json={"workout_id": w_id, "exercise_id": ex_id, "set_number": 1, "weight": 50, "reps": 5}, headers=headers)
+    assert s.status_code == status.HTTP_200_OK
+
+    # moving the workout to another month must keep its sets visible
+    edit = client.put(f"/workouts/{w_id}", json={"name": "W", "description": "", "date": "2025-12-15", "start_time": "2025-12-15T08:00:00"}, headers=headers)
+    assert edit.status_code == status.HTTP_200_OK
+    sets = client.get(f"/workouts/{w_id}/sets", headers=headers)
+    assert sets.status_code == status.HTTP_200_OK
+    assert len(sets.json()) == 1
+
+
+def test_date_bounded_listing_and_prs(client):
+    headers = _get_auth_headers(client, "partuser2", "pw", "partuser2@example.com")
+    ex_id = client.post("/exercises", json={"name": "Squat", "description": ""}, headers=headers).json()["exercise_id"]
+    w_old = client.post("/workouts", json={"name": "Old", "description": "", "date": "2025-01-10", "start_time": "2025-01-10T08:00:00"}, headers=headers).json()["workout_id"]
+    w_new = client.post("/workouts", json={"name": "New", "description": "", "date": "2025-06-10", "start_time": "2025-06-10T08:00:00"}, headers=headers).json()["workout_id"]
+    client.post("/workoutexercises", json={"workout_id": w_old, "exercise_id": ex_id, "set_number": 1, "weight": 150, "reps": 1}, headers=headers)
+    client.post("/workoutexercises", json={"workout_id": w_new, "exercise_id": ex_id, "set_number": 1, "weight": 120, "reps": 3}, headers=headers)
+
+    listing = client.get("/workouts", params={"from": "2025-03-01"}, headers=headers)
+    assert listing.status_code == status.HTTP_200_OK
+    assert [w["workout_id"] for w in listing.json()] == [w_new]
+
+    all_time = client.get("/prs", headers=headers).json()
+    assert float(all_time[0]["weight"]) == 150.0
+    recent = client.get("/prs", params={"from": "2025-03-01", "to": "2025-12-31"}, headers=headers).json()
+    assert float(recent[0]["weight"]) == 120.0
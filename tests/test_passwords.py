@@ -0,0 +1,100 @@
+import asyncio
+
+import pytest
+from fastapi import status
+from sqlalchemy import inspect, select
+
+from conftest import AsyncSessionShim, SyncSessionLocal
+from models.user import User
+from passwords import PasswordHasher, BcryptBackend, password_hasher
+
+
+class CountingBcrypt(BcryptBackend):
+    def __init__(self, rounds):
+        super().__init__(rounds)
+        self.verified = 0
+
+    def verify(self, password, hashed):
+        self.verified += 1
+        return super().verify(password, hashed)
+
+
+def test_concurrent_verifications_are_batched_and_deduplicated():
+    backend = CountingBcrypt(rounds=4)
+    hasher = PasswordHasher("bcrypt", workers=2, backends={"bcrypt": backend})
+
+    async def scenario():
+        hashed = await hasher.hash("secret")
+        other = await hasher.hash("other")
+        # a retry storm: the same credentials many times, plus a few distinct logins
+        results = await asyncio.gather(*[hasher.verify("secret", hashed) for _ in range(20)], hasher.verify("wrong", hashed), hasher.verify("other", other), hasher.verify("x", "not a hash"))
+        return results
+
+    results = asyncio.run(scenario())
+    hasher.close()
+    assert results == [True] * 20 + [False, True, False]
+    assert backend.verified == 3
+
+
+def test_cost_and_scheme_upgrades():
+    pytest.importorskip("argon2")
+
+    async def scenario():
+        old = await PasswordHasher("bcrypt", backends={"bcrypt": BcryptBackend(rounds=4)}).hash("pw")
+        current = PasswordHasher("bcrypt", backends={"bcrypt": BcryptBackend(rounds=5)})
+        valid, upgraded = await current.verify_and_update("pw", old)
+        assert valid and upgraded.startswith("$2b$05$")
+        assert await current.verify_and_update("pw", upgraded) == (True, None)
+        assert await current.verify_and_update("nope", old) == (False, None)
+
+        argon2 = PasswordHasher("argon2id")
+        valid, upgraded = await argon2.verify_and_update("pw", old)
+        assert valid and upgraded.startswith("$argon2id$")
+        assert await argon2.verify_and_update("pw", upgraded) == (True, None)
+
+    asyncio.run(scenario())
+    with pytest.raises(ValueError):
+        PasswordHasher("md5")
+
+
+def test_login_rehashes_with_the_configured_scheme(client, monkeypatch):
+    pytest.importorskip("argon2")
+    payload = {"username": "hashuser", "password": "pw", "email": "hashuser@example.com"}
+    assert client.post("/register", json=payload).status_code == status.HTTP_200_OK
+    with SyncSessionLocal() as db:
+        assert db.scalars(select(User.hashed_password)).one().startswith("$2b$")
+
+    monkeypatch.setattr(password_hasher, "scheme", "argon2id")
+    login = {"username_or_email": "hashuser", "password": "pw"}
+    assert client.post("/login", json=login).status_code == status.HTTP_200_OK
+    with SyncSessionLocal() as db:
+        assert db.scalars(select(User.hashed_password)).one().startswith("$argon2id$")
+    # the upgraded hash verifies on the next login
+    assert client.post("/login", json=login).status_code == status.HTTP_200_OK
+
+
+def test_login_does_not_reload_the_user_after_the_rehash_commit(client, monkeypatch):
+    # the test shim reloads expired attributes silently; on asyncpg that lazy load raises
+    # MissingGreenlet, so check that nothing touched the user once the commit expired it
+    monkeypatch.setattr(password_hasher, "scheme", "bcrypt")
+    bcrypt_backend = password_hasher.backend("bcrypt")
+    monkeypatch.setattr(bcrypt_backend, "rounds", 4)
+    payload = {"username": "hashuser2", "password": "pw", "email": "hashuser2@example.com"}
+    assert client.post("/register", json=payload).status_code == status.HTTP_200_OK
+    # a cost change makes the next login upgrade the hash
+    monkeypatch.setattr(bcrypt_backend, "rounds", 5)
+
+    committed = []
+    original_commit = AsyncSessionShim.commit
+
+    async def recording_commit(self):
+        await original_commit(self)
+        committed.extend(obj for obj in self._session.identity_map.values() if isinstance(obj, User))
+
+    monkeypatch.setattr(AsyncSessionShim, "commit", recording_commit)
+    login = client.post("/login", json={"username_or_email": "hashuser2", "password": "pw"})
+    assert login.status_code == status.HTTP_200_OK
+    assert login.json()["username"] == "hashuser2" and login.json()["email"] == "hashuser2@example.com"
+
+    assert len(committed) == 1
+    assert {"id", "username", "email"} <= inspect(committed[0]).expired_attributes
@@ -0,0 +1,69 @@
+import asyncio
+import sys
+import threading
+
+from fastapi import status
+
+import auth
+from profiler import collapse_stack, collapsed, profiler
+
+
+def _get_auth_headers(client, username: str, password: str, email: str):
+    register_payload = {"username": username, "password": password, "email": email}
+    reg = client.post("/register", json=register_payload)
+    assert reg.status_code == status.HTTP_200_OK
+
+    login_payload = {"username_or_email": username, "password": password}
+    login_resp = client.post("/login", json=login_payload)
+    assert login_resp.status_code == status.HTTP_200_OK
+    token = login_resp.json().get("jwt_token")
+    assert token
+    return {"Authorization": f"Bearer {token}"}
+
+
+def _spin(stop: threading.Event):
+    while not stop.is_set():
+        sum(range(1000))
+
+
+def test_profile_samples_other_threads_as_collapsed_stacks():
+    stop = threading.Event()
+    worker = threading.Thread(target=_spin, args=(stop,), name="busy-worker")
+    worker.start()
+    try:
+        profile = asyncio.run(profiler.profile(0.3))
+    finally:
+        stop.set()
+        worker.join()
+
+    assert profile.samples > 0 and profile.overhead < 0.05
+    lines = collapsed(profile).splitlines()
+    busy = [line for line in lines if line.startswith("busy-worker;")]
+    assert busy and all("_spin (tests/test_profiler.py:" in line for line in busy)
+    # every line is "frame;frame;... count"
+    assert all(line.rsplit(" ", 1)[1].isdigit() for line in lines)
+    # the sampler leaves itself out
+    assert not any(line.startswith("profiler;") for line in lines)
+    assert not profiler.running
+
+
+def test_collapse_stack_runs_from_thread_to_innermost_frame():
+    frame = sys._getframe()
+    stack = collapse_stack("Main;Thread", frame)
+    assert stack.startswith("Main:Thread;")
+    assert stack.endswith(f";test_collapse_stack_runs_from_thread_to_innermost_frame (tests/test_profiler.py:{frame.f_code.co_firstlineno})")
+
+
+def test_profile_endpoint_is_admin_only(client, monkeypatch):
+    admin = _get_auth_headers(client, "profadmin", "pw", "profadmin@example.com")
+    other = _get_auth_headers(client, "profuser", "pw", "profuser@example.com")
+    monkeypatch.setattr(auth, "ADMIN_USER_IDS", frozenset({1}))
+
+    assert client.get("/debug/profile", params={"seconds": 0.1}, headers=other).status_code == status.HTTP_403_FORBIDDEN
+    assert client.get("/debug/profile", params={"seconds": 600}, headers=admin).status_code == status.HTTP_422_UNPROCESSABLE_ENTITY
+
+    response = client.get("/debug/profile", params={"seconds": 0.2}, headers=admin)
+    assert response.status_code == status.HTTP_200_OK
+    assert response.headers["content-type"].startswith("text/plain")
+    assert int(response.headers["x-profile-samples"]) > 0
+    assert response.text.strip()
@@ -0,0 +1,124 @@
+import asyncio
+import time
+
+from fastapi import status
+import pytest
+
+from ratelimit import rate_limiter, RateLimitRule, RateLimiter, MemoryBucketStore, SharedBucketStore, LocalRedisStandIn, DEFAULT_RULES, DEFAULT_RULE
+from auth import token_subjects
+
+
+def _get_auth_headers(client, username: str, password: str, email: str):
+    register_payload = {"username": username, "password": password, "email": email}
+    reg = client.post("/register", json=register_payload)
+    assert reg.status_code == status.HTTP_200_OK
+
+    login_payload = {"username_or_email": username, "password": password}
+    login_resp = client.post("/login", json=login_payload)
+    assert login_resp.status_code == status.HTTP_200_OK
+    token = login_resp.json().get("jwt_token")
+    assert token
+    return {"Authorization": f"Bearer {token}"}
+
+
+@pytest.fixture
+def limited(client):
+    """Enable the limiter with small, test-sized rules on a fresh store."""
+    previous = (rate_limiter.enabled, rate_limiter.store, rate_limiter.fallback_store, rate_limiter.default_rule)
+    rate_limiter.enabled = True
+    rate_limiter.store = rate_limiter.fallback_store = MemoryBucketStore()
+    rate_limiter.default_rule = RateLimitRule("default", "3/minute")
+    rate_limiter.configure_rules({
+        ("POST", "/login"): RateLimitRule("login", "2/minute", scope="ip"),
+        ("GET", "/workouts/{workout_id}"): RateLimitRule("workout", "1/minute"),
+    })
+    token_subjects.clear()
+    yield client
+    rate_limiter.enabled, rate_limiter.store, rate_limiter.fallback_store, rate_limiter.default_rule = previous
+    rate_limiter.configure_rules(DEFAULT_RULES)
+
+
+def test_login_is_limited_per_ip(limited):
+    client = limited
+    payload = {"username_or_email": "nobody", "password": "wrong"}
+
+    first = client.post("/login", json=payload)
+    assert first.headers["RateLimit-Limit"] == "2"
+    assert first.headers["RateLimit-Remaining"] == "1"
+    assert first.headers["RateLimit-Policy"] == "2;w=60"
+    client.post("/login", json=payload)
+
+    blocked = client.post("/login", json=payload)
+    assert blocked.status_code == status.HTTP_429_TOO_MANY_REQUESTS
+    assert blocked.json() == {"detail": "Too many requests."}
+    assert 0 < int(blocked.headers["Retry-After"]) <= 30
+
+
+def test_authenticated_requests_are_limited_per_user(limited):
+    client = limited
+    rate_limiter.configure_rules({("GET", "/workouts/{workout_id}"): RateLimitRule("workout", "1/minute")})
+    rate_limiter.default_rule = RateLimitRule("default", "10/minute")
+    alice = _get_auth_headers(client, "rluser1", "pw", "rluser1@example.com")
+    bob = _get_auth_headers(client, "rluser2", "pw", "rluser2@example.com")
+
+    # templated routes match whatever ids the path carries
+    assert client.get("/workouts/1", headers=alice).status_code == status.HTTP_404_NOT_FOUND
+    assert client.get("/workouts/2", headers=alice).status_code == status.HTTP_429_TOO_MANY_REQUESTS
+    # same IP, different user: separate bucket
+    assert client.get("/workouts/1", headers=bob).status_code == status.HTTP_404_NOT_FOUND
+    # other routes use the default rule
+    assert client.get("/workouts", headers=alice).headers["RateLimit-Limit"] == "10"
+
+
+def test_shared_store_with_local_stand_in(limited):
+    client = limited
+    rate_limiter.store = SharedBucketStore(LocalRedisStandIn())
+    payload = {"username_or_email": "nobody", "password": "wrong"}
+    statuses = [client.post("/login", json=payload).status_code for _ in range(3)]
+    assert statuses[-1] == status.HTTP_429_TOO_MANY_REQUESTS
+
+
+def test_shared_store_errors_fall_back_to_local_buckets():
+    class _DownRedis:
+        async def eval(self, *args):
+            raise ConnectionRefusedError("redis down")
+
+    limiter = RateLimiter({}, RateLimitRule("default", "1/minute"), SharedBucketStore(_DownRedis()))
+    results = [asyncio.run(limiter.take("u:1", limiter.default_rule))[0] for _ in range(2)]
+    assert results == [True, False]
+
+
+def test_bucket_refills_over_time():
+    store = MemoryBucketStore()
+    assert store.take("k", rate=1000.0, burst=1) == (True, 0.0)
+    assert not store.take("k", rate=1000.0, burst=1)[0]
+    time.sleep(0.01)
+    assert store.take("k", rate=1000.0, burst=1)[0]
+
+
+def test_eviction_keeps_each_rule_and_active_clients():
+    store = MemoryBucketStore(max_keys=3)
+    login = DEFAULT_RULES[("POST", "/login")]
+    # a spent login bucket takes minutes to refill; a default-rule flood must not reset it
+    for _ in range(login.burst):
+        store.take("login:ip:attacker", login.rate, login.burst)
+    assert not store.take("login:ip:attacker", login.rate, login.burst)[0]
+
+    for i in range(10):
+        store.take("login:ip:attacker", login.rate, login.burst)
+        store.take(f"default:ip:{i}", DEFAULT_RULE.rate, DEFAULT_RULE.burst)
+        assert len(store) <= 3
+
+    # the least recently used keys went out, the client that kept sending did not
+    assert not store.take("login:ip:attacker", login.rate, login.burst)[0]
+
+
+def test_refilled_buckets_are_evicted_first():
+    store = MemoryBucketStore(max_keys=2)
+    store.take("fast", rate=1000.0, burst=1)
+    store.take("slow", rate=0.001, burst=1)
+    time.sleep(0.01)
+    store.take("slow", rate=0.001, burst=1)
+    store.take("new", rate=1000.0, burst=1)
+    # "fast" had refilled and went first; "slow" is still spent
+    assert not store.take("slow", rate=0.001, burst=1)[0]
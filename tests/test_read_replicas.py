@@ -0,0 +1,105 @@
+from fastapi import status
+import pytest
+from sqlalchemy import create_engine
+from sqlalchemy.exc import OperationalError
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import StaticPool
+
+from conftest import AsyncSessionShim
+from database import replica_router, ReplicaRouter, REPLICA_PIN_COOKIE
+from models.base import Base
+
+
+def _get_auth_headers(client, username: str, password: str, email: str):
+    register_payload = {"username": username, "password": password, "email": email}
+    reg = client.post("/register", json=register_payload)
+    assert reg.status_code == status.HTTP_200_OK
+
+    login_payload = {"username_or_email": username, "password": password}
+    login_resp = client.post("/login", json=login_payload)
+    assert login_resp.status_code == status.HTTP_200_OK
+    token = login_resp.json().get("jwt_token")
+    assert token
+    return {"Authorization": f"Bearer {token}"}
+
+
+@pytest.fixture
+def replica(client):
+    """Point the router at a second, independent in-memory database acting as the replica.
+
+    It starts empty, so reads served from it are easy to tell apart from the primary.
+    """
+    replica_engine = create_engine("sqlite:///:memory:", connect_args={"check_same_thread": False}, poolclass=StaticPool)
+    Base.metadata.create_all(bind=replica_engine)
+    ReplicaSessionLocal = sessionmaker(bind=replica_engine)
+
+    previous = (replica_router.session_factory, replica_router.pin_seconds, replica_router.retry_seconds)
+    replica_router.configure(lambda: AsyncSessionShim(ReplicaSessionLocal()), pin_seconds=60, retry_seconds=60)
+    yield replica_router
+    replica_router.configure(*previous)
+    replica_engine.dispose()
+
+
+def test_reads_are_pinned_to_primary_after_a_write(replica, client):
+    headers = _get_auth_headers(client, "repuser1", "pw", "repuser1@example.com")
+    created = client.post("/exercises", json={"name": "Squat", "description": ""}, headers=headers)
+    assert created.status_code == status.HTTP_200_OK
+
+    # within the pin window the user reads their own write from the primary
+    resp = client.get("/exercises", headers=headers)
+    assert [e["name"] for e in resp.json()] == ["squat"]
+
+    # once the window lapses, reads go to the (lagging, here empty) replica
+    replica._pinned_until.clear()
+    client.cookies.clear()
+    resp = client.get("/exercises", headers=headers)
+    assert resp.status_code == status.HTTP_200_OK
+    assert resp.json() == []
+
+
+def test_replica_errors_fall_back_to_primary(replica, client):
+    headers = _get_auth_headers(client, "repuser2", "pw", "repuser2@example.com")
+    client.post("/exercises", json={"name": "Row", "description": ""}, headers=headers)
+    replica._pinned_until.clear()
+    client.cookies.clear()
+
+    class _BrokenReplica:
+        async def connection(self):
+            raise OperationalError("SELECT 1", {}, Exception("replica down"))
+
+        async def close(self):
+            pass
+
+    replica.session_factory = _BrokenReplica
+    resp = client.get("/exercises", headers=headers)
+    assert resp.status_code == status.HTTP_200_OK
+    assert [e["name"] for e in resp.json()] == ["row"]
+    # the replica is skipped for the retry window instead of being probed on every request
+    assert not replica.use_replica(12345)
+
+
+def test_pin_cookie_keeps_reads_on_primary_across_workers(replica, client):
+    headers = _get_auth_headers(client, "repuser3", "pw", "repuser3@example.com")
+    created = client.post("/exercises", json={"name": "Press", "description": ""}, headers=headers)
+    assert REPLICA_PIN_COOKIE in created.cookies
+
+    # another worker has no in-process pin for the user; the cookie still keeps the read on the primary
+    replica._pinned_until.clear()
+    assert [e["name"] for e in client.get("/exercises", headers=headers).json()] == ["press"]
+
+    # the cookie only pins the user it was issued to, and only until it lapses
+    user_id = int(created.cookies[REPLICA_PIN_COOKIE].split(":")[0])
+    assert not ReplicaRouter.cookie_pins(f"{user_id + 1}:9999999999", user_id)
+    assert not ReplicaRouter.cookie_pins(f"{user_id}:1", user_id)
+    assert not ReplicaRouter.cookie_pins("garbage", user_id)
+
+
+def test_router_without_replica_always_uses_primary():
+    router = ReplicaRouter(None, pin_seconds=5, retry_seconds=5)
+    assert not router.use_replica(1)
+
+    router.configure(object, pin_seconds=0.0)
+    assert router.use_replica(1)
+    router.pin(1)
+    # a zero-length pin expires immediately
+    assert router.use_replica(1)
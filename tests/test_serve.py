@@ -0,0 +1,115 @@
+import os
+import signal
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+import urllib.request
+
+import pytest
+
+from serve import pool_sizing, Master
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def test_pool_sizing_stays_within_the_budget():
+    for budget, workers in [(80, 1), (80, 3), (80, 8), (100, 16), (4, 4)]:
+        pool_size, max_overflow = pool_sizing(budget, workers)
+        assert pool_size >= 1
+        assert (pool_size + max_overflow) * workers <= budget
+    assert pool_sizing(80, 4) == (15, 5)
+    with pytest.raises(ValueError):
+        pool_sizing(3, 4)
+
+
+def test_respawn_backs_off_and_gives_up_on_a_crash_loop():
+    master = Master(None, workers = 1, graceful_seconds = 1, max_fast_failures = 4, backoff = 1, min_uptime = 10)
+    master.started_at[0] = 100.0
+    assert [master.respawn_delay(0, 101.0) for _ in range(3)] == [1, 2, 4]
+    assert master.respawn_delay(0, 101.0) is None
+
+    # a worker that ran for a while starts the streak over
+    master.fast_failures[0] = 3
+    assert master.respawn_delay(0, 200.0) == 0
+    assert master.respawn_delay(0, 200.0) == 0 and master.fast_failures[0] == 0
+
+
+class _CrashingMaster(Master):
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.forks = 0
+
+    def spawn(self, sock, slot : int):
+        # a worker that fails at startup, without forking a copy of the test process
+        pid = os.fork()
+        if pid == 0:
+            os._exit(3)
+        self.forks += 1
+        self.children[pid] = slot
+        self.started_at[slot] = time.monotonic()
+
+
+def test_master_exits_non_zero_after_consecutive_fast_failures():
+    handlers = {sig: signal.getsignal(sig) for sig in (signal.SIGTERM, signal.SIGINT)}
+    master = _CrashingMaster(None, workers = 1, graceful_seconds = 1, max_fast_failures = 3, backoff = 0.05)
+    try:
+        with socket.socket() as sock:
+            assert master.run(sock) == 1
+    finally:
+        for sig, handler in handlers.items():
+            signal.signal(sig, handler)
+    assert master.forks == 3
+
+
+def _get(port : int) -> int:
+    with urllib.request.urlopen(f"http://127.0.0.1:{port}/", timeout = 1) as response:
+        return response.status
+
+
+def _children(pid : int) -> set[int]:
+    out = subprocess.run(["ps", "--ppid", str(pid), "-o", "pid="], capture_output = True, text = True)
+    return {int(line) for line in out.stdout.split()}
+
+
+def test_workers_are_replaced_and_drain_on_sigterm():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        port = s.getsockname()[1]
+    env = {**os.environ, "DB_WARMUP_CONNECTIONS": "0", "RATE_LIMIT_ENABLED": "false"}
+    log = tempfile.TemporaryFile(mode = "w+")
+    master = subprocess.Popen([sys.executable, "serve.py", "--host", "127.0.0.1", "--port", str(port), "--workers", "2"],
+                              cwd = ROOT, env = env, stdout = log, stderr = subprocess.STDOUT, text = True)
+
+    def output() -> str:
+        log.seek(0)
+        return log.read()
+
+    try:
+        deadline = time.monotonic() + 30
+        while True:
+            try:
+                assert _get(port) == 200
+                break
+            except OSError:
+                assert time.monotonic() < deadline, "launcher did not start"
+                time.sleep(0.05)
+
+        workers = _children(master.pid)
+        assert len(workers) == 2
+        os.kill(workers.pop(), signal.SIGKILL)
+        deadline = time.monotonic() + 10
+        while output().count("Application startup complete") < 3:
+            assert time.monotonic() < deadline, "crashed worker was not replaced"
+            time.sleep(0.05)
+
+        master.send_signal(signal.SIGTERM)
+        master.wait(timeout = 30)
+    finally:
+        if master.poll() is None:
+            master.kill()
+    assert master.returncode == 0
+    # every live worker ran the lifespan shutdown, which disposes the engines
+    assert output().count("Application shutdown complete") == 2
+    log.close()
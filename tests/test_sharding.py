@@ -0,0 +1,102 @@
+import asyncio
+
+from fastapi import status
+import pytest
+from sqlalchemy import create_engine, select, func
+from sqlalchemy.orm import sessionmaker, Session
+from sqlalchemy.pool import StaticPool
+
+from conftest import AsyncSessionShim, ENGINE, SyncSessionLocal
+from models.base import Base
+from models.exercise import Exercise
+from models.user import User
+from sharding import shard_map, move_user, interleave_sequences_sql
+
+
+def _get_auth_headers(client, username: str, password: str, email: str):
+    register_payload = {"username": username, "password": password, "email": email}
+    reg = client.post("/register", json=register_payload)
+    assert reg.status_code == status.HTTP_200_OK
+
+    login_payload = {"username_or_email": username, "password": password}
+    login_resp = client.post("/login", json=login_payload)
+    assert login_resp.status_code == status.HTTP_200_OK
+    token = login_resp.json().get("jwt_token")
+    assert token
+    return {"Authorization": f"Bearer {token}"}, login_resp.json()["id"]
+
+
+def _count(engine, model, **filters):
+    with Session(engine) as session:
+        return session.scalar(select(func.count()).select_from(model).filter_by(**filters))
+
+
+@pytest.fixture
+def shards(client):
+    """Two in-memory shard databases; the conftest database acts as the global directory."""
+    engines = [
+        create_engine("sqlite:///:memory:", connect_args={"check_same_thread": False}, poolclass=StaticPool)
+        for _ in range(2)
+    ]
+    factories = []
+    for engine in engines:
+        Base.metadata.create_all(bind=engine)
+        factories.append(lambda SessionLocal=sessionmaker(bind=engine): AsyncSessionShim(SessionLocal()))
+
+    shard_map.configure(factories, refresh_seconds=0)
+    yield engines, factories
+    shard_map.configure([])
+    for engine in engines:
+        engine.dispose()
+
+
+def test_user_data_lands_on_its_shard(shards, client):
+    engines, _ = shards
+    headers_a, id_a = _get_auth_headers(client, "sharduser1", "pw", "sharduser1@example.com")
+    headers_b, id_b = _get_auth_headers(client, "sharduser2", "pw", "sharduser2@example.com")
+    assert shard_map.shard_for(id_a) != shard_map.shard_for(id_b)
+
+    assert client.post("/exercises", json={"name": "Squat", "description": ""}, headers=headers_a).status_code == status.HTTP_200_OK
+    assert client.post("/exercises", json={"name": "Dip", "description": ""}, headers=headers_b).status_code == status.HTTP_200_OK
+
+    for user_id in (id_a, id_b):
+        home = engines[shard_map.shard_for(user_id)]
+        other = engines[1 - shard_map.shard_for(user_id)]
+        assert _count(home, User, id=user_id) == 1
+        assert _count(home, Exercise, user_id=user_id) == 1
+        assert _count(other, Exercise, user_id=user_id) == 0
+
+    # the directory only holds users
+    assert _count(ENGINE, Exercise) == 0
+    assert [e["name"] for e in client.get("/exercises", headers=headers_a).json()] == ["squat"]
+
+
+def test_move_user_between_shards(shards, client):
+    engines, factories = shards
+    headers, user_id = _get_auth_headers(client, "sharduser3", "pw", "sharduser3@example.com")
+    ex_id = client.post("/exercises", json={"name": "Row", "description": ""}, headers=headers).json()["exercise_id"]
+    w_id = client.post("/workouts", json={"name": "W", "description": "", "date": "2025-10-01", "start_time": "2025-10-01T08:00:00"}, headers=headers).json()["workout_id"]
+    client.post("/workoutexercises", json={"workout_id": w_id, "exercise_id": ex_id, "set_number": 1, "weight": 70, "reps": 8}, headers=headers)
+
+    source = shard_map.shard_for(user_id)
+    target = 1 - source
+    directory_factory = lambda: AsyncSessionShim(SyncSessionLocal())
+    counts = asyncio.run(move_user(directory_factory, factories[source], factories[target], user_id, target))
+    assert counts == {"exercises": 1, "workouts": 1, "sets": 1}
+
+    assert _count(engines[source], User, id=user_id) == 0
+    assert _count(engines[target], Exercise, user_id=user_id) == 1
+
+    # the next request refreshes placements from the directory and follows the user
+    sets = client.get(f"/workouts/{w_id}/sets", headers=headers)
+    assert sets.status_code == status.HTTP_200_OK
+    assert sets.json()[0]["weight"] == 70
+    assert shard_map.shard_for(user_id) == target
+
+
+def test_interleaved_sequences_are_disjoint():
+    statements = [interleave_sequences_sql(k, 3, 1000) for k in range(3)]
+    starts = [int(s[0].rsplit(" ", 1)[1]) for s in statements]
+    assert all(start > 1000 for start in starts)
+    assert sorted(start % 3 for start in starts) == [0, 1, 2]
+    assert statements[0][0].startswith("ALTER SEQUENCE exercises_exercise_id_seq INCREMENT BY 3")
@@ -0,0 +1,71 @@
+from fastapi import status
+import pytest
+from sqlalchemy import event, text
+from sqlalchemy.exc import IntegrityError
+
+import auth
+from conftest import ENGINE
+from slow_queries import slow_query_log
+
+
+def _get_auth_headers(client, username: str, password: str, email: str):
+    register_payload = {"username": username, "password": password, "email": email}
+    reg = client.post("/register", json=register_payload)
+    assert reg.status_code == status.HTTP_200_OK
+
+    login_payload = {"username_or_email": username, "password": password}
+    login_resp = client.post("/login", json=login_payload)
+    assert login_resp.status_code == status.HTTP_200_OK
+    token = login_resp.json().get("jwt_token")
+    assert token
+    return {"Authorization": f"Bearer {token}"}
+
+
+@pytest.fixture
+def logging_everything(monkeypatch):
+    # every statement counts as slow and every SELECT is explained
+    monkeypatch.setattr(slow_query_log, "threshold_ms", 0)
+    monkeypatch.setattr(slow_query_log, "explain_rate", 1)
+    slow_query_log.clear()
+    slow_query_log.install(ENGINE)
+    yield slow_query_log
+    slow_query_log.uninstall(ENGINE)
+    slow_query_log.clear()
+
+
+def test_slow_statements_are_kept_with_route_parameters_and_plan(client, logging_everything, monkeypatch):
+    admin = _get_auth_headers(client, "slowadmin", "pw", "slowadmin@example.com")
+    monkeypatch.setattr(auth, "ADMIN_USER_IDS", frozenset({1}))
+
+    assert client.get("/prs", params={"from": "2024-01-01"}, headers=admin).status_code == status.HTTP_200_OK
+
+    body = client.get("/debug/slow-queries", headers=admin).json()
+    assert body["enabled"] is True
+    prs = next(q for q in body["queries"] if q["route"] == "GET /prs")
+    assert prs["statement"].startswith("SELECT") and "from_date_1" in prs["parameters"]
+    assert prs["plan"]
+
+    # the password hash is masked, and INSERTs are never explained
+    register = next(q for q in body["queries"] if q["route"] == "POST /register" and q["statement"].startswith("INSERT"))
+    assert "***" in register["parameters"] and "$2b$" not in register["parameters"]
+    assert register["plan"] is None
+
+
+def test_debug_endpoint_is_admin_only_and_disabled_log_has_no_listeners(client):
+    headers = _get_auth_headers(client, "slowuser", "pw", "slowuser@example.com")
+    assert client.get("/debug/slow-queries", headers=headers).status_code == status.HTTP_403_FORBIDDEN
+    assert not event.contains(ENGINE, "before_cursor_execute", slow_query_log._before)
+
+
+def test_failed_statements_leave_no_start_time_behind(client, logging_everything):
+    with ENGINE.connect() as connection:
+        connection.execute(text("CREATE TEMP TABLE slow_unique (id INTEGER PRIMARY KEY)"))
+        connection.execute(text("INSERT INTO slow_unique VALUES (1)"))
+        for _ in range(3):
+            with pytest.raises(IntegrityError):
+                connection.execute(text("INSERT INTO slow_unique VALUES (1)"))
+            assert "slow_query_start" not in connection.info
+        logged = len(logging_everything.entries)
+        connection.execute(text("SELECT 1"))
+        assert len(logging_everything.entries) == logged + 1
+        connection.rollback()
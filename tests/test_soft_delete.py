@@ -0,0 +1,106 @@
+import asyncio
+from datetime import datetime, timedelta, timezone
+
+from fastapi import status
+from sqlalchemy import func, select, update
+
+from conftest import SyncSessionLocal, AsyncSessionShim
+from compaction import compact
+from models.exercise import Exercise
+from models.workout import Workout
+from models.workout_exercise import WorkoutExercise
+
+
+def _get_auth_headers(client, username: str, password: str, email: str):
+    register_payload = {"username": username, "password": password, "email": email}
+    reg = client.post("/register", json=register_payload)
+    assert reg.status_code == status.HTTP_200_OK
+
+    login_payload = {"username_or_email": username, "password": password}
+    login_resp = client.post("/login", json=login_payload)
+    assert login_resp.status_code == status.HTTP_200_OK
+    token = login_resp.json().get("jwt_token")
+    assert token
+    return {"Authorization": f"Bearer {token}"}
+
+
+def _setup(client, headers, weights: list[int]):
+    exercise_id = client.post("/exercises", json={"name": "Squat", "description": ""}, headers=headers).json()["exercise_id"]
+    workout = {"name": "Legs", "description": "", "date": "2024-03-01", "start_time": "2024-03-01T09:00:00"}
+    workout_id = client.post("/workouts", json=workout, headers=headers).json()["workout_id"]
+    for set_number, weight in enumerate(weights, start=1):
+        payload = {"workout_id": workout_id, "exercise_id": exercise_id, "set_number": set_number, "weight": weight, "reps": 5}
+        assert client.post("/workoutexercises", json=payload, headers=headers).status_code == status.HTTP_200_OK
+    return exercise_id, workout_id
+
+
+def _rows(model, deleted: bool | None = None) -> int:
+    with SyncSessionLocal() as db:
+        statement = select(func.count()).select_from(model).execution_options(include_deleted=True)
+        if deleted is not None:
+            statement = statement.where(model.deleted_at.is_not(None) if deleted else model.deleted_at.is_(None))
+        return db.scalar(statement)
+
+
+def test_deleted_set_is_hidden_and_its_key_can_be_logged_again(client):
+    headers = _get_auth_headers(client, "softuser1", "pw", "softuser1@example.com")
+    exercise_id, workout_id = _setup(client, headers, [100, 140])
+
+    set_url = f"/workouts/{workout_id}/sets/{exercise_id}/2"
+    assert client.delete(set_url, headers=headers).status_code == status.HTTP_204_NO_CONTENT
+    assert client.get(set_url, headers=headers).status_code == status.HTTP_404_NOT_FOUND
+    assert client.delete(set_url, headers=headers).status_code == status.HTTP_404_NOT_FOUND
+    assert len(client.get(f"/workouts/{workout_id}/sets", headers=headers).json()) == 1
+    assert client.get("/prs", headers=headers).json() == [{"name": "squat", "weight": 100}]
+    # the row is still there, only stamped
+    assert _rows(WorkoutExercise, deleted=True) == 1
+
+    payload = {"workout_id": workout_id, "exercise_id": exercise_id, "set_number": 2, "weight": 120, "reps": 3}
+    assert client.post("/workoutexercises", json=payload, headers=headers).status_code == status.HTTP_200_OK
+    assert client.get(set_url, headers=headers).json()["weight"] == 120
+    assert _rows(WorkoutExercise, deleted=True) == 0
+    # a live set still conflicts
+    assert client.post("/workoutexercises", json=payload, headers=headers).status_code == status.HTTP_409_CONFLICT
+
+
+def test_deleted_workouts_and_exercises_disappear_from_every_read(client):
+    headers = _get_auth_headers(client, "softuser2", "pw", "softuser2@example.com")
+    exercise_id, workout_id = _setup(client, headers, [100, 110])
+
+    assert client.delete(f"/workouts/{workout_id}", headers=headers).status_code == status.HTTP_204_NO_CONTENT
+    assert client.get("/workouts", headers=headers).json() == []
+    assert client.get("/prs", headers=headers).json() == []
+    assert client.get(f"/exercises/{exercise_id}/history", headers=headers).json()["points"] == []
+    assert _rows(WorkoutExercise, deleted=True) == 2
+
+    # no live sets left, so no cascade is needed; the name is free for a new exercise
+    assert client.delete(f"/exercises/{exercise_id}", headers=headers).status_code == status.HTTP_204_NO_CONTENT
+    assert client.get("/exercises", headers=headers).json() == []
+    assert client.get("/exercises/search", params={"q": "squ"}, headers=headers).json() == []
+    recreated = client.post("/exercises", json={"name": "Squat", "description": ""}, headers=headers)
+    assert recreated.status_code == status.HTTP_200_OK
+    assert recreated.json()["exercise_id"] != exercise_id
+
+
+def test_compaction_removes_only_old_tombstones(client):
+    headers = _get_auth_headers(client, "softuser3", "pw", "softuser3@example.com")
+    old_exercise, old_workout = _setup(client, headers, [100, 110, 120, 130, 140])
+    assert client.delete(f"/exercises/{old_exercise}", params={"cascade": "true"}, headers=headers).status_code == status.HTTP_204_NO_CONTENT
+    assert client.delete(f"/workouts/{old_workout}", headers=headers).status_code == status.HTTP_204_NO_CONTENT
+
+    workout = {"name": "Arms", "description": "", "date": "2024-03-02", "start_time": "2024-03-02T09:00:00"}
+    recent_workout = client.post("/workouts", json=workout, headers=headers).json()["workout_id"]
+    assert client.delete(f"/workouts/{recent_workout}", headers=headers).status_code == status.HTTP_204_NO_CONTENT
+
+    long_ago = datetime.now(timezone.utc) - timedelta(days=60)
+    with SyncSessionLocal() as db:
+        for model in (WorkoutExercise, Exercise):
+            db.execute(update(model).values(deleted_at=long_ago))
+        db.execute(update(Workout).where(Workout.workout_id == old_workout).values(deleted_at=long_ago))
+        db.commit()
+
+    counts = asyncio.run(compact(lambda: AsyncSessionShim(SyncSessionLocal()), retention_days=30, batch_size=2, pause=0))
+    assert counts == {"workout_exercises": 5, "workouts": 1, "exercises": 1}
+    assert _rows(WorkoutExercise) == 0 and _rows(Exercise) == 0
+    # deleted within the retention window: kept for sync and undo
+    assert _rows(Workout, deleted=True) == 1
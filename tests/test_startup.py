@@ -0,0 +1,20 @@
+from benchmarks.startup_bench import run_probe, IMPORT_BUDGET_SECONDS, FIRST_RESPONSE_BUDGET_SECONDS
+
+
+def test_cold_start_stays_within_budget():
+    # best of two fresh interpreters, so one noisy run does not fail the suite
+    probes = [run_probe() for _ in range(2)]
+    best = min(probes, key=lambda p: p["first_response_s"])
+
+    assert best["status"] == 200
+    assert best["loaded"] == [], f"imported at startup instead of on first use: {best['loaded']}"
+    assert best["import_s"] < IMPORT_BUDGET_SECONDS
+    assert best["first_response_s"] < FIRST_RESPONSE_BUDGET_SECONDS
+
+
+def test_lifespan_creates_engines(client):
+    import database
+
+    # created by the app lifespan (the TestClient context), not by importing database
+    assert database.engine is not None
+    assert database.AsyncSession.kw["bind"] is database.engine
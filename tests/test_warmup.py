@@ -0,0 +1,54 @@
+import asyncio
+from datetime import date
+
+from sqlalchemy import create_engine, event
+from sqlalchemy.engine.default import CACHE_HIT
+from sqlalchemy.ext.asyncio import create_async_engine
+from sqlalchemy.orm import Session
+from sqlalchemy.pool import StaticPool
+
+import queries
+from database import warm_up_engine
+from models.base import Base
+
+
+def test_warmup_primes_the_compiled_cache():
+    engine = create_engine("sqlite:///:memory:", connect_args={"check_same_thread": False}, poolclass=StaticPool)
+    Base.metadata.create_all(bind=engine)
+
+    cache_hits = []
+    event.listen(engine, "after_cursor_execute", lambda conn, cursor, statement, params, context, executemany: cache_hits.append(context.cache_hit is CACHE_HIT))
+
+    with Session(engine) as session:
+        for statement in queries.warmup_statements():
+            assert session.execute(statement).all() == []
+
+        # real requests use other ids and dates, but reuse the SQL compiled during warmup
+        cache_hits.clear()
+        session.execute(queries.workouts_for_user(42))
+        session.execute(queries.prs_for_user(42, to_date=date(2024, 1, 31)))
+        session.execute(queries.set_by_key(7, 8, 9))
+        assert cache_hits == [True, True, True]
+    engine.dispose()
+
+
+def test_hot_statements_bind_their_arguments(client):
+    headers = {"Authorization": f"Bearer {_token(client)}"}
+    client.post("/workouts", json={"name": "A", "description": "", "date": "2024-01-10", "start_time": "2024-01-10T09:00:00"}, headers=headers)
+    client.post("/workouts", json={"name": "B", "description": "", "date": "2024-02-10", "start_time": "2024-02-10T09:00:00"}, headers=headers)
+
+    # the same cached lambda must not leak the previous call's dates
+    assert [w["name"] for w in client.get("/workouts", params={"from": "2024-02-01"}, headers=headers).json()] == ["B"]
+    assert [w["name"] for w in client.get("/workouts", params={"from": "2024-01-01"}, headers=headers).json()] == ["A", "B"]
+    assert [w["name"] for w in client.get("/workouts", params={"to": "2024-01-31"}, headers=headers).json()] == ["A"]
+
+
+def test_warmup_failure_leaves_the_pool_lazy():
+    unreachable = create_async_engine("postgresql+asyncpg://u:p@127.0.0.1:1/db")
+    assert asyncio.run(warm_up_engine(unreachable, connections=2)) == 0
+    asyncio.run(unreachable.dispose())
+
+
+def _token(client):
+    client.post("/register", json={"username": "warmuser", "password": "pw", "email": "warmuser@example.com"})
+    return client.post("/login", json={"username_or_email": "warmuser", "password": "pw"}).json()["jwt_token"]
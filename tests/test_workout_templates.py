@@ -0,0 +1,86 @@
+from fastapi import status
+from sqlalchemy import event
+
+from conftest import ENGINE
+
+
+def _get_auth_headers(client, username: str, password: str, email: str):
+    register_payload = {"username": username, "password": password, "email": email}
+    reg = client.post("/register", json=register_payload)
+    assert reg.status_code == status.HTTP_200_OK
+
+    login_payload = {"username_or_email": username, "password": password}
+    login_resp = client.post("/login", json=login_payload)
+    assert login_resp.status_code == status.HTTP_200_OK
+    token = login_resp.json().get("jwt_token")
+    assert token
+    return {"Authorization": f"Bearer {token}"}
+
+
+def _template(client, headers, sets: list[tuple[int, int]]):
+    exercise_id = client.post("/exercises", json={"name": "Squat", "description": ""}, headers=headers).json()["exercise_id"]
+    workout = {"name": "Leg day", "description": "5x5", "date": "2024-01-01", "start_time": "2024-01-01T09:00:00", "is_template": True}
+    created = client.post("/workouts", json=workout, headers=headers).json()
+    assert created["is_template"] is True
+    for set_number, (weight, reps) in enumerate(sets, start=1):
+        payload = {"workout_id": created["workout_id"], "exercise_id": exercise_id, "set_number": set_number, "weight": weight, "reps": reps}
+        assert client.post("/workoutexercises", json=payload, headers=headers).status_code == status.HTTP_200_OK
+    return exercise_id, created["workout_id"]
+
+
+def test_clone_copies_the_workout_and_scales_its_sets_in_the_database(client):
+    headers = _get_auth_headers(client, "tmpluser1", "pw", "tmpluser1@example.com")
+    exercise_id, template_id = _template(client, headers, [(100, 5), (100, 5), (60, 12)])
+
+    statements = []
+    record = lambda conn, cursor, statement, params, context, executemany: statements.append(statement)
+    event.listen(ENGINE, "before_cursor_execute", record)
+    try:
+        clone = {"date": "2024-01-08", "start_time": "2024-01-08T09:00:00", "weight_percent": 105}
+        response = client.post(f"/workouts/{template_id}/clone", json=clone, headers=headers)
+    finally:
+        event.remove(ENGINE, "before_cursor_execute", record)
+
+    assert response.status_code == status.HTTP_200_OK
+    body = response.json()
+    assert body["name"] == "Leg day" and body["description"] == "5x5" and body["date"] == "2024-01-08"
+    assert body["is_template"] is False and body["sets_copied"] == 3 and body["workout_id"] != template_id
+    # no SELECT of the source rows: SQLite runs the two INSERT ... SELECTs separately,
+    # then only the leaderboard membership check
+    assert [s.split()[0] for s in statements] == ["INSERT", "INSERT", "SELECT"]
+    assert all("SELECT" in s for s in statements) and "FROM users" in statements[2]
+
+    sets = client.get(f"/workouts/{body['workout_id']}/sets", headers=headers).json()
+    assert [(s["exercise_id"], s["set_number"], s["weight"], s["reps"]) for s in sets] == [(exercise_id, 1, 105, 5), (exercise_id, 2, 105, 5), (exercise_id, 3, 63, 12)]
+
+
+def test_templates_are_listed_apart_and_left_out_of_prs(client):
+    headers = _get_auth_headers(client, "tmpluser2", "pw", "tmpluser2@example.com")
+    _, template_id = _template(client, headers, [(200, 1)])
+
+    assert client.get("/workouts", headers=headers).json() == []
+    assert [w["workout_id"] for w in client.get("/workouts", params={"template": "true"}, headers=headers).json()] == [template_id]
+    assert client.get("/prs", headers=headers).json() == []
+
+    clone = {"date": "2024-01-08", "start_time": "2024-01-08T09:00:00", "name": "Heavy single", "weight_percent": 90}
+    cloned = client.post(f"/workouts/{template_id}/clone", json=clone, headers=headers).json()
+    assert cloned["name"] == "Heavy single"
+    assert client.get("/prs", headers=headers).json() == [{"name": "squat", "weight": 180}]
+
+    # editing a template without mentioning the flag keeps it a template
+    edit = {"name": "Leg day", "date": "2024-01-01", "start_time": "2024-01-01T09:00:00"}
+    assert client.put(f"/workouts/{template_id}", json=edit, headers=headers).json()["is_template"] is True
+
+
+def test_clone_checks_ownership_and_skips_deleted_sets(client):
+    owner = _get_auth_headers(client, "tmpluser3", "pw", "tmpluser3@example.com")
+    other = _get_auth_headers(client, "tmpluser4", "pw", "tmpluser4@example.com")
+    exercise_id, template_id = _template(client, owner, [(100, 5), (110, 5)])
+    clone = {"date": "2024-01-08", "start_time": "2024-01-08T09:00:00"}
+
+    assert client.post(f"/workouts/{template_id}/clone", json=clone, headers=other).status_code == status.HTTP_403_FORBIDDEN
+    assert client.post("/workouts/999/clone", json=clone, headers=owner).status_code == status.HTTP_404_NOT_FOUND
+    assert client.get("/workouts", headers=other).json() == []
+
+    assert client.delete(f"/workouts/{template_id}/sets/{exercise_id}/2", headers=owner).status_code == status.HTTP_204_NO_CONTENT
+    assert client.post(f"/workouts/{template_id}/clone", json=clone, headers=owner).json()["sets_copied"] == 1